@@ -1,26 +1,40 @@
 from fastapi import FastAPI, HTTPException
-from fastapi.responses import JSONResponse
+from fastapi.responses import JSONResponse, StreamingResponse
 from pydantic import BaseModel
 import os
+import json
+from dataclasses import asdict
+import asyncio
+import logging
 from typing import List, Dict, Any, Optional
 from fastapi import Request
 from starlette.middleware.base import BaseHTTPMiddleware
 from modules.security.auth import verify_token, authenticate_issue_token
 
-from prompts import AGENT_PERSONA, REPRICING_PROMPT_TEMPLATE, REPRICING_PROMPT_BRIEF
-from modules.repricing.repricer import compute_new_price, fetch_competitor_prices, enforce_margin_or_adjust
-from modules.ai.ai_handler import call_gemini
-from modules.finance.calculator import calculate_margin
-from modules.negotiator.negotiator import negotiate
+from modules.repricing.repricer import compute_new_price, fetch_competitor_prices, afetch_competitor_prices, build_repricing_brief, REPRICING_CONTEXT, reprice_from_index, number_or
+from modules.repricing.competitor_index import get_competitor_index, save_competitor_index
+from modules.repricing.scheduler import get_repricing_scheduler
+from modules.repricing.gate import hybrid_reprice, get_gate_metrics
+from modules.allegro.price_push import get_price_push_queue
+from modules.repricing import bulk as bulk_repricing
+from modules.ai.ai_handler import call_gemini, acall_gemini, get_ai_stats, get_circuit_state
+from modules.finance.calculator import calculate_margin, CostModel
+from modules.finance.cost_table import get_cost_table
+from modules.negotiator.negotiator import negotiate, anegotiate
 from modules.logistics.carrier_manager import select_optimal_carrier
 from modules.logistics.print_station import group_print_batch, generate_packing_slip
-from modules.orders.order_manager import process_new_order, get_dashboard_orders
+from modules.orders.order_manager import process_new_order, get_dashboard_orders, get_order, rebuild_pnl
+from modules.orders.batch import get_order_batch_pool
+from modules.orders.job_queue import get_order_job_queue
+from modules.allegro.order_sync import get_order_sync
+from modules.finance.pnl import get_pnl, DIMENSIONS as PNL_DIMENSIONS
 from modules.allegro.quality_monitor import analyze_discussion, prioritize_discussions
 from modules.ads.ads_integrator import check_and_flag_ads, evaluate_product_for_ads
 from modules.orders.review_manager import enqueue_review_on_delivery, run_due_reviews, get_pending_reviews
-from modules.allegro.quality_guard import handle_dispute, monitor_quality_metrics
+from modules.allegro.quality_guard import handle_dispute, ahandle_dispute, monitor_quality_metrics
 from modules.ads.ads_manager import adjust_ads_based_on_margin
 from modules.reviews.review_booster import request_positive_review
+from modules.messaging.messaging_engine import stream_smart_reply
 
 # try to import optional helpers
 try:
@@ -33,6 +47,7 @@ except Exception:
     google_drive_manager = None
 
 app = FastAPI()
+logger = logging.getLogger(__name__)
 MODEL_NAME = os.environ.get('LM_MODEL', 'models/gemini-3-pro-preview')
 
 # Simple LM client stub - replace with actual Gemini/OpenAI client code
@@ -49,6 +64,14 @@ def send_to_model(prompt: str, model_name: str = MODEL_NAME) -> Dict[str, Any]:
         return {'ok': False, 'error': str(e), 'model': model_name}
 
 
+async def asend_to_model(prompt: str, model_name: str = MODEL_NAME, context: str = None) -> Dict[str, Any]:
+    """Async variant of send_to_model: awaits the shared async AI client instead of blocking the event loop."""
+    try:
+        return await acall_gemini(prompt, model=model_name, response_mime_type='application/json', task='repricing', context=context)
+    except Exception as e:
+        return {'ok': False, 'error': str(e), 'model': model_name}
+
+
 class AuthMiddleware(BaseHTTPMiddleware):
     async def dispatch(self, request: Request, call_next):
         path = request.url.path
@@ -72,7 +95,8 @@ class ProductIn(BaseModel):
     id: str
     sku: Optional[str]
     price: float
-    cost: float
+    cost: Optional[float] = None  # None: taken from the cost table (COST_TABLE_PATH) by sku
+    category: Optional[str] = None
     our_lead_time_days: Optional[float] = 1
     our_rating: Optional[float] = 5.0
 
@@ -93,28 +117,245 @@ class RepriceRequest(BaseModel):
 
 @app.post('/api/reprice')
 async def reprice(req: RepriceRequest):
-    # get competitor prices either from payload or by fetching sources
-    competitors = []
+    # get competitor prices either from payload, by fetching sources, or from the competitor index
+    product = req.product.dict()
     if req.competitors:
         competitors = [c.dict() for c in req.competitors]
     elif req.competitor_sources:
-        competitors = fetch_competitor_prices(req.competitor_sources)
+        competitors = await afetch_competitor_prices(req.competitor_sources)
+    else:
+        return reprice_from_index(product, config=req.config)
 
-    product = req.product.dict()
     result = compute_new_price(product, competitors, config=req.config)
     return result
 
 
+# Competitor index: incremental offer updates instead of resending the competitor list
+class CompetitorOffersIn(BaseModel):
+    product_id: str
+    offers: List[CompetitorIn] = []
+    removed_sellers: List[str] = []
+
+
+@app.post('/api/competitors/offers')
+async def api_competitor_offers(req: CompetitorOffersIn):
+    index = get_competitor_index()
+    index.upsert_many(req.product_id, [o.dict() for o in req.offers])
+    for seller in req.removed_sellers:
+        index.remove(req.product_id, seller)
+    return {'ok': True, 'best': index.best(req.product_id), 'best_effective': index.best_effective(req.product_id)}
+
+
+@app.get('/api/competitors/{product_id}')
+async def api_competitors(product_id: str):
+    index = get_competitor_index()
+    return {'ok': True, 'offers': index.offers(product_id), 'best': index.best(product_id),
+            'best_effective': index.best_effective(product_id)}
+
+
+@app.post('/api/competitors/snapshot')
+async def api_competitors_snapshot():
+    path = save_competitor_index()
+    if not path:
+        raise HTTPException(status_code=400, detail='COMPETITOR_INDEX_PATH not set')
+    return {'ok': True, 'path': path, 'stats': get_competitor_index().stats()}
+
+
+@app.on_event('shutdown')
+def _save_competitor_index_on_shutdown():
+    try:
+        save_competitor_index()
+    except Exception:
+        logger.exception('Saving competitor index failed')
+
+
+# Incremental repricing: products are repriced when their inputs change (see modules/repricing/scheduler.py)
+class RepricingProductsIn(BaseModel):
+    products: List[Dict[str, Any]]
+    removed: List[str] = []
+
+
+@app.post('/api/repricing/products')
+async def api_repricing_products(req: RepricingProductsIn):
+    scheduler = get_repricing_scheduler()
+    for product in req.products:
+        if product.get('id') is None:
+            raise HTTPException(status_code=400, detail='each product needs an id')
+        scheduler.upsert_product(product)
+    for product_id in req.removed:
+        scheduler.remove_product(product_id)
+    return {'ok': True, 'queue_depth': scheduler.stats()['queue_depth']}
+
+
+@app.get('/api/repricing/scheduler')
+async def api_repricing_scheduler():
+    return {'ok': True, 'stats': get_repricing_scheduler().stats()}
+
+
+@app.get('/api/repricing/scheduler/{product_id}')
+async def api_repricing_scheduler_product(product_id: str):
+    return {'ok': True, 'status': get_repricing_scheduler().product_status(product_id)}
+
+
+@app.post('/api/repricing/scheduler/run')
+async def api_repricing_scheduler_run():
+    # one batch on demand (also works with the background loop disabled)
+    repriced = await asyncio.get_running_loop().run_in_executor(None, get_repricing_scheduler().run_once)
+    return {'ok': True, 'repriced': repriced, 'stats': get_repricing_scheduler().stats()}
+
+
+def _push_repriced_price(product_id: str, product: Dict[str, Any], result: Dict[str, Any]):
+    if result['new_price'] != number_or(product.get('price'), 0):
+        get_price_push_queue().enqueue(product.get('offer_id') or product_id, result['new_price'], product.get('currency') or 'PLN')
+
+
+@app.on_event('startup')
+def _start_repricing_scheduler():
+    if os.environ.get('PRICE_PUSH_ENABLED', '0') == '1':
+        get_price_push_queue().start()
+        get_repricing_scheduler().on_result = _push_repriced_price
+    if os.environ.get('REPRICING_SCHEDULER', '0') == '1':
+        get_repricing_scheduler().start()
+
+
+@app.on_event('shutdown')
+def _stop_repricing_scheduler():
+    get_repricing_scheduler().stop()
+    if os.environ.get('PRICE_PUSH_ENABLED', '0') == '1':
+        get_price_push_queue().stop()
+
+
+# Per-SKU costs and category fees (see modules/finance/cost_table.py)
+@app.on_event('startup')
+def _load_cost_table():
+    get_cost_table()
+
+
+@app.get('/api/finance/costs/{sku}')
+async def api_finance_costs(sku: str):
+    table = get_cost_table()
+    row = table.get(sku) if table else None
+    if row is None:
+        raise HTTPException(status_code=404, detail='SKU not in cost table')
+    costs = CostModel.from_product({'sku': sku})
+    return {'ok': True, 'row': row, 'cost_model': asdict(costs), 'min_price_10pct': costs.min_price(0.10)}
+
+
+@app.post('/api/finance/costs/reload')
+async def api_finance_costs_reload():
+    table = get_cost_table()
+    if table is None:
+        raise HTTPException(status_code=400, detail='COST_TABLE_PATH not set')
+    result = await asyncio.get_running_loop().run_in_executor(None, table.reload)
+    return {'ok': True, 'result': result, 'stats': table.stats()}
+
+
+# Profit and loss from processed orders (see modules/finance/pnl.py)
+@app.get('/api/finance/pnl')
+async def api_finance_pnl(start: Optional[str] = None, end: Optional[str] = None):
+    pnl = get_pnl()
+    out = {'ok': True, 'total': pnl.total(), 'stats': pnl.stats()}
+    if start or end:
+        try:
+            out['range'] = pnl.days(start or end, end or start)
+        except ValueError:
+            raise HTTPException(status_code=400, detail='start/end must be ISO dates')
+    return out
+
+
+@app.get('/api/finance/pnl/{dimension}')
+async def api_finance_pnl_breakdown(dimension: str, key: Optional[str] = None, sort_by: str = 'profit', limit: int = 50,
+                                    ascending: bool = False):
+    if dimension not in PNL_DIMENSIONS:
+        raise HTTPException(status_code=404, detail=f'dimension must be one of {list(PNL_DIMENSIONS)}')
+    if key is not None:
+        return {'ok': True, 'row': get_pnl().get(dimension, key)}
+    try:
+        return {'ok': True, 'rows': get_pnl().breakdown(dimension, sort_by=sort_by, limit=limit, ascending=ascending)}
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+
+
+@app.post('/api/finance/pnl/rebuild')
+async def api_finance_pnl_rebuild():
+    return {'ok': True, 'orders': rebuild_pnl(), 'total': get_pnl().total()}
+
+
+# Outbound price changes to Allegro (see modules/allegro/price_push.py)
+class PriceChangeIn(BaseModel):
+    offer_id: str
+    price: float
+    currency: str = 'PLN'
+
+
+class PricePushRequest(BaseModel):
+    changes: List[PriceChangeIn]
+
+
+@app.post('/api/prices/push')
+async def api_prices_push(req: PricePushRequest):
+    return get_price_push_queue().enqueue_many([c.dict() for c in req.changes])
+
+
+@app.get('/api/prices/push')
+async def api_prices_push_stats():
+    return {'ok': True, 'stats': get_price_push_queue().stats()}
+
+
+@app.get('/api/prices/push/{offer_id}')
+async def api_prices_push_offer(offer_id: str):
+    status = get_price_push_queue().offer_status(offer_id)
+    if status is None:
+        raise HTTPException(status_code=404, detail='no price change recorded for this offer')
+    return {'ok': True, 'status': status}
+
+
+class BulkRepriceItem(BaseModel):
+    product: ProductIn
+    competitors: Optional[List[CompetitorIn]] = None
+
+
+class BulkRepriceRequest(BaseModel):
+    # either items (same shape as /api/reprice) or columns (see modules/repricing/bulk.py COLUMNS) for large sweeps
+    items: Optional[List[BulkRepriceItem]] = None
+    columns: Optional[Dict[str, List[Optional[float]]]] = None  # best_price null = no competitor
+    config: Optional[Dict[str, Any]] = None
+
+
+@app.post('/api/reprice/bulk')
+async def reprice_bulk(req: BulkRepriceRequest):
+    if req.columns is not None:
+        if bulk_repricing.np is None:
+            raise HTTPException(status_code=501, detail='columnar repricing needs numpy')
+        if 'price' not in req.columns or len({len(v) for v in req.columns.values()}) > 1:
+            raise HTTPException(status_code=400, detail='columns must include price and have equal lengths')
+        try:
+            out = bulk_repricing.reprice_columns(req.columns, config=req.config)
+        except ValueError as e:
+            raise HTTPException(status_code=400, detail=str(e))
+        return {
+            'ok': True,
+            'count': len(out['new_price']),
+            'new_price': out['new_price'].tolist(),
+            'baseline': out['baseline'].tolist(),
+            'rule': out['rule'].tolist(),
+            'floored': out['floored'].tolist(),
+            'rules': {code: reason for code, (reason, _) in bulk_repricing.RULES.items()},
+        }
+
+    items = [{'product': i.product.dict(), 'competitors': [c.dict() for c in i.competitors or []]} for i in req.items or []]
+    results = bulk_repricing.reprice_bulk(items, config=req.config)
+    return {'ok': True, 'count': len(results), 'results': [dict(r, id=i['product']['id']) for i, r in zip(items, results)]}
+
+
 @app.post('/api/reprice_with_model')
 async def reprice_with_model(req: RepriceRequest):
     # build a prompt for the model
-    competitors = [c.dict() for c in req.competitors] if req.competitors else fetch_competitor_prices(req.competitor_sources or [])
-    prompt = REPRICING_PROMPT_TEMPLATE.format(persona=AGENT_PERSONA)
-    brief = REPRICING_PROMPT_BRIEF.format(persona=AGENT_PERSONA, product=req.product.json(), competitors=str(competitors), config=str(req.config or {}))
-    full = prompt + "\n\n" + brief
+    competitors = [c.dict() for c in req.competitors] if req.competitors else await afetch_competitor_prices(req.competitor_sources or [])
+    brief = build_repricing_brief(req.product.dict(), competitors, req.config)
 
-    # Call the LM (Gemini)
-    lm_resp = send_to_model(full, MODEL_NAME)
+    # Call the LM (Gemini); persona + rules go as cached context
+    lm_resp = await asend_to_model(brief, MODEL_NAME, context=REPRICING_CONTEXT)
 
     # Also compute deterministic recommendation
     deterministic = compute_new_price(req.product.dict(), competitors, config=req.config)
@@ -128,49 +369,19 @@ async def reprice_with_model(req: RepriceRequest):
 @app.post('/api/execute_repricing')
 async def execute_repricing(req: RepriceRequest):
     # 1) gather competitors
-    competitors = [c.dict() for c in req.competitors] if req.competitors else fetch_competitor_prices(req.competitor_sources or [])
-
-    # 2) deterministic baseline
-    deterministic = compute_new_price(req.product.dict(), competitors, config=req.config)
-
-    # 3) prepare prompt for Gemini including competitor data
-    brief = REPRICING_PROMPT_BRIEF.format(persona=AGENT_PERSONA, product=req.product.json(), competitors=str(competitors), config=str(req.config or {}))
-    prompt = REPRICING_PROMPT_TEMPLATE.format(persona=AGENT_PERSONA) + "\n\n" + brief
-
-    # 4) ask model
-    lm_resp = send_to_model(prompt, MODEL_NAME)
-
-    # 5) parse model suggestion
-    suggested_price = None
-    if lm_resp.get('ok') and isinstance(lm_resp.get('response'), dict):
-        suggested_price = lm_resp['response'].get('new_price')
-
-    # 6) enforce margin using calculator
-    final = {
-        'deterministic': deterministic,
-        'lm': lm_resp,
-        'final_price': None,
-        'final_reason': None,
-        'margin_ok': None
-    }
+    competitors = [c.dict() for c in req.competitors] if req.competitors else await afetch_competitor_prices(req.competitor_sources or [])
+    product = req.product.dict()
 
-    # prefer model suggestion if safe
-    candidate = deterministic['new_price']
-    if suggested_price is not None:
-        candidate = float(suggested_price)
+    # 2) decisive cases get the deterministic price; ambiguous ones also ask the model, under a deadline
+    def ask_model():
+        return asend_to_model(build_repricing_brief(product, competitors, req.config), MODEL_NAME, context=REPRICING_CONTEXT)
 
-    enforcement = enforce_margin_or_adjust(candidate, req.product.dict(), config=req.config)
-    final['final_price'] = enforcement['safe_price']
-    final['margin_ok'] = enforcement['ok']
-    final['final_reason'] = f"chosen_candidate={candidate}; margin={enforcement['margin']}";
+    return await hybrid_reprice(product, competitors, req.config, ask_model)
 
-    # if margin not ok and deterministic differs, fallback to deterministic safe price
-    if not enforcement['ok'] and deterministic.get('new_price') is not None:
-        fallback_enf = enforce_margin_or_adjust(deterministic['new_price'], req.product.dict(), config=req.config)
-        final['final_price'] = fallback_enf['safe_price']
-        final['final_reason'] += f"; fallback_to_deterministic={fallback_enf['safe_price']}"
 
-    return final
+@app.get('/api/repricing/gate')
+async def api_repricing_gate():
+    return get_gate_metrics().stats()
 
 
 # Negotiation endpoint
@@ -185,7 +396,7 @@ class NegotiateRequest(BaseModel):
 
 @app.post('/api/negotiate')
 async def api_negotiate(req: NegotiateRequest):
-    result = negotiate(req.offer_id, req.client_offer, req.product.dict(), req.customer_history or {}, req.inventory_count or 0, config=req.config)
+    result = await anegotiate(req.offer_id, req.client_offer, req.product.dict(), req.customer_history or {}, req.inventory_count or 0, config=req.config)
     return result
 
 
@@ -255,15 +466,120 @@ async def api_orders_process(req: OrderIn):
         raise HTTPException(status_code=500, detail=str(e))
 
 
+class OrderBatchIn(BaseModel):
+    orders: List[Dict[str, Any]]
+
+
+@app.post('/api/orders/process_batch')
+async def api_orders_process_batch(req: OrderBatchIn):
+    """Queue many orders for process_new_order on the worker pool; poll /api/orders/jobs/{job_id}."""
+    out = get_order_batch_pool().submit(req.orders)
+    if out.get('error') == 'queue_full':
+        return JSONResponse(status_code=429, content=out, headers={'Retry-After': str(out['retry_after_s'])})
+    if out.get('error') == 'batch_too_large':
+        return JSONResponse(status_code=413, content=out)
+    return JSONResponse(status_code=202, content=out)
+
+
+@app.get('/api/orders/process_batch')
+async def api_orders_process_batch_stats():
+    return {'ok': True, 'stats': get_order_batch_pool().stats()}
+
+
+@app.get('/api/orders/jobs/{job_id}')
+async def api_orders_job(job_id: str):
+    job = get_order_batch_pool().job(job_id)
+    if job is None:
+        raise HTTPException(status_code=404, detail='unknown job')
+    return {'ok': True, 'job': job}
+
+
+@app.on_event('shutdown')
+def _stop_order_batch_pool():
+    get_order_batch_pool().stop()
+
+
+# Durable workflow queue (see modules/orders/job_queue.py); workers may also run in separate processes
+@app.post('/api/orders/queue')
+async def api_orders_queue(req: OrderBatchIn):
+    return get_order_job_queue().enqueue_many(req.orders)
+
+
+@app.get('/api/orders/queue')
+async def api_orders_queue_stats():
+    return {'ok': True, 'stats': get_order_job_queue().stats()}
+
+
+@app.get('/api/orders/queue/{order_id}')
+async def api_orders_queue_job(order_id: str):
+    job = get_order_job_queue().job(order_id)
+    if job is None:
+        raise HTTPException(status_code=404, detail='no workflow job for this order')
+    return {'ok': True, 'job': job}
+
+
+def _order_jobs_enabled() -> bool:
+    # order sync hands its orders to the queue, so it needs the workers too
+    return os.environ.get('ORDER_JOBS_ENABLED', '0') == '1' or os.environ.get('ORDER_SYNC_ENABLED', '0') == '1'
+
+
+@app.on_event('startup')
+def _start_order_job_queue():
+    if _order_jobs_enabled():
+        get_order_job_queue().start(workers=int(os.environ.get('ORDER_JOBS_WORKERS', '2')))
+
+
+@app.on_event('shutdown')
+def _stop_order_job_queue():
+    if _order_jobs_enabled():
+        get_order_job_queue().stop()
+
+
+# Incremental order intake from Allegro's order events feed (see modules/allegro/order_sync.py)
+@app.post('/api/orders/sync')
+async def api_orders_sync():
+    last_run = await asyncio.get_running_loop().run_in_executor(None, get_order_sync().run_once)
+    return {'ok': last_run.get('result') == 'ok', 'run': last_run}
+
+
+@app.get('/api/orders/sync')
+async def api_orders_sync_stats():
+    return {'ok': True, 'stats': get_order_sync().stats()}
+
+
+@app.on_event('startup')
+def _start_order_sync():
+    if os.environ.get('ORDER_SYNC_ENABLED', '0') == '1':
+        get_order_sync().start()
+
+
+@app.on_event('shutdown')
+def _stop_order_sync():
+    if os.environ.get('ORDER_SYNC_ENABLED', '0') == '1':
+        get_order_sync().stop()
+
+
 @app.get('/api/orders/dashboard')
-async def api_orders_dashboard():
+async def api_orders_dashboard(limit: int = 50, cursor: Optional[str] = None, status: Optional[str] = None,
+                               risk: Optional[bool] = None, since: Optional[float] = None, until: Optional[float] = None):
     try:
-        data = get_dashboard_orders()
-        return {'ok': True, 'orders': data}
+        page = get_dashboard_orders(limit=max(1, min(limit, 500)), cursor=cursor, status=status, risk=risk,
+                                    since=since, until=until)
+        return {'ok': True, 'orders': page['orders'], 'next_cursor': page['next_cursor']}
+    except ValueError as e:
+        return JSONResponse(status_code=400, content={'ok': False, 'error': str(e)})
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
 
 
+@app.get('/api/orders/{order_id}')
+async def api_orders_get(order_id: str, raw: bool = False):
+    order = get_order(order_id, with_raw=raw)
+    if order is None:
+        return JSONResponse(status_code=404, content={'ok': False, 'error': 'order_not_found'})
+    return {'ok': True, 'order': order}
+
+
 # Allegro quality endpoints
 class DiscussionIn(BaseModel):
     discussion: Dict[str, Any]
@@ -281,15 +597,34 @@ async def api_analyze_discussion(req: DiscussionIn):
 @app.post('/api/allegro/dispute')
 async def api_allegro_dispute(req: DiscussionIn):
     try:
-        dispute_text = req.discussion.get('text') or '"
-'.join(m.get('text','') for m in req.discussion.get('messages',[]))
+        dispute_text = req.discussion.get('text') or '\n'.join(m.get('text','') for m in req.discussion.get('messages',[]))
         order_ctx = req.discussion.get('order_context', {})
-        out = handle_dispute(dispute_text, order_ctx)
+        out = await ahandle_dispute(dispute_text, order_ctx)
         return {'ok': True, 'result': out}
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
 
 
+# Customer message reply streamed as Server-Sent Events: 'delta' events carry reply text as the
+# model writes it, the closing 'final' event has the structured result (action, human_required)
+class SmartReplyIn(BaseModel):
+    message: Dict[str, Any]
+    context: Dict[str, Any] = {}
+
+
+@app.post('/api/messages/reply/stream')
+async def api_messages_reply_stream(req: SmartReplyIn):
+    def events():
+        try:
+            for event in stream_smart_reply(req.message, req.context):
+                yield f"event: {event['type']}\ndata: {json.dumps(event, ensure_ascii=False, default=str)}\n\n"
+        except Exception as e:
+            yield f"event: error\ndata: {json.dumps({'ok': False, 'error': str(e)})}\n\n"
+
+    return StreamingResponse(events(), media_type='text/event-stream',
+                             headers={'Cache-Control': 'no-cache', 'X-Accel-Buffering': 'no'})
+
+
 @app.post('/api/orders/mark_delivered')
 async def api_orders_mark_delivered(req: OrderIn):
     try:
@@ -320,7 +655,7 @@ async def api_reviews_run_pending():
 # Ads optimize endpoint
 class AdsOptimizeIn(BaseModel):
     product_id: str
-    current_margin: float
+    current_margin: Optional[float] = None  # None: computed from product_info
     product_info: Optional[Dict[str, Any]] = None
 
 
@@ -345,3 +680,21 @@ async def api_quality_score():
         return {'ok': True, 'score': score, 'warnings': warnings}
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
+
+
+# AI layer runtime stats (cache hit/miss per task)
+@app.get('/api/ai/stats')
+async def api_ai_stats():
+    try:
+        return {'ok': True, 'stats': get_ai_stats()}
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=str(e))
+
+
+# AI circuit breaker state (closed / open / half_open) with rolling error rate and p95 latency
+@app.get('/api/ai/circuit')
+async def api_ai_circuit():
+    try:
+        return {'ok': True, 'circuit': get_circuit_state()}
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=str(e))
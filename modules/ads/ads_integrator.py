@@ -1,6 +1,8 @@
 from typing import Dict, Any
 import logging
 
+from modules.finance.calculator import CostModel
+
 logger = logging.getLogger(__name__)
 
 
@@ -21,7 +23,10 @@ def check_and_flag_ads(sku: str, margin: float, threshold: float = 0.05) -> Dict
     return {'ok': True, 'flag': None}
 
 
-def evaluate_product_for_ads(product: Dict[str, Any], margin: float, config: Dict[str, Any] = None) -> Dict[str, Any]:
+def evaluate_product_for_ads(product: Dict[str, Any], margin: float = None, config: Dict[str, Any] = None) -> Dict[str, Any]:
+    """margin=None: the product's own margin at its price (CostModel.from_product)."""
     cfg = config or {}
+    if margin is None:
+        margin = CostModel.from_product(product).margin(float(product.get('price', 0)))
     threshold = float(cfg.get('min_margin_pct_for_ads', 0.05))
     return check_and_flag_ads(product.get('sku') or product.get('id'), margin, threshold=threshold)
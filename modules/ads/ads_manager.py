@@ -1,7 +1,7 @@
 from typing import Dict, Any
 import logging
 
-from modules.finance.calculator import calculate_margin
+from modules.finance.calculator import CostModel
 
 logger = logging.getLogger(__name__)
 
@@ -9,12 +9,15 @@ logger = logging.getLogger(__name__)
 def adjust_ads_based_on_margin(product_id: str, current_margin: float, product_info: Dict[str, Any] = None, config: Dict[str, Any] = None) -> Dict[str, Any]:
     """Decide ad action based on margin and product performance.
 
+    current_margin=None computes it from product_info (price + cost fields, see CostModel.from_product).
     Returns: {ok, action: 'LOWER_CPC'|'PAUSE_ADS'|'BOOST_ADS'|None, reason}
     """
     cfg = config or {}
     pause_threshold = float(cfg.get('pause_margin_pct', 0.07))
     boost_threshold = float(cfg.get('boost_margin_pct', 0.20))
 
+    if current_margin is None and product_info:
+        current_margin = CostModel.from_product(product_info).margin(float(product_info.get('price', 0)))
     try:
         m = float(current_margin)
     except Exception:
@@ -1,12 +1,46 @@
+from typing import Dict, Any
 from modules.ai.base import BaseAIHandler
 
 
-# Singleton handler used by modules. Configurable via env if needed.
-_DEFAULT_MODEL = 'models/gemini-3-pro-preview'
+# Singleton handler used by modules. Calls without an explicit model are routed by task (modules.ai.router).
 _DEFAULT_RESPONSE_MIME = 'application/json'
-_handler = BaseAIHandler(model=_DEFAULT_MODEL, response_mime_type=_DEFAULT_RESPONSE_MIME)
+_handler = BaseAIHandler(response_mime_type=_DEFAULT_RESPONSE_MIME)
 
 
-def call_gemini(prompt: str, model: str = None, response_mime_type: str = None) -> Dict[str, Any]:
-    """Unified wrapper to call the shared AI handler. Returns dict with 'ok' and 'response' or 'error'."""
-    return _handler.generate(prompt, model=model, response_mime_type=response_mime_type)
+def call_gemini(prompt: str, model: str = None, response_mime_type: str = None, task: str = None,
+                timeout: float = None, context: str = None) -> Dict[str, Any]:
+    """Unified wrapper to call the shared AI handler. Returns dict with 'ok' and 'response' or 'error'.
+
+    context: name of a registered static prefix (modules.ai.context_cache); prompt is then only the per-request part.
+    """
+    return _handler.generate(prompt, model=model, response_mime_type=response_mime_type, task=task, timeout=timeout,
+                             context=context)
+
+
+async def acall_gemini(prompt: str, model: str = None, response_mime_type: str = None, task: str = None,
+                       timeout: float = None, context: str = None) -> Dict[str, Any]:
+    """Async variant of call_gemini; does not block the event loop while waiting on the model."""
+    return await _handler.agenerate(prompt, model=model, response_mime_type=response_mime_type, task=task, timeout=timeout,
+                                    context=context)
+
+
+def get_ai_stats() -> Dict[str, Any]:
+    """Runtime counters of the shared AI layer (cache, async client load, coalesced calls, circuit state, model tiers)."""
+    from modules.ai.cache import get_cache
+    from modules.ai.async_client import get_async_client
+    from modules.ai.singleflight import get_singleflight
+    from modules.ai.circuit import get_breaker
+    from modules.ai.base import get_backend
+    from modules.ai.prompt_builder import get_prompt_stats
+    from modules.ai.router import get_router
+    from modules.ai.context_cache import get_context_registry
+    backend = get_backend()
+    return {'backend': {'name': backend.name, **(backend.stats() if hasattr(backend, 'stats') else {})},
+            'cache': get_cache().stats(), 'async_client': get_async_client().stats(), 'singleflight': get_singleflight().stats(),
+            'circuit': get_breaker().state(), 'prompts': get_prompt_stats(),
+            'router': get_router().stats(), 'contexts': get_context_registry().stats()}
+
+
+def get_circuit_state() -> Dict[str, Any]:
+    from modules.ai.circuit import get_breaker
+    return get_breaker().state()
@@ -0,0 +1,94 @@
+import os
+import asyncio
+import logging
+import threading
+import weakref
+from concurrent.futures import ThreadPoolExecutor
+from typing import Dict, Any, Callable, Awaitable, Optional
+
+logger = logging.getLogger(__name__)
+
+
+class AsyncAIClient:
+    """Shared gateway for async model calls used by BaseAIHandler.agenerate.
+
+    Bounds the number of concurrent model round-trips per event loop (semaphore),
+    applies a per-call timeout and owns the thread pool used when the provider
+    SDK has no native coroutine API. Cancelling the awaiting task releases the
+    slot immediately; a blocking SDK call already running in the pool finishes
+    in the background and its result is discarded.
+    """
+
+    def __init__(self, max_concurrency: int = None, timeout_s: float = None):
+        self.max_concurrency = int(max_concurrency or os.environ.get('AI_MAX_CONCURRENCY', '8'))
+        self.timeout_s = float(timeout_s or os.environ.get('AI_TIMEOUT_S', '30'))
+        self.executor = ThreadPoolExecutor(max_workers=self.max_concurrency, thread_name_prefix='ai-call')
+        self._semaphores: 'weakref.WeakKeyDictionary' = weakref.WeakKeyDictionary()
+        self._lock = threading.Lock()
+        self._stats = {'calls': 0, 'in_flight': 0, 'waiting': 0, 'completed': 0, 'timeouts': 0, 'cancelled': 0}
+
+    def _semaphore(self) -> asyncio.Semaphore:
+        loop = asyncio.get_running_loop()
+        sem = self._semaphores.get(loop)
+        if sem is None:
+            sem = asyncio.Semaphore(self.max_concurrency)
+            self._semaphores[loop] = sem
+        return sem
+
+    def _bump(self, field: str, delta: int = 1):
+        with self._lock:
+            self._stats[field] += delta
+
+    async def run(self, coro_fn: Callable[[], Awaitable[Dict[str, Any]]], timeout: float = None) -> Dict[str, Any]:
+        """Await coro_fn() inside a concurrency slot. Raises asyncio.TimeoutError after `timeout` seconds."""
+        self._bump('calls')
+        self._bump('waiting')
+        sem = self._semaphore()
+        try:
+            await sem.acquire()
+        finally:
+            self._bump('waiting', -1)
+        self._bump('in_flight')
+        try:
+            result = await asyncio.wait_for(coro_fn(), timeout or self.timeout_s)
+            self._bump('completed')
+            return result
+        except asyncio.TimeoutError:
+            self._bump('timeouts')
+            raise
+        except asyncio.CancelledError:
+            self._bump('cancelled')
+            raise
+        finally:
+            self._bump('in_flight', -1)
+            sem.release()
+
+    async def run_blocking(self, fn: Callable[..., Any], *args) -> Any:
+        """Run a blocking callable on the shared AI thread pool without blocking the event loop."""
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(self.executor, lambda: fn(*args))
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            out = dict(self._stats)
+        out['max_concurrency'] = self.max_concurrency
+        out['timeout_s'] = self.timeout_s
+        return out
+
+
+_client: Optional[AsyncAIClient] = None
+_client_lock = threading.Lock()
+
+
+def get_async_client() -> AsyncAIClient:
+    global _client
+    if _client is None:
+        with _client_lock:
+            if _client is None:
+                _client = AsyncAIClient()
+    return _client
+
+
+def set_async_client(client: AsyncAIClient):
+    global _client
+    _client = client
@@ -0,0 +1,191 @@
+import copy
+import json
+import time
+import logging
+import threading
+import codecs
+import http.client
+from urllib.parse import urlparse
+from typing import Dict, Any, Optional, Iterator
+
+from modules.ai.base import AIBackend, parse_model_text
+from modules.ai.cache import canonical_prompt, make_key
+
+logger = logging.getLogger(__name__)
+
+
+class HTTPBackend(AIBackend):
+    """Talks to the local stand-in server (modules.ai.fake_server) over keep-alive HTTP.
+
+    POST {base_url}/v1/generate  {model, task, response_mime_type, prompt, context_id?} -> {text}
+    POST {base_url}/v1/stream    same body -> chunked text/plain, the answer text as it is generated
+    POST {base_url}/v1/contexts  {model, text, ttl_s} -> {id}   (static prefix stored server-side)
+    One persistent connection per thread, so load tests measure model latency, not TCP setup.
+    """
+
+    name = 'http'
+
+    def __init__(self, base_url: str, timeout_s: float = 60.0):
+        parsed = urlparse(base_url)
+        self.base_url = base_url
+        self.host = parsed.hostname or '127.0.0.1'
+        self.port = parsed.port or 80
+        self.timeout_s = timeout_s
+        self._local = threading.local()
+
+    def _conn(self) -> http.client.HTTPConnection:
+        conn = getattr(self._local, 'conn', None)
+        if conn is None:
+            conn = http.client.HTTPConnection(self.host, self.port, timeout=self.timeout_s)
+            self._local.conn = conn
+        return conn
+
+    def _post(self, path: str, body: Dict[str, Any]) -> tuple:
+        data = json.dumps(body, ensure_ascii=False).encode('utf-8')
+        headers = {'Content-Type': 'application/json'}
+        for attempt in range(2):
+            conn = self._conn()
+            try:
+                conn.request('POST', path, body=data, headers=headers)
+                resp = conn.getresponse()
+                return resp.status, resp.read()
+            except (http.client.HTTPException, ConnectionError, OSError):
+                # stale keep-alive connection: reconnect once
+                conn.close()
+                self._local.conn = None
+                if attempt:
+                    raise
+        return 599, b''
+
+    def generate(self, model: str, prompt: Any, response_mime_type: str, task: str = None,
+                 cached_context: str = None) -> Dict[str, Any]:
+        body = {
+            'model': model,
+            'task': task or 'default',
+            'response_mime_type': response_mime_type,
+            'prompt': prompt if isinstance(prompt, str) else canonical_prompt(prompt),
+        }
+        if cached_context:
+            body['context_id'] = cached_context
+        status, raw = self._post('/v1/generate', body)
+        if status == 410:
+            return {'ok': False, 'error': f'cached context {cached_context} expired', 'context_missing': True}
+        if status != 200:
+            return {'ok': False, 'error': f'stand-in server returned {status}: {raw[:200].decode("utf-8", "replace")}'}
+        return parse_model_text(json.loads(raw).get('text'), response_mime_type)
+
+    def stream(self, model: str, prompt: Any, response_mime_type: str, task: str = None) -> Iterator[str]:
+        # own connection: the thread-local keep-alive one must not be left half-read if the consumer stops early
+        conn = http.client.HTTPConnection(self.host, self.port, timeout=self.timeout_s)
+        try:
+            conn.request('POST', '/v1/stream', body=json.dumps({
+                'model': model,
+                'task': task or 'default',
+                'response_mime_type': response_mime_type,
+                'prompt': prompt if isinstance(prompt, str) else canonical_prompt(prompt),
+            }, ensure_ascii=False).encode('utf-8'), headers={'Content-Type': 'application/json'})
+            resp = conn.getresponse()
+            if resp.status != 200:
+                raise RuntimeError(f'stand-in server returned {resp.status}: {resp.read()[:200].decode("utf-8", "replace")}')
+            decoder = codecs.getincrementaldecoder('utf-8')()
+            while True:
+                data = resp.read1(4096)
+                if not data:
+                    break
+                text = decoder.decode(data)
+                if text:
+                    yield text
+            tail = decoder.decode(b'', final=True)
+            if tail:
+                yield tail
+        finally:
+            conn.close()
+
+    def create_cached_context(self, model: str, text: str, ttl_s: float = 3600) -> Optional[str]:
+        status, raw = self._post('/v1/contexts', {'model': model, 'text': text, 'ttl_s': ttl_s})
+        if status != 200:
+            logger.warning('Stand-in server refused cached context (%s)', status)
+            return None
+        return json.loads(raw).get('id')
+
+
+class CassetteBackend(AIBackend):
+    """Record/replay backend backed by a JSONL file.
+
+    mode='record': call `inner`, append each successful result to the cassette.
+    mode='replay': answer only from the cassette; unknown prompts return {'ok': False}.
+    mode='auto':   replay when recorded, otherwise call `inner` and record.
+    With replay_latency=True replays sleep for the latency measured at record time.
+    """
+
+    name = 'cassette'
+
+    def __init__(self, path: str, mode: str = 'replay', inner: AIBackend = None, replay_latency: bool = False):
+        if mode not in ('record', 'replay', 'auto'):
+            raise ValueError(f'unknown cassette mode {mode}')
+        if mode != 'replay' and inner is None:
+            raise ValueError('record/auto mode needs an inner backend')
+        self.path = path
+        self.mode = mode
+        self.inner = inner
+        self.replay_latency = replay_latency
+        self._lock = threading.Lock()
+        self._entries: Dict[str, Dict[str, Any]] = {}
+        self._stats = {'replayed': 0, 'recorded': 0, 'missed': 0}
+        self._load()
+
+    def _load(self):
+        try:
+            with open(self.path, 'r', encoding='utf-8') as f:
+                for line in f:
+                    line = line.strip()
+                    if not line:
+                        continue
+                    entry = json.loads(line)
+                    self._entries[entry['key']] = entry
+        except FileNotFoundError:
+            pass
+        logger.info('Cassette %s: %d recorded responses', self.path, len(self._entries))
+
+    def _lookup(self, key: str) -> Optional[Dict[str, Any]]:
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None:
+                self._stats['replayed'] += 1
+            return entry
+
+    def _record(self, key: str, model: str, task: str, latency_s: float, result: Dict[str, Any]):
+        entry = {'key': key, 'model': model, 'task': task, 'latency_s': round(latency_s, 4), 'result': copy.deepcopy(result)}
+        with self._lock:
+            self._entries[key] = entry
+            self._stats['recorded'] += 1
+            with open(self.path, 'a', encoding='utf-8') as f:
+                f.write(json.dumps(entry, ensure_ascii=False, default=str) + '\n')
+
+    def generate(self, model: str, prompt: Any, response_mime_type: str, task: str = None,
+                 cached_context: str = None) -> Dict[str, Any]:
+        # no create_cached_context here: prompts always arrive complete, so cassette keys stay stable
+        key = make_key(model, response_mime_type, prompt)
+        if self.mode != 'record':
+            entry = self._lookup(key)
+            if entry is not None:
+                if self.replay_latency:
+                    time.sleep(entry.get('latency_s', 0))
+                # callers (e.g. the model router) mutate results; the recorded one must stay as it was
+                return copy.deepcopy(entry['result'])
+            if self.mode == 'replay':
+                with self._lock:
+                    self._stats['missed'] += 1
+                return {'ok': False, 'error': f'cassette miss ({task or "default"})'}
+
+        start = time.monotonic()
+        result = self.inner.generate(model, prompt, response_mime_type, task=task)
+        if result.get('ok'):
+            self._record(key, model, task, time.monotonic() - start, result)
+        return result
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            out = dict(self._stats)
+            out['entries'] = len(self._entries)
+        return out
@@ -1,8 +1,21 @@
 import os
+import copy
 import json
+import time
+import asyncio
 import logging
-from typing import Dict, Any
+import threading
+from concurrent.futures import ThreadPoolExecutor, TimeoutError as FutureTimeout
+from typing import Dict, Any, Optional, Iterator
 import socket
+from datetime import timedelta
+
+from modules.ai.cache import get_cache, make_key
+from modules.ai.async_client import get_async_client
+from modules.ai.singleflight import get_singleflight, LeaderCancelled
+from modules.ai.circuit import get_breaker, deadline_for
+from modules.ai.router import get_router
+from modules.ai.context_cache import get_context_registry
 
 try:
     import google.generativeai as genai
@@ -11,28 +24,70 @@ except Exception:
 
 logger = logging.getLogger(__name__)
 
+# Sync calls run here so generate() can give up at the task deadline; an abandoned call finishes in the background.
+_SYNC_WORKERS = int(os.environ.get('AI_SYNC_WORKERS', '32'))
+_deadline_pool = ThreadPoolExecutor(max_workers=_SYNC_WORKERS, thread_name_prefix='ai-sync')
+# one slot per pool thread, held until the model call returns (also for abandoned calls): a call only
+# starts when a thread is free, so it never waits in the pool's queue and the deadline bounds the whole wait
+_deadline_slots = threading.BoundedSemaphore(_SYNC_WORKERS)
 
-class BaseAIHandler:
-    def __init__(self, model: str = 'models/gemini-3-pro-preview', response_mime_type: str = 'application/json'):
-        self.model = model
-        self.response_mime_type = response_mime_type
 
-    def generate(self, prompt: str, model: str = None, response_mime_type: str = None) -> Dict[str, Any]:
-        model = model or self.model
-        response_mime_type = response_mime_type or self.response_mime_type
+class AIBackend:
+    """Model provider interface used by BaseAIHandler.
+
+    generate() returns {'ok': True, 'response': parsed} or {'ok': False, 'error': str}.
+    Implementations: GeminiBackend (real client), modules.ai.backends.CassetteBackend
+    (record/replay) and modules.ai.backends.HTTPBackend (local stand-in server).
+    """
+
+    name = 'base'
+
+    def generate(self, model: str, prompt: Any, response_mime_type: str, task: str = None,
+                 cached_context: str = None) -> Dict[str, Any]:
+        raise NotImplementedError
+
+    async def agenerate(self, model: str, prompt: Any, response_mime_type: str, task: str = None,
+                        cached_context: str = None) -> Dict[str, Any]:
+        # default: blocking call on the shared AI pool
+        return await get_async_client().run_blocking(self.generate, model, prompt, response_mime_type, task, cached_context)
+
+    def stream(self, model: str, prompt: Any, response_mime_type: str, task: str = None) -> Iterator[str]:
+        """Yield raw response text as it is generated; raises on failure.
+
+        Default for providers without streaming: one chunk with the whole answer.
+        """
+        out = self.generate(model, prompt, response_mime_type, task=task)
+        if not out.get('ok'):
+            raise RuntimeError(out.get('error') or 'model call failed')
+        response = out.get('response')
+        if isinstance(response, dict) and set(response) == {'raw'}:
+            yield response['raw'] or ''
+        else:
+            yield json.dumps(response, ensure_ascii=False)
+
+    def create_cached_context(self, model: str, text: str, ttl_s: float = 3600) -> Optional[str]:
+        """Register a static prompt prefix with the provider; returns a handle for generate(cached_context=...).
+
+        None means unsupported: the caller sends the prefix inline. A generate() answer with
+        'context_missing': True means the handle expired on the provider side.
+        """
+        return None
 
-        # Heartbeat / host check: prevent running AI on unauthorized hosts
-        allowed_host = os.environ.get('ALLOWED_HOST')
-        if allowed_host:
-            try:
-                current = socket.gethostname()
-                if allowed_host != current:
-                    msg = f'Host {current} not allowed to run AI (allowed: {allowed_host})'
-                    logger.error(msg)
-                    return {'ok': False, 'error': msg}
-            except Exception:
-                logger.exception('Host check failed')
 
+def parse_model_text(text: Optional[str], response_mime_type: str) -> Dict[str, Any]:
+    if response_mime_type == 'application/json' and text:
+        try:
+            return {'ok': True, 'response': json.loads(text)}
+        except Exception:
+            logger.exception('Failed to parse JSON from model response')
+            return {'ok': True, 'response': {'raw': text}}
+    return {'ok': True, 'response': {'raw': text}}
+
+
+class GeminiBackend(AIBackend):
+    name = 'gemini'
+
+    def _configure_client(self) -> Optional[Dict[str, Any]]:
         if genai is None:
             msg = 'google.generativeai not installed'
             logger.error(msg)
@@ -45,38 +100,335 @@ class BaseAIHandler:
             logger.error(msg)
             return {'ok': False, 'error': msg}
 
-        try:
-            genai.configure(api_key=api_key)
-            response = genai.generate(model=model, prompt=prompt, response_mime_type=response_mime_type)
+        genai.configure(api_key=api_key)
+        return None
+
+    def generate(self, model: str, prompt: Any, response_mime_type: str, task: str = None,
+                 cached_context: str = None) -> Dict[str, Any]:
+        error = self._configure_client()
+        if error:
+            return error
+        extra = {'cached_content': cached_context} if cached_context else {}
+        response = genai.generate(model=model, prompt=prompt, response_mime_type=response_mime_type, **extra)
+        return self._parse_response(response, response_mime_type)
+
+    async def agenerate(self, model: str, prompt: Any, response_mime_type: str, task: str = None,
+                        cached_context: str = None) -> Dict[str, Any]:
+        # Use the SDK coroutine when available, otherwise the blocking call on the shared AI pool
+        native = getattr(genai, 'generate_async', None) if genai is not None else None
+        if native is None:
+            return await super().agenerate(model, prompt, response_mime_type, task=task, cached_context=cached_context)
+        error = self._configure_client()
+        if error:
+            return error
+        extra = {'cached_content': cached_context} if cached_context else {}
+        response = await native(model=model, prompt=prompt, response_mime_type=response_mime_type, **extra)
+        return self._parse_response(response, response_mime_type)
 
-            text = None
-            if hasattr(response, 'text'):
-                text = response.text
-            else:
-                text = getattr(response, 'content', None) or str(response)
+    def stream(self, model: str, prompt: Any, response_mime_type: str, task: str = None) -> Iterator[str]:
+        error = self._configure_client()
+        if error:
+            raise RuntimeError(error['error'])
+        for chunk in genai.generate(model=model, prompt=prompt, response_mime_type=response_mime_type, stream=True):
+            text = getattr(chunk, 'text', None)
+            if text:
+                yield text
 
-            parsed = None
-            if response_mime_type == 'application/json' and text:
+    def create_cached_context(self, model: str, text: str, ttl_s: float = 3600) -> Optional[str]:
+        caching = getattr(genai, 'caching', None) if genai is not None else None
+        if caching is None or self._configure_client():
+            return None
+        cached = caching.CachedContent.create(model=model, system_instruction=text, ttl=timedelta(seconds=ttl_s))
+        return getattr(cached, 'name', None)
+
+    def _parse_response(self, response: Any, response_mime_type: str) -> Dict[str, Any]:
+        text = None
+        if hasattr(response, 'text'):
+            text = response.text
+        else:
+            text = getattr(response, 'content', None) or str(response)
+
+        parsed = None
+        if response_mime_type == 'application/json' and text:
+            try:
+                parsed = json.loads(text)
+            except Exception:
                 try:
-                    parsed = json.loads(text)
+                    if hasattr(response, 'candidates') and len(response.candidates) > 0:
+                        cand = response.candidates[0]
+                        parsed = json.loads(cand.get('content', cand.get('text', '{}')))
                 except Exception:
-                    try:
-                        if hasattr(response, 'candidates') and len(response.candidates) > 0:
-                            cand = response.candidates[0]
-                            parsed = json.loads(cand.get('content', cand.get('text', '{}')))
-                    except Exception:
-                        logger.exception('Failed to parse JSON from model response')
-                        parsed = {'raw': text}
-            else:
-                parsed = {'raw': text}
+                    logger.exception('Failed to parse JSON from model response')
+                    parsed = {'raw': text}
+        else:
+            parsed = {'raw': text}
+
+        try:
+            if hasattr(response, 'metadata'):
+                logger.info('Model metadata: %s', getattr(response, 'metadata'))
+        except Exception:
+            pass
+
+        return {'ok': True, 'response': parsed}
+
+
+class BaseAIHandler:
+    def __init__(self, model: str = None, response_mime_type: str = 'application/json', task: str = None):
+        # model=None: pick the model tier per task (modules.ai.router), escalating on unusable output
+        self.model = model
+        self.response_mime_type = response_mime_type
+        # task name selects the cache TTL and latency budget (modules.ai.cache / modules.ai.circuit)
+        self.task = task or 'default'
+
+    def generate(self, prompt: str, model: str = None, response_mime_type: str = None, task: str = None,
+                 timeout: float = None, context: str = None) -> Dict[str, Any]:
+        """context: name of a static prefix registered in modules.ai.context_cache; prompt is then only the suffix."""
+        model = model or self.model
+        response_mime_type = response_mime_type or self.response_mime_type
+        task = task or self.task
+        if model:
+            return self._generate(prompt, model, response_mime_type, task, timeout, context)
+        return get_router().generate(task, lambda m: self._generate(prompt, m, response_mime_type, task, timeout, context))
+
+    def _generate(self, prompt: str, model: str, response_mime_type: str, task: str, timeout: float = None,
+                  context: str = None) -> Dict[str, Any]:
+        denied = self._check_host()
+        if denied:
+            return denied
+
+        cache = get_cache()
+        key = make_key(model, response_mime_type, get_context_registry().key_prompt(context, prompt) if context else prompt)
+        cached = cache.get(key, task)
+        if cached is not None:
+            return cached
+
+        deadline = timeout or deadline_for(task)
 
+        # concurrent identical prompts share one model call
+        def call():
+            if not _deadline_slots.acquire(blocking=False):
+                # every worker is busy (e.g. hung model calls): fail fast instead of queueing past the deadline
+                logger.warning('AI sync workers busy, skipping model call (%s)', task)
+                return {'ok': False, 'error': 'AI sync workers busy', 'circuit_open': True}
+            breaker = get_breaker()
+            if not breaker.allow():
+                _deadline_slots.release()
+                return {'ok': False, 'error': 'AI circuit open', 'circuit_open': True}
+
+            def run():
+                try:
+                    return self._call_model(prompt, model, response_mime_type, task, context)
+                finally:
+                    _deadline_slots.release()
+
+            start = time.monotonic()
+            try:
+                out = _deadline_pool.submit(run).result(timeout=deadline)
+            except FutureTimeout:
+                # the call keeps running in its thread (and holds its slot) until the model returns
+                msg = f'Model call exceeded {deadline}s deadline ({task})'
+                logger.warning(msg)
+                out = {'ok': False, 'error': msg, 'timeout': True}
+            breaker.record(out.get('ok', False), time.monotonic() - start)
+            if out.get('ok'):
+                cache.set(key, out, task)
+            return out
+
+        result, shared = get_singleflight().do(key, call)
+        return copy.deepcopy(result) if shared else result
+
+    async def agenerate(self, prompt: str, model: str = None, response_mime_type: str = None, task: str = None,
+                        timeout: float = None, context: str = None) -> Dict[str, Any]:
+        """Coroutine counterpart of generate() for async callers (FastAPI handlers).
+
+        Runs through the shared AsyncAIClient: bounded concurrency (AI_MAX_CONCURRENCY)
+        and a per-call timeout (task deadline capped by AI_TIMEOUT_S unless `timeout` is given).
+        """
+        model = model or self.model
+        response_mime_type = response_mime_type or self.response_mime_type
+        task = task or self.task
+        if model:
+            return await self._agenerate(prompt, model, response_mime_type, task, timeout, context)
+        return await get_router().agenerate(task, lambda m: self._agenerate(prompt, m, response_mime_type, task, timeout, context))
+
+    async def _agenerate(self, prompt: str, model: str, response_mime_type: str, task: str,
+                         timeout: float = None, context: str = None) -> Dict[str, Any]:
+        denied = self._check_host()
+        if denied:
+            return denied
+
+        cache = get_cache()
+        key = make_key(model, response_mime_type, get_context_registry().key_prompt(context, prompt) if context else prompt)
+        cached = cache.get(key, task)
+        if cached is not None:
+            return cached
+
+        client = get_async_client()
+        deadline = timeout or min(deadline_for(task), client.timeout_s)
+
+        async def call():
+            breaker = get_breaker()
+            if not breaker.allow():
+                return {'ok': False, 'error': 'AI circuit open', 'circuit_open': True}
+            start = time.monotonic()
             try:
-                if hasattr(response, 'metadata'):
-                    logger.info('Model metadata: %s', getattr(response, 'metadata'))
+                out = await client.run(lambda: self._acall_model(prompt, model, response_mime_type, task, context), timeout=deadline)
+            except asyncio.TimeoutError:
+                msg = f'Model call exceeded {deadline}s deadline ({task})'
+                logger.warning(msg)
+                out = {'ok': False, 'error': msg, 'timeout': True}
+            except asyncio.CancelledError:
+                breaker.record(False, time.monotonic() - start)
+                raise
+            breaker.record(out.get('ok', False), time.monotonic() - start)
+            if out.get('ok'):
+                cache.set(key, out, task)
+            return out
+
+        try:
+            result, shared = await get_singleflight().ado(key, call)
+        except LeaderCancelled as e:
+            return {'ok': False, 'error': str(e)}
+        return copy.deepcopy(result) if shared else result
+
+    def stream(self, prompt: str, model: str = None, response_mime_type: str = None,
+               task: str = None) -> Iterator[Dict[str, Any]]:
+        """Streaming generate(): yields {'delta': text} as the model produces output, then
+        {'done': True, 'result': <generate()-shaped result>}.
+
+        Shares the response cache (a hit yields only the final event) and the circuit breaker.
+        Routed tasks use their tier model directly; streamed output is not escalated.
+        """
+        response_mime_type = response_mime_type or self.response_mime_type
+        task = task or self.task
+        model = model or self.model or get_router().model_for(task)
+
+        denied = self._check_host()
+        if denied:
+            yield {'done': True, 'result': denied}
+            return
+
+        cache = get_cache()
+        key = make_key(model, response_mime_type, prompt)
+        cached = cache.get(key, task)
+        if cached is not None:
+            yield {'done': True, 'result': cached}
+            return
+
+        breaker = get_breaker()
+        if not breaker.allow():
+            yield {'done': True, 'result': {'ok': False, 'error': 'AI circuit open', 'circuit_open': True}}
+            return
+
+        start = time.monotonic()
+        parts = []
+        result = None
+        try:
+            for chunk in get_backend().stream(model, prompt, response_mime_type, task=task):
+                parts.append(chunk)
+                yield {'delta': chunk}
+            result = parse_model_text(''.join(parts), response_mime_type)
+        except Exception as e:
+            logger.exception('Model stream failed')
+            result = {'ok': False, 'error': str(e)}
+        finally:
+            # a client that disconnects mid-stream still releases its breaker slot
+            ok = result.get('ok', False) if result is not None else bool(parts)
+            breaker.record(ok, time.monotonic() - start)
+        if result.get('ok'):
+            cache.set(key, result, task)
+        yield {'done': True, 'result': result}
+
+    def _check_host(self) -> Optional[Dict[str, Any]]:
+        # Heartbeat / host check: prevent running AI on unauthorized hosts
+        allowed_host = os.environ.get('ALLOWED_HOST')
+        if allowed_host:
+            try:
+                current = socket.gethostname()
+                if allowed_host != current:
+                    msg = f'Host {current} not allowed to run AI (allowed: {allowed_host})'
+                    logger.error(msg)
+                    return {'ok': False, 'error': msg}
             except Exception:
-                pass
+                logger.exception('Host check failed')
+        return None
 
-            return {'ok': True, 'response': parsed}
+    def _call_model(self, prompt: str, model: str, response_mime_type: str, task: str = None,
+                    context: str = None) -> Dict[str, Any]:
+        try:
+            backend = get_backend()
+            if not context:
+                return backend.generate(model, prompt, response_mime_type, task=task)
+            registry = get_context_registry()
+            handle = registry.handle_for(backend, model, context)
+            if handle:
+                out = backend.generate(model, prompt, response_mime_type, task=task, cached_context=handle)
+                if not out.get('context_missing'):
+                    registry.record(context, via_handle=True)
+                    return out
+                registry.invalidate(backend, model, context)
+            registry.record(context, via_handle=False)
+            return backend.generate(model, registry.full_prompt(context, prompt), response_mime_type, task=task)
         except Exception as e:
             logger.exception('Model generate failed')
             return {'ok': False, 'error': str(e)}
+
+    async def _acall_model(self, prompt: str, model: str, response_mime_type: str, task: str = None,
+                           context: str = None) -> Dict[str, Any]:
+        try:
+            backend = get_backend()
+            if not context:
+                return await backend.agenerate(model, prompt, response_mime_type, task=task)
+            registry = get_context_registry()
+            handle = await registry.ahandle_for(backend, model, context)
+            if handle:
+                out = await backend.agenerate(model, prompt, response_mime_type, task=task, cached_context=handle)
+                if not out.get('context_missing'):
+                    registry.record(context, via_handle=True)
+                    return out
+                registry.invalidate(backend, model, context)
+            registry.record(context, via_handle=False)
+            return await backend.agenerate(model, registry.full_prompt(context, prompt), response_mime_type, task=task)
+        except Exception as e:
+            logger.exception('Model generate_async failed')
+            return {'ok': False, 'error': str(e)}
+
+
+_backend: Optional[AIBackend] = None
+_backend_lock = threading.Lock()
+
+
+def build_backend_from_env() -> AIBackend:
+    """AI_BACKEND selects the provider: 'gemini' (default), 'cassette' or 'http' (local stand-in server)."""
+    name = os.environ.get('AI_BACKEND', 'gemini').lower()
+    if name == 'gemini':
+        return GeminiBackend()
+    from modules.ai import backends
+    if name == 'http':
+        return backends.HTTPBackend(os.environ.get('AI_FAKE_URL', 'http://127.0.0.1:8765'))
+    if name == 'cassette':
+        inner_name = os.environ.get('AI_CASSETTE_INNER', 'gemini').lower()
+        inner = backends.HTTPBackend(os.environ.get('AI_FAKE_URL', 'http://127.0.0.1:8765')) if inner_name == 'http' else GeminiBackend()
+        return backends.CassetteBackend(
+            os.environ.get('AI_CASSETTE_PATH', 'ai_cassette.jsonl'),
+            mode=os.environ.get('AI_CASSETTE_MODE', 'replay'),
+            inner=inner,
+            replay_latency=os.environ.get('AI_CASSETTE_REPLAY_LATENCY', '0') == '1',
+        )
+    logger.warning('Unknown AI_BACKEND=%s, using gemini', name)
+    return GeminiBackend()
+
+
+def get_backend() -> AIBackend:
+    global _backend
+    if _backend is None:
+        with _backend_lock:
+            if _backend is None:
+                _backend = build_backend_from_env()
+    return _backend
+
+
+def set_backend(backend: AIBackend):
+    """Swap the model provider at runtime (benchmarks, offline runs)."""
+    global _backend
+    _backend = backend
@@ -0,0 +1,251 @@
+import os
+import json
+import time
+import hashlib
+import sqlite3
+import logging
+import threading
+from collections import OrderedDict
+from typing import Dict, Any, List, Optional
+
+logger = logging.getLogger(__name__)
+
+
+# Per-module TTLs in seconds (0 disables caching for that task).
+# Override with AI_CACHE_TTL_<TASK>, e.g. AI_CACHE_TTL_INVENTORY=3600
+DEFAULT_TTLS: Dict[str, int] = {
+    'default': 300,
+    'repricing': 120,
+    'negotiator': 300,
+    'inventory': 6 * 3600,
+    'logistics': 3600,
+    'print_station': 3600,
+    'messaging': 600,
+    'message_classification': 600,
+    'discussion': 600,
+    'dispute': 600,
+    'risk': 3600,
+    'reviews': 3600,
+    'seo': 24 * 3600,
+}
+
+
+def canonical_prompt(prompt: Any) -> str:
+    """Normalize a prompt so equivalent prompts map to the same cache key.
+
+    Dict/list prompts are dumped as sorted compact JSON, string prompts get whitespace collapsed.
+    """
+    if isinstance(prompt, (dict, list, tuple)):
+        return json.dumps(prompt, sort_keys=True, separators=(',', ':'), ensure_ascii=False, default=str)
+    return ' '.join(str(prompt).split())
+
+
+def make_key(model: str, response_mime_type: str, prompt: Any) -> str:
+    raw = json.dumps([model or '', response_mime_type or '', canonical_prompt(prompt)], ensure_ascii=False)
+    return hashlib.sha256(raw.encode('utf-8')).hexdigest()
+
+
+class MemoryTier:
+    """In-process LRU tier. Values are stored serialized so callers never share mutable dicts."""
+
+    name = 'memory'
+
+    def __init__(self, max_entries: int = 1024):
+        self.max_entries = max_entries
+        self._data: 'OrderedDict[str, tuple]' = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key: str) -> Optional[tuple]:
+        with self._lock:
+            entry = self._data.get(key)
+            if entry is None:
+                return None
+            if entry[0] <= time.time():
+                del self._data[key]
+                return None
+            self._data.move_to_end(key)
+            return entry
+
+    def set(self, key: str, value: str, expires_at: float):
+        with self._lock:
+            self._data[key] = (expires_at, value)
+            self._data.move_to_end(key)
+            while len(self._data) > self.max_entries:
+                self._data.popitem(last=False)
+
+    def clear(self):
+        with self._lock:
+            self._data.clear()
+
+    def __len__(self):
+        return len(self._data)
+
+
+class SqliteTier:
+    """On-disk tier that survives restarts. Expired rows are dropped lazily on read and by purge_expired()."""
+
+    name = 'disk'
+
+    def __init__(self, path: str):
+        self.path = path
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(path, check_same_thread=False)
+        with self._lock:
+            self._conn.execute('CREATE TABLE IF NOT EXISTS ai_cache (key TEXT PRIMARY KEY, expires_at REAL NOT NULL, value TEXT NOT NULL)')
+            self._conn.commit()
+
+    def get(self, key: str) -> Optional[tuple]:
+        with self._lock:
+            row = self._conn.execute('SELECT expires_at, value FROM ai_cache WHERE key = ?', (key,)).fetchone()
+            if row is None:
+                return None
+            if row[0] <= time.time():
+                self._conn.execute('DELETE FROM ai_cache WHERE key = ?', (key,))
+                self._conn.commit()
+                return None
+            return row[0], row[1]
+
+    def set(self, key: str, value: str, expires_at: float):
+        with self._lock:
+            self._conn.execute('INSERT OR REPLACE INTO ai_cache (key, expires_at, value) VALUES (?, ?, ?)', (key, expires_at, value))
+            self._conn.commit()
+
+    def purge_expired(self) -> int:
+        with self._lock:
+            cur = self._conn.execute('DELETE FROM ai_cache WHERE expires_at <= ?', (time.time(),))
+            self._conn.commit()
+            return cur.rowcount
+
+    def clear(self):
+        with self._lock:
+            self._conn.execute('DELETE FROM ai_cache')
+            self._conn.commit()
+
+    def __len__(self):
+        with self._lock:
+            return self._conn.execute('SELECT COUNT(*) FROM ai_cache').fetchone()[0]
+
+
+class ResponseCache:
+    """Tiered cache for model responses keyed by make_key().
+
+    tiers are checked in order; a hit in a lower tier is copied into the tiers above it.
+    """
+
+    def __init__(self, tiers: List[Any], ttls: Dict[str, int] = None):
+        self.tiers = tiers
+        self.ttls = dict(DEFAULT_TTLS)
+        if ttls:
+            self.ttls.update(ttls)
+        self._stats: Dict[str, Dict[str, int]] = {}
+        self._lock = threading.Lock()
+
+    def ttl_for(self, task: str) -> int:
+        return int(self.ttls.get(task or 'default', self.ttls.get('default', 0)))
+
+    def _count(self, task: str, field: str):
+        with self._lock:
+            s = self._stats.setdefault(task or 'default', {'hits': 0, 'misses': 0, 'sets': 0})
+            s[field] = s.get(field, 0) + 1
+
+    def get(self, key: str, task: str = None) -> Optional[Dict[str, Any]]:
+        if self.ttl_for(task) <= 0:
+            return None
+        for i, tier in enumerate(self.tiers):
+            try:
+                entry = tier.get(key)
+            except Exception:
+                logger.exception('AI cache tier %s read failed', tier.name)
+                continue
+            if entry is None:
+                continue
+            expires_at, value = entry
+            for upper in self.tiers[:i]:
+                upper.set(key, value, expires_at)
+            self._count(task, 'hits')
+            self._count(task, f'hits_{tier.name}')
+            result = json.loads(value)
+            result['cached'] = True
+            return result
+        self._count(task, 'misses')
+        return None
+
+    def set(self, key: str, value: Dict[str, Any], task: str = None):
+        ttl = self.ttl_for(task)
+        if ttl <= 0:
+            return
+        try:
+            serialized = json.dumps(value, ensure_ascii=False, default=str)
+        except Exception:
+            logger.exception('AI cache: response not serializable, skipping')
+            return
+        expires_at = time.time() + ttl
+        for tier in self.tiers:
+            try:
+                tier.set(key, serialized, expires_at)
+            except Exception:
+                logger.exception('AI cache tier %s write failed', tier.name)
+        self._count(task, 'sets')
+
+    def clear(self):
+        for tier in self.tiers:
+            tier.clear()
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            per_task = {k: dict(v) for k, v in self._stats.items()}
+        hits = sum(v.get('hits', 0) for v in per_task.values())
+        misses = sum(v.get('misses', 0) for v in per_task.values())
+        return {
+            'hits': hits,
+            'misses': misses,
+            'hit_rate': round(hits / (hits + misses), 4) if (hits + misses) else 0.0,
+            'entries': {t.name: len(t) for t in self.tiers},
+            'ttls': dict(self.ttls),
+            'per_task': per_task,
+        }
+
+
+def _ttls_from_env() -> Dict[str, int]:
+    out = {}
+    for k, v in os.environ.items():
+        if k.startswith('AI_CACHE_TTL_'):
+            try:
+                out[k[len('AI_CACHE_TTL_'):].lower()] = int(v)
+            except ValueError:
+                logger.warning('Invalid %s=%s', k, v)
+    return out
+
+
+def build_cache_from_env() -> ResponseCache:
+    """AI_CACHE_ENABLED=0 disables caching, AI_CACHE_MAX_ENTRIES sizes the LRU, AI_CACHE_PATH enables the SQLite tier."""
+    ttls = _ttls_from_env()
+    if os.environ.get('AI_CACHE_ENABLED', '1') == '0':
+        ttls = {k: 0 for k in list(DEFAULT_TTLS) + list(ttls)}
+    tiers: List[Any] = [MemoryTier(int(os.environ.get('AI_CACHE_MAX_ENTRIES', '1024')))]
+    path = os.environ.get('AI_CACHE_PATH')
+    if path:
+        try:
+            tiers.append(SqliteTier(path))
+        except Exception:
+            logger.exception('AI cache: cannot open %s, using memory tier only', path)
+    return ResponseCache(tiers, ttls=ttls)
+
+
+_cache: Optional[ResponseCache] = None
+_cache_lock = threading.Lock()
+
+
+def get_cache() -> ResponseCache:
+    global _cache
+    if _cache is None:
+        with _cache_lock:
+            if _cache is None:
+                _cache = build_cache_from_env()
+    return _cache
+
+
+def set_cache(cache: ResponseCache):
+    """Replace the shared cache (e.g. a custom tier list or a disabled cache in tests)."""
+    global _cache
+    _cache = cache
@@ -0,0 +1,188 @@
+import os
+import time
+import logging
+import threading
+from collections import deque
+from typing import Dict, Any, Optional
+
+logger = logging.getLogger(__name__)
+
+
+# Per-task latency budgets in seconds. A call that exceeds its budget is abandoned and the
+# caller gets {'ok': False} so the module's heuristic fallback runs.
+# Override with AI_DEADLINE_<TASK>, e.g. AI_DEADLINE_LOGISTICS=2.5
+DEFAULT_DEADLINES: Dict[str, float] = {
+    'default': 20.0,
+    'repricing': 10.0,
+    'negotiator': 10.0,
+    'inventory': 8.0,
+    'logistics': 4.0,
+    'print_station': 4.0,
+    'messaging': 6.0,
+    'message_classification': 3.0,
+    'discussion': 6.0,
+    'dispute': 10.0,
+    'risk': 5.0,
+    'reviews': 10.0,
+    'seo': 30.0,
+}
+
+
+def deadline_for(task: str) -> float:
+    env = os.environ.get(f'AI_DEADLINE_{(task or "default").upper()}')
+    if env:
+        try:
+            return float(env)
+        except ValueError:
+            logger.warning('Invalid AI_DEADLINE_%s=%s', (task or 'default').upper(), env)
+    return DEFAULT_DEADLINES.get(task or 'default', DEFAULT_DEADLINES['default'])
+
+
+class CircuitBreaker:
+    """Rolling-window circuit breaker shared by all AI calls.
+
+    closed    -> calls pass; trips to open when, over the last `window_s` seconds and at least
+                 `min_calls` calls, the error rate reaches `error_rate` or p95 latency exceeds `p95_latency_s`.
+    open      -> calls are rejected immediately for `cooldown_s` seconds.
+    half_open -> up to `probes` calls pass; all succeeding within the latency budget closes the
+                 circuit, any failure re-opens it.
+    """
+
+    CLOSED = 'closed'
+    OPEN = 'open'
+    HALF_OPEN = 'half_open'
+
+    def __init__(self, window_s: float = 60.0, min_calls: int = 10, error_rate: float = 0.5,
+                 p95_latency_s: float = 8.0, cooldown_s: float = 30.0, probes: int = 2):
+        self.window_s = window_s
+        self.min_calls = min_calls
+        self.error_rate = error_rate
+        self.p95_latency_s = p95_latency_s
+        self.cooldown_s = cooldown_s
+        self.probes = probes
+        self._lock = threading.Lock()
+        self._calls: deque = deque()  # (ts, ok, latency)
+        self._state = self.CLOSED
+        self._opened_at: Optional[float] = None
+        self._reason: Optional[str] = None
+        self._probes_in_flight = 0
+        self._probe_successes = 0
+        self._counters = {'rejected': 0, 'trips': 0}
+
+    def _prune(self, now: float):
+        while self._calls and now - self._calls[0][0] > self.window_s:
+            self._calls.popleft()
+
+    def _window_stats(self) -> Dict[str, Any]:
+        n = len(self._calls)
+        if not n:
+            return {'calls': 0, 'error_rate': 0.0, 'p95_latency_s': 0.0}
+        errors = sum(1 for c in self._calls if not c[1])
+        latencies = sorted(c[2] for c in self._calls)
+        p95 = latencies[min(n - 1, int(round(0.95 * (n - 1))))]
+        return {'calls': n, 'error_rate': round(errors / n, 4), 'p95_latency_s': round(p95, 4)}
+
+    def _trip(self, now: float, reason: str):
+        self._state = self.OPEN
+        self._opened_at = now
+        self._reason = reason
+        self._probes_in_flight = 0
+        self._probe_successes = 0
+        self._counters['trips'] += 1
+        logger.warning('AI circuit opened: %s', reason)
+
+    def allow(self) -> bool:
+        """Return True if a call may proceed. Callers that get True must later call record()."""
+        now = time.monotonic()
+        with self._lock:
+            if self._state == self.OPEN and now - self._opened_at >= self.cooldown_s:
+                self._state = self.HALF_OPEN
+                self._probes_in_flight = 0
+                self._probe_successes = 0
+                logger.info('AI circuit half-open: probing')
+            if self._state == self.CLOSED:
+                return True
+            if self._state == self.HALF_OPEN and self._probes_in_flight < self.probes:
+                self._probes_in_flight += 1
+                return True
+            self._counters['rejected'] += 1
+            return False
+
+    def record(self, ok: bool, latency_s: float):
+        now = time.monotonic()
+        with self._lock:
+            if self._state == self.HALF_OPEN:
+                self._probes_in_flight = max(0, self._probes_in_flight - 1)
+                if not ok or latency_s > self.p95_latency_s:
+                    self._trip(now, f'probe failed (ok={ok}, latency={latency_s:.2f}s)')
+                    return
+                self._probe_successes += 1
+                if self._probe_successes >= self.probes:
+                    self._state = self.CLOSED
+                    self._opened_at = None
+                    self._reason = None
+                    self._calls.clear()
+                    logger.info('AI circuit closed after successful probes')
+                return
+            if self._state == self.OPEN:
+                return
+            self._calls.append((now, bool(ok), latency_s))
+            self._prune(now)
+            if len(self._calls) < self.min_calls:
+                return
+            stats = self._window_stats()
+            if stats['error_rate'] >= self.error_rate:
+                self._trip(now, f"error rate {stats['error_rate']} >= {self.error_rate}")
+            elif stats['p95_latency_s'] > self.p95_latency_s:
+                self._trip(now, f"p95 latency {stats['p95_latency_s']}s > {self.p95_latency_s}s")
+
+    def reset(self):
+        with self._lock:
+            self._state = self.CLOSED
+            self._opened_at = None
+            self._reason = None
+            self._calls.clear()
+
+    def state(self) -> Dict[str, Any]:
+        now = time.monotonic()
+        with self._lock:
+            self._prune(now)
+            out = {
+                'state': self._state,
+                'reason': self._reason,
+                'open_for_s': round(now - self._opened_at, 2) if self._opened_at is not None else None,
+                'window': self._window_stats(),
+                'config': {'window_s': self.window_s, 'min_calls': self.min_calls, 'error_rate': self.error_rate,
+                           'p95_latency_s': self.p95_latency_s, 'cooldown_s': self.cooldown_s, 'probes': self.probes},
+            }
+            out.update(self._counters)
+        return out
+
+
+def build_breaker_from_env() -> CircuitBreaker:
+    return CircuitBreaker(
+        window_s=float(os.environ.get('AI_CB_WINDOW_S', '60')),
+        min_calls=int(os.environ.get('AI_CB_MIN_CALLS', '10')),
+        error_rate=float(os.environ.get('AI_CB_ERROR_RATE', '0.5')),
+        p95_latency_s=float(os.environ.get('AI_CB_P95_S', '8')),
+        cooldown_s=float(os.environ.get('AI_CB_COOLDOWN_S', '30')),
+        probes=int(os.environ.get('AI_CB_PROBES', '2')),
+    )
+
+
+_breaker: Optional[CircuitBreaker] = None
+_breaker_lock = threading.Lock()
+
+
+def get_breaker() -> CircuitBreaker:
+    global _breaker
+    if _breaker is None:
+        with _breaker_lock:
+            if _breaker is None:
+                _breaker = build_breaker_from_env()
+    return _breaker
+
+
+def set_breaker(breaker: CircuitBreaker):
+    global _breaker
+    _breaker = breaker
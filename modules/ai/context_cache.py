@@ -0,0 +1,111 @@
+import os
+import time
+import hashlib
+import logging
+import threading
+from typing import Dict, Any, Optional
+
+from modules.ai.prompt_builder import estimate_tokens
+from modules.ai.async_client import get_async_client
+
+logger = logging.getLogger(__name__)
+
+_MISSING = object()
+
+
+class ContextRegistry:
+    """Static prompt prefixes (persona + module instructions) registered once per backend/model.
+
+    Callers pass context=<name> and only the per-request suffix. When the backend supports cached
+    context (create_cached_context returns a handle) the suffix is sent against the handle; otherwise
+    the prefix is prepended locally. Handles are re-created after ttl_s or when the backend reports
+    them gone.
+    """
+
+    def __init__(self, ttl_s: float = None):
+        self.ttl_s = float(ttl_s if ttl_s is not None else os.environ.get('AI_CONTEXT_TTL_S', '3600'))
+        self._lock = threading.Lock()
+        self._texts: Dict[str, str] = {}
+        self._digests: Dict[str, str] = {}
+        # (backend id, model, name) -> (handle or None when unsupported, created_at)
+        self._handles: Dict[tuple, tuple] = {}
+        self._stats: Dict[str, Dict[str, int]] = {}
+
+    def register(self, name: str, text: str):
+        with self._lock:
+            self._texts[name] = text
+            self._digests[name] = hashlib.sha256(text.encode('utf-8')).hexdigest()[:16]
+            # text changed: drop handles built from the old prefix
+            self._handles = {k: v for k, v in self._handles.items() if k[2] != name}
+
+    def text(self, name: str) -> str:
+        return self._texts[name]
+
+    def key_prompt(self, name: str, prompt: str) -> str:
+        """What the response cache keys on: prefix digest + suffix (no need to hash the whole prefix)."""
+        return f'[context:{name}:{self._digests[name]}]\n{prompt}'
+
+    def full_prompt(self, name: str, prompt: str) -> str:
+        return f'{self._texts[name]}\n\n{prompt}'
+
+    def cached_handle(self, backend: Any, model: str, name: str) -> Any:
+        """Known handle (None if unsupported) or _MISSING when it has to be (re)created."""
+        entry = self._handles.get((id(backend), model, name))
+        if entry is None or (entry[0] is not None and time.monotonic() - entry[1] > self.ttl_s):
+            return _MISSING
+        return entry[0]
+
+    def handle_for(self, backend: Any, model: str, name: str) -> Optional[str]:
+        handle = self.cached_handle(backend, model, name)
+        if handle is not _MISSING:
+            return handle
+        try:
+            handle = backend.create_cached_context(model, self._texts[name], ttl_s=self.ttl_s)
+        except Exception:
+            logger.exception('Creating cached context %s failed, sending the prefix inline', name)
+            handle = None
+        with self._lock:
+            self._handles[(id(backend), model, name)] = (handle, time.monotonic())
+        if handle:
+            logger.info('Registered cached context %s for %s (%s)', name, model, handle)
+        return handle
+
+    async def ahandle_for(self, backend: Any, model: str, name: str) -> Optional[str]:
+        handle = self.cached_handle(backend, model, name)
+        if handle is not _MISSING:
+            return handle
+        # first use (or expiry): the provider round-trip runs off the event loop
+        return await get_async_client().run_blocking(self.handle_for, backend, model, name)
+
+    def invalidate(self, backend: Any, model: str, name: str):
+        with self._lock:
+            self._handles.pop((id(backend), model, name), None)
+
+    def record(self, name: str, via_handle: bool):
+        prefix_tokens = estimate_tokens(self._texts.get(name, ''))
+        with self._lock:
+            s = self._stats.setdefault(name, {'requests': 0, 'via_cached_context': 0, 'inline': 0,
+                                              'prefix_tokens': prefix_tokens, 'input_tokens_saved': 0})
+            s['requests'] += 1
+            if via_handle:
+                s['via_cached_context'] += 1
+                s['input_tokens_saved'] += prefix_tokens
+            else:
+                s['inline'] += 1
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            return {'registered': sorted(self._texts), 'handles': sum(1 for h, _ in self._handles.values() if h),
+                    'contexts': {k: dict(v) for k, v in self._stats.items()}}
+
+
+_registry = ContextRegistry()
+
+
+def get_context_registry() -> ContextRegistry:
+    return _registry
+
+
+def register_context(name: str, text: str):
+    """Register a static prompt prefix under `name` (call at import time of the owning module)."""
+    _registry.register(name, text)
@@ -0,0 +1,275 @@
+"""Local stand-in for the Gemini API, for offline load testing.
+
+Run:  python -m modules.ai.fake_server --port 8765 --latency lognormal:-0.7,0.5 --error-rate 0.02
+Then: AI_BACKEND=http AI_FAKE_URL=http://127.0.0.1:8765 uvicorn main:app
+
+Each request sleeps for a sample of the configured latency distribution, fails with
+the configured probability, and otherwise returns JSON shaped like the real model's
+answer for the calling module (see RESPONSE_FACTORIES). Static prompt prefixes can be
+registered via POST /v1/contexts and referenced by id, like provider-side context caching.
+POST /v1/stream sends the same answer as chunked text: the sampled latency is the time to
+first token, then one small chunk every `chunk_delay` seconds.
+"""
+import re
+import json
+import time
+import random
+import hashlib
+import logging
+import argparse
+import threading
+from datetime import datetime, timedelta
+from http.server import ThreadingHTTPServer, BaseHTTPRequestHandler
+from typing import Dict, Any, Callable, Optional
+
+logger = logging.getLogger(__name__)
+
+
+def parse_latency(spec: str) -> Callable[[random.Random], float]:
+    """Latency distribution from a spec string (seconds):
+
+    constant:0.4 | uniform:0.2,1.5 | normal:0.8,0.2 | lognormal:mu,sigma (median = e^mu)
+    """
+    kind, _, args = spec.partition(':')
+    params = [float(a) for a in args.split(',') if a] if args else []
+    if kind == 'constant':
+        return lambda rng: params[0] if params else 0.0
+    if kind == 'uniform':
+        return lambda rng: rng.uniform(params[0], params[1])
+    if kind == 'normal':
+        return lambda rng: max(0.0, rng.gauss(params[0], params[1]))
+    if kind == 'lognormal':
+        return lambda rng: rng.lognormvariate(params[0], params[1])
+    raise ValueError(f'unknown latency distribution {spec}')
+
+
+def _number_after(field: str, prompt: str, default: float) -> float:
+    m = re.search(r"['\"]?" + re.escape(field) + r"['\"]?\s*:\s*(-?[0-9]+(?:\.[0-9]+)?)", prompt)
+    return float(m.group(1)) if m else default
+
+
+def _seeded(prompt: str) -> random.Random:
+    # same prompt -> same answer, so replays and cache tests are reproducible
+    return random.Random(int(hashlib.sha256(prompt.encode('utf-8')).hexdigest()[:12], 16))
+
+
+def _repricing(prompt: str) -> Dict[str, Any]:
+    price = _number_after('price', prompt, 100.0)
+    return {'new_price': round(price * 0.99, 2), 'reason': 'stand-in: micro-jump', 'actions': ['apply_price']}
+
+
+def _negotiator(prompt: str) -> Dict[str, Any]:
+    min_price = _number_after('min_price', prompt, 50.0)
+    offer = _number_after('client_offer', prompt, min_price)
+    proposed = round(max(min_price, offer) * 1.03, 2)
+    return {'decision': 'COUNTER_OFFER', 'proposed_price': proposed, 'reason': 'stand-in counter', 'message': f'Mogę zaproponować {proposed} zł.', 'actions': ['counter_offer']}
+
+
+def _input_block(prompt: str) -> Any:
+    marker = 'Input (JSON):\n'
+    if marker not in prompt:
+        return None
+    try:
+        return json.loads(prompt.split(marker, 1)[1])
+    except ValueError:
+        return None
+
+
+def _inventory_one(seed: str) -> Dict[str, Any]:
+    days = _seeded(seed).randint(3, 90)
+    return {'predicted_depletion_date': (datetime.utcnow() + timedelta(days=days)).date().isoformat(), 'days_to_depletion': days, 'risk': 'high' if days < 14 else ('medium' if days < 30 else 'low'), 'rationale': 'stand-in forecast'}
+
+
+def _inventory(prompt: str) -> Dict[str, Any]:
+    entries = _input_block(prompt)
+    if isinstance(entries, list):
+        # batch prompt: keyed array, one prediction per product_id
+        return {'predictions': [dict(_inventory_one(str(e.get('product_id'))), product_id=e.get('product_id')) for e in entries]}
+    return _inventory_one(prompt)
+
+
+def _logistics(prompt: str) -> Dict[str, Any]:
+    carrier = _seeded(prompt).choice(['DHL', 'InPost', 'LocalCourier'])
+    return {'carrier': carrier, 'cost': 12.5, 'lead_time': 2, 'reason': 'stand-in choice', 'confidence': 0.8}
+
+
+def _print_station(prompt: str) -> Dict[str, Any]:
+    return {'packing_list': [], 'note': 'stand-in route'}
+
+
+def _messaging(prompt: str) -> Dict[str, Any]:
+    if 'reply_text' in prompt:
+        return {'reply_text': 'Dziękujemy za wiadomość! Paczka zostanie wysłana dziś.', 'action': None, 'human_required': False}
+    return {'sentiment': 'neutral', 'intent': 'shipping_question', 'urgency': 3, 'entities': {}, 'confidence': 0.9}
+
+
+def _discussion(prompt: str) -> Dict[str, Any]:
+    return {'priority': 'medium', 'suggested_reply': 'Dziękujemy, sprawdzamy sprawę.', 'human_required': False, 'confidence': 0.85}
+
+
+def _dispute(prompt: str) -> Dict[str, Any]:
+    return {'reply_text': 'Przykro nam. Proponujemy wymianę.', 'suggested_resolution': {'type': 'replace', 'amount': None, 'note': 'stand-in'}, 'human_required': False}
+
+
+def _risk(prompt: str) -> Dict[str, Any]:
+    return {'risk': False, 'reasons': [], 'severity': 'low', 'action': 'auto'}
+
+
+def _reviews(prompt: str) -> Dict[str, Any]:
+    return {'message': 'Dziękujemy za zakup! Będziemy wdzięczni za opinię.', 'send': True}
+
+
+def _seo(prompt: str) -> Any:
+    if 'SEO Cloner' in prompt:
+        return [{'title': f'Wariant {i + 1}', 'html_description': '<p>stand-in</p>', 'keywords': ['stand-in'], 'angle': 'premium'} for i in range(3)]
+    return {'title': 'Stand-in title', 'html_description': '<p>stand-in</p>', 'keywords': ['stand-in']}
+
+
+RESPONSE_FACTORIES: Dict[str, Callable[[str], Any]] = {
+    'repricing': _repricing,
+    'negotiator': _negotiator,
+    'inventory': _inventory,
+    'logistics': _logistics,
+    'print_station': _print_station,
+    'messaging': _messaging,
+    'message_classification': _messaging,
+    'discussion': _discussion,
+    'dispute': _dispute,
+    'risk': _risk,
+    'reviews': _reviews,
+    'seo': _seo,
+}
+
+
+class FakeGeminiServer(ThreadingHTTPServer):
+    daemon_threads = True
+
+    def __init__(self, address, latency: str = 'constant:0', error_rate: float = 0.0,
+                 task_latency: Dict[str, str] = None, seed: Optional[int] = None, chunk_delay: float = 0.02):
+        super().__init__(address, _Handler)
+        self.chunk_delay = chunk_delay
+        self.latency = parse_latency(latency)
+        self.task_latency = {k: parse_latency(v) for k, v in (task_latency or {}).items()}
+        self.error_rate = error_rate
+        self.rng = random.Random(seed)
+        self._lock = threading.Lock()
+        self.counters = {'requests': 0, 'errors': 0, 'prompt_chars': 0, 'context_requests': 0, 'contexts': 0}
+        self.contexts: Dict[str, Dict[str, Any]] = {}
+
+    def add_context(self, text: str, ttl_s: float) -> str:
+        ctx_id = 'ctx-' + hashlib.sha256(text.encode('utf-8')).hexdigest()[:12]
+        with self._lock:
+            self.contexts[ctx_id] = {'text': text, 'expires': time.monotonic() + ttl_s}
+            self.counters['contexts'] = len(self.contexts)
+        return ctx_id
+
+    def resolve(self, ctx_id: str, prompt: str) -> Optional[str]:
+        """Prompt as the model sees it; counts only the chars actually sent. None for unknown/expired ids."""
+        with self._lock:
+            self.counters['prompt_chars'] += len(prompt)
+            if not ctx_id:
+                return prompt
+            ctx = self.contexts.get(ctx_id)
+            if ctx is None or ctx['expires'] < time.monotonic():
+                self.contexts.pop(ctx_id, None)
+                return None
+            self.counters['context_requests'] += 1
+            return ctx['text'] + '\n\n' + prompt
+
+    def sample(self, task: str) -> tuple:
+        with self._lock:
+            self.counters['requests'] += 1
+            delay = self.task_latency.get(task, self.latency)(self.rng)
+            fail = self.rng.random() < self.error_rate
+            if fail:
+                self.counters['errors'] += 1
+        return delay, fail
+
+
+class _Handler(BaseHTTPRequestHandler):
+    protocol_version = 'HTTP/1.1'
+
+    def log_message(self, fmt, *args):
+        logger.debug(fmt, *args)
+
+    def _send(self, status: int, body: Dict[str, Any]):
+        data = json.dumps(body, ensure_ascii=False).encode('utf-8')
+        self.send_response(status)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(data)))
+        self.end_headers()
+        self.wfile.write(data)
+
+    def do_GET(self):
+        if self.path == '/v1/stats':
+            return self._send(200, dict(self.server.counters))
+        self._send(404, {'error': 'not found'})
+
+    def do_POST(self):
+        length = int(self.headers.get('Content-Length', 0))
+        body = json.loads(self.rfile.read(length) or b'{}')
+        if self.path == '/v1/contexts':
+            return self._send(200, {'id': self.server.add_context(body.get('text') or '', float(body.get('ttl_s') or 3600))})
+        if self.path not in ('/v1/generate', '/v1/stream'):
+            return self._send(404, {'error': 'not found'})
+
+        task = body.get('task') or 'default'
+        prompt = self.server.resolve(body.get('context_id'), body.get('prompt') or '')
+        if prompt is None:
+            return self._send(410, {'error': 'unknown context'})
+        delay, fail = self.server.sample(task)
+        if delay:
+            time.sleep(delay)
+        if fail:
+            return self._send(503, {'error': 'stand-in injected failure'})
+        payload = RESPONSE_FACTORIES.get(task, lambda p: {})(prompt)
+        text = json.dumps(payload, ensure_ascii=False)
+        if self.path == '/v1/stream':
+            return self._stream(text)
+        self._send(200, {'text': text, 'latency_s': round(delay, 4)})
+
+    def _stream(self, text: str, size: int = 8):
+        self.send_response(200)
+        self.send_header('Content-Type', 'text/plain; charset=utf-8')
+        self.send_header('Transfer-Encoding', 'chunked')
+        self.end_headers()
+        for i in range(0, len(text), size):
+            if i and self.server.chunk_delay:
+                time.sleep(self.server.chunk_delay)
+            data = text[i:i + size].encode('utf-8')
+            self.wfile.write(b'%x\r\n%s\r\n' % (len(data), data))
+            self.wfile.flush()
+        self.wfile.write(b'0\r\n\r\n')
+
+
+def start_fake_server(host: str = '127.0.0.1', port: int = 0, **kwargs) -> FakeGeminiServer:
+    """Start the stand-in in a background thread; port=0 picks a free port (see server.server_port)."""
+    server = FakeGeminiServer((host, port), **kwargs)
+    threading.Thread(target=server.serve_forever, name='fake-gemini', daemon=True).start()
+    return server
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Local Gemini stand-in for load testing')
+    parser.add_argument('--host', default='127.0.0.1')
+    parser.add_argument('--port', type=int, default=8765)
+    parser.add_argument('--latency', default='lognormal:-0.7,0.5', help='default latency distribution')
+    parser.add_argument('--task-latency', action='append', default=[], help='per-task override, e.g. inventory=uniform:1,3')
+    parser.add_argument('--error-rate', type=float, default=0.0)
+    parser.add_argument('--seed', type=int, default=None)
+    parser.add_argument('--chunk-delay', type=float, default=0.02, help='seconds between streamed chunks')
+    args = parser.parse_args()
+
+    task_latency = dict(item.split('=', 1) for item in args.task_latency)
+    server = FakeGeminiServer((args.host, args.port), latency=args.latency, error_rate=args.error_rate,
+                              task_latency=task_latency, seed=args.seed, chunk_delay=args.chunk_delay)
+    logging.basicConfig(level=logging.INFO)
+    logger.info('Fake Gemini listening on http://%s:%d', args.host, server.server_port)
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+
+
+if __name__ == '__main__':
+    main()
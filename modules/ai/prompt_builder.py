@@ -0,0 +1,179 @@
+import json
+import math
+import logging
+import threading
+from datetime import datetime, timedelta
+from typing import Dict, Any, Optional
+
+logger = logging.getLogger(__name__)
+
+
+# Fields each task actually needs. A spec is True (keep value as-is) or a dict of key -> spec;
+# dict specs applied to a list are applied to every element. Keys not listed are dropped.
+_ITEM = {'sku': True, 'id': True, 'product_id': True, 'product_name': True, 'qty': True, 'price': True, 'cost': True}
+_ADDRESS = {'country': True, 'postcode': True, 'city': True, 'region': True}
+_PRODUCT = {'id': True, 'sku': True, 'name': True, 'price': True, 'cost': True, 'stock': True, 'category': True,
+            'our_lead_time_days': True, 'our_rating': True}
+
+TASK_FIELDS: Dict[str, Dict[str, Any]] = {
+    'risk': {'order': {'order_id': True, 'total_price': True, 'calculated_margin': True, 'payment': True,
+                       'buyer': {'login': True, 'guest': True}, 'shipping_to': _ADDRESS, 'items': _ITEM}},
+    'logistics': {'package': {'weight_kg': True, 'dimensions': True, 'value': True}, 'destination': _ADDRESS,
+                  'carriers': {'name': True, 'base_price': True, 'price_per_kg': True, 'lead_time_days': True, 'reliability': True}},
+    'print_station': {'order_id': True, 'items': {'sku': True, 'qty': True, 'location': True, 'product_name': True}},
+    'inventory': {'product_id': True, 'sales_history_summary': True, 'lead_time_days': True,
+                  'extra_context': {'product': _PRODUCT}},
+    'messaging': {'message': {'message_text': True, 'sentiment': True, 'intent': True, 'urgency': True, 'entities': True},
+                  'context': {'order_id': True, 'lang': True, 'order_status': True, 'product': _PRODUCT,
+                              'customer_history': True, 'inventory_count': True}},
+    'repricing': {'product': _PRODUCT, 'competitors': {'seller': True, 'price': True, 'lead_time_days': True, 'rating': True},
+                  'config': True},
+    'negotiator': {'client_offer': True, 'min_price': True, 'inventory_count': True, 'customer_history': True,
+                   'config': True, 'product': _PRODUCT},
+    'dispute': {'order_context': {'order_id': True, 'total_price': True, 'status': True, 'items': _ITEM, 'shipping_to': _ADDRESS,
+                                  'delivered_at': True, 'carrier': True}},
+    'discussion': {'discussion': {'id': True, 'order_id': True, 'messages': {'from': True, 'text': True, 'ts': True},
+                                  'buyer_history': True}},
+    'reviews': {'order_id': True, 'order': {'order_id': True, 'items': {'product_name': True, 'qty': True}, 'lang': True,
+                                            'buyer': {'login': True, 'first_name': True}}},
+}
+
+
+def compact_json(obj: Any) -> str:
+    """Canonical compact JSON: sorted keys, no whitespace, UTF-8 kept as-is."""
+    return json.dumps(obj, sort_keys=True, separators=(',', ':'), ensure_ascii=False, default=str)
+
+
+def prune(obj: Any, spec: Any) -> Any:
+    """Keep only the fields described by spec (see TASK_FIELDS). None/empty values are dropped too."""
+    if spec is True or spec is None:
+        return obj
+    if isinstance(obj, list):
+        return [prune(o, spec) for o in obj]
+    if not isinstance(obj, dict):
+        return obj
+    out = {}
+    for k, sub in spec.items():
+        if k in obj and obj[k] not in (None, '', [], {}):
+            out[k] = prune(obj[k], sub)
+    return out
+
+
+def estimate_tokens(text: str) -> int:
+    # ~4 characters per token is close enough for Gemini/GPT tokenizers on mixed PL/EN JSON
+    return int(math.ceil(len(text) / 4.0))
+
+
+def summarize_sales_history(sales_history: Any, bucket: str = 'week', max_buckets: int = 12,
+                            now: Optional[datetime] = None) -> Any:
+    """Aggregate [{date, qty}] into a fixed-size summary so prompt size no longer grows with history.
+
+    Returns { bucket, buckets: [{start, qty}] (last `max_buckets`, zero-filled), total_qty, records,
+    first_date, last_date, days_span, avg_daily, bucket_mean, bucket_std, trend_per_bucket, days_since_last_sale }.
+    Anything that is not a list of dated records is returned unchanged.
+    """
+    if not isinstance(sales_history, list) or not sales_history:
+        return sales_history
+    rows = []
+    try:
+        for s in sales_history:
+            rows.append((datetime.fromisoformat(str(s.get('date'))[:19]), float(s.get('qty', 0) or 0)))
+    except Exception:
+        return sales_history
+
+    step = timedelta(days=7 if bucket == 'week' else 1)
+
+    def bucket_start(d: datetime) -> datetime:
+        day = datetime(d.year, d.month, d.day)
+        return day - timedelta(days=day.weekday()) if bucket == 'week' else day
+
+    totals: Dict[datetime, float] = {}
+    for d, q in rows:
+        b = bucket_start(d)
+        totals[b] = totals.get(b, 0.0) + q
+
+    first = min(d for d, _ in rows)
+    last = max(d for d, _ in rows)
+    end = bucket_start(last)
+    start = max(bucket_start(first), end - step * (max_buckets - 1))
+    series = []
+    cur = start
+    while cur <= end:
+        series.append(totals.get(cur, 0.0))
+        cur += step
+
+    n = len(series)
+    mean = sum(series) / n
+    std = math.sqrt(sum((x - mean) ** 2 for x in series) / n)
+    # least-squares slope over bucket index: units per bucket
+    xm = (n - 1) / 2.0
+    denom = sum((i - xm) ** 2 for i in range(n))
+    slope = sum((i - xm) * (series[i] - mean) for i in range(n)) / denom if denom else 0.0
+
+    total = sum(q for _, q in rows)
+    days_span = max(1, (last - first).days)
+    now = now or datetime.utcnow()
+    return {
+        'bucket': bucket,
+        'buckets': [{'start': (start + step * i).date().isoformat(), 'qty': round(q, 2)} for i, q in enumerate(series)],
+        'total_qty': round(total, 2),
+        'records': len(rows),
+        'first_date': first.date().isoformat(),
+        'last_date': last.date().isoformat(),
+        'days_span': days_span,
+        'avg_daily': round(total / days_span, 4),
+        'bucket_mean': round(mean, 4),
+        'bucket_std': round(std, 4),
+        'trend_per_bucket': round(slope, 4),
+        'days_since_last_sale': max(0, (now - last).days),
+    }
+
+
+class PromptStats:
+    """Per-task token accounting: naive str() serialization of the full input vs. what was actually sent."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._stats: Dict[str, Dict[str, int]] = {}
+
+    def record(self, task: str, before_tokens: int, after_tokens: int):
+        with self._lock:
+            s = self._stats.setdefault(task or 'default', {'prompts': 0, 'tokens_before': 0, 'tokens_after': 0})
+            s['prompts'] += 1
+            s['tokens_before'] += before_tokens
+            s['tokens_after'] += after_tokens
+
+    def snapshot(self) -> Dict[str, Any]:
+        with self._lock:
+            out = {}
+            for task, s in self._stats.items():
+                saved = s['tokens_before'] - s['tokens_after']
+                out[task] = dict(s, tokens_saved=saved,
+                                 saved_pct=round(100.0 * saved / s['tokens_before'], 2) if s['tokens_before'] else 0.0)
+            return out
+
+
+_prompt_stats = PromptStats()
+
+
+def get_prompt_stats() -> Dict[str, Any]:
+    return _prompt_stats.snapshot()
+
+
+def compact_payload(task: str, payload: Any, fields: Dict[str, Any] = None, baseline: Any = None) -> str:
+    """Serialize payload for `task`: drop unneeded fields, dump compact JSON and record the token savings.
+
+    baseline: what used to be sent (defaults to payload) when the caller already pre-aggregated it.
+    """
+    spec = fields if fields is not None else TASK_FIELDS.get(task)
+    out = compact_json(prune(payload, spec) if spec else payload)
+    try:
+        _prompt_stats.record(task, estimate_tokens(str(payload if baseline is None else baseline)), estimate_tokens(out))
+    except Exception:
+        logger.exception('Prompt stats failed for %s', task)
+    return out
+
+
+def build_prompt(task: str, instruction: str, payload: Any, fields: Dict[str, Any] = None, baseline: Any = None) -> str:
+    """instruction + compact input block, the standard shape for module prompts."""
+    return f"{instruction}\nInput (JSON):\n{compact_payload(task, payload, fields=fields, baseline=baseline)}"
@@ -0,0 +1,179 @@
+import os
+import time
+import logging
+import threading
+from collections import deque
+from typing import Dict, Any, Callable, Awaitable, Optional
+
+logger = logging.getLogger(__name__)
+
+
+# Model per tier. Override with AI_MODEL_FAST / AI_MODEL_PRO.
+TIER_MODELS: Dict[str, str] = {
+    'fast': os.environ.get('AI_MODEL_FAST', 'models/gemini-2.5-flash'),
+    'pro': os.environ.get('AI_MODEL_PRO', 'models/gemini-3-pro-preview'),
+}
+
+# Task -> tier. Tasks not listed use 'pro'. Override with AI_TIER_<TASK>=fast|pro.
+TASK_TIERS: Dict[str, str] = {
+    'message_classification': 'fast',
+    'discussion': 'fast',
+    'logistics': 'fast',
+}
+
+# Minimal output contract per task: required keys and allowed values. Output of a cheaper tier
+# that breaks it (or reports confidence below the threshold) is re-asked on the next tier up.
+TASK_SCHEMAS: Dict[str, Dict[str, Any]] = {
+    'message_classification': {
+        'required': ['sentiment', 'intent', 'urgency'],
+        'enums': {'sentiment': ['negative', 'neutral', 'positive'],
+                  'intent': ['product_question', 'complaint', 'shipping_question', 'price_inquiry', 'negotiation', 'other']},
+    },
+    'discussion': {
+        'required': ['priority', 'suggested_reply'],
+        'enums': {'priority': ['high', 'medium', 'low']},
+    },
+    'logistics': {
+        'required': ['carrier', 'reason'],
+    },
+}
+
+_ESCALATION = ['fast', 'pro']
+
+
+def validate_output(task: str, response: Any) -> bool:
+    schema = TASK_SCHEMAS.get(task)
+    if schema is None:
+        return isinstance(response, (dict, list)) and not (isinstance(response, dict) and set(response) == {'raw'})
+    if not isinstance(response, dict):
+        return False
+    for key in schema.get('required', []):
+        if response.get(key) in (None, ''):
+            return False
+    for key, allowed in schema.get('enums', {}).items():
+        if key in response and response[key] not in allowed:
+            return False
+    return True
+
+
+class ModelRouter:
+    """Maps task types to model tiers and escalates when the cheaper tier's answer is unusable.
+
+    Tracks per-tier latency (p50/p95 over the last `window` calls), JSON/schema validity and escalations.
+    """
+
+    def __init__(self, tier_models: Dict[str, str] = None, task_tiers: Dict[str, str] = None,
+                 min_confidence: float = None, window: int = 500):
+        self.tier_models = dict(tier_models or TIER_MODELS)
+        self.task_tiers = dict(task_tiers or TASK_TIERS)
+        self.min_confidence = float(min_confidence if min_confidence is not None else os.environ.get('AI_ESCALATE_CONFIDENCE', '0.6'))
+        self._lock = threading.Lock()
+        self._window = window
+        self._tiers: Dict[str, Dict[str, Any]] = {}
+
+    def tier_for(self, task: str) -> str:
+        env = os.environ.get(f'AI_TIER_{(task or "default").upper()}')
+        if env in self.tier_models:
+            return env
+        return self.task_tiers.get(task or 'default', 'pro')
+
+    def model_for(self, task: str) -> str:
+        return self.tier_models[self.tier_for(task)]
+
+    def _next_tier(self, tier: str) -> Optional[str]:
+        idx = _ESCALATION.index(tier) if tier in _ESCALATION else len(_ESCALATION) - 1
+        return _ESCALATION[idx + 1] if idx + 1 < len(_ESCALATION) else None
+
+    def _needs_escalation(self, task: str, result: Dict[str, Any]) -> Optional[str]:
+        if not result.get('ok'):
+            return None  # errors go to the module fallback, a bigger model will not fix an outage
+        response = result.get('response')
+        if not validate_output(task, response):
+            return 'invalid_output'
+        conf = response.get('confidence') if isinstance(response, dict) else None
+        try:
+            if conf is not None and float(conf) < self.min_confidence:
+                return 'low_confidence'
+        except (TypeError, ValueError):
+            return 'invalid_output'
+        return None
+
+    def _record(self, tier: str, latency_s: float, result: Dict[str, Any], valid: bool, escalated: bool):
+        with self._lock:
+            s = self._tiers.setdefault(tier, {'calls': 0, 'errors': 0, 'valid': 0, 'escalated': 0,
+                                              'latencies': deque(maxlen=self._window)})
+            s['calls'] += 1
+            if not result.get('ok'):
+                s['errors'] += 1
+            elif valid:
+                s['valid'] += 1
+            if escalated:
+                s['escalated'] += 1
+            if not result.get('cached'):
+                s['latencies'].append(latency_s)
+
+    def _after_call(self, task: str, tier: str, start: float, result: Dict[str, Any]) -> Optional[str]:
+        reason = self._needs_escalation(task, result)
+        next_tier = self._next_tier(tier) if reason else None
+        self._record(tier, time.monotonic() - start, result, valid=result.get('ok') and reason != 'invalid_output',
+                     escalated=next_tier is not None)
+        if next_tier:
+            logger.info('Router: escalating %s from %s to %s (%s)', task, tier, next_tier, reason)
+        return next_tier
+
+    def generate(self, task: str, call: Callable[[str], Dict[str, Any]]) -> Dict[str, Any]:
+        """call(model) performs the actual (cached, guarded) model request."""
+        tier = self.tier_for(task)
+        while True:
+            start = time.monotonic()
+            result = call(self.tier_models[tier])
+            next_tier = self._after_call(task, tier, start, result)
+            if next_tier is None:
+                result['tier'] = tier
+                return result
+            tier = next_tier
+
+    async def agenerate(self, task: str, call: Callable[[str], Awaitable[Dict[str, Any]]]) -> Dict[str, Any]:
+        tier = self.tier_for(task)
+        while True:
+            start = time.monotonic()
+            result = await call(self.tier_models[tier])
+            next_tier = self._after_call(task, tier, start, result)
+            if next_tier is None:
+                result['tier'] = tier
+                return result
+            tier = next_tier
+
+    def stats(self) -> Dict[str, Any]:
+        out = {'tier_models': dict(self.tier_models), 'task_tiers': dict(self.task_tiers), 'tiers': {}}
+        with self._lock:
+            for tier, s in self._tiers.items():
+                lat = sorted(s['latencies'])
+                ok_calls = s['calls'] - s['errors']
+                out['tiers'][tier] = {
+                    'calls': s['calls'],
+                    'errors': s['errors'],
+                    'escalated': s['escalated'],
+                    'valid_rate': round(s['valid'] / ok_calls, 4) if ok_calls else None,
+                    'p50_latency_s': round(lat[len(lat) // 2], 4) if lat else None,
+                    'p95_latency_s': round(lat[min(len(lat) - 1, int(0.95 * len(lat)))], 4) if lat else None,
+                }
+        return out
+
+
+_router: Optional[ModelRouter] = None
+_router_lock = threading.Lock()
+
+
+def get_router() -> ModelRouter:
+    global _router
+    if _router is None:
+        with _router_lock:
+            if _router is None:
+                _router = ModelRouter()
+    return _router
+
+
+def set_router(router: ModelRouter):
+    global _router
+    _router = router
@@ -0,0 +1,90 @@
+import asyncio
+import logging
+import threading
+from concurrent.futures import Future
+from typing import Dict, Any, Callable, Awaitable, Tuple
+
+logger = logging.getLogger(__name__)
+
+
+class LeaderCancelled(RuntimeError):
+    """Raised to coalesced callers when the call they were waiting on was cancelled."""
+
+
+class SingleFlight:
+    """Coalesce concurrent calls that share a key into a single execution.
+
+    The first caller for a key (the leader) runs the function; callers arriving
+    while it is in progress wait for and share its result. Threaded callers use
+    do(), asyncio callers use ado(); both share the same in-flight table, so a
+    coroutine can wait on a call started by a worker thread and vice versa.
+    Both return (result, shared) where shared is True for coalesced callers.
+    """
+
+    def __init__(self):
+        self._inflight: Dict[str, Future] = {}
+        self._lock = threading.Lock()
+        self._stats = {'calls': 0, 'executed': 0, 'coalesced': 0}
+
+    def _join(self, key: str) -> Tuple[Future, bool]:
+        with self._lock:
+            self._stats['calls'] += 1
+            fut = self._inflight.get(key)
+            if fut is not None:
+                self._stats['coalesced'] += 1
+                return fut, False
+            fut = Future()
+            self._inflight[key] = fut
+            self._stats['executed'] += 1
+            return fut, True
+
+    def _finish(self, key: str, fut: Future):
+        with self._lock:
+            if self._inflight.get(key) is fut:
+                del self._inflight[key]
+
+    def do(self, key: str, fn: Callable[[], Any]) -> Tuple[Any, bool]:
+        fut, leader = self._join(key)
+        if not leader:
+            return fut.result(), True
+        try:
+            result = fn()
+        except BaseException as e:
+            self._finish(key, fut)
+            fut.set_exception(e)
+            raise
+        self._finish(key, fut)
+        fut.set_result(result)
+        return result, False
+
+    async def ado(self, key: str, coro_fn: Callable[[], Awaitable[Any]]) -> Tuple[Any, bool]:
+        fut, leader = self._join(key)
+        if not leader:
+            # shield: cancelling this waiter must not cancel the shared call
+            return await asyncio.shield(asyncio.wrap_future(fut)), True
+        try:
+            result = await coro_fn()
+        except asyncio.CancelledError:
+            self._finish(key, fut)
+            fut.set_exception(LeaderCancelled(f'in-flight call {key[:12]} was cancelled'))
+            raise
+        except BaseException as e:
+            self._finish(key, fut)
+            fut.set_exception(e)
+            raise
+        self._finish(key, fut)
+        fut.set_result(result)
+        return result, False
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            out = dict(self._stats)
+            out['in_flight'] = len(self._inflight)
+        return out
+
+
+_singleflight = SingleFlight()
+
+
+def get_singleflight() -> SingleFlight:
+    return _singleflight
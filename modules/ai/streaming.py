@@ -0,0 +1,70 @@
+import re
+import json
+from typing import Optional
+
+
+class JsonStringFieldExtractor:
+    """Pulls the value of one top-level string field out of a JSON document while it is still streaming.
+
+    feed(chunk) returns the newly decoded part of the field value ('' if nothing new yet), so
+    reply text can be shown before the closing brace arrives. Escapes split across chunks are held
+    back until complete. `done` turns True once the closing quote has been seen.
+    """
+
+    def __init__(self, field: str):
+        self._start = re.compile(r'"' + re.escape(field) + r'"\s*:\s*"')
+        self._buf = ''
+        self._in_value = False
+        self.done = False
+        self.value = ''
+
+    def feed(self, chunk: str) -> str:
+        if self.done or not chunk:
+            return ''
+        self._buf += chunk
+        if not self._in_value:
+            m = self._start.search(self._buf)
+            if not m:
+                # keep only a tail long enough to hold a split key
+                self._buf = self._buf[-(len(self._start.pattern) + 16):]
+                return ''
+            self._in_value = True
+            self._buf = self._buf[m.end():]
+        out = []
+        i = 0
+        buf = self._buf
+        while i < len(buf):
+            c = buf[i]
+            if c == '"':
+                self.done = True
+                i += 1
+                break
+            if c != '\\':
+                out.append(c)
+                i += 1
+                continue
+            seq = self._escape(buf, i)
+            if seq is None:
+                break  # incomplete escape: wait for the next chunk
+            out.append(json.loads('"' + seq + '"'))
+            i += len(seq)
+        self._buf = buf[i:]
+        text = ''.join(out)
+        self.value += text
+        return text
+
+    @staticmethod
+    def _escape(buf: str, i: int) -> Optional[str]:
+        if i + 1 >= len(buf):
+            return None
+        if buf[i + 1] != 'u':
+            return buf[i:i + 2]
+        if i + 6 > len(buf):
+            return None
+        seq = buf[i:i + 6]
+        if 0xD800 <= int(seq[2:], 16) <= 0xDBFF:
+            # high surrogate: decode together with the low half
+            if i + 12 > len(buf):
+                return None
+            return buf[i:i + 12]
+        return seq
@@ -0,0 +1,120 @@
+"""Minimal Allegro REST client for the Python backend.
+
+Base URL from ALLEGRO_API_URL (default https://api.allegro.pl; point it at
+modules.allegro.fake_allegro for offline runs), bearer token from ALLEGRO_API_TOKEN.
+"""
+import os
+import logging
+import threading
+from typing import Dict, Any, List, Optional
+
+try:
+    import requests
+    from requests.adapters import HTTPAdapter
+except Exception:
+    requests = None
+
+logger = logging.getLogger(__name__)
+
+MEDIA_TYPE = 'application/vnd.allegro.public.v1+json'
+
+
+class AllegroError(Exception):
+    def __init__(self, status: int, message: str):
+        super().__init__(f'Allegro HTTP {status}: {message}')
+        self.status = status
+
+
+class AllegroRateLimited(AllegroError):
+    def __init__(self, retry_after: Optional[float]):
+        super().__init__(429, 'rate limited')
+        self.retry_after = retry_after
+
+
+class AllegroClient:
+    def __init__(self, base_url: str = 'https://api.allegro.pl', token: str = None, timeout_s: float = 10.0,
+                 pool_size: int = 16):
+        if requests is None:
+            raise RuntimeError('requests not installed')
+        self.base_url = base_url.rstrip('/')
+        self.token = token
+        self.timeout_s = timeout_s
+        self.session = requests.Session()
+        # keep-alive connections for concurrent callers (requests' default pool holds 10)
+        adapter = HTTPAdapter(pool_connections=1, pool_maxsize=pool_size)
+        self.session.mount('https://', adapter)
+        self.session.mount('http://', adapter)
+
+    def _request(self, method: str, path: str, body: Any = None, params: Dict[str, Any] = None) -> Any:
+        headers = {'Accept': MEDIA_TYPE}
+        if body is not None:
+            headers['Content-Type'] = MEDIA_TYPE
+        if self.token:
+            headers['Authorization'] = f'Bearer {self.token}'
+        resp = self.session.request(method, self.base_url + path, json=body, params=params, headers=headers, timeout=self.timeout_s)
+        if resp.status_code == 429:
+            retry_after = resp.headers.get('Retry-After')
+            raise AllegroRateLimited(float(retry_after) if retry_after and retry_after.replace('.', '', 1).isdigit() else None)
+        if resp.status_code >= 400:
+            raise AllegroError(resp.status_code, resp.text[:300])
+        return resp.json() if resp.content else {}
+
+    # --- offer price change commands ----------------------------------------------------
+
+    def put_price_change_command(self, command_id: str, offer_ids: List[str], amount: float, currency: str = 'PLN') -> Dict[str, Any]:
+        """One FIXED_PRICE command for a group of offers (Allegro applies one modification per command)."""
+        body = {
+            'modification': {'type': 'FIXED_PRICE', 'price': {'amount': f'{amount:.2f}', 'currency': currency}},
+            'offerCriteria': [{'type': 'CONTAINS_OFFERS', 'offers': [{'id': str(o)} for o in offer_ids]}],
+        }
+        return self._request('PUT', f'/sale/offer-price-change-commands/{command_id}', body)
+
+    def get_price_change_command(self, command_id: str) -> Dict[str, Any]:
+        """{id, taskCount: {total, success, failed}}"""
+        return self._request('GET', f'/sale/offer-price-change-commands/{command_id}')
+
+    def get_price_change_tasks(self, command_id: str, limit: int = 1000, offset: int = 0) -> List[Dict[str, Any]]:
+        """[{offer: {id}, status: SUCCESS|FAIL|IN_PROGRESS, message}]"""
+        body = self._request('GET', f'/sale/offer-price-change-commands/{command_id}/tasks', params={'limit': limit, 'offset': offset})
+        return body.get('tasks', [])
+
+    # --- orders -------------------------------------------------------------------------
+
+    def get_order_events(self, from_id: str = None, types: List[str] = None, limit: int = 1000) -> List[Dict[str, Any]]:
+        """Order events after from_id, oldest first: [{id, occurredAt, type, order: {checkoutForm: {id}}}]"""
+        params: Dict[str, Any] = {'limit': limit}
+        if from_id:
+            params['from'] = from_id
+        if types:
+            params['type'] = list(types)
+        return self._request('GET', '/order/events', params=params).get('events', [])
+
+    def get_order_event_stats(self) -> Dict[str, Any]:
+        """{latestEvent: {id, occurredAt}}"""
+        return self._request('GET', '/order/event-stats')
+
+    def get_checkout_form(self, form_id: str) -> Dict[str, Any]:
+        return self._request('GET', f'/order/checkout-forms/{form_id}')
+
+
+_client: Optional[AllegroClient] = None
+_client_lock = threading.Lock()
+
+
+def get_allegro_client() -> AllegroClient:
+    global _client
+    if _client is None:
+        with _client_lock:
+            if _client is None:
+                _client = AllegroClient(
+                    base_url=os.environ.get('ALLEGRO_API_URL', 'https://api.allegro.pl'),
+                    token=os.environ.get('ALLEGRO_API_TOKEN'),
+                    timeout_s=float(os.environ.get('ALLEGRO_TIMEOUT_S', '10')),
+                    pool_size=int(os.environ.get('ALLEGRO_POOL_SIZE', '16')),
+                )
+    return _client
+
+
+def set_allegro_client(client: Optional[AllegroClient]):
+    global _client
+    _client = client
@@ -0,0 +1,287 @@
+"""Local stand-in for the Allegro REST API, for testing outbound integrations offline.
+
+Run:  python -m modules.allegro.fake_allegro --port 8767 --rate 5 --process-delay 0.5 --fail-rate 0.02
+Then: ALLEGRO_API_URL=http://127.0.0.1:8767
+
+Implemented:
+  PUT /sale/offer-price-change-commands/<id>        accept a FIXED_PRICE command (201; 409 if the id is reused
+                                                    with a different body)
+  GET /sale/offer-price-change-commands/<id>        {id, taskCount: {total, success, failed}}
+  GET /sale/offer-price-change-commands/<id>/tasks  per-offer task status
+  GET /order/events?from=&type=&limit=              order events after `from`, oldest first
+  GET /order/event-stats                            {latestEvent: {id, occurredAt}}
+  GET /order/checkout-forms/<id>                    one checkout form
+  GET /stats                                        request counters and current offer prices
+Requests above --rate per second (token bucket, burst --burst) get 429 with Retry-After. Command tasks
+finish --process-delay seconds after submission; each offer fails with probability --fail-rate.
+--orders N seeds N synthetic paid orders; tests add more with server.add_order() / update_order().
+"""
+import json
+import time
+import uuid
+import random
+import logging
+import argparse
+import threading
+from datetime import datetime, timezone
+from urllib.parse import urlsplit, parse_qs
+from http.server import ThreadingHTTPServer, BaseHTTPRequestHandler
+from typing import Dict, Any, List, Optional
+
+logger = logging.getLogger(__name__)
+
+COMMANDS_PATH = '/sale/offer-price-change-commands/'
+FORMS_PATH = '/order/checkout-forms/'
+
+
+def _now_iso() -> str:
+    return datetime.now(timezone.utc).isoformat(timespec='milliseconds').replace('+00:00', 'Z')
+
+
+class FakeAllegroServer(ThreadingHTTPServer):
+    daemon_threads = True
+
+    def __init__(self, address, rate: float = 0.0, burst: int = 5, process_delay: float = 0.2,
+                 fail_rate: float = 0.0, seed: Optional[int] = None):
+        super().__init__(address, _Handler)
+        self.rate = rate
+        self.burst = burst
+        self.process_delay = process_delay
+        self.fail_rate = fail_rate
+        self.rng = random.Random(seed)
+        self._lock = threading.Lock()
+        self._tokens = float(burst)
+        self._refilled = time.monotonic()
+        self.commands: Dict[str, Dict[str, Any]] = {}
+        # offer id -> current price amount (what a seller would see on the listing)
+        self.prices: Dict[str, float] = {}
+        # order events feed: ids are increasing integers (as strings), forms are the current checkout forms
+        self.events: List[Dict[str, Any]] = []
+        self.forms: Dict[str, Dict[str, Any]] = {}
+        self.counters = {'requests': 0, 'rate_limited': 0, 'commands': 0, 'offers_changed': 0, 'offers_failed': 0,
+                         'event_polls': 0, 'form_fetches': 0}
+
+    def admit(self) -> Optional[float]:
+        """None when the request may proceed, else seconds until a token is available."""
+        with self._lock:
+            self.counters['requests'] += 1
+            if self.rate <= 0:
+                return None
+            now = time.monotonic()
+            self._tokens = min(self.burst, self._tokens + (now - self._refilled) * self.rate)
+            self._refilled = now
+            if self._tokens >= 1:
+                self._tokens -= 1
+                return None
+            self.counters['rate_limited'] += 1
+            return (1 - self._tokens) / self.rate
+
+    def submit(self, command_id: str, body: Dict[str, Any]) -> int:
+        modification = body.get('modification') or {}
+        if modification.get('type') != 'FIXED_PRICE':
+            return 422
+        amount = float(modification['price']['amount'])
+        offer_ids = [o['id'] for c in body.get('offerCriteria', []) for o in c.get('offers', [])]
+        with self._lock:
+            existing = self.commands.get(command_id)
+            if existing is not None:
+                return 200 if existing['body'] == body else 409
+            tasks = {oid: ('FAIL' if self.rng.random() < self.fail_rate else 'SUCCESS') for oid in offer_ids}
+            self.commands[command_id] = {'body': body, 'amount': amount, 'tasks': tasks,
+                                         'ready_at': time.monotonic() + self.process_delay, 'applied': False}
+            self.counters['commands'] += 1
+        return 201
+
+    def command(self, command_id: str) -> Optional[Dict[str, Any]]:
+        with self._lock:
+            cmd = self.commands.get(command_id)
+            if cmd is None:
+                return None
+            ready = time.monotonic() >= cmd['ready_at']
+            if ready and not cmd['applied']:
+                cmd['applied'] = True
+                for oid, status in cmd['tasks'].items():
+                    if status == 'SUCCESS':
+                        self.prices[oid] = cmd['amount']
+                        self.counters['offers_changed'] += 1
+                    else:
+                        self.counters['offers_failed'] += 1
+            return {'ready': ready, 'tasks': dict(cmd['tasks'])}
+
+
+    # --- orders ---------------------------------------------------------------------------
+
+    def _emit(self, form_id: str, event_type: str):
+        # caller holds the lock
+        self.events.append({'id': str(len(self.events) + 1), 'occurredAt': _now_iso(), 'type': event_type,
+                            'order': {'checkoutForm': {'id': form_id}}})
+
+    def add_order(self, form: Dict[str, Any] = None, event_type: str = 'READY_FOR_PROCESSING') -> str:
+        """Store a checkout form (synthetic when None) and emit its event; returns the form id."""
+        with self._lock:
+            form = dict(form or self._synthetic_form())
+            form.setdefault('id', str(uuid.uuid4()))
+            form['updatedAt'] = _now_iso()
+            self.forms[form['id']] = form
+            self._emit(form['id'], event_type)
+        return form['id']
+
+    def update_order(self, form_id: str, event_type: str = 'BUYER_MODIFIED', **changes):
+        with self._lock:
+            self.forms[form_id].update(changes, updatedAt=_now_iso())
+            self._emit(form_id, event_type)
+
+    def generate_orders(self, n: int) -> List[str]:
+        return [self.add_order() for _ in range(n)]
+
+    def _synthetic_form(self) -> Dict[str, Any]:
+        items = []
+        for _ in range(self.rng.randint(1, 3)):
+            offer_id = str(self.rng.randint(10 ** 9, 10 ** 10))
+            price = round(self.rng.uniform(20, 400), 2)
+            items.append({'id': str(uuid.uuid4()), 'offer': {'id': offer_id, 'name': f'Offer {offer_id}', 'external': {'id': f'SKU-{offer_id[-4:]}'}},
+                          'quantity': self.rng.randint(1, 2), 'price': {'amount': f'{price:.2f}', 'currency': 'PLN'},
+                          'boughtAt': _now_iso()})
+        total = sum(float(i['price']['amount']) * i['quantity'] for i in items)
+        return {
+            'status': 'READY_FOR_PROCESSING',
+            'buyer': {'id': str(self.rng.randint(1, 10 ** 6)), 'login': f'buyer{self.rng.randint(1, 99999)}', 'email': 'buyer@example.com'},
+            'lineItems': items,
+            'delivery': {'method': {'name': 'Allegro Paczkomaty InPost'},
+                         'address': {'city': 'Warszawa', 'zipCode': '00-001', 'countryCode': 'PL'}},
+            'fulfillment': {'status': 'NEW'},
+            'summary': {'totalToPay': {'amount': f'{total:.2f}', 'currency': 'PLN'}},
+        }
+
+    def events_after(self, from_id: Optional[str], types: List[str], limit: int) -> List[Dict[str, Any]]:
+        with self._lock:
+            self.counters['event_polls'] += 1
+            start = int(from_id) if from_id else 0
+            out = [e for e in self.events[start:] if not types or e['type'] in types]
+            return out[:limit]
+
+    def form(self, form_id: str) -> Optional[Dict[str, Any]]:
+        with self._lock:
+            self.counters['form_fetches'] += 1
+            form = self.forms.get(form_id)
+            return dict(form) if form else None
+
+
+class _Handler(BaseHTTPRequestHandler):
+    protocol_version = 'HTTP/1.1'
+
+    def log_message(self, fmt, *args):
+        logger.debug(fmt, *args)
+
+    def _send(self, status: int, payload: Any = None, headers: Dict[str, str] = None):
+        body = json.dumps(payload).encode('utf-8') if payload is not None else b''
+        self.send_response(status)
+        self.send_header('Content-Type', 'application/vnd.allegro.public.v1+json')
+        for k, v in (headers or {}).items():
+            self.send_header(k, v)
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        if body:
+            self.wfile.write(body)
+
+    def _admitted(self) -> bool:
+        wait = self.server.admit()
+        if wait is None:
+            return True
+        self._send(429, {'errors': [{'code': 'TooManyRequests'}]}, {'Retry-After': f'{wait:.2f}'})
+        return False
+
+    def do_PUT(self):
+        # read the body even when rejecting, or it would be parsed as the next request on the connection
+        raw = self.rfile.read(int(self.headers.get('Content-Length') or 0))
+        if not self.path.startswith(COMMANDS_PATH):
+            return self._send(404, {'errors': [{'code': 'NotFound'}]})
+        if not self._admitted():
+            return
+        command_id = self.path[len(COMMANDS_PATH):]
+        try:
+            status = self.server.submit(command_id, json.loads(raw or b'{}'))
+        except (ValueError, KeyError, TypeError):
+            status = 422
+        if status == 422:
+            return self._send(422, {'errors': [{'code': 'ValidationError'}]})
+        if status == 409:
+            return self._send(409, {'errors': [{'code': 'Conflict'}]})
+        self._send(status, {'id': command_id})
+
+    def do_GET(self):
+        if self.path == '/stats':
+            return self._send(200, dict(self.server.counters, prices=self.server.prices, orders=len(self.server.forms),
+                                        events=len(self.server.events)))
+        path = self.path.split('?', 1)[0]
+        if path.startswith('/order/'):
+            return self._orders(path)
+        if not path.startswith(COMMANDS_PATH):
+            return self._send(404, {'errors': [{'code': 'NotFound'}]})
+        if not self._admitted():
+            return
+        command_id, _, sub = path[len(COMMANDS_PATH):].partition('/')
+        cmd = self.server.command(command_id)
+        if cmd is None:
+            return self._send(404, {'errors': [{'code': 'NotFound'}]})
+        tasks = cmd['tasks']
+        if sub == 'tasks':
+            return self._send(200, {'tasks': [
+                {'offer': {'id': oid}, 'status': status if cmd['ready'] else 'IN_PROGRESS',
+                 'message': 'stand-in injected failure' if cmd['ready'] and status == 'FAIL' else ''}
+                for oid, status in tasks.items()]})
+        done = list(tasks.values()) if cmd['ready'] else []
+        self._send(200, {'id': command_id, 'taskCount': {'total': len(tasks), 'success': done.count('SUCCESS'),
+                                                         'failed': done.count('FAIL')}})
+
+
+    def _orders(self, path: str):
+        if not self._admitted():
+            return
+        if path == '/order/events':
+            query = parse_qs(urlsplit(self.path).query)
+            limit = min(1000, int((query.get('limit') or ['100'])[0]))
+            events = self.server.events_after((query.get('from') or [None])[0], query.get('type') or [], limit)
+            return self._send(200, {'events': events})
+        if path == '/order/event-stats':
+            latest = self.server.events[-1] if self.server.events else None
+            return self._send(200, {'latestEvent': {'id': latest['id'], 'occurredAt': latest['occurredAt']} if latest else None})
+        if path.startswith(FORMS_PATH):
+            form = self.server.form(path[len(FORMS_PATH):])
+            if form is not None:
+                return self._send(200, form)
+        self._send(404, {'errors': [{'code': 'NotFound'}]})
+
+
+def start_fake_allegro(host: str = '127.0.0.1', port: int = 0, **kwargs) -> FakeAllegroServer:
+    """Start the stand-in in a background thread; port=0 picks a free port (see server.server_port)."""
+    server = FakeAllegroServer((host, port), **kwargs)
+    threading.Thread(target=server.serve_forever, name='fake-allegro', daemon=True).start()
+    return server
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Local Allegro REST API stand-in')
+    parser.add_argument('--host', default='127.0.0.1')
+    parser.add_argument('--port', type=int, default=8767)
+    parser.add_argument('--rate', type=float, default=5.0, help='requests per second before 429 (0 = unlimited)')
+    parser.add_argument('--burst', type=int, default=5)
+    parser.add_argument('--process-delay', type=float, default=0.5)
+    parser.add_argument('--fail-rate', type=float, default=0.0)
+    parser.add_argument('--seed', type=int, default=None)
+    parser.add_argument('--orders', type=int, default=0, help='synthetic paid orders to seed the events feed with')
+    args = parser.parse_args()
+
+    server = FakeAllegroServer((args.host, args.port), rate=args.rate, burst=args.burst, process_delay=args.process_delay,
+                               fail_rate=args.fail_rate, seed=args.seed)
+    server.generate_orders(args.orders)
+    logging.basicConfig(level=logging.INFO)
+    logger.info('Fake Allegro API listening on http://%s:%d', args.host, server.server_port)
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,327 @@
+"""Incremental order intake from Allegro's order events feed.
+
+Each run reads GET /order/events from the persisted cursor (the id of the last event handled) and
+collects the checkout forms the new events point at. Each form is fetched once per run, even when
+several events mention it. Forms are fetched concurrently and each one is handed to the sink, by
+default the durable order job queue (modules/orders/job_queue.py), so the fetch threads only
+enqueue and the workflow runs on the queue's workers. A form whose updatedAt was already handed
+over is skipped, so replayed events cost one fetch and no reprocessing. Cancelled forms go to the
+sink as well; process_new_order then marks the stored order cancelled and removes its P&L. The cursor moves only after every form of a page has been fetched or parked for
+retry. A failing form is retried on the next runs (up to max_retries) instead of blocking the feed.
+On a 429 the forms not fetched yet are parked (without using up their retries) and the run stops;
+the loop waits for Retry-After before the next run.
+"""
+import os
+import time
+import sqlite3
+import logging
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from typing import Dict, Any, List, Optional, Callable
+
+from modules.allegro.client import AllegroClient, AllegroError, AllegroRateLimited, get_allegro_client
+
+logger = logging.getLogger(__name__)
+
+SCHEMA = '''
+CREATE TABLE IF NOT EXISTS sync_state (key TEXT PRIMARY KEY, value TEXT);
+CREATE TABLE IF NOT EXISTS forms (form_id TEXT PRIMARY KEY, updated_at TEXT, status TEXT, synced_at REAL NOT NULL);
+CREATE TABLE IF NOT EXISTS retry (form_id TEXT PRIMARY KEY, attempts INTEGER NOT NULL, last_error TEXT);
+'''
+
+EVENT_TYPES = ('READY_FOR_PROCESSING', 'BUYER_MODIFIED', 'BUYER_CANCELLED', 'AUTO_CANCELLED')
+# forms in these statuses are handed to the sink; others (e.g. still unpaid) are only recorded
+PROCESS_STATUSES = ('READY_FOR_PROCESSING',)
+# cancellations are handed to the sink too: process_new_order takes the order out of the store's P&L
+CANCELLED_STATUSES = ('CANCELLED',)
+
+
+def _amount(money: Optional[Dict[str, Any]]) -> float:
+    try:
+        return float((money or {}).get('amount') or 0)
+    except (TypeError, ValueError):
+        return 0.0
+
+
+def checkout_form_to_order(form: Dict[str, Any]) -> Dict[str, Any]:
+    """Map an Allegro checkout form to the order dict process_new_order takes.
+
+    Items carry no costs: CostModel.from_order resolves them (and the category fee) from the cost table by SKU.
+    """
+    items = []
+    for li in form.get('lineItems') or []:
+        offer = li.get('offer') or {}
+        items.append({
+            'id': offer.get('id'),
+            'sku': (offer.get('external') or {}).get('id') or offer.get('id'),
+            'name': offer.get('name'),
+            'qty': int(li.get('quantity') or 1),
+            'price': _amount(li.get('price')),
+        })
+    delivery = form.get('delivery') or {}
+    address = delivery.get('address') or {}
+    bought = [li.get('boughtAt') for li in form.get('lineItems') or [] if li.get('boughtAt')]
+    return {
+        'order_id': form['id'],
+        'source': 'allegro',
+        'status': form.get('status'),
+        'total_price': _amount((form.get('summary') or {}).get('totalToPay')),
+        'currency': ((form.get('summary') or {}).get('totalToPay') or {}).get('currency', 'PLN'),
+        'items': items,
+        'buyer': {k: (form.get('buyer') or {}).get(k) for k in ('id', 'login', 'email')},
+        'shipping_to': {'country': address.get('countryCode', ''), 'city': address.get('city'), 'zip': address.get('zipCode')},
+        'delivery_method': (delivery.get('method') or {}).get('name'),
+        'created_at': min(bought) if bought else form.get('updatedAt'),
+        'updatedAt': form.get('updatedAt'),
+        'summary': form.get('summary'),
+    }
+
+
+def default_sink() -> Callable[[Dict[str, Any]], Any]:
+    """Enqueue on the process-wide order job queue; its workers run the workflow."""
+    from modules.orders.job_queue import get_order_job_queue
+    return get_order_job_queue().enqueue
+
+
+class OrderSync:
+    def __init__(self, db_path: str = 'order_sync.db', client: AllegroClient = None, sink: Callable[[Dict[str, Any]], Any] = None,
+                 workers: int = 8, page_size: int = 1000, max_pages: int = 50, interval_s: float = 30.0,
+                 max_retries: int = 5, event_types: tuple = EVENT_TYPES, start_at: str = 'beginning'):
+        self._client = client
+        self._sink = sink
+        self.workers = workers
+        self.page_size = page_size
+        self.max_pages = max_pages
+        self.interval_s = interval_s
+        self.max_retries = max_retries
+        self.event_types = list(event_types)
+        self.start_at = start_at
+        self._lock = threading.Lock()
+        self._run_lock = threading.Lock()
+        self._conn = sqlite3.connect(db_path, check_same_thread=False)
+        with self._lock:
+            self._conn.execute('PRAGMA journal_mode=WAL')
+            self._conn.executescript(SCHEMA)
+            self._conn.commit()
+        self._pool = ThreadPoolExecutor(max_workers=workers, thread_name_prefix='order-sync')
+        self._stats = {'runs': 0, 'events': 0, 'forms_fetched': 0, 'processed': 0, 'cancelled': 0, 'unchanged': 0,
+                       'skipped_status': 0, 'errors': 0, 'retried': 0, 'dropped': 0, 'rate_limited': 0}
+        self._last_run: Dict[str, Any] = {}
+        self._limited_until = 0.0  # monotonic time before which the loop must not call Allegro (after a 429)
+        self._thread: Optional[threading.Thread] = None
+        self._stop = threading.Event()
+
+    @property
+    def client(self) -> AllegroClient:
+        if self._client is None:
+            self._client = get_allegro_client()
+        return self._client
+
+    @property
+    def sink(self) -> Callable[[Dict[str, Any]], Any]:
+        if self._sink is None:
+            self._sink = default_sink()
+        return self._sink
+
+    def _count(self, field: str, n: int = 1):
+        with self._lock:
+            self._stats[field] += n
+
+    # --- cursor -------------------------------------------------------------------------
+
+    def cursor(self) -> Optional[str]:
+        with self._lock:
+            row = self._conn.execute("SELECT value FROM sync_state WHERE key = 'cursor'").fetchone()
+        return row[0] if row else None
+
+    def set_cursor(self, event_id: Optional[str]):
+        with self._lock:
+            self._conn.execute("INSERT OR REPLACE INTO sync_state (key, value) VALUES ('cursor', ?)", (event_id,))
+            self._conn.commit()
+
+    def _initial_cursor(self) -> Optional[str]:
+        """No cursor yet: 'latest' skips the backlog (only orders from now on), 'beginning' reads every retained event."""
+        if self.start_at != 'latest':
+            return None
+        latest = (self.client.get_order_event_stats() or {}).get('latestEvent') or {}
+        self.set_cursor(latest.get('id'))
+        return latest.get('id')
+
+    # --- forms --------------------------------------------------------------------------
+
+    def _seen(self, form_ids: List[str]) -> Dict[str, str]:
+        with self._lock:
+            rows = self._conn.execute(f'SELECT form_id, updated_at FROM forms WHERE form_id IN ({",".join("?" * len(form_ids))})',
+                                      form_ids).fetchall() if form_ids else []
+        return dict(rows)
+
+    def _handle_form(self, form_id: str, seen_updated_at: Optional[str]) -> str:
+        """Fetch one form and hand it to the sink; returns the outcome. Raises AllegroRateLimited."""
+        form = self.client.get_checkout_form(form_id)
+        self._count('forms_fetched')
+        if form.get('updatedAt') and form.get('updatedAt') == seen_updated_at:
+            return 'unchanged'
+        if form.get('status') in PROCESS_STATUSES:
+            self.sink(checkout_form_to_order(form))
+            outcome = 'processed'
+        elif form.get('status') in CANCELLED_STATUSES:
+            self.sink(checkout_form_to_order(form))
+            outcome = 'cancelled'
+        else:
+            outcome = 'skipped_status'
+        with self._lock:
+            self._conn.execute('INSERT OR REPLACE INTO forms (form_id, updated_at, status, synced_at) VALUES (?, ?, ?, ?)',
+                               (form_id, form.get('updatedAt'), form.get('status'), time.time()))
+            self._conn.execute('DELETE FROM retry WHERE form_id = ?', (form_id,))
+            self._conn.commit()
+        return outcome
+
+    def _defer(self, form_ids: List[str]):
+        """Park rate-limited forms for the next run; they keep their attempt count."""
+        with self._lock:
+            self._conn.executemany('INSERT OR IGNORE INTO retry (form_id, attempts, last_error) VALUES (?, 0, ?)',
+                                   [(fid, 'rate_limited') for fid in form_ids])
+            self._conn.commit()
+
+    def _park(self, form_id: str, error: str):
+        with self._lock:
+            row = self._conn.execute('SELECT attempts FROM retry WHERE form_id = ?', (form_id,)).fetchone()
+            attempts = (row[0] if row else 0) + 1
+            if attempts > self.max_retries:
+                self._conn.execute('DELETE FROM retry WHERE form_id = ?', (form_id,))
+                self._stats['dropped'] += 1
+                logger.error('Order sync: giving up on checkout form %s after %d attempts: %s', form_id, attempts - 1, error)
+            else:
+                self._conn.execute('INSERT OR REPLACE INTO retry (form_id, attempts, last_error) VALUES (?, ?, ?)',
+                                   (form_id, attempts, error))
+            self._conn.commit()
+
+    def _handle_forms(self, form_ids: List[str]) -> bool:
+        """Fetch and sink forms concurrently; every form ends handled or parked. False when rate limited."""
+        seen = self._seen(form_ids)
+        futures = {fid: self._pool.submit(self._handle_form, fid, seen.get(fid)) for fid in form_ids}
+        limited = None
+        deferred = []
+        for fid, fut in futures.items():
+            try:
+                self._count(fut.result())
+            except AllegroRateLimited as e:
+                limited = e
+                deferred.append(fid)
+            except Exception as e:
+                # 404 and other errors: park the form for a later run and keep the feed moving
+                logger.warning('Order sync: checkout form %s failed: %s', fid, e)
+                self._count('errors')
+                self._park(fid, str(e)[:300])
+        if limited is not None:
+            self._defer(deferred)
+            self._count('rate_limited')
+            self._limited_until = time.monotonic() + (limited.retry_after or self.interval_s)
+            return False
+        return True
+
+    # --- runs ---------------------------------------------------------------------------
+
+    def run_once(self) -> Dict[str, Any]:
+        """Read new events (up to max_pages pages) and process the forms they name."""
+        with self._run_lock:
+            started = time.monotonic()
+            before = dict(self._stats)
+            self._count('runs')
+            try:
+                with self._lock:
+                    retry_ids = [r[0] for r in self._conn.execute('SELECT form_id FROM retry LIMIT ?', (self.page_size,))]
+                if retry_ids:
+                    self._count('retried', len(retry_ids))
+                    if not self._handle_forms(retry_ids):
+                        return self._finish(started, before, 'rate_limited')
+
+                cursor = self.cursor() or self._initial_cursor()
+                for _ in range(self.max_pages):
+                    events = self.client.get_order_events(cursor, self.event_types, self.page_size)
+                    if not events:
+                        break
+                    self._count('events', len(events))
+                    form_ids = list(dict.fromkeys(e['order']['checkoutForm']['id'] for e in events))
+                    complete = self._handle_forms(form_ids)
+                    cursor = events[-1]['id']
+                    self.set_cursor(cursor)
+                    if not complete:
+                        return self._finish(started, before, 'rate_limited')
+                    if len(events) < self.page_size:
+                        break
+            except AllegroRateLimited as e:
+                self._count('rate_limited')
+                self._limited_until = time.monotonic() + (e.retry_after or self.interval_s)
+                return self._finish(started, before, 'rate_limited')
+            except AllegroError as e:
+                logger.warning('Order sync: events feed failed: %s', e)
+                return self._finish(started, before, 'error')
+            return self._finish(started, before, 'ok')
+
+    def _finish(self, started: float, before: Dict[str, int], result: str) -> Dict[str, Any]:
+        with self._lock:
+            delta = {k: v - before.get(k, 0) for k, v in self._stats.items() if k != 'runs'}
+        self._last_run = dict(delta, result=result, elapsed_s=round(time.monotonic() - started, 3), cursor=self.cursor())
+        return self._last_run
+
+    def _loop(self):
+        while not self._stop.is_set():
+            wait = max(0.0, self._limited_until - time.monotonic())
+            if wait:
+                self._stop.wait(wait)
+                continue
+            try:
+                self.run_once()
+            except Exception:
+                logger.exception('Order sync run failed')
+            self._stop.wait(self.interval_s)
+
+    def start(self):
+        if self._thread and self._thread.is_alive():
+            return
+        self._stop.clear()
+        self._thread = threading.Thread(target=self._loop, name='order-sync-loop', daemon=True)
+        self._thread.start()
+        logger.info('Order sync started (every %.0fs, %d fetch workers)', self.interval_s, self.workers)
+
+    def stop(self, timeout: float = 5.0):
+        self._stop.set()
+        if self._thread:
+            self._thread.join(timeout)
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            forms = self._conn.execute('SELECT COUNT(*) FROM forms').fetchone()[0]
+            retrying = self._conn.execute('SELECT COUNT(*) FROM retry').fetchone()[0]
+            out = dict(self._stats, forms_known=forms, retrying=retrying, last_run=self._last_run)
+        out['cursor'] = self.cursor()
+        out['running'] = bool(self._thread and self._thread.is_alive())
+        return out
+
+
+_sync: Optional[OrderSync] = None
+_sync_lock = threading.Lock()
+
+
+def get_order_sync() -> OrderSync:
+    """Process-wide sync configured from ORDER_SYNC_* env vars (not started until start())."""
+    global _sync
+    if _sync is None:
+        with _sync_lock:
+            if _sync is None:
+                types = os.environ.get('ORDER_SYNC_EVENT_TYPES')
+                _sync = OrderSync(
+                    db_path=os.environ.get('ORDER_SYNC_DB', 'order_sync.db'),
+                    workers=int(os.environ.get('ORDER_SYNC_WORKERS', '8')),
+                    interval_s=float(os.environ.get('ORDER_SYNC_INTERVAL_S', '30')),
+                    max_retries=int(os.environ.get('ORDER_SYNC_MAX_RETRIES', '5')),
+                    event_types=tuple(t.strip() for t in types.split(',') if t.strip()) if types else EVENT_TYPES,
+                    start_at=os.environ.get('ORDER_SYNC_START', 'beginning'),
+                )
+    return _sync
+
+
+def set_order_sync(sync: Optional[OrderSync]):
+    global _sync
+    _sync = sync
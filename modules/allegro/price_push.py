@@ -0,0 +1,362 @@
+"""Outbound price-change queue to Allegro.
+
+enqueue() records the latest price per offer in SQLite (a newer price for a queued offer replaces
+the older one). A background loop groups pending offers by target price into Allegro
+offer-price-change commands (one FIXED_PRICE modification per command, up to batch_size offers),
+submits them under a token bucket and polls each command until its tasks finish. Failed offers are
+retried up to max_attempts. Offers with a command in flight are held back so changes to one offer
+are applied in order. Commands are stored before they are sent and re-sent with the same id after
+a restart (PUT is idempotent per command id).
+"""
+import os
+import time
+import uuid
+import sqlite3
+import logging
+import threading
+from typing import Dict, Any, List, Optional
+
+from modules.allegro.client import AllegroClient, AllegroError, AllegroRateLimited, get_allegro_client
+
+logger = logging.getLogger(__name__)
+
+SCHEMA = '''
+CREATE TABLE IF NOT EXISTS pending (offer_id TEXT PRIMARY KEY, price REAL NOT NULL, currency TEXT NOT NULL,
+                                    attempts INTEGER NOT NULL DEFAULT 0, enqueued_at REAL NOT NULL);
+CREATE TABLE IF NOT EXISTS commands (command_id TEXT PRIMARY KEY, price REAL NOT NULL, currency TEXT NOT NULL,
+                                     status TEXT NOT NULL, created_at REAL NOT NULL, next_poll_at REAL);
+CREATE TABLE IF NOT EXISTS command_offers (offer_id TEXT PRIMARY KEY, command_id TEXT NOT NULL, attempts INTEGER NOT NULL);
+CREATE INDEX IF NOT EXISTS command_offers_by_command ON command_offers (command_id);
+CREATE TABLE IF NOT EXISTS offer_status (offer_id TEXT PRIMARY KEY, price REAL, status TEXT NOT NULL, command_id TEXT,
+                                         error TEXT, updated_at REAL NOT NULL);
+'''
+
+
+class TokenBucket:
+    """rate tokens per second up to burst; pause() blocks it after a 429."""
+
+    def __init__(self, rate: float, burst: int):
+        self.rate = rate
+        self.burst = burst
+        self._tokens = float(burst)
+        self._refilled = time.monotonic()
+        self._blocked_until = 0.0
+        self._lock = threading.Lock()
+
+    def try_acquire(self) -> bool:
+        with self._lock:
+            now = time.monotonic()
+            if now < self._blocked_until:
+                return False
+            self._tokens = min(self.burst, self._tokens + (now - self._refilled) * self.rate)
+            self._refilled = now
+            if self._tokens >= 1:
+                self._tokens -= 1
+                return True
+            return False
+
+    def pause(self, seconds: float):
+        with self._lock:
+            self._blocked_until = max(self._blocked_until, time.monotonic() + seconds)
+            self._tokens = 0.0
+
+    def state(self) -> Dict[str, Any]:
+        with self._lock:
+            return {'rate': self.rate, 'burst': self.burst, 'tokens': round(self._tokens, 2),
+                    'paused_for_s': round(max(0.0, self._blocked_until - time.monotonic()), 3)}
+
+
+class PricePushQueue:
+    def __init__(self, db_path: str = 'price_push.db', client: AllegroClient = None, batch_size: int = 1000,
+                 rate: float = 1.0, burst: int = 5, poll_interval_s: float = 2.0, max_attempts: int = 3,
+                 tick_s: float = 0.5, max_in_flight: int = 50):
+        self._client = client
+        self.max_in_flight = max_in_flight
+        self.batch_size = batch_size
+        self.poll_interval_s = poll_interval_s
+        self.max_attempts = max_attempts
+        self.tick_s = tick_s
+        self.bucket = TokenBucket(rate, burst)
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(db_path, check_same_thread=False)
+        with self._lock:
+            self._conn.executescript(SCHEMA)
+            self._conn.commit()
+        self._stats = {'enqueued': 0, 'coalesced': 0, 'commands_sent': 0, 'rate_limited': 0, 'send_errors': 0,
+                       'polls': 0, 'applied': 0, 'retried': 0, 'failed': 0}
+        self._thread: Optional[threading.Thread] = None
+        self._stop = threading.Event()
+        # 429s in a row; each one doubles the pause, since Retry-After only covers the next single request
+        self._limited_streak = 0
+
+    @property
+    def client(self) -> AllegroClient:
+        if self._client is None:
+            self._client = get_allegro_client()
+        return self._client
+
+    def _count(self, field: str, n: int = 1):
+        with self._lock:
+            self._stats[field] += n
+
+    def _rate_limited(self, e: AllegroRateLimited):
+        self._count('rate_limited')
+        self._limited_streak += 1
+        wait = 1.0 if e.retry_after is None else max(0.1, e.retry_after)
+        self.bucket.pause(min(30.0, wait * 2 ** (self._limited_streak - 1)))
+
+    def _set_status(self, rows: List[tuple]):
+        """rows: (offer_id, price, status, command_id, error); caller holds the lock."""
+        now = time.time()
+        self._conn.executemany('INSERT OR REPLACE INTO offer_status (offer_id, price, status, command_id, error, updated_at) '
+                               'VALUES (?, ?, ?, ?, ?, ?)', [r + (now,) for r in rows])
+
+    # --- producers ----------------------------------------------------------------------
+
+    def enqueue(self, offer_id: str, price: float, currency: str = 'PLN') -> Dict[str, Any]:
+        return self.enqueue_many([{'offer_id': offer_id, 'price': price, 'currency': currency}])
+
+    def enqueue_many(self, changes: List[Dict[str, Any]]) -> Dict[str, Any]:
+        """Queue price changes; a queued change for the same offer is replaced (latest wins)."""
+        now = time.time()
+        rows = [(str(c['offer_id']), round(float(c['price']), 2), c.get('currency') or 'PLN', now) for c in changes]
+        with self._lock:
+            ids = [r[0] for r in rows]
+            existing = set()
+            for i in range(0, len(ids), 500):
+                chunk = ids[i:i + 500]
+                existing.update(r[0] for r in self._conn.execute(
+                    f'SELECT offer_id FROM pending WHERE offer_id IN ({",".join("?" * len(chunk))})', chunk))
+            # a replaced change keeps its place in line (enqueued_at) so hot offers are not starved
+            self._conn.executemany(
+                'INSERT INTO pending (offer_id, price, currency, attempts, enqueued_at) VALUES (?, ?, ?, 0, ?) '
+                'ON CONFLICT(offer_id) DO UPDATE SET price = excluded.price, currency = excluded.currency, attempts = 0', rows)
+            self._set_status([(r[0], r[1], 'queued', None, None) for r in rows])
+            self._conn.commit()
+            coalesced = len(existing) + (len(ids) - len(set(ids)))
+            self._stats['enqueued'] += len(rows)
+            self._stats['coalesced'] += coalesced
+        return {'ok': True, 'queued': len(rows), 'coalesced': coalesced}
+
+    # --- submission ---------------------------------------------------------------------
+
+    def _build_commands(self, limit_commands: int) -> int:
+        """Move pending offers into new command rows, grouped by (price, currency); returns commands built."""
+        with self._lock:
+            rows = self._conn.execute(
+                'SELECT p.offer_id, p.price, p.currency, p.attempts FROM pending p '
+                'WHERE NOT EXISTS (SELECT 1 FROM command_offers c WHERE c.offer_id = p.offer_id) '
+                'ORDER BY p.enqueued_at LIMIT ?', (self.batch_size * limit_commands,)).fetchall()
+            groups: Dict[tuple, List[tuple]] = {}
+            for offer_id, price, currency, attempts in rows:
+                groups.setdefault((price, currency), []).append((offer_id, attempts))
+            built = 0
+            now = time.time()
+            for (price, currency), offers in groups.items():
+                for i in range(0, len(offers), self.batch_size):
+                    if built >= limit_commands:
+                        break
+                    chunk = offers[i:i + self.batch_size]
+                    command_id = str(uuid.uuid4())
+                    self._conn.execute('INSERT INTO commands (command_id, price, currency, status, created_at) VALUES (?, ?, ?, ?, ?)',
+                                       (command_id, price, currency, 'new', now))
+                    self._conn.executemany('INSERT INTO command_offers (offer_id, command_id, attempts) VALUES (?, ?, ?)',
+                                           [(o, command_id, a) for o, a in chunk])
+                    self._conn.executemany('DELETE FROM pending WHERE offer_id = ?', [(o,) for o, _ in chunk])
+                    built += 1
+            self._conn.commit()
+            return built
+
+    def _command_offers(self, command_id: str) -> List[tuple]:
+        with self._lock:
+            return self._conn.execute('SELECT offer_id, attempts FROM command_offers WHERE command_id = ?', (command_id,)).fetchall()
+
+    def _send_new_commands(self) -> int:
+        with self._lock:
+            commands = self._conn.execute("SELECT command_id, price, currency FROM commands WHERE status = 'new' ORDER BY created_at").fetchall()
+        sent = 0
+        for command_id, price, currency in commands:
+            if not self.bucket.try_acquire():
+                break
+            offers = self._command_offers(command_id)
+            try:
+                self.client.put_price_change_command(command_id, [o for o, _ in offers], price, currency)
+            except AllegroRateLimited as e:
+                self._rate_limited(e)
+                break
+            except AllegroError as e:
+                if e.status in (400, 409, 422):
+                    self._finish_offers(command_id, price, [(o, a, str(e)) for o, a in offers], retryable=False)
+                else:
+                    self._count('send_errors')
+                    logger.warning('Price change command %s not accepted yet: %s', command_id, e)
+                continue
+            except Exception as e:
+                self._count('send_errors')
+                logger.warning('Price change command %s not sent: %s', command_id, e)
+                break
+            self._limited_streak = 0
+            with self._lock:
+                self._conn.execute("UPDATE commands SET status = 'submitted', next_poll_at = ? WHERE command_id = ?",
+                                   (time.time() + self.poll_interval_s, command_id))
+                self._set_status([(o, price, 'submitted', command_id, None) for o, _ in offers])
+                self._conn.commit()
+                self._stats['commands_sent'] += 1
+            sent += 1
+        return sent
+
+    # --- status polling -----------------------------------------------------------------
+
+    def _finish_offers(self, command_id: str, price: float, failed: List[tuple], applied: List[str] = (),
+                       retryable: bool = True):
+        """Close a command: applied offers are done, failed ones (offer_id, attempts, error) retried or given up."""
+        with self._lock:
+            currency = (self._conn.execute('SELECT currency FROM commands WHERE command_id = ?', (command_id,)).fetchone() or ('PLN',))[0]
+            # offers re-priced while this command was in flight: the newer queued change supersedes the outcome
+            newer = {r[0] for r in self._conn.execute(
+                'SELECT p.offer_id FROM pending p JOIN command_offers c ON c.offer_id = p.offer_id WHERE c.command_id = ?', (command_id,))}
+            status_rows = [(o, price, 'applied', command_id, None) for o in applied if o not in newer]
+            retry = []
+            gave_up = 0
+            for offer_id, attempts, error in failed:
+                if offer_id in newer:
+                    continue
+                if retryable and attempts + 1 < self.max_attempts:
+                    retry.append((offer_id, price, currency, attempts + 1, time.time()))
+                    status_rows.append((offer_id, price, 'retrying', command_id, error))
+                else:
+                    gave_up += 1
+                    status_rows.append((offer_id, price, 'failed', command_id, error))
+            self._conn.executemany('INSERT INTO pending (offer_id, price, currency, attempts, enqueued_at) VALUES (?, ?, ?, ?, ?)', retry)
+            self._set_status(status_rows)
+            self._conn.execute('DELETE FROM command_offers WHERE command_id = ?', (command_id,))
+            self._conn.execute('DELETE FROM commands WHERE command_id = ?', (command_id,))
+            self._conn.commit()
+            self._stats['applied'] += len(applied)
+            self._stats['retried'] += len(retry)
+            self._stats['failed'] += gave_up
+
+    def _poll_commands(self) -> int:
+        with self._lock:
+            due = self._conn.execute("SELECT command_id, price FROM commands WHERE status = 'submitted' AND next_poll_at <= ? "
+                                     'ORDER BY next_poll_at', (time.time(),)).fetchall()
+        finished = 0
+        for command_id, price in due:
+            if not self.bucket.try_acquire():
+                break
+            try:
+                self._count('polls')
+                counts = self.client.get_price_change_command(command_id).get('taskCount') or {}
+                done = int(counts.get('success', 0)) + int(counts.get('failed', 0)) >= int(counts.get('total', 0))
+                tasks = self.client.get_price_change_tasks(command_id) if done else []
+                self._limited_streak = 0
+            except AllegroRateLimited as e:
+                self._rate_limited(e)
+                break
+            except Exception as e:
+                logger.warning('Polling price change command %s failed: %s', command_id, e)
+                done, tasks = False, []
+            if not done or any(t.get('status') == 'IN_PROGRESS' for t in tasks):
+                with self._lock:
+                    self._conn.execute('UPDATE commands SET next_poll_at = ? WHERE command_id = ?',
+                                       (time.time() + self.poll_interval_s, command_id))
+                    self._conn.commit()
+                continue
+            attempts = dict(self._command_offers(command_id))
+            by_offer = {str((t.get('offer') or {}).get('id')): t for t in tasks}
+            applied, failed = [], []
+            for offer_id, tried in attempts.items():
+                task = by_offer.get(offer_id)
+                if task is not None and task.get('status') == 'SUCCESS':
+                    applied.append(offer_id)
+                else:
+                    failed.append((offer_id, tried, (task or {}).get('message') or 'no task reported'))
+            self._finish_offers(command_id, price, failed, applied)
+            finished += 1
+        return finished
+
+    # --- loop ---------------------------------------------------------------------------
+
+    def run_once(self) -> Dict[str, int]:
+        """One tick: poll due commands, resend unsent ones, then build and send new ones.
+
+        Polls go first and new commands are capped at max_in_flight so a large backlog cannot take
+        every token and leave submitted commands unpolled.
+        """
+        finished = self._poll_commands()
+        sent = self._send_new_commands()
+        with self._lock:
+            in_flight = self._conn.execute('SELECT COUNT(*) FROM commands').fetchone()[0]
+        room = min(int(self.bucket.burst), self.max_in_flight - in_flight)
+        built = self._build_commands(limit_commands=room) if room > 0 else 0
+        if built:
+            sent += self._send_new_commands()
+        return {'built': built, 'sent': sent, 'finished': finished}
+
+    def _loop(self):
+        while not self._stop.is_set():
+            try:
+                self.run_once()
+            except Exception:
+                logger.exception('Price push tick failed')
+            self._stop.wait(self.tick_s)
+
+    def start(self):
+        if self._thread and self._thread.is_alive():
+            return
+        self._stop.clear()
+        self._thread = threading.Thread(target=self._loop, name='price-push', daemon=True)
+        self._thread.start()
+
+    def stop(self, timeout: float = 5.0):
+        self._stop.set()
+        if self._thread:
+            self._thread.join(timeout)
+
+    # --- observability ------------------------------------------------------------------
+
+    def offer_status(self, offer_id: str) -> Optional[Dict[str, Any]]:
+        with self._lock:
+            row = self._conn.execute('SELECT price, status, command_id, error, updated_at FROM offer_status WHERE offer_id = ?',
+                                     (str(offer_id),)).fetchone()
+        if row is None:
+            return None
+        return {'offer_id': str(offer_id), 'price': row[0], 'status': row[1], 'command_id': row[2], 'error': row[3], 'updated_at': row[4]}
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            pending = self._conn.execute('SELECT COUNT(*), MIN(enqueued_at) FROM pending').fetchone()
+            commands = dict(self._conn.execute('SELECT status, COUNT(*) FROM commands GROUP BY status').fetchall())
+            in_flight = self._conn.execute('SELECT COUNT(*) FROM command_offers').fetchone()[0]
+            return dict(
+                self._stats,
+                running=bool(self._thread and self._thread.is_alive()),
+                pending=pending[0],
+                oldest_pending_s=round(time.time() - pending[1], 3) if pending[1] else None,
+                commands_unsent=commands.get('new', 0),
+                commands_in_flight=commands.get('submitted', 0),
+                offers_in_flight=in_flight,
+                bucket=self.bucket.state(),
+            )
+
+
+_queue: Optional[PricePushQueue] = None
+_queue_lock = threading.Lock()
+
+
+def get_price_push_queue() -> PricePushQueue:
+    """Process-wide queue configured from PRICE_PUSH_* env vars (not started until start())."""
+    global _queue
+    if _queue is None:
+        with _queue_lock:
+            if _queue is None:
+                _queue = PricePushQueue(
+                    db_path=os.environ.get('PRICE_PUSH_DB', 'price_push.db'),
+                    batch_size=int(os.environ.get('PRICE_PUSH_BATCH_SIZE', '1000')),
+                    rate=float(os.environ.get('PRICE_PUSH_RATE', '1')),
+                    burst=int(os.environ.get('PRICE_PUSH_BURST', '5')),
+                    poll_interval_s=float(os.environ.get('PRICE_PUSH_POLL_S', '2')),
+                    max_attempts=int(os.environ.get('PRICE_PUSH_MAX_ATTEMPTS', '3')),
+                    max_in_flight=int(os.environ.get('PRICE_PUSH_MAX_IN_FLIGHT', '50')),
+                )
+    return _queue
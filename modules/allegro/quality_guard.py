@@ -3,25 +3,20 @@ import logging
 import time
 
 from modules.ai.base import BaseAIHandler
+from modules.ai.prompt_builder import compact_payload
 
 logger = logging.getLogger(__name__)
 
 
-def handle_dispute(dispute_text: str, order_context: Dict[str, Any]) -> Dict[str, Any]:
-    """Analyze dispute and return immediate de-escalation reply and suggested resolution.
-
-    Returns: {ok, reply_text, suggested_resolution, human_required}
-    """
-    handler = BaseAIHandler(response_mime_type='application/json')
-    prompt = (
+def _dispute_prompt(dispute_text: str, order_context: Dict[str, Any]) -> str:
+    return (
         "You are an expert Allegro seller assistant. Analyze the dispute and propose a calm, conciliatory reply. "
         "Return JSON: { reply_text: string, suggested_resolution: {type: 'refund_partial'|'replace'|'full_refund'|'other', amount: number|null, note: string}, human_required: bool }"
-        f"\n\nOrder context: {order_context}\n\nDispute text: {dispute_text}"
+        f"\n\nOrder context: {compact_payload('dispute', {'order_context': order_context})}\n\nDispute text: {dispute_text}"
     )
 
-    start = time.time()
-    resp = handler.generate(prompt)
-    elapsed = time.time() - start
+
+def _dispute_result(resp: Dict[str, Any], elapsed: float) -> Dict[str, Any]:
     if not resp.get('ok'):
         logger.warning('AI dispute analysis failed: %s', resp.get('error'))
         # fallback simple reply
@@ -32,6 +27,25 @@ def handle_dispute(dispute_text: str, order_context: Dict[str, Any]) -> Dict[str
     return {'ok': True, 'reply_text': parsed.get('reply_text'), 'suggested_resolution': parsed.get('suggested_resolution'), 'human_required': bool(parsed.get('human_required', False)), 'elapsed_s': elapsed}
 
 
+def handle_dispute(dispute_text: str, order_context: Dict[str, Any]) -> Dict[str, Any]:
+    """Analyze dispute and return immediate de-escalation reply and suggested resolution.
+
+    Returns: {ok, reply_text, suggested_resolution, human_required}
+    """
+    handler = BaseAIHandler(response_mime_type='application/json', task='dispute')
+    start = time.time()
+    resp = handler.generate(_dispute_prompt(dispute_text, order_context))
+    return _dispute_result(resp, time.time() - start)
+
+
+async def ahandle_dispute(dispute_text: str, order_context: Dict[str, Any]) -> Dict[str, Any]:
+    """Async variant of handle_dispute for FastAPI handlers."""
+    handler = BaseAIHandler(response_mime_type='application/json', task='dispute')
+    start = time.time()
+    resp = await handler.agenerate(_dispute_prompt(dispute_text, order_context))
+    return _dispute_result(resp, time.time() - start)
+
+
 def monitor_quality_metrics() -> Dict[str, Any]:
     """Monitor shipping times and tracking numbers; proactively prepare messages for delayed shipments.
 
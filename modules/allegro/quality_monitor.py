@@ -13,6 +13,14 @@ def _safe_import(name: str, attr: str = None):
         return None
 
 
+def _heuristic_analysis(discussion: Dict[str, Any]) -> Dict[str, Any]:
+    # fallback heuristics
+    text = ' '.join(m.get('text','') for m in discussion.get('messages',[])).lower()
+    urgency = 'high' if any(w in text for w in ['reklamacja','pilne','natychmiast','pilsne','uszkodzon']) else 'medium'
+    reply = 'Dziękujemy za zgłoszenie. Pracujemy nad sprawą i wrócimy w ciągu 1 godziny.'
+    return {'ok': True, 'priority': urgency, 'suggested_reply': reply, 'human_required': False, 'source': 'heuristic'}
+
+
 def analyze_discussion(discussion: Dict[str, Any]) -> Dict[str, Any]:
     """Analyze a buyer-seller discussion and propose a prioritized reply.
 
@@ -20,22 +28,22 @@ def analyze_discussion(discussion: Dict[str, Any]) -> Dict[str, Any]:
     Returns: {ok, priority, suggested_reply, human_required}
     """
     BaseAIHandler = _safe_import('modules.ai.base', 'BaseAIHandler')
-    if BaseAIHandler is None:
-        # fallback heuristics
-        text = ' '.join(m.get('text','') for m in discussion.get('messages',[])).lower()
-        urgency = 'high' if any(w in text for w in ['reklamacja','pilne','natychmiast','pilsne','uszkodzon']) else 'medium'
-        reply = 'Dziękujemy za zgłoszenie. Pracujemy nad sprawą i wrócimy w ciągu 1 godziny.'
-        return {'ok': True, 'priority': urgency, 'suggested_reply': reply, 'human_required': False}
-
-    handler = BaseAIHandler(response_mime_type='application/json')
-    prompt = {
-        'task': 'Prioritize and draft a de-escalating reply for an Allegro discussion. Fast response <1h.',
-        'discussion': discussion,
-        'instructions': 'Return JSON: { priority: "high|medium|low", suggested_reply: string, human_required: bool }'
-    }
+    build_prompt = _safe_import('modules.ai.prompt_builder', 'build_prompt')
+    if BaseAIHandler is None or build_prompt is None:
+        return _heuristic_analysis(discussion)
+
+    handler = BaseAIHandler(response_mime_type='application/json', task='discussion')
+    prompt = build_prompt(
+        'discussion',
+        'Prioritize and draft a de-escalating reply for an Allegro discussion. Fast response <1h. Return JSON: { priority: "high|medium|low", suggested_reply: string, human_required: bool, confidence: 0-1 }',
+        {'discussion': discussion}
+    )
     resp = handler.generate(prompt)
     if not resp.get('ok'):
         logger.warning('AI quality analysis failed: %s', resp.get('error'))
+        if resp.get('circuit_open'):
+            # AI degraded: answer from keywords right away instead of surfacing an error
+            return _heuristic_analysis(discussion)
         return {'ok': False, 'error': resp.get('error')}
 
     parsed = resp.get('response') or {}
@@ -0,0 +1,60 @@
+"""Margin sweep benchmark: batch calculator vs the per-product scalar path.
+
+Run: python -m modules.finance.bench --products 1000000 --price-steps 5
+"""
+import time
+import random
+import argparse
+
+from modules.finance.calculator import CostModel, margin_batch, min_price_batch, price_for_profit_batch, np
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Margin sweep benchmark')
+    parser.add_argument('--products', type=int, default=1_000_000)
+    parser.add_argument('--price-steps', type=int, default=5, help='candidate prices per product (e.g. -10%%..+10%%)')
+    parser.add_argument('--scalar-sample', type=int, default=100_000, help='products timed on the scalar path')
+    args = parser.parse_args()
+
+    rng = random.Random(0)
+    products = [{'cost': rng.uniform(5, 500), 'packaging_cost': rng.uniform(0, 3), 'shipping_cost': rng.uniform(0, 15),
+                 'ads_cost': rng.uniform(0, 5), 'marketplace_fee_pct': rng.choice([0.08, 0.1, 0.125, 0.15])}
+                for _ in range(args.products)]
+    models = [CostModel.from_product(p) for p in products]
+    steps = [1 + (i - args.price_steps // 2) * 0.05 for i in range(args.price_steps)]
+    base_prices = [m.fixed_costs * 1.4 for m in models]
+
+    sample = models[:args.scalar_sample]
+    t0 = time.perf_counter()
+    for m, base in zip(sample, base_prices):
+        for s in steps:
+            m.margin(base * s)
+        m.min_price(0.2)
+        m.price_for_profit(10.0)
+    scalar_s = (time.perf_counter() - t0) * len(models) / len(sample)
+
+    fixed = [m.fixed_costs for m in models]
+    fees = [m.fee_pct for m in models]
+    if np is not None:
+        fixed, fees = np.array(fixed), np.array(fees)
+        prices = np.array(base_prices)[None, :] * np.array(steps)[:, None]
+    else:
+        prices = None
+    t0 = time.perf_counter()
+    if prices is not None:
+        margin_batch(prices, fixed, fees)
+    else:
+        for s in steps:
+            margin_batch([b * s for b in base_prices], fixed, fees)
+    min_price_batch(fixed, fees, 0.2)
+    price_for_profit_batch(fixed, fees, 10.0)
+    batch_s = time.perf_counter() - t0
+
+    cells = len(models) * (len(steps) + 2)
+    print(f'{len(models)} products x {len(steps)} prices + min price + price for profit ({cells} values)')
+    print(f'scalar CostModel: {scalar_s:.2f}s (extrapolated from {len(sample)} products)')
+    print(f'batch ({"numpy" if np is not None else "lists"}): {batch_s:.3f}s  -> {scalar_s / batch_s:.0f}x')
+
+
+if __name__ == '__main__':
+    main()
@@ -1,4 +1,128 @@
-from typing import Dict, Any
+from dataclasses import dataclass
+from typing import Dict, Any, List, Optional, Union, Sequence
+
+try:
+    import numpy as np
+except Exception:
+    np = None
+
+# margin = (price - fixed_costs - price * fee_pct) / price = 1 - fee_pct - fixed_costs / price
+# so for a target margin m:  price = fixed_costs / (1 - fee_pct - m)
+# and for a target profit P: price = (fixed_costs + P) / (1 - fee_pct)
+
+DEFAULT_FEE_PCT = 0.15
+
+Numbers = Union[float, Sequence[float]]
+
+
+@dataclass
+class CostModel:
+    """Per-unit costs of selling one product (or one order when built with from_order)."""
+    cost: float = 0.0
+    packaging: float = 0.0
+    shipping: float = 0.0
+    ads: float = 0.0
+    fee_pct: float = DEFAULT_FEE_PCT
+
+    @classmethod
+    def from_product(cls, product: Dict[str, Any]) -> 'CostModel':
+        """product: { sku, cost, packaging_cost, shipping_cost, ads_cost, marketplace_fee_pct, category }
+
+        With a cost table configured (COST_TABLE_PATH, modules/finance/cost_table.py), fields missing or
+        None on the product come from the SKU's row and the fee from its category schedule.
+        """
+        table = _cost_table()
+        if table is not None:
+            product = table.resolve(product)
+        return cls(
+            cost=float(product.get('cost') or 0),
+            packaging=float(product.get('packaging_cost') or 0),
+            shipping=float(product.get('shipping_cost') or 0),
+            ads=float(product.get('ads_cost') or 0),
+            fee_pct=float(_or_default(product.get('marketplace_fee_pct'), DEFAULT_FEE_PCT)),
+        )
+
+    @classmethod
+    def per_item(cls, order: Dict[str, Any]) -> List['CostModel']:
+        """Per-unit costs of each order item, resolved like from_product (cost table by SKU when configured)."""
+        return [cls.from_product(it) for it in order.get('items') or []]
+
+    @classmethod
+    def from_order(cls, order: Dict[str, Any]) -> 'CostModel':
+        """Whole-order costs: per-unit item costs * qty summed.
+
+        Packaging / shipping / ads / marketplace_fee_pct set on the order win over the items' own (from the
+        item or its cost table row); the items' fees are averaged weighted by item revenue.
+        """
+        items = order.get('items') or []
+        models = cls.per_item(order)
+        units = [item_units(it) for it in items]
+
+        def total(field: str, order_key: str) -> float:
+            value = order.get(order_key)
+            if value is not None:
+                return float(value)
+            return sum(getattr(m, field) * n for m, n in zip(models, units))
+
+        fee_pct = order.get('marketplace_fee_pct')
+        if fee_pct is None:
+            weights = [float(_or_default(it.get('price'), 0)) * n for it, n in zip(items, units)]
+            if sum(weights) > 0:
+                fee_pct = sum(m.fee_pct * w for m, w in zip(models, weights)) / sum(weights)
+            elif models:
+                fee_pct = sum(m.fee_pct for m in models) / len(models)
+            else:
+                fee_pct = DEFAULT_FEE_PCT
+        return cls(
+            cost=sum(m.cost * n for m, n in zip(models, units)),
+            packaging=total('packaging', 'packaging_cost'),
+            shipping=total('shipping', 'shipping_cost'),
+            ads=total('ads', 'ads_cost'),
+            fee_pct=float(fee_pct),
+        )
+
+    @property
+    def fixed_costs(self) -> float:
+        return self.cost + self.packaging + self.shipping + self.ads
+
+    def margin(self, sale_price: float) -> float:
+        return _margin(float(sale_price), self.fixed_costs, self.fee_pct)
+
+    def profit(self, sale_price: float) -> float:
+        return float(sale_price) * (1 - self.fee_pct) - self.fixed_costs
+
+    def min_price(self, target_margin: float) -> Optional[float]:
+        """Lowest price reaching target_margin; None when fees + margin leave nothing to cover costs."""
+        denom = 1 - self.fee_pct - target_margin
+        return self.fixed_costs / denom if denom > 0 else None
+
+    def price_for_profit(self, target_profit: float) -> Optional[float]:
+        denom = 1 - self.fee_pct
+        return (self.fixed_costs + target_profit) / denom if denom > 0 else None
+
+    def as_dicts(self) -> tuple:
+        """(product_costs, marketplace_fees) in the shape calculate_margin takes."""
+        return ({'cost': self.cost, 'packaging': self.packaging, 'shipping': self.shipping, 'ads': self.ads},
+                {'fee_pct': self.fee_pct})
+
+
+def _or_default(value: Any, default: float) -> Any:
+    return default if value is None else value
+
+
+def item_units(item: Dict[str, Any]) -> int:
+    """An order item's quantity (1 when missing or null)."""
+    return int(_or_default(item.get('qty'), 1))
+
+
+def _cost_table():
+    # imported lazily: cost_table is optional and imports nothing from here
+    from modules.finance.cost_table import get_cost_table
+    return get_cost_table()
+
+
+def _margin(sale_price: float, fixed_costs: float, fee_pct: float) -> float:
+    return (sale_price - fixed_costs - sale_price * fee_pct) / sale_price if sale_price > 0 else 0
 
 
 def calculate_margin(sale_price: float, product_costs: Dict[str, float], marketplace_fees: Dict[str, float]) -> float:
@@ -8,15 +132,62 @@ def calculate_margin(sale_price: float, product_costs: Dict[str, float], marketp
     marketplace_fees: { fee_pct } e.g. 0.15 for 15%
     Returns margin as fraction (0.2 = 20%)
     """
-    cost = float(product_costs.get('cost', 0))
-    packaging = float(product_costs.get('packaging', 0))
-    shipping = float(product_costs.get('shipping', 0))
-    ads = float(product_costs.get('ads', 0))
-    fee_pct = float(marketplace_fees.get('fee_pct', 0))
-
-    # marketplace fee applies to sale price
-    marketplace_fee = sale_price * fee_pct
-
-    total_costs = cost + packaging + shipping + ads + marketplace_fee
-    margin = (sale_price - total_costs) / sale_price if sale_price > 0 else 0
-    return margin
+    fixed_costs = sum(float(product_costs.get(k, 0)) for k in ('cost', 'packaging', 'shipping', 'ads'))
+    return _margin(float(sale_price), fixed_costs, float(marketplace_fees.get('fee_pct', 0)))
+
+
+# Batch versions over arrays (NumPy when installed, else lists). Arguments broadcast against each other,
+# so a catalog sweep is e.g. margin_batch(prices, fixed_costs, fee_pcts) or min_price_batch(fixed, fee, 0.2).
+
+def _arrays(*values: Numbers) -> tuple:
+    return np.broadcast_arrays(*(np.asarray(v, dtype=np.float64) for v in values))
+
+
+def _lists(*values: Numbers) -> tuple:
+    n = max((len(v) for v in values if isinstance(v, (list, tuple))), default=1)
+    return tuple(list(v) if isinstance(v, (list, tuple)) else [float(v)] * n for v in values)
+
+
+def margin_batch(sale_prices: Numbers, fixed_costs: Numbers, fee_pct: Numbers = DEFAULT_FEE_PCT):
+    """Margin per price (0 where price <= 0)."""
+    if np is None:
+        return [_margin(float(p), float(c), float(f)) for p, c, f in zip(*_lists(sale_prices, fixed_costs, fee_pct))]
+    p, c, f = _arrays(sale_prices, fixed_costs, fee_pct)
+    out = np.zeros(p.shape)
+    positive = p > 0
+    np.divide(p - c - p * f, p, out=out, where=positive)
+    return out
+
+
+def min_price_batch(fixed_costs: Numbers, fee_pct: Numbers = DEFAULT_FEE_PCT, target_margin: Numbers = 0.10):
+    """Closed-form lowest price reaching target_margin (NaN / None where unreachable)."""
+    if np is None:
+        return [c / (1 - f - m) if 1 - f - m > 0 else None
+                for c, f, m in zip(*_lists(fixed_costs, fee_pct, target_margin))]
+    c, f, m = _arrays(fixed_costs, fee_pct, target_margin)
+    denom = 1 - f - m
+    out = np.full(c.shape, np.nan)
+    np.divide(c, denom, out=out, where=denom > 0)
+    return out
+
+
+def price_for_profit_batch(fixed_costs: Numbers, fee_pct: Numbers = DEFAULT_FEE_PCT, target_profit: Numbers = 0.0):
+    """Price at which profit per unit equals target_profit (NaN / None where fees take everything)."""
+    if np is None:
+        return [(c + t) / (1 - f) if 1 - f > 0 else None
+                for c, f, t in zip(*_lists(fixed_costs, fee_pct, target_profit))]
+    c, f, t = _arrays(fixed_costs, fee_pct, target_profit)
+    denom = 1 - f
+    out = np.full(c.shape, np.nan)
+    np.divide(c + t, denom, out=out, where=denom > 0)
+    return out
+
+
+def cost_columns(products: Sequence[Dict[str, Any]]) -> Dict[str, Any]:
+    """{'fixed_costs': [...], 'fee_pct': [...]} for the batch functions, from product dicts."""
+    models = [CostModel.from_product(p) for p in products]
+    fixed = [m.fixed_costs for m in models]
+    fees = [m.fee_pct for m in models]
+    if np is not None:
+        return {'fixed_costs': np.array(fixed, dtype=np.float64), 'fee_pct': np.array(fees, dtype=np.float64)}
+    return {'fixed_costs': fixed, 'fee_pct': fees}
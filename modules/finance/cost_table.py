@@ -0,0 +1,251 @@
+"""Per-SKU cost table with category fee schedules.
+
+Source: a CSV at COST_TABLE_PATH with a header row
+    sku,cost,packaging_cost,shipping_cost,ads_cost,category,marketplace_fee_pct
+(every column but sku optional; an empty marketplace_fee_pct means "use the category fee"), and
+optionally a JSON fee schedule at COST_FEES_PATH: {"default": 0.15, "categories": {"<category>": 0.08, ...}}
+(a flat {"<category>": pct} object also works).
+
+Rows are mirrored into SQLite (COST_TABLE_DB, default <COST_TABLE_PATH>.db) together with the source
+file's mtime/size, so a restart with an unchanged source loads from SQLite instead of re-parsing.
+Lookups are served from an in-memory dict. When the source changes (checked at most every
+COST_TABLE_CHECK_S seconds) it is re-read and only added / changed / removed rows are written.
+Rows set with upsert() live in a separate overlay (table `overrides`) that reloads do not touch; an
+overlay row wins over the source row for its SKU until drop_upserts() removes it.
+"""
+import os
+import csv
+import json
+import time
+import sqlite3
+import logging
+import threading
+from typing import Dict, Any, Optional, List
+
+logger = logging.getLogger(__name__)
+
+COST_FIELDS = ('cost', 'packaging_cost', 'shipping_cost', 'ads_cost')
+COLUMNS = COST_FIELDS + ('category', 'marketplace_fee_pct')
+
+
+def _parse_row(raw: Dict[str, str]) -> Dict[str, Any]:
+    row: Dict[str, Any] = {}
+    for k in COST_FIELDS:
+        v = (raw.get(k) or '').strip()
+        row[k] = float(v) if v else 0.0
+    row['category'] = (raw.get('category') or '').strip() or None
+    fee = (raw.get('marketplace_fee_pct') or '').strip()
+    row['marketplace_fee_pct'] = float(fee) if fee else None
+    return row
+
+
+def _file_sig(path: Optional[str]) -> Optional[tuple]:
+    try:
+        st = os.stat(path)
+        return st.st_mtime_ns, st.st_size
+    except (OSError, TypeError):
+        return None
+
+
+class CostTable:
+    def __init__(self, source_path: str, fees_path: str = None, db_path: str = None, check_interval_s: float = 5.0,
+                 default_fee_pct: float = 0.15):
+        self.source_path = source_path
+        self.fees_path = fees_path
+        self.db_path = db_path or f'{source_path}.db'
+        self.check_interval_s = check_interval_s
+        self.default_fee_pct = default_fee_pct
+        self._lock = threading.Lock()
+        self._rows: Dict[str, Dict[str, Any]] = {}
+        self._overrides: Dict[str, Dict[str, Any]] = {}
+        self._fees: Dict[str, float] = {}
+        self._source_sig: Optional[tuple] = None
+        self._fees_sig: Optional[tuple] = None
+        self._checked_at = 0.0
+        self._stats = {'lookups': 0, 'hits': 0, 'reloads': 0, 'rows_written': 0, 'rows_removed': 0}
+        self._conn = sqlite3.connect(self.db_path, check_same_thread=False)
+        with self._lock:
+            for table in ('costs', 'overrides'):
+                self._conn.execute(f'CREATE TABLE IF NOT EXISTS {table} (sku TEXT PRIMARY KEY, cost REAL, packaging_cost REAL, '
+                                   'shipping_cost REAL, ads_cost REAL, category TEXT, marketplace_fee_pct REAL)')
+            self._conn.execute('CREATE TABLE IF NOT EXISTS meta (key TEXT PRIMARY KEY, value TEXT)')
+            self._conn.commit()
+        self.load()
+
+    # --- loading ------------------------------------------------------------------------
+
+    def load(self):
+        """Startup: rows from SQLite when it matches the source file, else a full read of the source."""
+        with self._lock:
+            stored = dict(self._conn.execute('SELECT key, value FROM meta').fetchall())
+            rows = self._conn.execute(f'SELECT sku, {", ".join(COLUMNS)} FROM costs').fetchall()
+            self._rows = {r[0]: dict(zip(COLUMNS, r[1:])) for r in rows}
+            overrides = self._conn.execute(f'SELECT sku, {", ".join(COLUMNS)} FROM overrides').fetchall()
+            self._overrides = {r[0]: dict(zip(COLUMNS, r[1:])) for r in overrides}
+            if stored.get('source_sig'):
+                self._source_sig = tuple(json.loads(stored['source_sig']))
+        self._load_fees()
+        if _file_sig(self.source_path) != self._source_sig:
+            self.reload()
+        else:
+            logger.info('Cost table: %d SKUs loaded from %s', len(self._rows), self.db_path)
+
+    def _load_fees(self):
+        sig = _file_sig(self.fees_path)
+        if sig is None or sig == self._fees_sig:
+            return
+        with open(self.fees_path, 'r', encoding='utf-8') as f:
+            doc = json.load(f)
+        categories = doc.get('categories', doc) if isinstance(doc, dict) else {}
+        fees = {str(k): float(v) for k, v in categories.items() if k != 'default'}
+        with self._lock:
+            self._fees = fees
+            if 'default' in doc:
+                self.default_fee_pct = float(doc['default'])
+            self._fees_sig = sig
+        logger.info('Cost table: %d category fees loaded from %s', len(fees), self.fees_path)
+
+    def _read_source(self) -> Dict[str, Dict[str, Any]]:
+        rows = {}
+        with open(self.source_path, 'r', encoding='utf-8', newline='') as f:
+            for raw in csv.DictReader(f):
+                sku = (raw.get('sku') or '').strip()
+                if not sku:
+                    continue
+                try:
+                    rows[sku] = _parse_row(raw)
+                except ValueError:
+                    logger.warning('Cost table: skipping malformed row for SKU %s', sku)
+        return rows
+
+    def reload(self, force: bool = False) -> Dict[str, int]:
+        """Re-read the source if it changed; writes only the rows that differ."""
+        self._load_fees()
+        sig = _file_sig(self.source_path)
+        if sig is None:
+            return {'changed': 0, 'removed': 0}
+        if sig == self._source_sig and not force:
+            return {'changed': 0, 'removed': 0}
+        fresh = self._read_source()
+        with self._lock:
+            changed = [(sku, row) for sku, row in fresh.items() if self._rows.get(sku) != row]
+            removed = [sku for sku in self._rows if sku not in fresh]
+            self._conn.executemany(f'INSERT OR REPLACE INTO costs (sku, {", ".join(COLUMNS)}) VALUES (?, ?, ?, ?, ?, ?, ?)',
+                                   [(sku,) + tuple(row[c] for c in COLUMNS) for sku, row in changed])
+            self._conn.executemany('DELETE FROM costs WHERE sku = ?', [(sku,) for sku in removed])
+            self._conn.execute("INSERT OR REPLACE INTO meta (key, value) VALUES ('source_sig', ?)", (json.dumps(list(sig)),))
+            self._conn.commit()
+            for sku, row in changed:
+                self._rows[sku] = row
+            for sku in removed:
+                del self._rows[sku]
+            self._source_sig = sig
+            self._stats['reloads'] += 1
+            self._stats['rows_written'] += len(changed)
+            self._stats['rows_removed'] += len(removed)
+        logger.info('Cost table reloaded from %s: %d changed, %d removed, %d SKUs',
+                    self.source_path, len(changed), len(removed), len(self._rows))
+        return {'changed': len(changed), 'removed': len(removed)}
+
+    def maybe_reload(self):
+        """Cheap enough to call on every lookup: stats the source files at most every check_interval_s."""
+        now = time.monotonic()
+        if now - self._checked_at < self.check_interval_s:
+            return
+        self._checked_at = now
+        try:
+            self.reload()
+        except Exception:
+            logger.exception('Cost table reload from %s failed; keeping previous rows', self.source_path)
+
+    # --- lookups ------------------------------------------------------------------------
+
+    def get(self, sku: str) -> Optional[Dict[str, Any]]:
+        self._stats['lookups'] += 1
+        row = self._overrides.get(str(sku)) or self._rows.get(str(sku))
+        if row is not None:
+            self._stats['hits'] += 1
+        return row
+
+    def fee_for(self, category: Optional[str]) -> float:
+        return self._fees.get(category, self.default_fee_pct) if category else self.default_fee_pct
+
+    def row_for_product(self, product: Dict[str, Any]) -> Optional[Dict[str, Any]]:
+        for key in ('sku', 'id'):
+            if product.get(key) is not None:
+                row = self.get(product[key])
+                if row is not None:
+                    return row
+        return None
+
+    def resolve(self, product: Dict[str, Any]) -> Dict[str, Any]:
+        """Cost fields for a product: values on the product win, then its table row, then the category fee."""
+        row = self.row_for_product(product) or {}
+        out = {}
+        for k in COST_FIELDS:
+            v = product.get(k)
+            out[k] = float(v if v is not None else row.get(k) or 0.0)
+        category = product.get('category') or row.get('category')
+        fee = product.get('marketplace_fee_pct')
+        if fee is None:
+            fee = row.get('marketplace_fee_pct')
+        out['category'] = category
+        out['marketplace_fee_pct'] = float(fee if fee is not None else self.fee_for(category))
+        return out
+
+    def upsert(self, rows: List[Dict[str, Any]]):
+        """Direct updates (e.g. a supplier price change) without touching the source file.
+
+        Kept in the overlay: they survive reloads of the source until drop_upserts().
+        """
+        parsed = [(str(r['sku']), _parse_row({k: '' if r.get(k) is None else str(r[k]) for k in COLUMNS})) for r in rows]
+        with self._lock:
+            self._conn.executemany(f'INSERT OR REPLACE INTO overrides (sku, {", ".join(COLUMNS)}) VALUES (?, ?, ?, ?, ?, ?, ?)',
+                                   [(sku,) + tuple(row[c] for c in COLUMNS) for sku, row in parsed])
+            self._conn.commit()
+            for sku, row in parsed:
+                self._overrides[sku] = row
+            self._stats['rows_written'] += len(parsed)
+
+    def drop_upserts(self, skus: List[str] = None) -> int:
+        """Remove overlay rows (all when skus is None) so those SKUs follow the source again."""
+        with self._lock:
+            targets = list(self._overrides) if skus is None else [str(s) for s in skus if str(s) in self._overrides]
+            self._conn.executemany('DELETE FROM overrides WHERE sku = ?', [(sku,) for sku in targets])
+            self._conn.commit()
+            for sku in targets:
+                del self._overrides[sku]
+        return len(targets)
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            return dict(self._stats, skus=len(self._rows), overrides=len(self._overrides), categories=len(self._fees), default_fee_pct=self.default_fee_pct,
+                        source=self.source_path, db=self.db_path)
+
+
+_table: Optional[CostTable] = None
+_table_lock = threading.Lock()
+
+
+def get_cost_table() -> Optional[CostTable]:
+    """Process-wide table from COST_TABLE_PATH (None when unset); checks the source for changes."""
+    global _table
+    if _table is None:
+        path = os.environ.get('COST_TABLE_PATH')
+        if not path:
+            return None
+        with _table_lock:
+            if _table is None:
+                _table = CostTable(
+                    path,
+                    fees_path=os.environ.get('COST_FEES_PATH'),
+                    db_path=os.environ.get('COST_TABLE_DB'),
+                    check_interval_s=float(os.environ.get('COST_TABLE_CHECK_S', '5')),
+                )
+    _table.maybe_reload()
+    return _table
+
+
+def set_cost_table(table: Optional[CostTable]):
+    global _table
+    _table = table
@@ -0,0 +1,171 @@
+"""Incremental profit-and-loss aggregates over processed orders.
+
+order_facts() turns one processed order into its P&L contribution (revenue, product/shipping/ads
+cost, marketplace fee, profit), split per SKU. apply_facts() adds those facts to running totals
+per SKU, day, carrier and ads state, kept in the `pnl_agg` table of the order store's SQLite
+database. The order store calls it in the same transaction that saves the order, first
+subtracting the facts stored for an earlier run of that order. The totals therefore survive
+restarts and are shared by every process using the database. Dashboard queries read the
+pre-aggregated rows (PnLAggregator) instead of rescanning orders. rebuild() recomputes everything
+from the stored facts.
+"""
+import sqlite3
+import logging
+import threading
+from datetime import datetime
+from typing import Dict, Any, List, Optional, Iterable
+
+from modules.finance.calculator import CostModel, item_units
+
+logger = logging.getLogger(__name__)
+
+DIMENSIONS = ('sku', 'day', 'carrier', 'ads_state')
+METRICS = ('revenue', 'cost', 'fee', 'profit', 'orders', 'units')
+
+
+def _order_day(order: Dict[str, Any], now: datetime = None) -> str:
+    for key in ('created_at', 'boughtAt', 'updatedAt'):
+        value = order.get(key)
+        if value:
+            try:
+                return datetime.fromisoformat(str(value).replace('Z', '+00:00')).date().isoformat()
+            except ValueError:
+                continue
+    return (now or datetime.now()).date().isoformat()
+
+
+def _carrier(status: Dict[str, Any]) -> str:
+    result = (status.get('steps', {}).get('logistics') or {}).get('result') or {}
+    return (result.get('carrier') or {}).get('carrier_name') or 'unknown'
+
+
+def _ads_state(status: Dict[str, Any]) -> str:
+    ads = status.get('steps', {}).get('ads') or {}
+    if not ads.get('ok'):
+        return 'unknown'
+    flags = {a.get('flag') for a in ads.get('actions', []) if a.get('flag')}
+    return 'paused' if 'PAUSE_ADS' in flags else 'active'
+
+
+def order_facts(order: Dict[str, Any], status: Dict[str, Any], now: datetime = None) -> Dict[str, Any]:
+    """One order's P&L contribution; order-level costs are allocated to SKUs by revenue share."""
+    model = CostModel.from_order(order)
+    revenue = float(order.get('total_price') or 0)
+    fee = revenue * model.fee_pct
+    items = order.get('items') or []
+    item_costs = CostModel.per_item(order)
+
+    item_revenue = [float(it.get('price') or 0) * item_units(it) for it in items]
+    known = sum(item_revenue)
+    # items without prices: fall back to an equal split of the order total
+    shares = [r / known for r in item_revenue] if known > 0 else [1 / len(items)] * len(items) if items else []
+    overhead = model.packaging + model.shipping + model.ads
+    per_sku = []
+    for it, unit_costs, share in zip(items, item_costs, shares):
+        units = item_units(it)
+        cost = unit_costs.cost * units + overhead * share
+        per_sku.append({'sku': str(it.get('sku') or it.get('id') or 'unknown'), 'units': units,
+                        'revenue': revenue * share, 'cost': cost, 'fee': fee * share,
+                        'profit': revenue * share - cost - fee * share})
+
+    return {
+        'day': _order_day(order, now),
+        'carrier': _carrier(status),
+        'ads_state': _ads_state(status),
+        'revenue': revenue,
+        'cost': model.fixed_costs,
+        'fee': fee,
+        'profit': revenue - model.fixed_costs - fee,
+        'units': sum(s['units'] for s in per_sku),
+        'skus': per_sku,
+    }
+
+
+SCHEMA = '''
+CREATE TABLE IF NOT EXISTS pnl_agg (dim TEXT NOT NULL, key TEXT NOT NULL, revenue REAL NOT NULL DEFAULT 0,
+                                    cost REAL NOT NULL DEFAULT 0, fee REAL NOT NULL DEFAULT 0, profit REAL NOT NULL DEFAULT 0,
+                                    orders INTEGER NOT NULL DEFAULT 0, units INTEGER NOT NULL DEFAULT 0,
+                                    PRIMARY KEY (dim, key));
+'''
+
+_UPSERT = (f'INSERT INTO pnl_agg (dim, key, {", ".join(METRICS)}) VALUES (?, ?, ?, ?, ?, ?, ?, ?) '
+           'ON CONFLICT(dim, key) DO UPDATE SET ' + ', '.join(f'{m} = {m} + excluded.{m}' for m in METRICS))
+
+
+def apply_facts(conn: sqlite3.Connection, facts: Dict[str, Any], sign: int = 1):
+    """Add (sign=1) or remove (sign=-1) one order's facts; runs inside the caller's transaction."""
+    order_row = [sign * facts[m] for m in ('revenue', 'cost', 'fee', 'profit')] + [sign, sign * facts['units']]
+    rows = [('total', '')] + [(d, str(facts[d])) for d in ('day', 'carrier', 'ads_state')]
+    params = [r + tuple(order_row) for r in rows]
+    params += [('sku', s['sku'], sign * s['revenue'], sign * s['cost'], sign * s['fee'], sign * s['profit'], sign,
+                sign * s['units']) for s in facts['skus']]
+    conn.executemany(_UPSERT, params)
+
+
+def _finish(row: Optional[tuple]) -> Dict[str, Any]:
+    values = dict(zip(METRICS, row)) if row else {m: 0 for m in METRICS}
+    out = {m: round(v or 0, 2) if m not in ('orders', 'units') else int(v or 0) for m, v in values.items()}
+    out['margin'] = round(values['profit'] / values['revenue'], 4) if values['revenue'] else None
+    return out
+
+
+class PnLAggregator:
+    """Read side of the aggregates, sharing the order store's connection and lock."""
+
+    def __init__(self, conn: sqlite3.Connection, lock: threading.Lock):
+        self._conn = conn
+        self._lock = lock
+
+    def _query(self, sql: str, args: tuple = ()) -> List[tuple]:
+        with self._lock:
+            return self._conn.execute(sql, args).fetchall()
+
+    def rebuild(self, facts: Iterable[Dict[str, Any]]) -> int:
+        """Recompute all aggregates from stored per-order facts; the caller holds a write transaction."""
+        self._conn.execute('DELETE FROM pnl_agg')
+        n = 0
+        for f in facts:
+            if f:
+                apply_facts(self._conn, f)
+                n += 1
+        logger.info('P&L aggregates rebuilt from %d orders', n)
+        return n
+
+    # --- queries ------------------------------------------------------------------------
+
+    def total(self) -> Dict[str, Any]:
+        rows = self._query(f"SELECT {', '.join(METRICS)} FROM pnl_agg WHERE dim = 'total'")
+        return _finish(rows[0] if rows else None)
+
+    def get(self, dimension: str, key: str) -> Optional[Dict[str, Any]]:
+        rows = self._query(f"SELECT {', '.join(METRICS)} FROM pnl_agg WHERE dim = ? AND key = ? AND orders > 0",
+                           (dimension, key))
+        return _finish(rows[0]) if rows else None
+
+    def breakdown(self, dimension: str, sort_by: str = 'profit', limit: int = 50, ascending: bool = False) -> List[Dict[str, Any]]:
+        """Rows of one dimension sorted by a metric; cost grows with the number of keys, not orders."""
+        if sort_by not in METRICS + ('margin',):
+            raise ValueError(f'sort_by must be one of {list(METRICS) + ["margin"]}')
+        order = 'profit / NULLIF(revenue, 0)' if sort_by == 'margin' else sort_by
+        # NULL margins (no revenue) go last either way
+        rows = self._query(f"SELECT key, {', '.join(METRICS)} FROM pnl_agg WHERE dim = ? AND orders > 0 "
+                           f"ORDER BY ({order}) IS NULL, {order} {'ASC' if ascending else 'DESC'} LIMIT ?",
+                           (dimension, int(limit)))
+        return [dict(_finish(r[1:]), key=r[0]) for r in rows]
+
+    def days(self, start: str, end: str) -> Dict[str, Any]:
+        """Sum over the inclusive ISO date range."""
+        start, end = (datetime.fromisoformat(d).date().isoformat() for d in (start, end))
+        rows = self._query(f"SELECT {', '.join(f'SUM({m})' for m in METRICS)} FROM pnl_agg "
+                           "WHERE dim = 'day' AND key BETWEEN ? AND ?", (start, end))
+        return _finish(rows[0])
+
+    def stats(self) -> Dict[str, Any]:
+        counts = dict(self._query('SELECT dim, COUNT(*) FROM pnl_agg WHERE orders > 0 GROUP BY dim'))
+        return {'orders': self.total()['orders'], **{f'{d}_keys': counts.get(d, 0) for d in DIMENSIONS}}
+
+
+def get_pnl() -> PnLAggregator:
+    """Aggregates of the process-wide order store (ORDER_STORE_DB)."""
+    from modules.orders.order_store import get_order_store
+    return get_order_store().pnl
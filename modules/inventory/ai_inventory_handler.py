@@ -1,5 +1,6 @@
-from typing import Dict, Any
+from typing import Dict, Any, List
 from modules.ai.base import BaseAIHandler
+from modules.ai.prompt_builder import build_prompt, summarize_sales_history, prune, TASK_FIELDS
 import logging
 
 logger = logging.getLogger(__name__)
@@ -7,7 +8,7 @@ logger = logging.getLogger(__name__)
 
 class InventoryAIHandler(BaseAIHandler):
     def __init__(self, model: str = None, response_mime_type: str = None):
-        super().__init__(model=model or 'models/gemini-3-pro-preview', response_mime_type=response_mime_type or 'application/json')
+        super().__init__(model=model, response_mime_type=response_mime_type or 'application/json', task='inventory')
 
     def predict_stock(self, product_id: str, sales_history: Any, lead_time_days: int, extra_context: Dict[str, Any] = None) -> Dict[str, Any]:
         """Ask Gemini to predict stock depletion and risk factors.
@@ -20,9 +21,48 @@ class InventoryAIHandler(BaseAIHandler):
             'lead_time_days': lead_time_days,
             'extra_context': extra_context or {}
         }
-        prompt = f"Predict stock depletion for product and consider seasonality/external events. Return JSON with predicted_depletion_date, days_to_depletion, risk, rationale.\nInput:\n{ctx}"
+        # weekly buckets + summary stats instead of the raw history keep the prompt fixed-size
+        compact_ctx = dict(ctx, sales_history_summary=summarize_sales_history(sales_history))
+        prompt = build_prompt('inventory', "Predict stock depletion for product and consider seasonality/external events. Return JSON with predicted_depletion_date, days_to_depletion, risk, rationale.", compact_ctx, baseline=ctx)
         resp = self.generate(prompt)
         if not resp.get('ok'):
             logger.error('Inventory AI predict error: %s', resp.get('error'))
             return {'ok': False, 'error': resp.get('error')}
         return {'ok': True, 'prediction': resp.get('response')}
+
+    def batch_entry(self, product_id: str, sales_history: Any, lead_time_days: int, extra_context: Dict[str, Any] = None) -> Dict[str, Any]:
+        """Compact per-product input as sent inside a batch prompt (summarized history, pruned context)."""
+        return prune({
+            'product_id': product_id,
+            'sales_history_summary': summarize_sales_history(sales_history),
+            'lead_time_days': lead_time_days,
+            'extra_context': extra_context or {}
+        }, TASK_FIELDS['inventory'])
+
+    def predict_stock_batch(self, entries: List[Dict[str, Any]], timeout: float = None) -> Dict[str, Any]:
+        """Predict depletion for many products in one model request.
+
+        entries: items built with batch_entry(). The model answers with a keyed array; returns
+        { ok, predictions: {product_id: prediction} } holding only the products it answered for.
+        """
+        prompt = build_prompt(
+            'inventory',
+            "Predict stock depletion for each product and consider seasonality/external events. "
+            "Return JSON: { predictions: [ { product_id, predicted_depletion_date, days_to_depletion, risk, rationale } ] } "
+            "with exactly one entry per input product_id.",
+            entries, fields=True
+        )
+        resp = self.generate(prompt, timeout=timeout)
+        if not resp.get('ok'):
+            logger.error('Inventory AI batch predict error: %s', resp.get('error'))
+            return {'ok': False, 'error': resp.get('error'), 'circuit_open': bool(resp.get('circuit_open')),
+                    'timeout': bool(resp.get('timeout'))}
+
+        parsed = resp.get('response')
+        rows = parsed.get('predictions') if isinstance(parsed, dict) else parsed
+        wanted = {str(e.get('product_id')) for e in entries}
+        predictions = {}
+        for row in rows if isinstance(rows, list) else []:
+            if isinstance(row, dict) and str(row.get('product_id')) in wanted:
+                predictions[str(row.get('product_id'))] = row
+        return {'ok': True, 'predictions': predictions}
@@ -1,10 +1,13 @@
 from typing import Dict, Any, List
+import os
 import logging
+from concurrent.futures import ThreadPoolExecutor
 from datetime import datetime, timedelta
 
 from modules.inventory.ai_inventory_handler import InventoryAIHandler
 from modules.repricing.repricer import compute_new_price, enforce_margin_or_adjust
-from modules.finance.calculator import calculate_margin
+from modules.finance.calculator import margin_batch, cost_columns
+from modules.ai.prompt_builder import compact_json, estimate_tokens
 
 logger = logging.getLogger(__name__)
 
@@ -59,54 +62,133 @@ def predict_stock_health(product_id: str, sales_history: List[Dict[str, Any]], l
     return result
 
 
-def generate_restock_list(products: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
+def _velocity_per_day(sales_history: List[Dict[str, Any]]) -> float:
+    # estimate average daily velocity
+    try:
+        total_units = sum(item.get('qty', 0) for item in sales_history)
+        days_span = 1
+        if sales_history:
+            dates = [datetime.fromisoformat(item.get('date')) for item in sales_history]
+            days_span = max(1, (max(dates) - min(dates)).days)
+        return total_units / days_span
+    except Exception:
+        return 0
+
+
+def _local_prediction(p: Dict[str, Any], velocity: float, lead_time: int) -> Dict[str, Any]:
+    """Velocity-based estimate used for products the model could not answer for."""
+    stock = p.get('stock', p.get('inventory_count'))
+    days = None
+    try:
+        if stock is not None and velocity > 0:
+            days = int(float(stock) / velocity)
+    except Exception:
+        days = None
+    pred = {'days_to_depletion': days, 'source': 'velocity_estimate',
+            'rationale': f'local estimate from {round(velocity, 3)} units/day'}
+    if days is not None:
+        pred['predicted_depletion_date'] = (datetime.utcnow() + timedelta(days=days)).date().isoformat()
+        pred['risk'] = 'high' if days <= lead_time else ('medium' if days <= lead_time * 2 else 'low')
+    return pred
+
+
+def _pack_batches(entries: List[Dict[str, Any]], batch_size: int, token_budget: int) -> List[List[Dict[str, Any]]]:
+    """Greedily pack entries into batches bounded by item count and estimated input tokens."""
+    batches, current, tokens = [], [], 0
+    for e in entries:
+        t = estimate_tokens(compact_json(e))
+        if current and (len(current) >= batch_size or tokens + t > token_budget):
+            batches.append(current)
+            current, tokens = [], 0
+        current.append(e)
+        tokens += t
+    if current:
+        batches.append(current)
+    return batches
+
+
+# how many times a batch may be split / retried before its products get the local estimate
+MAX_SPLIT_DEPTH = 3
+
+
+def _predict_batch(handler: InventoryAIHandler, batch: List[Dict[str, Any]], depth: int = 0) -> Dict[str, Dict[str, Any]]:
+    """Run one batch; on failure or missing answers split it in half and retry. Returns product_id -> prediction.
+
+    An open circuit or a timeout is not retried: smaller batches would fail the same way, so those
+    products go straight to the local estimate. Splitting stops after MAX_SPLIT_DEPTH levels.
+    """
+    resp = handler.predict_stock_batch(batch)
+    if not resp.get('ok') and (resp.get('circuit_open') or resp.get('timeout')):
+        logger.info('Restock batch of %d not retried (%s)', len(batch), resp.get('error'))
+        return {}
+    found = resp.get('predictions', {}) if resp.get('ok') else {}
+    missing = [e for e in batch if str(e.get('product_id')) not in found]
+    if missing and len(batch) > 1 and depth < MAX_SPLIT_DEPTH:
+        if len(missing) == len(batch):
+            mid = len(batch) // 2
+            parts = [batch[:mid], batch[mid:]]
+        else:
+            parts = [missing]
+        logger.info('Restock batch of %d: %d unanswered, retrying as %s', len(batch), len(missing), [len(x) for x in parts])
+        for part in parts:
+            found.update(_predict_batch(handler, part, depth + 1))
+    return found
+
+
+def generate_restock_list(products: List[Dict[str, Any]], batch_size: int = None, token_budget: int = None,
+                          max_workers: int = None) -> List[Dict[str, Any]]:
     """Generate restock recommendations for given products.
 
     For each product compute forecasted depletion and recommend quantity to order based on velocity and lead time.
-    Uses calculate_margin to ensure restock is economically sensible.
+    Uses the finance calculator (margin_batch) to ensure restock is economically sensible.
+
+    Forecasts are requested in batches of up to `batch_size` products / `token_budget` estimated input
+    tokens (INVENTORY_BATCH_SIZE / INVENTORY_BATCH_TOKENS), run on `max_workers` threads
+    (INVENTORY_BATCH_WORKERS). Failed batches are split and retried; products still unanswered
+    get the local velocity estimate.
     """
+    batch_size = int(batch_size or os.environ.get('INVENTORY_BATCH_SIZE', '25'))
+    token_budget = int(token_budget or os.environ.get('INVENTORY_BATCH_TOKENS', '6000'))
+    max_workers = int(max_workers or os.environ.get('INVENTORY_BATCH_WORKERS', '4'))
+
     handler = InventoryAIHandler()
+    entries = []
+    for p in products:
+        lead_time = int(p.get('lead_time_days', 14))
+        entries.append(handler.batch_entry(p.get('id'), p.get('sales_history', []), lead_time, extra_context={'product': p}))
+
+    predictions: Dict[str, Dict[str, Any]] = {}
+    batches = _pack_batches(entries, batch_size, token_budget)
+    if batches:
+        with ThreadPoolExecutor(max_workers=max(1, min(max_workers, len(batches)))) as pool:
+            for found in pool.map(lambda b: _predict_batch(handler, b), batches):
+                predictions.update(found)
+
+    # check profitability of restock: margin at current price for the whole list in one pass
+    costs = cost_columns(products)
+    margins = margin_batch([float(p.get('price', 0)) for p in products], costs['fixed_costs'], costs['fee_pct'])
+
     restock = []
     for p in products:
         product_id = p.get('id')
         sales_history = p.get('sales_history', [])
         lead_time = int(p.get('lead_time_days', 14))
+        velocity = _velocity_per_day(sales_history)
 
-        ai_resp = handler.predict_stock(product_id, sales_history, lead_time, extra_context={'product': p})
-        pred = ai_resp.get('prediction') if ai_resp.get('ok') else {}
-
-        # estimate average daily velocity
-        try:
-            total_units = sum(item.get('qty', 0) for item in sales_history)
-            days_span = 1
-            if sales_history:
-                dates = [datetime.fromisoformat(item.get('date')) for item in sales_history]
-                days_span = max(1, (max(dates) - min(dates)).days)
-            velocity = total_units / days_span
-        except Exception:
-            velocity = 0
+        pred = predictions.get(str(product_id))
+        if pred is None:
+            pred = _local_prediction(p, velocity, lead_time)
 
         # recommend order qty = velocity * (lead_time + safety_days)
         safety_days = int(p.get('safety_days', 7))
         recommended_qty = int(max(0, round(velocity * (lead_time + safety_days))))
 
-        # check profitability of restock: estimate margin at current price
-        sale_price = float(p.get('price', 0))
-        product_costs = {
-            'cost': float(p.get('cost', 0)),
-            'packaging': float(p.get('packaging_cost', 0)),
-            'shipping': float(p.get('shipping_cost', 0)),
-            'ads': float(p.get('ads_cost', 0))
-        }
-        marketplace_fees = {'fee_pct': float(p.get('marketplace_fee_pct', 0.15))}
-        margin = calculate_margin(sale_price, product_costs, marketplace_fees)
-
         restock.append({
             'product_id': product_id,
             'predicted': pred,
             'velocity_per_day': velocity,
             'recommended_qty': recommended_qty,
-            'current_margin': margin
+            'current_margin': float(margins[len(restock)])
         })
 
     return restock
@@ -1,11 +1,12 @@
 from typing import Dict, Any, List
 import logging
 from modules.ai.base import BaseAIHandler
+from modules.ai.prompt_builder import build_prompt
 
 logger = logging.getLogger(__name__)
 
 
-_ai = BaseAIHandler()
+_ai = BaseAIHandler(task='logistics')
 
 
 def select_optimal_carrier(package_data: Dict[str, Any], destination: Dict[str, Any], carriers: List[Dict[str, Any]] = None) -> Dict[str, Any]:
@@ -29,7 +30,8 @@ def select_optimal_carrier(package_data: Dict[str, Any], destination: Dict[str,
     value = float(package_data.get('value', 0))
 
     # try to ask AI for recommendation (non-blocking fallback)
-    ai_prompt = f"Select optimal carrier for package {package_data} to {destination}. Available carriers: {carriers}. Return JSON with keys: carrier, cost, lead_time, reason." 
+    ai_prompt = build_prompt('logistics', "Select optimal carrier for package to destination from the available carriers. Return JSON with keys: carrier, cost, lead_time, reason, confidence (0-1).",
+                             {'package': package_data, 'destination': destination, 'carriers': carriers})
     ai_resp = _ai.generate(ai_prompt)
     if ai_resp.get('ok') and isinstance(ai_resp.get('response'), dict):
         try:
@@ -1,10 +1,11 @@
 from typing import Dict, Any, List
 import logging
 from modules.ai.base import BaseAIHandler
+from modules.ai.prompt_builder import build_prompt
 
 logger = logging.getLogger(__name__)
 
-_ai = BaseAIHandler()
+_ai = BaseAIHandler(task='print_station')
 
 
 def generate_packing_slip(order_data: Dict[str, Any]) -> Dict[str, Any]:
@@ -19,11 +20,8 @@ def generate_packing_slip(order_data: Dict[str, Any]) -> Dict[str, Any]:
 
     # Prepare a prompt for AI to order items for efficient picking
     try:
-        prompt = {
-            'task': 'Order items for shortest warehouse route',
-            'order_id': order_data.get('order_id'),
-            'items': items
-        }
+        prompt = build_prompt('print_station', 'Order items for shortest warehouse route. Return JSON: { packing_list: [...], note: string }',
+                              {'order_id': order_data.get('order_id'), 'items': items})
         ai_result = _ai.generate(prompt)
         if ai_result.get('ok') and isinstance(ai_result.get('response'), dict):
             out = ai_result.get('response')
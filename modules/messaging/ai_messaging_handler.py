@@ -1,13 +1,15 @@
 import logging
-from typing import Dict, Any
+from typing import Dict, Any, Iterator
 from modules.ai.base import BaseAIHandler
+from modules.ai.prompt_builder import compact_payload
+from modules.ai.streaming import JsonStringFieldExtractor
 
 logger = logging.getLogger(__name__)
 
 
 class MessagingAIHandler(BaseAIHandler):
     def __init__(self, model: str = None, response_mime_type: str = None):
-        super().__init__(model=model or 'models/gemini-3-pro-preview', response_mime_type=response_mime_type or 'application/json')
+        super().__init__(model=model, response_mime_type=response_mime_type or 'application/json', task='messaging')
 
     def analyze_incoming_message(self, message_text: str, lang: str = 'pl') -> Dict[str, Any]:
         """Return sentiment, intent, urgency (1-10) and extracted entities.
@@ -17,9 +19,9 @@ class MessagingAIHandler(BaseAIHandler):
         prompt = (
             f"Analyze the following customer message and return JSON with keys: sentiment ('negative'|'neutral'|'positive'),"
             f" intent (one of: 'product_question','complaint','shipping_question','price_inquiry','negotiation','other'),"
-            f" urgency (1-10), entities (json). Message:\n{message_text}\nReturn JSON."
+            f" urgency (1-10), entities (json), confidence (0-1). Message:\n{message_text}\nReturn JSON."
         )
-        resp = self.generate(prompt)
+        resp = self.generate(prompt, task='message_classification')
         if not resp.get('ok'):
             logger.error('Messaging analyze AI failed: %s', resp.get('error'))
             # fallback simple heuristics
@@ -46,18 +48,50 @@ class MessagingAIHandler(BaseAIHandler):
         context_data: { product, order_status, customer_history }
         Returns: { ok, reply_text, action: optional }
         """
-        prompt = (
-            f"You are a customer support assistant. Use empathetic, human tone. Apply Personal Touch. "
-            f"Given incoming message: {message_data} and context: {context_data}, produce JSON: {{'reply_text': string, 'action': optional_object, 'human_required': bool}}"
-        )
-        resp = self.generate(prompt)
+        resp = self.generate(self._reply_prompt(message_data, context_data))
         if not resp.get('ok'):
             logger.error('Messaging reply AI failed: %s', resp.get('error'))
-            # fallback generic reply
-            reply = "Dziękujemy za wiadomość. Skontaktujemy się wkrótce z odpowiedzią." if context_data.get('lang','pl') == 'pl' else "Thanks for your message. We'll reply shortly."
-            return {'ok': False, 'reply_text': reply}
+            return {'ok': False, 'reply_text': self._fallback_reply(context_data)}
+        return self._finalize_reply(resp.get('response') or {}, message_data, context_data)
 
-        parsed = resp.get('response') or {}
+    def stream_smart_reply(self, message_data: Dict[str, Any], context_data: Dict[str, Any]) -> Iterator[Dict[str, Any]]:
+        """Streaming generate_smart_reply.
+
+        Yields {'type': 'delta', 'text': str} with reply_text as the model writes it, then one
+        {'type': 'final', ...} event carrying the generate_smart_reply() result (action, human_required, hooks).
+        """
+        extractor = JsonStringFieldExtractor('reply_text')
+        streamed = False
+        for event in self.stream(self._reply_prompt(message_data, context_data)):
+            if 'delta' in event:
+                text = extractor.feed(event['delta'])
+                if text:
+                    streamed = True
+                    yield {'type': 'delta', 'text': text}
+                continue
+
+            resp = event['result']
+            if not resp.get('ok'):
+                logger.error('Messaging reply stream failed: %s', resp.get('error'))
+                result = {'ok': False, 'reply_text': self._fallback_reply(context_data)}
+            else:
+                result = self._finalize_reply(resp.get('response') or {}, message_data, context_data)
+            if not streamed and result.get('reply_text'):
+                # cache hit, fallback or reply under another key: send it as a single delta
+                yield {'type': 'delta', 'text': result['reply_text']}
+            yield dict(result, type='final')
+
+    def _reply_prompt(self, message_data: Dict[str, Any], context_data: Dict[str, Any]) -> str:
+        return (
+            f"You are a customer support assistant. Use empathetic, human tone. Apply Personal Touch. "
+            f"Given incoming message and context: {compact_payload('messaging', {'message': message_data, 'context': context_data})}, "
+            f"produce JSON: {{'reply_text': string, 'action': optional_object, 'human_required': bool}}"
+        )
+
+    def _fallback_reply(self, context_data: Dict[str, Any]) -> str:
+        return "Dziękujemy za wiadomość. Skontaktujemy się wkrótce z odpowiedzią." if context_data.get('lang','pl') == 'pl' else "Thanks for your message. We'll reply shortly."
+
+    def _finalize_reply(self, parsed: Dict[str, Any], message_data: Dict[str, Any], context_data: Dict[str, Any]) -> Dict[str, Any]:
 
         # If extreme negative sentiment, flag human
         human_required = False
@@ -1,4 +1,4 @@
-from typing import Dict, Any
+from typing import Dict, Any, Iterator
 from modules.messaging.ai_messaging_handler import MessagingAIHandler
 import logging
 
@@ -16,9 +16,17 @@ def analyze_incoming_message(message_text: str, context: Dict[str, Any] = None)
 def generate_smart_reply(message_data: Dict[str, Any], context_data: Dict[str, Any]) -> Dict[str, Any]:
     """Wrapper around handler.generate_smart_reply that also enriches context (order status stub).
     """
+    return handler.generate_smart_reply(message_data, _enrich_context(context_data))
+
+
+def stream_smart_reply(message_data: Dict[str, Any], context_data: Dict[str, Any]) -> Iterator[Dict[str, Any]]:
+    """Streaming variant of generate_smart_reply: 'delta' events with reply text, then one 'final' event."""
+    return handler.stream_smart_reply(message_data, _enrich_context(context_data))
+
+
+def _enrich_context(context_data: Dict[str, Any]) -> Dict[str, Any]:
     # enrich context with order status if order_id present (stub)
     if context_data and context_data.get('order_id'):
         # stubbed order status
         context_data.setdefault('order_status', {'status': 'shipped', 'eta': '2 dni'})
-
-    return handler.generate_smart_reply(message_data, context_data)
+    return context_data
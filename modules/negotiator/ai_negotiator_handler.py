@@ -1,28 +1,50 @@
 import logging
 from typing import Dict, Any
-from modules.ai.ai_handler import call_gemini
-from prompts import MODULE_PROMPTS
+from modules.ai.ai_handler import call_gemini, acall_gemini
+from prompts import NEGOTIATOR_PROMPT
+from modules.ai.prompt_builder import compact_payload
+from modules.ai.context_cache import register_context
 
 logger = logging.getLogger(__name__)
 
+NEGOTIATOR_CONTEXT = 'negotiator'
+register_context(NEGOTIATOR_CONTEXT, NEGOTIATOR_PROMPT)
+
+
+def _build_prompt(payload: Dict[str, Any]) -> str:
+    # per-request part only; the instructions go as cached context (NEGOTIATOR_CONTEXT)
+    return compact_payload('negotiator', payload)
+
+
+def _parse_decision(resp: Dict[str, Any]) -> Dict[str, Any]:
+    if not resp.get('ok'):
+        logger.error('AI negociator failed: %s', resp.get('error'))
+        return {'ok': False, 'error': resp.get('error')}
+    return {'ok': True, 'decision': resp.get('response')}
+
 
 def ask_negotiator_ai(payload: Dict[str, Any], model: str = 'models/gemini-3-pro-preview') -> Dict[str, Any]:
     """Call Gemini with negotiator prompt and return parsed decision.
 
     payload should contain: client_offer, product, min_price, customer_history, inventory_count, config
     """
-    prompt_template = MODULE_PROMPTS.get('negocjator')
-    if not prompt_template:
-        raise RuntimeError('Negociator prompt not found')
+    prompt = _build_prompt(payload)
+
+    try:
+        resp = call_gemini(prompt, model=model, response_mime_type='application/json', task='negotiator', context=NEGOTIATOR_CONTEXT)
+        return _parse_decision(resp)
+    except Exception as e:
+        logger.exception('Negociator call exception')
+        return {'ok': False, 'error': str(e)}
+
 
-    prompt = prompt_template.format(persona=payload.get('persona') or '') + "\n\n" + str(payload)
+async def aask_negotiator_ai(payload: Dict[str, Any], model: str = 'models/gemini-3-pro-preview') -> Dict[str, Any]:
+    """Async variant of ask_negotiator_ai (uses acall_gemini)."""
+    prompt = _build_prompt(payload)
 
     try:
-        resp = call_gemini(prompt, model=model, response_mime_type='application/json')
-        if not resp.get('ok'):
-            logger.error('AI negociator failed: %s', resp.get('error'))
-            return {'ok': False, 'error': resp.get('error')}
-        return {'ok': True, 'decision': resp.get('response')}
+        resp = await acall_gemini(prompt, model=model, response_mime_type='application/json', task='negotiator', context=NEGOTIATOR_CONTEXT)
+        return _parse_decision(resp)
     except Exception as e:
         logger.exception('Negociator call exception')
         return {'ok': False, 'error': str(e)}
@@ -0,0 +1,165 @@
+"""Bulk order ingestion: a bounded queue drained by a pool of workers running process_new_order.
+
+submit() accepts a whole batch or none of it. A batch that does not fit in the free queue space is
+rejected with an estimate of when it would (retry_after_s, from the measured per-order time), which
+the API turns into 429 + Retry-After. Each accepted batch is a job whose progress can be polled.
+Up to keep_jobs jobs are remembered; beyond that the oldest finished ones are forgotten (queued and
+running jobs are always kept, and are bounded by the queue size).
+"""
+import os
+import math
+import time
+import uuid
+import queue
+import logging
+import threading
+from collections import OrderedDict
+from typing import Dict, Any, List, Optional
+
+logger = logging.getLogger(__name__)
+
+
+class OrderBatchPool:
+    def __init__(self, workers: int = 8, max_queue: int = 1000, keep_jobs: int = 1000):
+        self.workers = workers
+        self.max_queue = max_queue
+        self.keep_jobs = keep_jobs
+        self._queue: 'queue.Queue' = queue.Queue(maxsize=max_queue)
+        self._lock = threading.Lock()
+        self._jobs: 'OrderedDict[str, Dict[str, Any]]' = OrderedDict()
+        self._threads: List[threading.Thread] = []
+        self._avg_order_s = 1.0  # EWMA of one order's processing time, seeds the first Retry-After
+        self._stats = {'jobs': 0, 'orders_accepted': 0, 'orders_done': 0, 'orders_failed': 0, 'rejected': 0}
+
+    def start(self):
+        with self._lock:
+            if self._threads:
+                return
+            for i in range(self.workers):
+                t = threading.Thread(target=self._worker, name=f'order-batch-{i}', daemon=True)
+                t.start()
+                self._threads.append(t)
+        logger.info('Order batch pool started: %d workers, queue %d', self.workers, self.max_queue)
+
+    def stop(self, timeout: float = 5.0):
+        with self._lock:
+            threads, self._threads = self._threads, []
+        for _ in threads:
+            self._queue.put(None)
+        for t in threads:
+            t.join(timeout)
+
+    def _worker(self):
+        from modules.orders.order_manager import process_new_order
+        while True:
+            item = self._queue.get()
+            if item is None:
+                return
+            job_id, order = item
+            started = time.monotonic()
+            try:
+                summary = process_new_order(order)
+                self._finish(job_id, started, order_id=summary.get('order_id'))
+            except Exception as e:
+                logger.exception('Batch job %s: order failed', job_id)
+                self._finish(job_id, started, error=str(e), order=order)
+
+    def _finish(self, job_id: str, started: float, order_id: str = None, error: str = None, order: Dict[str, Any] = None):
+        elapsed = time.monotonic() - started
+        with self._lock:
+            self._avg_order_s = 0.9 * self._avg_order_s + 0.1 * elapsed
+            job = self._jobs.get(job_id)
+            if error is None:
+                self._stats['orders_done'] += 1
+            else:
+                self._stats['orders_failed'] += 1
+            if job is None:
+                return
+            job['status'] = 'running'
+            if error is None:
+                job['done'] += 1
+                job['order_ids'].append(order_id)
+            else:
+                job['failed'] += 1
+                job['errors'].append({'order_id': (order or {}).get('order_id') or (order or {}).get('id'), 'error': error})
+            if job['done'] + job['failed'] == job['total']:
+                job['status'] = 'done'
+                job['finished_at'] = time.time()
+                self._evict_finished()
+
+    def _evict_finished(self):
+        # caller holds the lock; dropping a job that still has orders queued would lose its progress
+        excess = len(self._jobs) - self.keep_jobs
+        if excess <= 0:
+            return
+        for job_id in [j for j, job in self._jobs.items() if job['status'] == 'done'][:excess]:
+            del self._jobs[job_id]
+
+    def retry_after_s(self, needed: int) -> int:
+        """Seconds until `needed` queue slots are likely free at the current processing rate."""
+        with self._lock:
+            free = self.max_queue - self._queue.qsize()
+            per_slot = self._avg_order_s / max(1, self.workers)
+        return max(1, math.ceil((needed - free) * per_slot))
+
+    def submit(self, orders: List[Dict[str, Any]]) -> Dict[str, Any]:
+        """Queue a batch as one job. {'ok': False, 'error': 'queue_full', 'retry_after_s': n} when it does not fit."""
+        if len(orders) > self.max_queue:
+            return {'ok': False, 'error': 'batch_too_large', 'max_batch': self.max_queue}
+        self.start()
+        job_id = uuid.uuid4().hex
+        with self._lock:
+            # only submit() adds to the queue and it holds the lock, so the free space can only grow meanwhile
+            if self.max_queue - self._queue.qsize() < len(orders):
+                self._stats['rejected'] += 1
+                full = True
+            else:
+                full = False
+                self._jobs[job_id] = {'job_id': job_id, 'status': 'queued', 'total': len(orders), 'done': 0, 'failed': 0,
+                                      'created_at': time.time(), 'finished_at': None, 'order_ids': [], 'errors': []}
+                for order in orders:
+                    self._queue.put_nowait((job_id, order))
+                self._stats['jobs'] += 1
+                self._stats['orders_accepted'] += len(orders)
+                if not orders:
+                    self._jobs[job_id].update(status='done', finished_at=time.time())
+                self._evict_finished()
+        if full:
+            return {'ok': False, 'error': 'queue_full', 'retry_after_s': self.retry_after_s(len(orders))}
+        return {'ok': True, 'job_id': job_id, 'queued': len(orders)}
+
+    def job(self, job_id: str) -> Optional[Dict[str, Any]]:
+        with self._lock:
+            job = self._jobs.get(job_id)
+            if job is None:
+                return None
+            out = dict(job, order_ids=list(job['order_ids']), errors=list(job['errors']))
+        out['progress'] = round((out['done'] + out['failed']) / out['total'], 4) if out['total'] else 1.0
+        return out
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            return dict(self._stats, workers=self.workers, running=bool(self._threads), queued=self._queue.qsize(),
+                        max_queue=self.max_queue, avg_order_s=round(self._avg_order_s, 3))
+
+
+_pool: Optional[OrderBatchPool] = None
+_pool_lock = threading.Lock()
+
+
+def get_order_batch_pool() -> OrderBatchPool:
+    """Process-wide pool from ORDER_BATCH_WORKERS / ORDER_BATCH_QUEUE (workers start on first submit)."""
+    global _pool
+    if _pool is None:
+        with _pool_lock:
+            if _pool is None:
+                _pool = OrderBatchPool(
+                    workers=int(os.environ.get('ORDER_BATCH_WORKERS', '8')),
+                    max_queue=int(os.environ.get('ORDER_BATCH_QUEUE', '1000')),
+                )
+    return _pool
+
+
+def set_order_batch_pool(pool: Optional[OrderBatchPool]):
+    global _pool
+    _pool = pool
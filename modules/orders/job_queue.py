@@ -0,0 +1,309 @@
+"""Durable order-workflow job queue (SQLite, shared by any number of worker processes).
+
+One job per order id: enqueueing an order that is already queued, running or done with the same
+content is a no-op. Changed content restarts it from scratch. A worker leases a job for lease_s
+seconds, and every finished step is checkpointed in `job_steps` and extends the lease. A job whose
+lease expires (its worker crashed or hung) becomes visible to other workers again, and the next
+attempt runs only the steps that have no successful checkpoint. Steps that timed out or raised
+are retried with exponential backoff up to max_attempts. After that the order is stored with its
+partial results and the job is marked failed. A lease that expires on the last attempt marks the
+job failed as well, instead of handing it out again.
+
+Workers in other processes:  python -m modules.orders.job_queue --workers 4
+"""
+import os
+import json
+import time
+import socket
+import hashlib
+import sqlite3
+import logging
+import argparse
+import threading
+from typing import Dict, Any, List, Optional
+
+logger = logging.getLogger(__name__)
+
+SCHEMA = '''
+CREATE TABLE IF NOT EXISTS jobs (job_id TEXT PRIMARY KEY, order_json TEXT NOT NULL, order_hash TEXT NOT NULL,
+                                 status TEXT NOT NULL, attempts INTEGER NOT NULL DEFAULT 0, available_at REAL NOT NULL,
+                                 lease_owner TEXT, lease_until REAL, last_error TEXT,
+                                 created_at REAL NOT NULL, updated_at REAL NOT NULL);
+CREATE INDEX IF NOT EXISTS jobs_by_status ON jobs (status, available_at);
+CREATE INDEX IF NOT EXISTS jobs_by_lease ON jobs (status, lease_until);
+CREATE TABLE IF NOT EXISTS job_steps (job_id TEXT NOT NULL, step TEXT NOT NULL, result TEXT NOT NULL,
+                                      elapsed_ms REAL, finished_at REAL NOT NULL, PRIMARY KEY (job_id, step));
+'''
+
+# step errors worth another attempt; anything else (e.g. a module being unavailable) would fail the same way again
+RETRYABLE_ERRORS = ('timeout', 'exception')
+
+
+class LeaseLost(Exception):
+    """The job was re-leased by another worker (or re-enqueued) while this worker held it."""
+
+
+def _order_hash(order: Dict[str, Any]) -> str:
+    return hashlib.sha256(json.dumps(order, sort_keys=True, default=str).encode('utf-8')).hexdigest()
+
+
+class OrderJobQueue:
+    def __init__(self, db_path: str = 'order_jobs.db', lease_s: float = 120.0, max_attempts: int = 3,
+                 backoff_s: float = 2.0, max_backoff_s: float = 60.0):
+        self.db_path = db_path
+        self.lease_s = lease_s
+        self.max_attempts = max_attempts
+        self.backoff_s = backoff_s
+        self.max_backoff_s = max_backoff_s
+        self._lock = threading.Lock()
+        # autocommit mode: transactions are opened explicitly with BEGIN IMMEDIATE so a lease is taken
+        # atomically even when several processes share the file
+        self._conn = sqlite3.connect(db_path, check_same_thread=False, isolation_level=None, timeout=30)
+        with self._lock:
+            self._conn.execute('PRAGMA journal_mode=WAL')
+            self._conn.execute('PRAGMA synchronous=NORMAL')
+            self._conn.executescript(SCHEMA)
+        self._threads: List[threading.Thread] = []
+        self._stop = threading.Event()
+
+    def _tx(self, fn):
+        """Run fn(conn) in a write transaction."""
+        with self._lock:
+            self._conn.execute('BEGIN IMMEDIATE')
+            try:
+                out = fn(self._conn)
+                self._conn.execute('COMMIT')
+                return out
+            except BaseException:
+                self._conn.execute('ROLLBACK')
+                raise
+
+    # --- producers ----------------------------------------------------------------------
+
+    def enqueue(self, order: Dict[str, Any]) -> Dict[str, Any]:
+        """Queue an order's workflow; idempotent per order id (see module docstring)."""
+        from modules.orders.order_manager import assign_order_id
+        order = dict(order)
+        job_id = assign_order_id(order)
+        digest = _order_hash(order)
+        now = time.time()
+
+        def put(conn):
+            row = conn.execute('SELECT order_hash, status FROM jobs WHERE job_id = ?', (job_id,)).fetchone()
+            if row is not None and row[0] == digest:
+                if row[1] != 'failed':
+                    return {'ok': True, 'order_id': job_id, 'status': row[1], 'duplicate': True}
+                # resubmitting a failed order retries it, resuming from its checkpoints
+                conn.execute("UPDATE jobs SET status = 'queued', attempts = 0, available_at = ?, updated_at = ? "
+                             'WHERE job_id = ?', (now, now, job_id))
+                return {'ok': True, 'order_id': job_id, 'status': 'queued', 'duplicate': False}
+            # new order, or changed content: (re)start from scratch; clearing the lease makes a worker
+            # still running the old version fail its next checkpoint instead of overwriting this one
+            conn.execute('INSERT INTO jobs (job_id, order_json, order_hash, status, attempts, available_at, created_at, updated_at) '
+                         "VALUES (?, ?, ?, 'queued', 0, ?, ?, ?) ON CONFLICT(job_id) DO UPDATE SET "
+                         "order_json = excluded.order_json, order_hash = excluded.order_hash, status = 'queued', attempts = 0, "
+                         'available_at = excluded.available_at, lease_owner = NULL, lease_until = NULL, last_error = NULL, '
+                         'updated_at = excluded.updated_at',
+                         (job_id, json.dumps(order, default=str), digest, now, now, now))
+            conn.execute('DELETE FROM job_steps WHERE job_id = ?', (job_id,))
+            return {'ok': True, 'order_id': job_id, 'status': 'queued', 'duplicate': False}
+
+        return self._tx(put)
+
+    def enqueue_many(self, orders: List[Dict[str, Any]]) -> Dict[str, Any]:
+        results = [self.enqueue(o) for o in orders]
+        return {'ok': True, 'queued': sum(1 for r in results if not r['duplicate']),
+                'duplicates': sum(1 for r in results if r['duplicate']), 'order_ids': [r['order_id'] for r in results]}
+
+    # --- workers ------------------------------------------------------------------------
+
+    def lease(self, worker_id: str) -> Optional[Dict[str, Any]]:
+        """Take the next runnable job (queued and due, or leased with an expired lease and attempts left)."""
+        now = time.time()
+
+        def take(conn):
+            # expired leases that used up their attempts fail here; otherwise a job whose worker keeps
+            # crashing or hanging would be re-leased forever
+            expired = conn.execute("UPDATE jobs SET status = 'failed', lease_owner = NULL, lease_until = NULL, "
+                                   "last_error = 'lease expired on attempt ' || attempts, updated_at = ? "
+                                   "WHERE status = 'leased' AND lease_until < ? AND attempts >= ?",
+                                   (now, now, self.max_attempts)).rowcount
+            if expired:
+                logger.warning('Order jobs: %d expired lease(s) out of attempts marked failed', expired)
+            row = conn.execute(
+                "SELECT job_id, order_json, attempts FROM jobs WHERE (status = 'queued' AND available_at <= ?) "
+                "OR (status = 'leased' AND lease_until < ?) ORDER BY available_at LIMIT 1", (now, now)).fetchone()
+            if row is None:
+                return None
+            conn.execute("UPDATE jobs SET status = 'leased', lease_owner = ?, lease_until = ?, attempts = attempts + 1, "
+                         'updated_at = ? WHERE job_id = ?', (worker_id, now + self.lease_s, now, row[0]))
+            steps = conn.execute('SELECT step, result FROM job_steps WHERE job_id = ?', (row[0],)).fetchall()
+            return {'job_id': row[0], 'order': json.loads(row[1]), 'attempt': row[2] + 1,
+                    'checkpoints': {step: json.loads(result) for step, result in steps}}
+
+        return self._tx(take)
+
+    def _owned(self, conn, job_id: str, worker_id: str):
+        row = conn.execute("SELECT 1 FROM jobs WHERE job_id = ? AND status = 'leased' AND lease_owner = ?",
+                           (job_id, worker_id)).fetchone()
+        if row is None:
+            raise LeaseLost(job_id)
+
+    def checkpoint(self, job_id: str, worker_id: str, step: str, result: Dict[str, Any], elapsed_ms: float = None):
+        """Record a successful step and extend the lease; raises LeaseLost if the job is no longer ours."""
+        now = time.time()
+
+        def save(conn):
+            self._owned(conn, job_id, worker_id)
+            conn.execute('INSERT OR REPLACE INTO job_steps (job_id, step, result, elapsed_ms, finished_at) VALUES (?, ?, ?, ?, ?)',
+                         (job_id, step, json.dumps(result, default=str), elapsed_ms, now))
+            conn.execute('UPDATE jobs SET lease_until = ?, updated_at = ? WHERE job_id = ?', (now + self.lease_s, now, job_id))
+
+        self._tx(save)
+
+    def complete(self, job_id: str, worker_id: str, status: str = 'done', error: str = None):
+        def finish(conn):
+            self._owned(conn, job_id, worker_id)
+            conn.execute('UPDATE jobs SET status = ?, lease_owner = NULL, lease_until = NULL, last_error = ?, updated_at = ? '
+                         'WHERE job_id = ?', (status, error, time.time(), job_id))
+
+        self._tx(finish)
+
+    def retry_later(self, job_id: str, worker_id: str, attempt: int, error: str):
+        delay = min(self.max_backoff_s, self.backoff_s * (2 ** (attempt - 1)))
+
+        def release(conn):
+            self._owned(conn, job_id, worker_id)
+            conn.execute("UPDATE jobs SET status = 'queued', available_at = ?, lease_owner = NULL, lease_until = NULL, "
+                         'last_error = ?, updated_at = ? WHERE job_id = ?', (time.time() + delay, error, time.time(), job_id))
+
+        self._tx(release)
+
+    def run_one(self, worker_id: str) -> Optional[str]:
+        """Lease and run one job; returns its id, or None when nothing is runnable."""
+        from modules.orders.order_manager import process_new_order
+        job = self.lease(worker_id)
+        if job is None:
+            return None
+        job_id, attempt = job['job_id'], job['attempt']
+
+        def on_step(step: str, result: Dict[str, Any], elapsed_ms: float):
+            if result.get('ok'):
+                self.checkpoint(job_id, worker_id, step, result, elapsed_ms)
+
+        try:
+            summary = process_new_order(job['order'], checkpoints=job['checkpoints'], on_step=on_step)
+        except LeaseLost:
+            logger.warning('Order job %s: lease lost, dropping this run', job_id)
+            return job_id
+        except Exception as e:
+            logger.exception('Order job %s failed (attempt %d)', job_id, attempt)
+            self._retry_or_fail(job_id, worker_id, attempt, f'exception: {e}')
+            return job_id
+
+        steps = summary.get('raw_status', {}).get('steps', {})
+        retryable = sorted(name for name, r in steps.items() if not r.get('ok') and r.get('error') in RETRYABLE_ERRORS)
+        try:
+            if retryable:
+                self._retry_or_fail(job_id, worker_id, attempt, 'steps failed: ' + ', '.join(retryable))
+            else:
+                self.complete(job_id, worker_id)
+        except LeaseLost:
+            logger.warning('Order job %s: lease lost before completion', job_id)
+        return job_id
+
+    def _retry_or_fail(self, job_id: str, worker_id: str, attempt: int, error: str):
+        if attempt >= self.max_attempts:
+            logger.warning('Order job %s failed after %d attempts: %s', job_id, attempt, error)
+            self.complete(job_id, worker_id, status='failed', error=error)
+        else:
+            self.retry_later(job_id, worker_id, attempt, error)
+
+    def _worker(self, worker_id: str, idle_s: float):
+        while not self._stop.is_set():
+            try:
+                if self.run_one(worker_id) is None:
+                    self._stop.wait(idle_s)
+            except Exception:
+                logger.exception('Order job worker %s error', worker_id)
+                self._stop.wait(idle_s)
+
+    def start(self, workers: int = 2, idle_s: float = 0.5):
+        if self._threads:
+            return
+        self._stop.clear()
+        prefix = f'{socket.gethostname()}:{os.getpid()}'
+        for i in range(workers):
+            t = threading.Thread(target=self._worker, args=(f'{prefix}:{i}', idle_s), name=f'order-job-{i}', daemon=True)
+            t.start()
+            self._threads.append(t)
+        logger.info('Order job queue started: %d workers on %s', workers, self.db_path)
+
+    def stop(self, timeout: float = 5.0):
+        self._stop.set()
+        for t in self._threads:
+            t.join(timeout)
+        self._threads = []
+
+    # --- inspection ---------------------------------------------------------------------
+
+    def job(self, job_id: str) -> Optional[Dict[str, Any]]:
+        with self._lock:
+            row = self._conn.execute('SELECT status, attempts, available_at, lease_owner, lease_until, last_error, '
+                                     'created_at, updated_at FROM jobs WHERE job_id = ?', (job_id,)).fetchone()
+            steps = self._conn.execute('SELECT step, elapsed_ms, finished_at FROM job_steps WHERE job_id = ?',
+                                       (job_id,)).fetchall()
+        if row is None:
+            return None
+        keys = ('status', 'attempts', 'available_at', 'lease_owner', 'lease_until', 'last_error', 'created_at', 'updated_at')
+        return dict(zip(keys, row), order_id=job_id,
+                    checkpoints={s: {'elapsed_ms': ms, 'finished_at': at} for s, ms, at in steps})
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            by_status = dict(self._conn.execute('SELECT status, COUNT(*) FROM jobs GROUP BY status').fetchall())
+            expired = self._conn.execute("SELECT COUNT(*) FROM jobs WHERE status = 'leased' AND lease_until < ?",
+                                         (time.time(),)).fetchone()[0]
+        return {'by_status': by_status, 'expired_leases': expired, 'workers': len(self._threads), 'db': self.db_path}
+
+
+_queue: Optional[OrderJobQueue] = None
+_queue_lock = threading.Lock()
+
+
+def get_order_job_queue() -> OrderJobQueue:
+    """Process-wide queue configured from ORDER_JOBS_* env vars (no workers until start())."""
+    global _queue
+    if _queue is None:
+        with _queue_lock:
+            if _queue is None:
+                _queue = OrderJobQueue(
+                    db_path=os.environ.get('ORDER_JOBS_DB', 'order_jobs.db'),
+                    lease_s=float(os.environ.get('ORDER_JOBS_LEASE_S', '120')),
+                    max_attempts=int(os.environ.get('ORDER_JOBS_MAX_ATTEMPTS', '3')),
+                )
+    return _queue
+
+
+def set_order_job_queue(queue: Optional[OrderJobQueue]):
+    global _queue
+    _queue = queue
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Run order workflow workers against the shared job queue')
+    parser.add_argument('--workers', type=int, default=int(os.environ.get('ORDER_JOBS_WORKERS', '2')))
+    args = parser.parse_args()
+    logging.basicConfig(level=logging.INFO)
+    queue = get_order_job_queue()
+    queue.start(workers=args.workers)
+    try:
+        while True:
+            time.sleep(60)
+            logger.info('Order job queue: %s', queue.stats())
+    except KeyboardInterrupt:
+        queue.stop()
+
+
+if __name__ == '__main__':
+    main()
@@ -1,26 +1,44 @@
-from typing import Dict, Any, List
+from typing import Dict, Any, Optional, Callable
+import json
+import uuid
 import logging
 from modules.orders.workflow_engine import process_order_flow
+from modules.orders.order_store import get_order_store
+from modules.finance.pnl import order_facts
 
 logger = logging.getLogger(__name__)
 
-# In-memory store for processed orders (simple persistence during runtime)
-_ORDERS_STORE: Dict[str, Dict[str, Any]] = {}
+# marketplace order statuses that cancel an order (Allegro checkout form status)
+CANCELLED_STATUSES = ('CANCELLED',)
 
 
-def process_new_order(order_data: Dict[str, Any]) -> Dict[str, Any]:
-    """Main entry: process a new order through the workflow and store status."""
+def assign_order_id(order_data: Dict[str, Any]) -> str:
+    """The order's own id, else a UUID derived from its content (the same order always gets the same id)."""
     order_id = order_data.get('order_id') or order_data.get('id') or order_data.get('orderId')
     if not order_id:
-        order_id = f"tmp-{len(_ORDERS_STORE)+1}"
+        order_id = str(uuid.uuid5(uuid.NAMESPACE_URL, 'order:' + json.dumps(order_data, sort_keys=True, default=str)))
         order_data['order_id'] = order_id
+    return str(order_id)
+
+
+def process_new_order(order_data: Dict[str, Any], checkpoints: Dict[str, Any] = None,
+                      on_step: Callable[[str, Dict[str, Any], float], None] = None) -> Dict[str, Any]:
+    """Main entry: process a new order through the workflow and store status.
+
+    checkpoints / on_step resume and record individual workflow steps (see modules/orders/job_queue.py).
+    """
+    order_id = assign_order_id(order_data)
+    store = get_order_store()
+    if str(order_data.get('status') or '').upper() in CANCELLED_STATUSES:
+        return cancel_order(order_id, reason=order_data.get('status'))
 
     logger.info('Processing new order %s', order_id)
-    status = process_order_flow(order_data)
+    status = process_order_flow(order_data, checkpoints=checkpoints, on_step=on_step)
 
     # store a lightweight dashboard summary
     summary = {
         'order_id': order_id,
+        'status': status.get('status'),
         'total_price': order_data.get('total_price') or order_data.get('summary', {}).get('totalToPay', {}).get('amount'),
         'intelligence_status': {
             'profit': f"{status.get('steps', {}).get('finance', {}).get('margin')}",
@@ -30,9 +48,31 @@ def process_new_order(order_data: Dict[str, Any]) -> Dict[str, Any]:
         },
         'raw_status': status
     }
-    _ORDERS_STORE[str(order_id)] = summary
+    # P&L contribution; put() swaps it for this order's earlier one in the aggregates atomically
+    try:
+        summary['pnl'] = order_facts(order_data, status)
+    except Exception:
+        logger.exception('P&L facts failed for order %s', order_id)
+    store.put(summary, raw_status=status)
     return summary
 
 
-def get_dashboard_orders() -> List[Dict[str, Any]]:
-    return list(_ORDERS_STORE.values())
+def cancel_order(order_id: str, reason: str = None) -> Dict[str, Any]:
+    """Mark a stored order cancelled and remove it from the P&L aggregates; no workflow runs."""
+    logger.info('Cancelling order %s', order_id)
+    return get_order_store().cancel(order_id, reason=reason)
+
+
+def rebuild_pnl() -> int:
+    """Recompute P&L aggregates from the facts stored with each order."""
+    return get_order_store().rebuild_pnl()
+
+
+def get_dashboard_orders(limit: int = 50, cursor: str = None, status: str = None, risk: bool = None,
+                         since: float = None, until: float = None) -> Dict[str, Any]:
+    """One newest-first page of order summaries (without raw_status) and the cursor of the next page."""
+    return get_order_store().page(limit=limit, cursor=cursor, status=status, risk=risk, since=since, until=until)
+
+
+def get_order(order_id: str, with_raw: bool = False) -> Optional[Dict[str, Any]]:
+    return get_order_store().get(order_id, with_raw=with_raw)
@@ -0,0 +1,241 @@
+"""Persistent store for processed orders (SQLite in WAL mode).
+
+Each order has a lightweight summary row in `orders`, indexed for the dashboard by status, risk
+flag and created time. The full workflow status lives in `order_raw` and is read only when asked
+for. The dashboard pages newest-first with an opaque cursor ("<created_at>:<order_id>" of the
+last row returned), so a page costs an index range scan regardless of how many orders are stored.
+P&L aggregates (modules/finance/pnl.py) live in the same database. put() replaces an order's
+contribution in the same write transaction that saves the order, so concurrent writers and
+processes sharing the file stay consistent.
+"""
+import os
+import json
+import time
+import sqlite3
+import logging
+import threading
+from typing import Dict, Any, Optional, Iterator
+
+from modules.finance.pnl import SCHEMA as PNL_SCHEMA, PnLAggregator, apply_facts
+
+logger = logging.getLogger(__name__)
+
+# summary status of orders cancelled on the marketplace
+CANCELLED = 'cancelled'
+
+SCHEMA = '''
+CREATE TABLE IF NOT EXISTS orders (order_id TEXT PRIMARY KEY, status TEXT, risk INTEGER NOT NULL DEFAULT 0,
+                                   total_price REAL, created_at REAL NOT NULL, updated_at REAL NOT NULL,
+                                   summary TEXT NOT NULL, pnl TEXT);
+CREATE INDEX IF NOT EXISTS orders_by_created ON orders (created_at, order_id);
+CREATE INDEX IF NOT EXISTS orders_by_status ON orders (status, created_at, order_id);
+CREATE INDEX IF NOT EXISTS orders_by_risk ON orders (risk, created_at, order_id);
+CREATE TABLE IF NOT EXISTS order_raw (order_id TEXT PRIMARY KEY, raw_status TEXT NOT NULL);
+'''
+
+
+def _cursor(created_at: float, order_id: str) -> str:
+    return f'{created_at!r}:{order_id}'
+
+
+def _parse_cursor(cursor: str) -> tuple:
+    created_at, sep, order_id = cursor.partition(':')
+    if not sep:
+        raise ValueError(f'invalid cursor {cursor!r}')
+    return float(created_at), order_id
+
+
+def _float(value: Any) -> Optional[float]:
+    try:
+        return float(value) if value is not None else None
+    except (TypeError, ValueError):
+        return None
+
+
+class OrderStore:
+    def __init__(self, db_path: str = 'orders.db'):
+        self.db_path = db_path
+        self._lock = threading.Lock()
+        # autocommit mode: writes open BEGIN IMMEDIATE transactions themselves (see _tx)
+        self._conn = sqlite3.connect(db_path, check_same_thread=False, isolation_level=None, timeout=30)
+        with self._lock:
+            # WAL: dashboard reads do not block on order writes; NORMAL sync is durable across app crashes
+            self._conn.execute('PRAGMA journal_mode=WAL')
+            self._conn.execute('PRAGMA synchronous=NORMAL')
+            self._conn.executescript(SCHEMA + PNL_SCHEMA)
+        self.pnl = PnLAggregator(self._conn, self._lock)
+        # databases written before the aggregates were persisted: build them once from the stored facts
+        with self._lock:
+            missing = (self._conn.execute('SELECT 1 FROM pnl_agg LIMIT 1').fetchone() is None
+                       and self._conn.execute('SELECT 1 FROM orders WHERE pnl IS NOT NULL LIMIT 1').fetchone() is not None)
+        if missing:
+            self.rebuild_pnl()
+
+    def _tx(self, fn):
+        """Run fn(conn) in a write transaction."""
+        with self._lock:
+            self._conn.execute('BEGIN IMMEDIATE')
+            try:
+                out = fn(self._conn)
+                self._conn.execute('COMMIT')
+                return out
+            except BaseException:
+                self._conn.execute('ROLLBACK')
+                raise
+
+    def put(self, summary: Dict[str, Any], raw_status: Dict[str, Any] = None):
+        """Insert or replace an order; created_at is kept from the first time it was stored.
+
+        summary['pnl'] (order facts) replaces whatever this order contributed to the P&L aggregates before.
+        A cancelled order (see cancel()) is left as it is.
+        """
+        order_id = str(summary['order_id'])
+        row = dict(summary)
+        row.pop('raw_status', None)
+        now = time.time()
+        risk = bool(((row.get('intelligence_status') or {}).get('risk') or {}).get('risk'))
+
+        def write(conn):
+            previous = conn.execute('SELECT pnl, status FROM orders WHERE order_id = ?', (order_id,)).fetchone()
+            if previous and previous[1] == CANCELLED and row.get('status') != CANCELLED:
+                logger.info('Order %s was cancelled; not storing a later workflow result', order_id)
+                return
+            if previous and previous[0]:
+                apply_facts(conn, json.loads(previous[0]), -1)
+            if row.get('pnl'):
+                apply_facts(conn, row['pnl'], +1)
+            conn.execute(
+                'INSERT INTO orders (order_id, status, risk, total_price, created_at, updated_at, summary, pnl) '
+                'VALUES (?, ?, ?, ?, ?, ?, ?, ?) ON CONFLICT(order_id) DO UPDATE SET status = excluded.status, '
+                'risk = excluded.risk, total_price = excluded.total_price, updated_at = excluded.updated_at, '
+                'summary = excluded.summary, pnl = excluded.pnl',
+                (order_id, row.get('status'), int(risk), _float(row.get('total_price')), now, now,
+                 json.dumps(row, default=str), json.dumps(row['pnl']) if row.get('pnl') else None))
+            if raw_status is not None:
+                conn.execute('INSERT OR REPLACE INTO order_raw (order_id, raw_status) VALUES (?, ?)',
+                             (order_id, json.dumps(raw_status, default=str)))
+
+        self._tx(write)
+
+    def cancel(self, order_id: str, reason: str = None) -> Dict[str, Any]:
+        """Mark an order cancelled and take its facts out of the P&L aggregates (one transaction).
+
+        An order not stored yet gets a cancelled placeholder. put() keeps a cancelled order cancelled, so a
+        workflow run that finishes after the cancellation does not bring its P&L back.
+        """
+        order_id = str(order_id)
+        now = time.time()
+
+        def write(conn):
+            row = conn.execute('SELECT summary, pnl FROM orders WHERE order_id = ?', (order_id,)).fetchone()
+            if row and row[1]:
+                apply_facts(conn, json.loads(row[1]), -1)
+            summary = dict(json.loads(row[0]) if row else {'order_id': order_id}, status=CANCELLED)
+            summary.pop('pnl', None)
+            if reason:
+                summary['cancel_reason'] = reason
+            conn.execute(
+                'INSERT INTO orders (order_id, status, risk, total_price, created_at, updated_at, summary, pnl) '
+                'VALUES (?, ?, 0, ?, ?, ?, ?, NULL) ON CONFLICT(order_id) DO UPDATE SET status = excluded.status, '
+                'updated_at = excluded.updated_at, summary = excluded.summary, pnl = NULL',
+                (order_id, CANCELLED, _float(summary.get('total_price')), now, now, json.dumps(summary, default=str)))
+            return summary
+
+        return self._tx(write)
+
+    def rebuild_pnl(self) -> int:
+        """Recompute the P&L aggregates from the facts stored with each order."""
+        def rebuild(conn):
+            facts = (json.loads(r[0]) for r in conn.execute('SELECT pnl FROM orders WHERE pnl IS NOT NULL'))
+            return self.pnl.rebuild(facts)
+
+        return self._tx(rebuild)
+
+    def get(self, order_id: str, with_raw: bool = False) -> Optional[Dict[str, Any]]:
+        with self._lock:
+            row = self._conn.execute('SELECT summary, created_at FROM orders WHERE order_id = ?', (str(order_id),)).fetchone()
+            raw = None
+            if row and with_raw:
+                raw = self._conn.execute('SELECT raw_status FROM order_raw WHERE order_id = ?', (str(order_id),)).fetchone()
+        if row is None:
+            return None
+        out = dict(json.loads(row[0]), created_at=row[1])
+        if with_raw:
+            out['raw_status'] = json.loads(raw[0]) if raw else None
+        return out
+
+    def page(self, limit: int = 50, cursor: str = None, status: str = None, risk: bool = None,
+             since: float = None, until: float = None) -> Dict[str, Any]:
+        """Newest-first page of summaries; pass next_cursor back to continue (None at the end)."""
+        where, args = [], []
+        if status is not None:
+            where.append('status = ?')
+            args.append(status)
+        if risk is not None:
+            where.append('risk = ?')
+            args.append(int(risk))
+        if since is not None:
+            where.append('created_at >= ?')
+            args.append(float(since))
+        if until is not None:
+            where.append('created_at < ?')
+            args.append(float(until))
+        if cursor:
+            where.append('(created_at, order_id) < (?, ?)')
+            args.extend(_parse_cursor(cursor))
+        sql = 'SELECT order_id, created_at, summary FROM orders'
+        if where:
+            sql += ' WHERE ' + ' AND '.join(where)
+        sql += ' ORDER BY created_at DESC, order_id DESC LIMIT ?'
+        with self._lock:
+            rows = self._conn.execute(sql, args + [int(limit) + 1]).fetchall()
+        more = len(rows) > limit
+        rows = rows[:limit]
+        return {
+            'orders': [dict(json.loads(summary), created_at=created_at) for _, created_at, summary in rows],
+            'next_cursor': _cursor(rows[-1][1], rows[-1][0]) if more else None,
+        }
+
+    def iter_pnl(self, chunk: int = 1000) -> Iterator[Dict[str, Any]]:
+        """Stored P&L facts of every order, read in chunks."""
+        last = ''
+        while True:
+            with self._lock:
+                rows = self._conn.execute('SELECT order_id, pnl FROM orders WHERE order_id > ? AND pnl IS NOT NULL '
+                                          'ORDER BY order_id LIMIT ?', (last, chunk)).fetchall()
+            if not rows:
+                return
+            for _, pnl in rows:
+                yield json.loads(pnl)
+            last = rows[-1][0]
+
+    def count(self, status: str = None) -> int:
+        with self._lock:
+            if status is None:
+                return self._conn.execute('SELECT COUNT(*) FROM orders').fetchone()[0]
+            return self._conn.execute('SELECT COUNT(*) FROM orders WHERE status = ?', (status,)).fetchone()[0]
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            by_status = dict(self._conn.execute('SELECT status, COUNT(*) FROM orders GROUP BY status').fetchall())
+            risky = self._conn.execute('SELECT COUNT(*) FROM orders WHERE risk = 1').fetchone()[0]
+        return {'orders': sum(by_status.values()), 'by_status': by_status, 'risk': risky, 'db': self.db_path}
+
+
+_store: Optional[OrderStore] = None
+_store_lock = threading.Lock()
+
+
+def get_order_store() -> OrderStore:
+    """Process-wide store at ORDER_STORE_DB (default orders.db)."""
+    global _store
+    if _store is None:
+        with _store_lock:
+            if _store is None:
+                _store = OrderStore(os.environ.get('ORDER_STORE_DB', 'orders.db'))
+    return _store
+
+
+def set_order_store(store: Optional[OrderStore]):
+    global _store
+    _store = store
@@ -25,20 +25,19 @@ def enqueue_review_on_delivery(order_data: Dict[str, Any]):
 
 def run_due_reviews(now: datetime = None) -> Dict[str, Any]:
     """Process queued reviews that are due. Returns summary of sent messages."""
+    global _REVIEW_QUEUE
     from modules.ai.base import BaseAIHandler
+    from modules.ai.prompt_builder import build_prompt
     now = now or datetime.utcnow()
     sent = []
     remaining = []
-    handler = BaseAIHandler()
+    handler = BaseAIHandler(task='reviews')
     for job in _REVIEW_QUEUE:
         if job['due'] <= now:
             try:
                 order = job['order']
-                prompt = {
-                    'task': 'Generate personalized friendly review request message tailored to customer tone',
-                    'order': order,
-                    'instructions': 'Return JSON: { message: string }'
-                }
+                prompt = build_prompt('reviews', 'Generate personalized friendly review request message tailored to customer tone. Return JSON: { message: string }',
+                                      {'order_id': job['order_id'], 'order': order})
                 resp = handler.generate(prompt)
                 message = None
                 if resp.get('ok') and isinstance(resp.get('response'), dict):
@@ -53,7 +52,6 @@ def run_due_reviews(now: datetime = None) -> Dict[str, Any]:
             remaining.append(job)
 
     # replace queue with remaining
-    global _REVIEW_QUEUE
     _REVIEW_QUEUE = remaining
     return {'ok': True, 'sent': sent, 'remaining': len(_REVIEW_QUEUE)}
 
@@ -1,12 +1,17 @@
-from typing import Dict, Any, List
+from typing import Dict, Any, List, Callable, Tuple, NamedTuple, Optional
+import os
+import copy
+import time
 import logging
+import importlib
+from concurrent.futures import ThreadPoolExecutor, wait, FIRST_COMPLETED
 
 logger = logging.getLogger(__name__)
 
 
 def _safe_import(module_path: str, attr: str = None):
     try:
-        mod = __import__(module_path, fromlist=[attr] if attr else [])
+        mod = importlib.import_module(module_path)
         return getattr(mod, attr) if attr else mod
     except Exception:
         logger.exception('Optional import failed: %s.%s', module_path, attr)
@@ -16,15 +21,16 @@ def _safe_import(module_path: str, attr: str = None):
 def analyze_order_risk(order_data: Dict[str, Any]) -> Dict[str, Any]:
     """Ask AI to analyze order for anomalies and risk. Returns dict with flags."""
     BaseAIHandler = _safe_import('modules.ai.base', 'BaseAIHandler')
-    if BaseAIHandler is None:
+    build_prompt = _safe_import('modules.ai.prompt_builder', 'build_prompt')
+    if BaseAIHandler is None or build_prompt is None:
         return {'ok': False, 'error': 'AI handler unavailable', 'risk': False}
 
-    handler = BaseAIHandler()
-    prompt = {
-        'task': 'Analyze order for risk/anomaly',
-        'order': order_data,
-        'instructions': 'Return JSON: { risk: bool, reasons: [str], severity: "low|medium|high", action: "human"|"auto" }'
-    }
+    handler = BaseAIHandler(task='risk')
+    prompt = build_prompt(
+        'risk',
+        'Analyze order for risk/anomaly. Return JSON: { risk: bool, reasons: [str], severity: "low|medium|high", action: "human"|"auto" }',
+        {'order': order_data}
+    )
     resp = handler.generate(prompt)
     if not resp.get('ok'):
         logger.warning('AI risk analysis failed: %s', resp.get('error'))
@@ -72,109 +78,234 @@ def reserve_carrier_and_prepare_docs(order_data: Dict[str, Any]) -> Dict[str, An
     return {'carrier': carrier_info, 'packing_slip': packing}
 
 
-def process_order_flow(order_data: Dict[str, Any]) -> Dict[str, Any]:
-    """Full autonomous workflow for a single order. Non-blocking where possible.
+# --- workflow steps -------------------------------------------------------------------------
+# Each step takes the order and returns its entry for status['steps']. Steps share data through
+# order_data (finance sets calculated_margin, read by ads and risk): each step runs on its own copy,
+# and the top-level keys it changed are merged back once it finishes within its timeout.
 
-    Returns a status dict summarizing actions and results.
-    """
-    status: Dict[str, Any] = {'order_id': order_data.get('order_id') or order_data.get('id'), 'steps': {}}
+def _finance_step(order_data: Dict[str, Any]) -> Dict[str, Any]:
+    cost_model = _safe_import('modules.finance.calculator', 'CostModel')
+    if not cost_model:
+        return {'ok': False, 'error': 'calculator_unavailable'}
+    # aggregate product costs from items if available
+    margin = cost_model.from_order(order_data).margin(float(order_data.get('total_price', 0)))
+    order_data['calculated_margin'] = margin
+    return {'ok': True, 'margin': margin}
 
-    # Step 1: Finance
-    try:
-        calc = _safe_import('modules.finance.calculator', 'calculate_margin')
-        if calc:
-            # aggregate product costs from items if available
-            items = order_data.get('items', [])
-            total_cost = 0.0
-            for it in items:
-                total_cost += float(it.get('cost', 0)) * int(it.get('qty', 1))
-            product_costs = {'cost': total_cost, 'packaging': float(order_data.get('packaging_cost', 0)), 'shipping': float(order_data.get('shipping_cost', 0)), 'ads': float(order_data.get('ads_cost', 0))}
-            marketplace_fees = {'fee_pct': float(order_data.get('marketplace_fee_pct', 0.15))}
-            margin = calc(float(order_data.get('total_price', 0)), product_costs, marketplace_fees)
-            status['steps']['finance'] = {'ok': True, 'margin': margin}
-            order_data['calculated_margin'] = margin
-        else:
-            status['steps']['finance'] = {'ok': False, 'error': 'calculator_unavailable'}
-    except Exception:
-        logger.exception('Finance step failed')
-        status['steps']['finance'] = {'ok': False, 'error': 'exception'}
 
-    # Ads integration: check margin and flag PAUSE_ADS if needed (best-effort)
-    try:
-        ads_eval = _safe_import('modules.ads.ads_integrator', 'evaluate_product_for_ads')
-        if ads_eval:
-            ads_actions = []
-            for it in order_data.get('items', []):
-                sku = it.get('sku') or it.get('id')
-                m = order_data.get('calculated_margin') or 0
-                try:
-                    res = ads_eval(it, m, config=None)
-                    if res.get('flag'):
-                        ads_actions.append(res)
-                except Exception:
-                    logger.exception('Ads evaluation failed for %s', sku)
-            status['steps']['ads'] = {'ok': True, 'actions': ads_actions}
-        else:
-            status['steps']['ads'] = {'ok': False, 'error': 'ads_integrator_unavailable'}
-    except Exception:
-        logger.exception('Ads step failed')
-        status['steps']['ads'] = {'ok': False, 'error': 'exception'}
+def _restore_finance(order_data: Dict[str, Any], result: Dict[str, Any]):
+    if result.get('ok'):
+        order_data['calculated_margin'] = result.get('margin')
 
-    # Step 2: Inventory
-    try:
-        guard = _safe_import('modules.inventory.guard', None)
-        if guard:
-            # for each product call predict_stock_health asynchronously (best-effort)
-            inventory_actions = []
-            for it in order_data.get('items', []):
-                prod_id = it.get('id') or it.get('product_id') or it.get('sku')
-                sales_history = it.get('sales_history', [])
-                lead_time = int(it.get('lead_time_days', 14))
-                try:
-                    res = guard.predict_stock_health(prod_id, sales_history, lead_time, product={'price': it.get('price'), 'cost': it.get('cost')})
-                    inventory_actions.append({ 'product_id': prod_id, 'result': res })
-                except Exception:
-                    logger.exception('inventory check failed for %s', prod_id)
-            status['steps']['inventory'] = {'ok': True, 'results': inventory_actions}
-        else:
-            status['steps']['inventory'] = {'ok': False, 'error': 'inventory_guard_unavailable'}
-    except Exception:
-        logger.exception('Inventory step failed')
-        status['steps']['inventory'] = {'ok': False, 'error': 'exception'}
 
-    # Step 3: Communication - generate thank you / ETA message
-    try:
-        messaging = _safe_import('modules.messaging.messaging_engine', None)
-        if messaging:
-            message_ctx = {'order_id': order_data.get('order_id'), 'product': order_data.get('items', [])[0] if order_data.get('items') else {}, 'lang': order_data.get('lang', 'pl')}
-            message_data = {'message_text': 'order_confirmation', 'sentiment': 'positive', 'intent': 'confirmation', 'urgency': 1}
-            reply = messaging.generate_smart_reply(message_data, message_ctx)
-            status['steps']['communication'] = {'ok': True, 'reply': reply}
-        else:
-            status['steps']['communication'] = {'ok': False, 'error': 'messaging_unavailable'}
-    except Exception:
-        logger.exception('Communication step failed')
-        status['steps']['communication'] = {'ok': False, 'error': 'exception'}
+def _ads_step(order_data: Dict[str, Any]) -> Dict[str, Any]:
+    """Check margin and flag PAUSE_ADS if needed (best-effort)."""
+    ads_eval = _safe_import('modules.ads.ads_integrator', 'evaluate_product_for_ads')
+    if not ads_eval:
+        return {'ok': False, 'error': 'ads_integrator_unavailable'}
+    ads_actions = []
+    for it in order_data.get('items', []):
+        sku = it.get('sku') or it.get('id')
+        m = order_data.get('calculated_margin') or 0
+        try:
+            res = ads_eval(it, m, config=None)
+            if res.get('flag'):
+                ads_actions.append(res)
+        except Exception:
+            logger.exception('Ads evaluation failed for %s', sku)
+    return {'ok': True, 'actions': ads_actions}
+
+
+def _inventory_step(order_data: Dict[str, Any]) -> Dict[str, Any]:
+    guard = _safe_import('modules.inventory.guard', None)
+    if not guard:
+        return {'ok': False, 'error': 'inventory_guard_unavailable'}
+    inventory_actions = []
+    for it in order_data.get('items', []):
+        prod_id = it.get('id') or it.get('product_id') or it.get('sku')
+        sales_history = it.get('sales_history', [])
+        lead_time = int(it.get('lead_time_days', 14))
+        try:
+            res = guard.predict_stock_health(prod_id, sales_history, lead_time, product={'sku': it.get('sku'), 'price': it.get('price'), 'cost': it.get('cost')})
+            inventory_actions.append({ 'product_id': prod_id, 'result': res })
+        except Exception:
+            logger.exception('inventory check failed for %s', prod_id)
+    return {'ok': True, 'results': inventory_actions}
+
+
+def _communication_step(order_data: Dict[str, Any]) -> Dict[str, Any]:
+    """Generate thank you / ETA message."""
+    messaging = _safe_import('modules.messaging.messaging_engine', None)
+    if not messaging:
+        return {'ok': False, 'error': 'messaging_unavailable'}
+    message_ctx = {'order_id': order_data.get('order_id'), 'product': order_data.get('items', [])[0] if order_data.get('items') else {}, 'lang': order_data.get('lang', 'pl')}
+    message_data = {'message_text': 'order_confirmation', 'sentiment': 'positive', 'intent': 'confirmation', 'urgency': 1}
+    reply = messaging.generate_smart_reply(message_data, message_ctx)
+    return {'ok': True, 'reply': reply}
+
+
+def _logistics_step(order_data: Dict[str, Any]) -> Dict[str, Any]:
+    """Select carrier and prepare docs."""
+    return {'ok': True, 'result': reserve_carrier_and_prepare_docs(order_data)}
+
+
+def _risk_step(order_data: Dict[str, Any]) -> Dict[str, Any]:
+    """AI safety net; reads the finance margin."""
+    return analyze_order_risk(order_data)
+
+
+class Step(NamedTuple):
+    name: str
+    fn: Callable[[Dict[str, Any]], Dict[str, Any]]
+    deps: Tuple[str, ...] = ()
+    # re-applies a checkpointed result's side effects on order_data when the step is skipped on resume
+    restore: Optional[Callable[[Dict[str, Any], Dict[str, Any]], None]] = None
 
-    # Step 4: Logistics - select carrier and prepare docs
+
+# Dependency graph of the order workflow. Independent steps run concurrently, so an order takes
+# as long as its slowest chain (finance -> ads / risk) rather than the sum of all steps.
+STEPS: List[Step] = [
+    Step('finance', _finance_step, restore=_restore_finance),
+    Step('ads', _ads_step, ('finance',)),
+    Step('inventory', _inventory_step),
+    Step('communication', _communication_step),
+    Step('logistics', _logistics_step),
+    Step('risk_analysis', _risk_step, ('finance',)),
+]
+
+# Seconds a step may run, counted from when it starts, before the workflow records it as timed out
+# and moves on (the step's thread finishes in the background). Override with WORKFLOW_TIMEOUT_<STEP>, e.g. WORKFLOW_TIMEOUT_RISK_ANALYSIS=8
+DEFAULT_STEP_TIMEOUTS: Dict[str, float] = {
+    'default': 30.0,
+    'finance': 5.0,
+    'logistics': 15.0,
+    'risk_analysis': 15.0,
+}
+
+def step_timeout(name: str) -> float:
+    env = os.environ.get(f'WORKFLOW_TIMEOUT_{name.upper()}')
+    if env:
+        try:
+            return float(env)
+        except ValueError:
+            logger.warning('Invalid WORKFLOW_TIMEOUT_%s=%s', name.upper(), env)
+    return DEFAULT_STEP_TIMEOUTS.get(name, DEFAULT_STEP_TIMEOUTS['default'])
+
+
+def _run_step(step: Step, order_data: Dict[str, Any], clock: Dict[str, float]) -> Dict[str, Any]:
+    # the step's time budget starts here, when a thread picks it up, not when it was submitted
+    clock['started'] = time.monotonic()
     try:
-        logistics = reserve_carrier_and_prepare_docs(order_data)
-        status['steps']['logistics'] = {'ok': True, 'result': logistics}
+        return step.fn(order_data)
     except Exception:
-        logger.exception('Logistics step failed')
-        status['steps']['logistics'] = {'ok': False, 'error': 'exception'}
+        logger.exception('%s step failed', step.name)
+        clock['raised'] = True
+        return {'ok': False, 'error': 'exception'}
+    finally:
+        clock['ended'] = time.monotonic()
+
+
+def _merge_changes(order_data: Dict[str, Any], before: Dict[str, Any], after: Dict[str, Any]):
+    """Apply the top-level keys a step set, changed or removed on its copy (before -> after)."""
+    for key, value in after.items():
+        if key not in before or before[key] != value:
+            order_data[key] = value
+    for key in before:
+        if key not in after:
+            order_data.pop(key, None)
+
+
+# how often to look again while a submitted step has not started yet (its deadline is still unknown)
+_START_POLL_S = 0.05
+
+
+def run_steps(order_data: Dict[str, Any], steps: List[Step] = None, checkpoints: Dict[str, Any] = None,
+              on_step: Callable[[str, Dict[str, Any], float], None] = None) -> Tuple[Dict[str, Any], Dict[str, float]]:
+    """Run a step graph with maximum parallelism; returns ({step: result}, {step: elapsed_ms}).
+
+    A step starts once all its dependencies have finished (successfully or not: dependents fall
+    back to their defaults). Each call gets its own pool with a thread per step, so one order's
+    steps never wait behind another order's. A step running longer than its timeout gets
+    {'ok': False, 'error': 'timeout'}; its thread finishes in the background on its own copy of the
+    order, so nothing it writes afterwards reaches order_data or the steps that start later.
+    checkpoints: results of steps that already ran; they are not run again.
+    on_step(name, result, elapsed_ms) is called as each step finishes, e.g. to checkpoint it.
+    """
+    steps = steps if steps is not None else STEPS
+    results: Dict[str, Any] = {}
+    timings: Dict[str, float] = {}
+    for step in steps:
+        if checkpoints and step.name in checkpoints:
+            results[step.name] = checkpoints[step.name]
+            if step.restore:
+                step.restore(order_data, checkpoints[step.name])
+    pending = [s for s in steps if s.name not in results]
+    running: Dict[Any, Tuple[Step, Dict[str, float], Dict[str, Any], Dict[str, Any]]] = {}  # future -> (step, clock, before, copy)
+    pool = ThreadPoolExecutor(max_workers=max(1, len(pending)), thread_name_prefix='order-step')
 
-    # AI Safety Net: risk analysis
     try:
-        risk = analyze_order_risk(order_data)
-        status['steps']['risk_analysis'] = risk
-        if risk.get('risk') and risk.get('action') == 'human':
-            status['status'] = 'ORDER_STUCK_HUMAN_INTERVENTION'
-        else:
-            status['status'] = 'PROCESSING_OK'
-    except Exception:
-        logger.exception('Risk analysis failed')
-        status['steps']['risk_analysis'] = {'ok': False, 'error': 'exception'}
-        status['status'] = 'PROCESSING_OK'
+        while pending or running:
+            for step in [s for s in pending if all(d in results for d in s.deps)]:
+                pending.remove(step)
+                clock: Dict[str, float] = {}
+                before = copy.deepcopy(order_data)
+                view = copy.deepcopy(before)
+                running[pool.submit(_run_step, step, view, clock)] = (step, clock, before, view)
+            if not running:
+                # remaining steps depend on something that is not in the graph
+                for step in pending:
+                    results[step.name] = {'ok': False, 'error': 'missing_dependency'}
+                break
+
+            now = time.monotonic()
+            waits = [clock['started'] + step_timeout(step.name) - now for step, clock, _, _ in running.values() if 'started' in clock]
+            if len(waits) < len(running):
+                waits.append(_START_POLL_S)
+            finished, _ = wait(list(running), timeout=max(0.0, min(waits)), return_when=FIRST_COMPLETED)
+            now = time.monotonic()
+            for fut in list(running):
+                step, clock, before, view = running[fut]
+                if fut in finished:
+                    results[step.name] = fut.result()
+                    elapsed = clock['ended'] - clock['started']
+                    if not clock.get('raised'):
+                        _merge_changes(order_data, before, view)
+                elif 'started' in clock and now - clock['started'] >= step_timeout(step.name):
+                    fut.cancel()
+                    elapsed = now - clock['started']
+                    logger.warning('Workflow step %s timed out after %.1fs', step.name, elapsed)
+                    results[step.name] = {'ok': False, 'error': 'timeout'}
+                else:
+                    continue
+                timings[step.name] = round(elapsed * 1000, 1)
+                del running[fut]
+                if on_step:
+                    on_step(step.name, results[step.name], timings[step.name])
+    finally:
+        # do not wait for timed-out steps; anything not started yet is dropped
+        pool.shutdown(wait=False, cancel_futures=True)
+    return results, timings
+
 
+def process_order_flow(order_data: Dict[str, Any], checkpoints: Dict[str, Any] = None,
+                       on_step: Callable[[str, Dict[str, Any], float], None] = None) -> Dict[str, Any]:
+    """Full autonomous workflow for a single order; independent steps run in parallel (see STEPS).
+
+    Returns a status dict summarizing actions and results, with per-step timings in ms.
+    checkpoints / on_step: see run_steps (used by the durable job queue to resume a workflow).
+    """
+    started = time.monotonic()
+    status: Dict[str, Any] = {'order_id': order_data.get('order_id') or order_data.get('id'), 'steps': {}}
+    results, timings = run_steps(order_data, checkpoints=checkpoints, on_step=on_step)
+    status['steps'] = {s.name: results[s.name] for s in STEPS if s.name in results}
+
+    risk = status['steps'].get('risk_analysis') or {}
+    if risk.get('risk') and risk.get('action') == 'human':
+        status['status'] = 'ORDER_STUCK_HUMAN_INTERVENTION'
+    else:
+        status['status'] = 'PROCESSING_OK'
+    status['timings'] = timings
+    if checkpoints:
+        status['resumed'] = [s.name for s in STEPS if s.name in checkpoints]
+    status['elapsed_ms'] = round((time.monotonic() - started) * 1000, 1)
     return status
@@ -0,0 +1,290 @@
+"""Repricing backtest: replay historical competitor snapshots through the compute_new_price rules.
+
+Snapshots are loaded into [timestep x product] matrices (best competitor price / lead time /
+rating, forward-filled between observations). Each config variant is simulated with the bulk
+engine (modules.repricing.bulk.reprice_columns) one timestep at a time on a simulated clock, our
+price carrying over between steps. Variants run in parallel in a process pool.
+
+Snapshot record (JSONL, one per line):
+  {"ts": "2026-01-01T03:00:00", "product_id": "A1", "offers": [{seller, price, lead_time_days, rating}, ...]}
+  or with the best offer already picked: {"ts": ..., "product_id": ..., "best_price": .., "best_lead_time_days": .., "best_rating": ..}
+  An empty offers list means no competitor from that time on.
+Catalog: {product_id: {price, cost, our_lead_time_days, our_rating}} (price = starting price). Costs are
+resolved with CostModel.from_product, so packaging / shipping / ads / marketplace_fee_pct on the entry (or
+the cost table row for its id) count towards the reported margin.
+
+CLI: python -m modules.repricing.backtest snapshots.jsonl --catalog catalog.json \\
+        --grid min_margin_pct=0.1,0.2 --grid epsilon=0.01,0.05 --workers 4
+     python -m modules.repricing.backtest --synthetic 5000x2160 --grid allow_night_tests=1,0
+"""
+import os
+import json
+import time
+import logging
+import argparse
+import itertools
+from datetime import datetime, timedelta
+from concurrent.futures import ProcessPoolExecutor
+from typing import Dict, Any, List, Optional, Iterable
+
+from modules.repricing.bulk import reprice_columns, np, DEFAULT_CONFIG
+from modules.repricing.repricer import number_or
+from modules.finance.calculator import CostModel, margin_batch, DEFAULT_FEE_PCT
+
+logger = logging.getLogger(__name__)
+
+
+class SnapshotData:
+    """Columnar backtest input. best_* arrays are [T x N]; NaN best_price = no competitor.
+
+    fixed_costs / fee_pct (per product, as in CostModel) feed the margin metric; they default to cost
+    and DEFAULT_FEE_PCT.
+    """
+
+    def __init__(self, times: List[datetime], product_ids: List[str], price, cost, our_lead, our_rating,
+                 best_price, best_lead, best_rating, fixed_costs=None, fee_pct=None):
+        self.times = times
+        self.product_ids = product_ids
+        self.price = price
+        self.cost = cost
+        self.fixed_costs = cost if fixed_costs is None else fixed_costs
+        self.fee_pct = np.full(len(cost), DEFAULT_FEE_PCT) if fee_pct is None else fee_pct
+        self.our_lead = our_lead
+        self.our_rating = our_rating
+        self.best_price = best_price
+        self.best_lead = best_lead
+        self.best_rating = best_rating
+
+    @property
+    def shape(self) -> tuple:
+        return self.best_price.shape
+
+    def save(self, path: str) -> str:
+        """Binary .npz cache; much faster to reload than re-parsing the JSONL. Returns the written path
+        (numpy appends .npz when the name lacks it)."""
+        path = npz_path(path)
+        np.savez_compressed(path, times=np.array([t.isoformat() for t in self.times]), product_ids=np.array(self.product_ids),
+                            price=self.price, cost=self.cost, our_lead=self.our_lead, our_rating=self.our_rating,
+                            best_price=self.best_price, best_lead=self.best_lead, best_rating=self.best_rating,
+                            fixed_costs=self.fixed_costs, fee_pct=self.fee_pct)
+        return path
+
+    @classmethod
+    def load(cls, path: str) -> 'SnapshotData':
+        z = np.load(npz_path(path))
+        # caches written before fixed_costs / fee_pct existed fall back to the defaults
+        return cls([datetime.fromisoformat(t) for t in z['times'].tolist()], z['product_ids'].tolist(), z['price'], z['cost'],
+                   z['our_lead'], z['our_rating'], z['best_price'], z['best_lead'], z['best_rating'],
+                   z['fixed_costs'] if 'fixed_costs' in z.files else None, z['fee_pct'] if 'fee_pct' in z.files else None)
+
+
+def npz_path(path: str) -> str:
+    return path if path.endswith('.npz') else f'{path}.npz'
+
+
+def _best_fields(rec: Dict[str, Any]) -> tuple:
+    if 'offers' in rec:
+        offers = rec.get('offers') or []
+        if not offers:
+            return float('nan'), 999.0, 0.0
+        best = min(offers, key=lambda c: float(c.get('price', 1e9)))
+        return float(best.get('price', 0)), float(best.get('lead_time_days', 999)), float(best.get('rating', 0))
+    bp = rec.get('best_price')
+    return (float('nan') if bp is None else float(bp)), float(rec.get('best_lead_time_days', 999)), float(rec.get('best_rating', 0))
+
+
+def build_snapshot_data(records: Iterable[Dict[str, Any]], catalog: Dict[str, Dict[str, Any]]) -> SnapshotData:
+    """Records for products missing from the catalog are ignored."""
+    if np is None:
+        raise RuntimeError('numpy not installed')
+    product_ids = list(catalog)
+    col = {pid: i for i, pid in enumerate(product_ids)}
+    rows = []
+    for rec in records:
+        pid = str(rec.get('product_id'))
+        if pid in col:
+            rows.append((datetime.fromisoformat(str(rec['ts'])[:19]), col[pid], _best_fields(rec)))
+    times = sorted({r[0] for r in rows})
+    row_of = {t: i for i, t in enumerate(times)}
+    T, N = len(times), len(product_ids)
+
+    observed = np.zeros((T, N), dtype=bool)
+    bp = np.full((T, N), np.nan)
+    bl = np.full((T, N), 999.0)
+    br = np.zeros((T, N))
+    for t, j, (p, l, r) in rows:
+        i = row_of[t]
+        observed[i, j] = True
+        bp[i, j], bl[i, j], br[i, j] = p, l, r
+
+    # forward fill: each cell takes the latest observation at or before it
+    idx = np.where(observed, np.arange(T)[:, None], -1)
+    np.maximum.accumulate(idx, axis=0, out=idx)
+    seen = idx >= 0
+    safe = np.where(seen, idx, 0)
+    cols = np.arange(N)[None, :]
+    best_price = np.where(seen, bp[safe, cols], np.nan)
+    best_lead = np.where(seen, bl[safe, cols], 999.0)
+    best_rating = np.where(seen, br[safe, cols], 0.0)
+
+    def column(field, default):
+        return np.array([float(number_or(catalog[pid].get(field), default)) for pid in product_ids])
+
+    models = [CostModel.from_product(dict({'id': pid}, **catalog[pid])) for pid in product_ids]
+    return SnapshotData(times, product_ids, column('price', 0), np.array([m.cost for m in models]),
+                        column('our_lead_time_days', 1), column('our_rating', 5.0), best_price, best_lead, best_rating,
+                        fixed_costs=np.array([m.fixed_costs for m in models]), fee_pct=np.array([m.fee_pct for m in models]))
+
+
+def load_snapshots(path: str, catalog: Dict[str, Dict[str, Any]]) -> SnapshotData:
+    def records():
+        with open(path, 'r', encoding='utf-8') as f:
+            for line in f:
+                line = line.strip()
+                if line:
+                    yield json.loads(line)
+    return build_snapshot_data(records(), catalog)
+
+
+def synthetic_snapshots(n_products: int = 1000, n_steps: int = 24 * 30, step_minutes: int = 60,
+                        start: datetime = None, seed: int = 0) -> SnapshotData:
+    """Random-walk competitor prices for benchmarking the engine."""
+    if np is None:
+        raise RuntimeError('numpy not installed')
+    rng = np.random.default_rng(seed)
+    start = start or datetime(2026, 1, 1)
+    cost = np.round(rng.uniform(10, 300, n_products), 2)
+    price = np.round(cost * rng.uniform(1.2, 1.8, n_products), 2)
+    walk = np.cumsum(rng.normal(0, 0.01, (n_steps, n_products)), axis=0)
+    best_price = np.round(price * rng.uniform(0.85, 1.15, n_products) * np.exp(walk), 2)
+    best_price[rng.random((n_steps, n_products)) < 0.02] = np.nan
+    best_lead = rng.integers(1, 7, (n_steps, n_products)).astype(float)
+    best_rating = rng.choice([4.0, 4.5, 4.8, 5.0], (n_steps, n_products))
+    times = [start + timedelta(minutes=step_minutes * i) for i in range(n_steps)]
+    return SnapshotData(times, [f'P{i}' for i in range(n_products)], price, cost, rng.integers(1, 4, n_products).astype(float),
+                        rng.choice([4.5, 4.8, 5.0], n_products), best_price, best_lead, best_rating)
+
+
+def simulate(data: SnapshotData, config: Optional[Dict[str, Any]] = None) -> Dict[str, Any]:
+    """Run one config variant over the whole history; returns aggregate metrics."""
+    started = time.perf_counter()
+    cfg = dict(DEFAULT_CONFIG, **(config or {}))
+    T, N = data.shape
+    price = data.price.astype(np.float64).copy()
+    cost = data.cost
+    changes = np.zeros(N, dtype=np.int64)
+    margin_sum = 0.0
+    margin_n = 0
+    buy_box = 0
+    below_cost = 0
+    for t in range(T):
+        best = data.best_price[t]
+        out = reprice_columns({'price': price, 'cost': cost, 'our_lead_time_days': data.our_lead,
+                               'our_rating': data.our_rating, 'best_price': best,
+                               'best_lead_time_days': data.best_lead[t], 'best_rating': data.best_rating[t]},
+                              config=cfg, now=data.times[t])
+        new_price = out['new_price']
+        changes += new_price != price
+        price = new_price
+        priced = price > 0
+        margin_sum += float(np.sum(margin_batch(price, data.fixed_costs, data.fee_pct)[priced]))
+        margin_n += int(priced.sum())
+        # Buy Box proxy: no competitor, or we are at or below the cheapest offer
+        buy_box += int(np.sum(np.isnan(best) | (price <= best)))
+        below_cost += int(np.sum(price < cost))
+
+    cells = T * N
+    return {
+        'config': cfg,
+        'steps': T,
+        'products': N,
+        'avg_margin_pct': round(margin_sum / margin_n, 6) if margin_n else None,
+        'price_changes': int(changes.sum()),
+        'changes_per_product': round(float(changes.mean()), 3) if N else 0.0,
+        'buy_box_rate': round(buy_box / cells, 6) if cells else None,
+        'below_cost_share': round(below_cost / cells, 6) if cells else None,
+        'final_avg_price': round(float(price.mean()), 4) if N else None,
+        'elapsed_s': round(time.perf_counter() - started, 3),
+    }
+
+
+def config_grid(**axes: List[Any]) -> List[Dict[str, Any]]:
+    """config_grid(min_margin_pct=[0.1, 0.2], epsilon=[0.01]) -> every combination as a config dict."""
+    keys = list(axes)
+    return [dict(zip(keys, values)) for values in itertools.product(*(axes[k] for k in keys))]
+
+
+_worker_data: Optional[SnapshotData] = None
+
+
+def _init_worker(data: Any):
+    # data is sent once per worker process (or an .npz path loaded there), not once per variant
+    global _worker_data
+    _worker_data = SnapshotData.load(data) if isinstance(data, str) else data
+
+
+def _run_variant(config: Dict[str, Any]) -> Dict[str, Any]:
+    return simulate(_worker_data, config)
+
+
+def run_backtest(data: Any, configs: List[Dict[str, Any]], workers: int = None) -> List[Dict[str, Any]]:
+    """Simulate every config variant; results in config order.
+
+    data: SnapshotData or a path to an .npz saved with SnapshotData.save (preferred for large runs:
+    workers load it themselves instead of receiving a pickled copy).
+    """
+    workers = workers or min(len(configs), os.cpu_count() or 1)
+    if workers <= 1 or len(configs) <= 1:
+        loaded = SnapshotData.load(data) if isinstance(data, str) else data
+        return [simulate(loaded, c) for c in configs]
+    with ProcessPoolExecutor(max_workers=workers, initializer=_init_worker, initargs=(data,)) as pool:
+        return list(pool.map(_run_variant, configs))
+
+
+def _parse_grid(items: List[str]) -> Dict[str, List[Any]]:
+    axes = {}
+    for item in items:
+        key, _, values = item.partition('=')
+        parsed = []
+        for v in values.split(','):
+            if key == 'allow_night_tests':
+                parsed.append(v.strip().lower() in ('1', 'true', 'yes'))
+            else:
+                parsed.append(float(v))
+        axes[key] = parsed
+    return axes
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Backtest repricing configs over competitor snapshots')
+    parser.add_argument('snapshots', nargs='?', help='JSONL snapshots or .npz saved by a previous run')
+    parser.add_argument('--catalog', help='JSON {product_id: {price, cost, our_lead_time_days, our_rating}}')
+    parser.add_argument('--synthetic', help='NxT random data instead of snapshots, e.g. 5000x2160')
+    parser.add_argument('--grid', action='append', default=[], help='config axis, e.g. epsilon=0.01,0.05')
+    parser.add_argument('--workers', type=int, default=None)
+    parser.add_argument('--save-npz', help='store the loaded snapshot matrix for faster reruns')
+    args = parser.parse_args()
+    logging.basicConfig(level=logging.INFO)
+
+    t0 = time.perf_counter()
+    if args.synthetic:
+        n, t = (int(x) for x in args.synthetic.lower().split('x'))
+        data = synthetic_snapshots(n, t)
+    elif args.snapshots and args.snapshots.endswith('.npz'):
+        data = args.snapshots
+    else:
+        with open(args.catalog, 'r', encoding='utf-8') as f:
+            data = load_snapshots(args.snapshots, json.load(f))
+    if args.save_npz and isinstance(data, SnapshotData):
+        data = data.save(args.save_npz)
+    logger.info('Snapshots ready in %.1fs', time.perf_counter() - t0)
+
+    configs = config_grid(**_parse_grid(args.grid)) if args.grid else [{}]
+    results = run_backtest(data, configs, workers=args.workers)
+    for r in sorted(results, key=lambda r: -(r['avg_margin_pct'] or 0)):
+        print(json.dumps(r, default=str))
+    logger.info('%d variants in %.1fs', len(results), time.perf_counter() - t0)
+
+
+if __name__ == '__main__':
+    main()
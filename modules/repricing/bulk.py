@@ -0,0 +1,170 @@
+"""Columnar repricing: compute_new_price rules applied to the whole catalog in one NumPy pass.
+
+Results match modules.repricing.repricer.compute_new_price exactly (same float operations, same
+round-half-even to cents). Without NumPy the scalar function is used row by row.
+"""
+from datetime import datetime
+from typing import Dict, Any, List, Optional, Sequence
+import logging
+
+from modules.repricing.repricer import compute_new_price, number_or
+from modules.finance.calculator import CostModel
+
+try:
+    import numpy as np
+except Exception:
+    np = None
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_CONFIG = {
+    'min_margin_pct': 0.20,
+    'max_discount_pct': 0.15,
+    'epsilon': 0.01,
+    'allow_night_tests': True
+}
+
+# Input columns. best_* describe the cheapest competitor; best_price NaN / null means no competitor.
+COLUMNS = ('price', 'cost', 'our_lead_time_days', 'our_rating', 'best_price', 'best_lead_time_days', 'best_rating')
+COLUMN_DEFAULTS = {'price': 0.0, 'cost': 0.0, 'our_lead_time_days': 1.0, 'our_rating': 5.0,
+                   'best_price': float('nan'), 'best_lead_time_days': 999.0, 'best_rating': 0.0}
+# null / NaN is rejected in these columns; in the others it takes the column default
+REQUIRED_COLUMNS = ('price', 'cost')
+
+# Rule codes returned per row, with the reason/actions compute_new_price reports for them
+NO_COMPETITOR, HOLD, NIGHT_TEST, UNDERCUT, NO_CUT, RAISE_TO_BASELINE, NUDGE_UP = range(7)
+RULES = {
+    NO_COMPETITOR: ('Brak zmian — brak konkurencji', []),
+    HOLD: ('Konkurent tańszy, ale gorszy czas dostawy/ocena — utrzymujemy cenę (przewaga szybkiej dostawy)',
+           ['keep_price', 'highlight_fast_delivery']),
+    NIGHT_TEST: ('Nocny test: mikro-obniżka cenowa (micro-jump) by sprawdzić elastyczność', ['apply_price', 'run_night_test']),
+    UNDERCUT: ('Dostosowanie ceny aby odzyskać Buy Box przy zachowaniu minimalnej marży', ['apply_price']),
+    NO_CUT: ('Nie obniżamy ceny — nieopłacalne lub poza limitem rabatu', ['keep_price']),
+    RAISE_TO_BASELINE: ('Podnosimy do minimalnej dopuszczalnej marży', ['apply_price']),
+    NUDGE_UP: ('Jesteśmy najtańsi — delikatna optymalizacja ceny w górę dla większej marży', ['apply_price']),
+}
+
+
+def _round2(a):
+    """Python round(x, 2) for arrays: np.round scales by 100 first and can differ on near-ties,
+    so those few elements are re-rounded with the builtin."""
+    r = np.round(a, 2)
+    frac = np.abs(np.mod(a * 100.0, 1.0) - 0.5)
+    for i in np.nonzero(frac < 1e-6)[0]:
+        r[i] = round(float(a[i]), 2)
+    return r
+
+
+def reprice_columns(columns: Dict[str, Sequence[float]], config: Optional[Dict[str, Any]] = None,
+                    now: Optional[datetime] = None) -> Dict[str, Any]:
+    """Vectorized compute_new_price over equally long columns (see COLUMNS; missing ones take COLUMN_DEFAULTS).
+
+    Returns { new_price, baseline, rule, floored } arrays; rule indexes RULES, floored marks rows
+    lifted by the final baseline safety net. Raises ValueError for null / NaN in REQUIRED_COLUMNS.
+    Requires NumPy.
+    """
+    if np is None:
+        raise RuntimeError('numpy not installed')
+    cfg = dict(DEFAULT_CONFIG)
+    if config:
+        cfg.update(config)
+
+    n = len(columns['price'])
+    col = {}
+    for k in COLUMNS:
+        if k not in columns:
+            col[k] = np.full(n, COLUMN_DEFAULTS[k])
+            continue
+        a = np.asarray(columns[k], dtype=np.float64)  # None -> NaN
+        missing = np.isnan(a)
+        if k in REQUIRED_COLUMNS and missing.any():
+            raise ValueError(f'{k} column has null values at rows {np.nonzero(missing)[0][:10].tolist()}')
+        if k != 'best_price' and missing.any():
+            a = np.where(missing, COLUMN_DEFAULTS[k], a)
+        col[k] = a
+    price, cost = col['price'], col['cost']
+    best_price = col['best_price']
+
+    baseline = _round2(cost * (1 + cfg['min_margin_pct']))
+    has_best = ~np.isnan(best_price)
+    cheaper = has_best & (best_price < price)
+    hold = cheaper & (((col['best_lead_time_days'] - col['our_lead_time_days']) >= 2)
+                      | (col['best_rating'] + 0.1 < col['our_rating']))
+    compete = cheaper & ~hold
+    cheapest = has_best & ~cheaper
+
+    allowable_floor = np.maximum(baseline, price * (1 - cfg['max_discount_pct']))
+    target = _round2(np.minimum(price, np.maximum(allowable_floor, best_price - cfg['epsilon'])))
+    hour = (now or datetime.now()).hour
+    night = bool(cfg['allow_night_tests']) and 0 <= hour <= 5
+    nudge = _round2(np.minimum(price * 1.02, price + cfg['epsilon']))
+
+    rule = np.full(n, NO_COMPETITOR, dtype=np.int8)
+    new_price = price.copy()
+    rule[hold] = HOLD
+    new_price[hold] = np.maximum(price, baseline)[hold]
+    if night:
+        rule[compete] = NIGHT_TEST
+        new_price[compete] = target[compete]
+    else:
+        cut = compete & (target < price)
+        rule[cut] = UNDERCUT
+        new_price[cut] = target[cut]
+        rule[compete & ~cut] = NO_CUT
+    raise_ = cheapest & (price <= baseline)
+    rule[raise_] = RAISE_TO_BASELINE
+    new_price[raise_] = baseline[raise_]
+    up = cheapest & ~raise_
+    rule[up] = NUDGE_UP
+    new_price[up] = nudge[up]
+
+    # final safety: never go below baseline
+    floored = new_price < baseline
+    new_price[floored] = baseline[floored]
+    return {'new_price': _round2(new_price), 'baseline': baseline, 'rule': rule, 'floored': floored}
+
+
+def _best_competitor(competitors: List[Dict[str, Any]]) -> Optional[Dict[str, Any]]:
+    # same pick as compute_new_price: first entry with the lowest price
+    return min(competitors, key=lambda c: number_or(c.get('price'), 1e9)) if competitors else None
+
+
+def columns_from_items(items: List[Dict[str, Any]]) -> Dict[str, List[float]]:
+    """[{product, competitors}] -> columns for reprice_columns."""
+    out = {k: [] for k in COLUMNS}
+    for item in items:
+        p = item.get('product') or {}
+        best = _best_competitor(item.get('competitors') or [])
+        out['price'].append(number_or(p.get('price'), 0))
+        out['cost'].append(CostModel.from_product(p).cost)
+        out['our_lead_time_days'].append(number_or(p.get('our_lead_time_days'), 1))
+        out['our_rating'].append(number_or(p.get('our_rating'), 5.0))
+        out['best_price'].append(number_or(best.get('price'), 0) if best else float('nan'))
+        out['best_lead_time_days'].append(number_or(best.get('lead_time_days'), 999) if best else 999.0)
+        out['best_rating'].append(number_or(best.get('rating'), 0) if best else 0.0)
+    return out
+
+
+def reprice_bulk(items: List[Dict[str, Any]], config: Optional[Dict[str, Any]] = None,
+                 now: Optional[datetime] = None) -> List[Dict[str, Any]]:
+    """compute_new_price for many products at once.
+
+    items: [{ product, competitors }]. Returns the compute_new_price result for each item, in order.
+    """
+    if np is None:
+        return [compute_new_price(i.get('product') or {}, i.get('competitors') or [], config=config, now=now) for i in items]
+    if not items:
+        return []
+
+    out = reprice_columns(columns_from_items(items), config=config, now=now)
+    results = []
+    for new_price, baseline, rule, floored in zip(out['new_price'].tolist(), out['baseline'].tolist(),
+                                                  out['rule'].tolist(), out['floored'].tolist()):
+        reason, actions = RULES[rule]
+        actions = list(actions)
+        if floored:
+            reason += ' | korekta do baseline'
+            if 'apply_price' not in actions:
+                actions.append('apply_price')
+        results.append({'new_price': new_price, 'reason': reason, 'actions': actions, 'baseline': baseline})
+    return results
@@ -0,0 +1,212 @@
+"""Long-lived competitor offer index per product.
+
+Offers are upserted / removed incrementally (one seller at a time) and the best offer is read
+from heaps instead of sorting the competitor list on every repricing call. Heaps use lazy
+deletion: replaced or removed offers stay in the heap until they surface at the top, and a heap
+is rebuilt when stale entries outnumber live ones. Subscribers are told when a product's best
+offer changes (modules.repricing.scheduler marks it dirty).
+"""
+import os
+import json
+import heapq
+import logging
+import threading
+import time
+from typing import Dict, Any, List, Optional, Callable
+
+logger = logging.getLogger(__name__)
+
+# effective price = price * (1 + LEAD_WEIGHT * lead_time_days + RATING_WEIGHT * (5 - rating)):
+# one day of delivery costs ~1% of price, one rating star ~3%
+LEAD_WEIGHT = 0.01
+RATING_WEIGHT = 0.03
+
+
+class _ProductOffers:
+    __slots__ = ('offers', 'by_price', 'by_effective', 'seq')
+
+    def __init__(self):
+        self.offers: Dict[str, Dict[str, Any]] = {}
+        self.by_price: List[tuple] = []
+        self.by_effective: List[tuple] = []
+        self.seq = 0
+
+
+class CompetitorIndex:
+    def __init__(self, lead_weight: float = LEAD_WEIGHT, rating_weight: float = RATING_WEIGHT):
+        self.lead_weight = lead_weight
+        self.rating_weight = rating_weight
+        self._lock = threading.RLock()
+        self._products: Dict[str, _ProductOffers] = {}
+        self._stats = {'upserts': 0, 'removals': 0, 'rebuilds': 0}
+        self._listeners: List[Callable[[str], None]] = []
+
+    def subscribe(self, fn: Callable[[str], None]):
+        """fn(product_id) is called after an upsert/removal changes that product's best offer."""
+        self._listeners.append(fn)
+
+    def _best_key(self, p: Optional[_ProductOffers]) -> Optional[tuple]:
+        offer = self._top(p, p.by_price) if p else None
+        return (offer['seller'], offer['price'], offer['lead_time_days'], offer['rating']) if offer else None
+
+    def _notify(self, product_id: str):
+        for fn in self._listeners:
+            try:
+                fn(product_id)
+            except Exception:
+                logger.exception('Competitor index listener failed for %s', product_id)
+
+    def effective_price(self, offer: Dict[str, Any]) -> float:
+        return offer['price'] * (1 + self.lead_weight * offer['lead_time_days'] + self.rating_weight * (5.0 - offer['rating']))
+
+    def upsert(self, product_id: str, seller: str, price: float, lead_time_days: float = 5, rating: float = 4.5,
+               updated_at: float = None) -> Dict[str, Any]:
+        offer = {'seller': str(seller), 'price': float(price), 'lead_time_days': float(lead_time_days),
+                 'rating': float(rating), 'updated_at': updated_at or time.time()}
+        with self._lock:
+            p = self._products.setdefault(str(product_id), _ProductOffers())
+            before = self._best_key(p) if self._listeners else None
+            p.seq += 1
+            offer['_seq'] = p.seq
+            p.offers[offer['seller']] = offer
+            # seq breaks ties in insertion order and tells live entries from stale ones
+            heapq.heappush(p.by_price, (offer['price'], p.seq, offer['seller']))
+            heapq.heappush(p.by_effective, (self.effective_price(offer), p.seq, offer['seller']))
+            self._stats['upserts'] += 1
+            self._maybe_rebuild(p)
+            changed = bool(self._listeners) and self._best_key(p) != before
+        if changed:
+            self._notify(str(product_id))
+        return self._public(offer)
+
+    def upsert_many(self, product_id: str, offers: List[Dict[str, Any]]):
+        for o in offers:
+            self.upsert(product_id, o.get('seller', 'unknown'), o.get('price', 0), o.get('lead_time_days', 5),
+                        o.get('rating', 4.5), o.get('updated_at'))
+
+    def remove(self, product_id: str, seller: str) -> bool:
+        with self._lock:
+            p = self._products.get(str(product_id))
+            before = self._best_key(p) if self._listeners else None
+            if p is None or p.offers.pop(str(seller), None) is None:
+                return False
+            self._stats['removals'] += 1
+            if not p.offers:
+                del self._products[str(product_id)]
+                p = None
+            else:
+                self._maybe_rebuild(p)
+            changed = bool(self._listeners) and self._best_key(p) != before
+        if changed:
+            self._notify(str(product_id))
+        return True
+
+    def remove_product(self, product_id: str) -> bool:
+        with self._lock:
+            return self._products.pop(str(product_id), None) is not None
+
+    def _top(self, p: _ProductOffers, heap: List[tuple]) -> Optional[Dict[str, Any]]:
+        while heap:
+            _, seq, seller = heap[0]
+            offer = p.offers.get(seller)
+            if offer is not None and offer['_seq'] == seq:
+                return offer
+            heapq.heappop(heap)
+        return None
+
+    def _maybe_rebuild(self, p: _ProductOffers):
+        live = len(p.offers)
+        if len(p.by_price) > 2 * live + 8:
+            offers = sorted(p.offers.values(), key=lambda o: o['_seq'])
+            p.by_price = [(o['price'], o['_seq'], o['seller']) for o in offers]
+            p.by_effective = [(self.effective_price(o), o['_seq'], o['seller']) for o in offers]
+            heapq.heapify(p.by_price)
+            heapq.heapify(p.by_effective)
+            self._stats['rebuilds'] += 1
+
+    def best(self, product_id: str) -> Optional[Dict[str, Any]]:
+        """Cheapest offer (ties: the one inserted first)."""
+        with self._lock:
+            p = self._products.get(str(product_id))
+            return self._public(self._top(p, p.by_price)) if p else None
+
+    def best_effective(self, product_id: str) -> Optional[Dict[str, Any]]:
+        """Offer with the lowest price adjusted for lead time and rating, with 'effective_price' added."""
+        with self._lock:
+            p = self._products.get(str(product_id))
+            offer = self._top(p, p.by_effective) if p else None
+            return dict(self._public(offer), effective_price=round(self.effective_price(offer), 4)) if offer else None
+
+    def offers(self, product_id: str) -> List[Dict[str, Any]]:
+        with self._lock:
+            p = self._products.get(str(product_id))
+            return [self._public(o) for o in sorted(p.offers.values(), key=lambda o: o['_seq'])] if p else []
+
+    def product_ids(self) -> List[str]:
+        with self._lock:
+            return list(self._products)
+
+    @staticmethod
+    def _public(offer: Optional[Dict[str, Any]]) -> Optional[Dict[str, Any]]:
+        return {k: v for k, v in offer.items() if k != '_seq'} if offer else None
+
+    def snapshot(self) -> Dict[str, Any]:
+        """Plain-dict state (offers in insertion order); restore() rebuilds the heaps from it."""
+        with self._lock:
+            return {'version': 1, 'lead_weight': self.lead_weight, 'rating_weight': self.rating_weight,
+                    'products': {pid: self.offers(pid) for pid in self._products}}
+
+    def restore(self, state: Dict[str, Any]):
+        with self._lock:
+            self._products = {}
+            for pid, offers in (state.get('products') or {}).items():
+                self.upsert_many(pid, offers)
+
+    def save(self, path: str):
+        """Atomic snapshot to a JSON file."""
+        tmp = f'{path}.tmp'
+        with open(tmp, 'w', encoding='utf-8') as f:
+            json.dump(self.snapshot(), f, ensure_ascii=False, separators=(',', ':'))
+        os.replace(tmp, path)
+
+    def load(self, path: str) -> bool:
+        try:
+            with open(path, 'r', encoding='utf-8') as f:
+                self.restore(json.load(f))
+        except FileNotFoundError:
+            return False
+        logger.info('Competitor index restored from %s: %d products', path, len(self._products))
+        return True
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            return dict(self._stats, products=len(self._products), offers=sum(len(p.offers) for p in self._products.values()))
+
+
+_index: Optional[CompetitorIndex] = None
+_index_lock = threading.Lock()
+
+
+def get_competitor_index() -> CompetitorIndex:
+    """Process-wide index; restored from COMPETITOR_INDEX_PATH on first use when set."""
+    global _index
+    if _index is None:
+        with _index_lock:
+            if _index is None:
+                index = CompetitorIndex()
+                path = os.environ.get('COMPETITOR_INDEX_PATH')
+                if path:
+                    try:
+                        index.load(path)
+                    except Exception:
+                        logger.exception('Cannot restore competitor index from %s', path)
+                _index = index
+    return _index
+
+
+def save_competitor_index() -> Optional[str]:
+    path = os.environ.get('COMPETITOR_INDEX_PATH')
+    if path and _index is not None:
+        _index.save(path)
+        return path
+    return None
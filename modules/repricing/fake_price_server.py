@@ -0,0 +1,141 @@
+"""Local stand-in for competitor price sources, for testing the fetcher offline.
+
+Run:  python -m modules.repricing.fake_price_server --port 8766 --latency uniform:0.05,0.3 --error-rate 0.05
+Then use sources like {'type': 'api', 'url': 'http://127.0.0.1:8766/offers/SKU-1'}.
+
+GET /offers/<key> returns {offers: [...]} (deterministic per key until set_offers() changes it)
+with ETag / Last-Modified, answers 304 to matching conditional requests, sleeps a sampled
+latency and fails with 503 at the configured rate. GET /stats returns request counters.
+"""
+import json
+import time
+import random
+import hashlib
+import logging
+import argparse
+import threading
+from email.utils import formatdate
+from http.server import ThreadingHTTPServer, BaseHTTPRequestHandler
+from typing import Dict, Any, List, Optional
+
+from modules.ai.fake_server import parse_latency
+
+logger = logging.getLogger(__name__)
+
+
+def _default_offers(key: str) -> List[Dict[str, Any]]:
+    rng = random.Random(int(hashlib.sha256(key.encode('utf-8')).hexdigest()[:12], 16))
+    base = rng.uniform(20, 400)
+    return [{'seller': f'seller-{i}', 'price': round(base * rng.uniform(0.85, 1.15), 2),
+             'lead_time_days': rng.randint(1, 6), 'rating': rng.choice([4.2, 4.6, 4.9])} for i in range(rng.randint(1, 5))]
+
+
+class FakePriceServer(ThreadingHTTPServer):
+    daemon_threads = True
+
+    def __init__(self, address, latency: str = 'constant:0', error_rate: float = 0.0, seed: Optional[int] = None):
+        super().__init__(address, _Handler)
+        self.latency = parse_latency(latency)
+        self.error_rate = error_rate
+        self.rng = random.Random(seed)
+        self._lock = threading.Lock()
+        self._docs: Dict[str, Dict[str, Any]] = {}
+        self.counters = {'requests': 0, 'errors': 0, 'not_modified': 0, 'in_flight': 0, 'max_in_flight': 0}
+
+    def set_offers(self, key: str, offers: List[Dict[str, Any]]):
+        body = json.dumps({'offers': offers}, ensure_ascii=False).encode('utf-8')
+        with self._lock:
+            self._docs[key] = {'body': body, 'etag': '"%s"' % hashlib.sha256(body).hexdigest()[:16],
+                               'last_modified': formatdate(time.time(), usegmt=True)}
+
+    def doc(self, key: str) -> Dict[str, Any]:
+        if key not in self._docs:
+            self.set_offers(key, _default_offers(key))
+        return self._docs[key]
+
+    def begin(self) -> tuple:
+        with self._lock:
+            self.counters['requests'] += 1
+            self.counters['in_flight'] += 1
+            self.counters['max_in_flight'] = max(self.counters['max_in_flight'], self.counters['in_flight'])
+            delay = self.latency(self.rng)
+            fail = self.rng.random() < self.error_rate
+            if fail:
+                self.counters['errors'] += 1
+        return delay, fail
+
+    def not_modified(self):
+        # counted before the 304 goes out, so a client never sees the reply before the counter
+        with self._lock:
+            self.counters['not_modified'] += 1
+
+    def end(self):
+        with self._lock:
+            self.counters['in_flight'] -= 1
+
+
+class _Handler(BaseHTTPRequestHandler):
+    protocol_version = 'HTTP/1.1'
+
+    def log_message(self, fmt, *args):
+        logger.debug(fmt, *args)
+
+    def _send(self, status: int, body: bytes = b'', headers: Dict[str, str] = None):
+        self.send_response(status)
+        for k, v in (headers or {}).items():
+            self.send_header(k, v)
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        if body:
+            self.wfile.write(body)
+
+    def do_GET(self):
+        if self.path == '/stats':
+            return self._send(200, json.dumps(self.server.counters).encode('utf-8'), {'Content-Type': 'application/json'})
+        if not self.path.startswith('/offers/'):
+            return self._send(404, b'{"error": "not found"}', {'Content-Type': 'application/json'})
+
+        delay, fail = self.server.begin()
+        try:
+            if delay:
+                time.sleep(delay)
+            if fail:
+                return self._send(503, b'{"error": "stand-in injected failure"}', {'Content-Type': 'application/json'})
+            doc = self.server.doc(self.path[len('/offers/'):])
+            headers = {'ETag': doc['etag'], 'Last-Modified': doc['last_modified']}
+            if self.headers.get('If-None-Match') == doc['etag'] or (
+                    not self.headers.get('If-None-Match') and self.headers.get('If-Modified-Since') == doc['last_modified']):
+                self.server.not_modified()
+                return self._send(304, headers=headers)
+            self._send(200, doc['body'], dict(headers, **{'Content-Type': 'application/json'}))
+        finally:
+            self.server.end()
+
+
+def start_fake_price_server(host: str = '127.0.0.1', port: int = 0, **kwargs) -> FakePriceServer:
+    """Start the stand-in in a background thread; port=0 picks a free port (see server.server_port)."""
+    server = FakePriceServer((host, port), **kwargs)
+    threading.Thread(target=server.serve_forever, name='fake-prices', daemon=True).start()
+    return server
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Local competitor price source stand-in')
+    parser.add_argument('--host', default='127.0.0.1')
+    parser.add_argument('--port', type=int, default=8766)
+    parser.add_argument('--latency', default='uniform:0.05,0.3')
+    parser.add_argument('--error-rate', type=float, default=0.0)
+    parser.add_argument('--seed', type=int, default=None)
+    args = parser.parse_args()
+
+    server = FakePriceServer((args.host, args.port), latency=args.latency, error_rate=args.error_rate, seed=args.seed)
+    logging.basicConfig(level=logging.INFO)
+    logger.info('Fake price source listening on http://%s:%d', args.host, server.server_port)
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,203 @@
+"""Gated hybrid repricing.
+
+Each case is first classified by the deterministic rules: decisive cases (no competitor, we are
+clearly cheapest, the cheaper competitor is clearly slower / worse rated) return the
+compute_new_price result without a model call. Ambiguous cases (price near a tie, competitor
+cheaper and comparable) run the model and the deterministic engine concurrently; if the model
+misses the deadline or fails, the deterministic price is used.
+"""
+import os
+import math
+import time
+import asyncio
+import logging
+import threading
+from collections import deque
+from typing import Dict, Any, List, Optional, Callable, Awaitable
+
+from modules.ai.circuit import deadline_for
+from modules.repricing.repricer import compute_new_price, enforce_margin_or_adjust, number_or
+
+logger = logging.getLogger(__name__)
+
+# best competitor at least this much above our price -> we are clearly cheapest
+PRICE_BAND_PCT = 0.02
+# cheaper competitor delivering at least this many days later (and not better rated) -> keep price
+LEAD_GAP_DAYS = 3.0
+# cheaper competitor rated at least this much lower -> keep price
+RATING_GAP = 0.3
+
+
+def classify_case(product: Dict[str, Any], competitors: List[Dict[str, Any]], price_band_pct: float = PRICE_BAND_PCT,
+                  lead_gap_days: float = LEAD_GAP_DAYS, rating_gap: float = RATING_GAP) -> Dict[str, Any]:
+    """{'decisive': bool, 'reason': str} for one repricing case."""
+    if not competitors:
+        return {'decisive': True, 'reason': 'no_competitor'}
+    best = min(competitors, key=lambda c: number_or(c.get('price'), 1e9))
+    # null fields count as missing, as in compute_new_price
+    price = number_or(product.get('price'), 0)
+    best_price = number_or(best.get('price'), 0)
+    if best_price >= price * (1 + price_band_pct):
+        return {'decisive': True, 'reason': 'we_are_cheapest'}
+    if best_price >= price * (1 - price_band_pct):
+        return {'decisive': False, 'reason': 'price_tie'}
+
+    lead_gap = number_or(best.get('lead_time_days'), 999) - number_or(product.get('our_lead_time_days'), 1)
+    rating_diff = number_or(product.get('our_rating'), 5.0) - number_or(best.get('rating'), 0)
+    if lead_gap >= lead_gap_days and rating_diff >= 0:
+        return {'decisive': True, 'reason': 'competitor_slower'}
+    if rating_diff >= rating_gap and lead_gap >= 0:
+        return {'decisive': True, 'reason': 'competitor_worse_rated'}
+    return {'decisive': False, 'reason': 'competitor_comparable'}
+
+
+def combine(deterministic: Dict[str, Any], lm_resp: Optional[Dict[str, Any]], product: Dict[str, Any],
+            config: Optional[Dict[str, Any]] = None) -> Dict[str, Any]:
+    """Prefer the model's new_price when it keeps the margin, else the deterministic price.
+
+    A new_price that is not a positive number (e.g. "149,99 zł") is ignored and noted in 'model_error'.
+    """
+    suggested_price = None
+    if lm_resp and lm_resp.get('ok') and isinstance(lm_resp.get('response'), dict):
+        suggested_price = lm_resp['response'].get('new_price')
+
+    final = {
+        'deterministic': deterministic,
+        'lm': lm_resp,
+        'final_price': None,
+        'final_reason': None,
+        'margin_ok': None
+    }
+
+    candidate = deterministic['new_price']
+    if suggested_price is not None:
+        try:
+            candidate = float(suggested_price)
+            if not math.isfinite(candidate) or candidate <= 0:
+                raise ValueError(suggested_price)
+        except (TypeError, ValueError):
+            logger.warning('Repricing model returned an unusable new_price %r', suggested_price)
+            final['model_error'] = f'unusable new_price {suggested_price!r}'
+            candidate = deterministic['new_price']
+
+    enforcement = enforce_margin_or_adjust(candidate, product, config=config)
+    final['final_price'] = enforcement['safe_price']
+    final['margin_ok'] = enforcement['ok']
+    final['final_reason'] = f"chosen_candidate={candidate}; margin={enforcement['margin']}"
+
+    # if margin not ok and deterministic differs, fallback to deterministic safe price
+    if not enforcement['ok'] and deterministic.get('new_price') is not None:
+        fallback_enf = enforce_margin_or_adjust(deterministic['new_price'], product, config=config)
+        final['final_price'] = fallback_enf['safe_price']
+        final['final_reason'] += f"; fallback_to_deterministic={fallback_enf['safe_price']}"
+    return final
+
+
+class GateMetrics:
+    """Gate rate and latency saved (decisive cases x observed model latency)."""
+
+    def __init__(self, window: int = 500):
+        self._lock = threading.Lock()
+        self._counts = {'cases': 0, 'decisive': 0, 'ambiguous': 0, 'model_used': 0, 'timeouts': 0, 'model_errors': 0}
+        self._reasons: Dict[str, int] = {}
+        self._model_latency = deque(maxlen=window)
+        self._decisive_latency = deque(maxlen=window)
+        self._decisive_total_s = 0.0
+
+    def _avg_model_latency(self) -> Optional[float]:
+        return sum(self._model_latency) / len(self._model_latency) if self._model_latency else None
+
+    def record(self, reason: str, decisive: bool, latency_s: float, outcome: str = None):
+        """outcome (ambiguous cases): 'model' | 'timeout' | 'model_error'."""
+        with self._lock:
+            self._counts['cases'] += 1
+            self._counts['decisive' if decisive else 'ambiguous'] += 1
+            self._reasons[reason] = self._reasons.get(reason, 0) + 1
+            if decisive:
+                self._decisive_latency.append(latency_s)
+                self._decisive_total_s += latency_s
+                return
+            if outcome == 'model':
+                self._counts['model_used'] += 1
+            elif outcome == 'timeout':
+                self._counts['timeouts'] += 1
+            else:
+                self._counts['model_errors'] += 1
+            self._model_latency.append(latency_s)
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            cases = self._counts['cases']
+            avg_model = self._avg_model_latency()
+            avg_decisive = sum(self._decisive_latency) / len(self._decisive_latency) if self._decisive_latency else None
+            # every decisive case would otherwise have waited about as long as an ambiguous one
+            saved = max(0.0, self._counts['decisive'] * avg_model - self._decisive_total_s) if avg_model is not None else 0.0
+            return dict(
+                self._counts,
+                gate_rate=round(self._counts['decisive'] / cases, 4) if cases else None,
+                reasons=dict(self._reasons),
+                avg_ambiguous_ms=round(avg_model * 1000, 1) if avg_model is not None else None,
+                avg_decisive_ms=round(avg_decisive * 1000, 3) if avg_decisive is not None else None,
+                latency_saved_s=round(saved, 3),
+            )
+
+
+_metrics = GateMetrics()
+
+
+def get_gate_metrics() -> GateMetrics:
+    return _metrics
+
+
+def gate_deadline_s() -> float:
+    """REPRICING_GATE_DEADLINE_S, default: the AI layer's repricing deadline."""
+    env = os.environ.get('REPRICING_GATE_DEADLINE_S')
+    if env:
+        try:
+            return float(env)
+        except ValueError:
+            logger.warning('Invalid REPRICING_GATE_DEADLINE_S=%s', env)
+    return deadline_for('repricing')
+
+
+async def hybrid_reprice(product: Dict[str, Any], competitors: List[Dict[str, Any]], config: Optional[Dict[str, Any]],
+                         model_call: Callable[[], Awaitable[Dict[str, Any]]], deadline_s: float = None,
+                         metrics: GateMetrics = None) -> Dict[str, Any]:
+    """Gate, then deterministic-only or model + deterministic under a deadline.
+
+    model_call: coroutine factory returning the AI layer's {'ok', 'response'} dict.
+    Adds 'gate': {decisive, reason, source, elapsed_ms} to the combined result.
+    """
+    metrics = metrics or _metrics
+    started = time.perf_counter()
+    gate = classify_case(product, competitors)
+
+    if gate['decisive']:
+        deterministic = compute_new_price(product, competitors, config=config)
+        final = combine(deterministic, None, product, config)
+        elapsed = time.perf_counter() - started
+        metrics.record(gate['reason'], True, elapsed)
+        final['gate'] = dict(gate, source='deterministic', elapsed_ms=round(elapsed * 1000, 3))
+        return final
+
+    deadline_s = gate_deadline_s() if deadline_s is None else deadline_s
+    model_task = asyncio.ensure_future(model_call())
+    deterministic = await asyncio.to_thread(compute_new_price, product, competitors, config)
+    try:
+        lm_resp = await asyncio.wait_for(model_task, timeout=max(0.0, deadline_s - (time.perf_counter() - started)))
+        outcome = 'model' if lm_resp.get('ok') else 'model_error'
+    except asyncio.TimeoutError:
+        lm_resp = {'ok': False, 'error': f'repricing model exceeded {deadline_s}s deadline', 'timeout': True}
+        outcome = 'timeout'
+    except Exception as e:
+        lm_resp = {'ok': False, 'error': str(e)}
+        outcome = 'model_error'
+
+    final = combine(deterministic, lm_resp, product, config)
+    if final.get('model_error'):
+        outcome = 'model_error'
+    elapsed = time.perf_counter() - started
+    metrics.record(gate['reason'], False, elapsed, outcome)
+    source = 'model' if outcome == 'model' else f'deterministic_{outcome}'
+    final['gate'] = dict(gate, source=source, elapsed_ms=round(elapsed * 1000, 3))
+    return final
@@ -0,0 +1,215 @@
+"""Concurrent competitor price fetching.
+
+One pooled requests.Session shared by a thread pool, a concurrency cap per host, per-source
+timeouts, retries with full jitter, conditional requests (ETag / If-Modified-Since) and a short
+TTL cache, so products sharing a source do not refetch it. Concurrent fetches of the same URL
+share one request (modules.ai.singleflight).
+"""
+import os
+import time
+import random
+import asyncio
+import logging
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from urllib.parse import urlparse
+from typing import Dict, Any, List, Optional, Callable
+
+from modules.ai.singleflight import SingleFlight
+
+try:
+    import requests
+    from requests.adapters import HTTPAdapter
+except Exception:
+    requests = None
+    HTTPAdapter = None
+
+logger = logging.getLogger(__name__)
+
+
+def normalize_offer(item: Dict[str, Any], source: Dict[str, Any] = None) -> Dict[str, Any]:
+    source = source or {}
+    return {
+        'seller': item.get('seller') or source.get('seller', 'unknown'),
+        'price': float(item.get('price', 999999)),
+        'lead_time_days': float(item.get('lead_time_days', source.get('lead_time_days', 5))),
+        'rating': float(item.get('rating', source.get('rating', 4.5))),
+    }
+
+
+def parse_json_offers(body: Any, source: Dict[str, Any]) -> List[Dict[str, Any]]:
+    """[offer, ...] | {offers: [...]} | single offer object."""
+    if isinstance(body, dict):
+        body = body.get('offers', [body])
+    return [normalize_offer(it, source) for it in body or [] if isinstance(it, dict) and 'price' in it]
+
+
+# source['parser'] -> fn(decoded JSON body, source) -> offers
+PARSERS: Dict[str, Callable[[Any, Dict[str, Any]], List[Dict[str, Any]]]] = {'json': parse_json_offers}
+
+
+def register_parser(name: str, fn: Callable[[Any, Dict[str, Any]], List[Dict[str, Any]]]):
+    PARSERS[name] = fn
+
+
+class _RetryableStatus(Exception):
+    def __init__(self, status: int, retry_after: float = None):
+        super().__init__(f'HTTP {status}')
+        self.status = status
+        self.retry_after = retry_after
+
+
+class CompetitorPriceFetcher:
+    def __init__(self, max_workers: int = 16, per_host: int = 4, timeout_s: float = 5.0, retries: int = 2,
+                 backoff_s: float = 0.2, ttl_s: float = 60.0):
+        if requests is None:
+            raise RuntimeError('requests not installed')
+        self.per_host = per_host
+        self.timeout_s = timeout_s
+        self.retries = retries
+        self.backoff_s = backoff_s
+        self.ttl_s = ttl_s
+        self.session = requests.Session()
+        adapter = HTTPAdapter(pool_connections=max(4, max_workers // 2), pool_maxsize=max_workers)
+        self.session.mount('http://', adapter)
+        self.session.mount('https://', adapter)
+        self._pool = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix='price-fetch')
+        self._flight = SingleFlight()
+        self._lock = threading.Lock()
+        self._hosts: Dict[str, threading.BoundedSemaphore] = {}
+        # url -> {offers, etag, last_modified, fetched_at}
+        self._cache: Dict[str, Dict[str, Any]] = {}
+        self._stats = {'requests': 0, 'cache_hits': 0, 'not_modified': 0, 'retries': 0, 'errors': 0, 'coalesced': 0}
+
+    def _count(self, field: str, n: int = 1):
+        with self._lock:
+            self._stats[field] += n
+
+    def _host_slot(self, url: str) -> threading.BoundedSemaphore:
+        host = urlparse(url).netloc
+        with self._lock:
+            sem = self._hosts.get(host)
+            if sem is None:
+                sem = self._hosts[host] = threading.BoundedSemaphore(self.per_host)
+            return sem
+
+    def fetch(self, source: Dict[str, Any]) -> Dict[str, Any]:
+        """Offers for one source: {ok, offers, cached, error}. Never raises."""
+        url = source['url']
+        entry = self._cache.get(url)
+        if entry and time.monotonic() - entry['fetched_at'] < float(source.get('ttl_s', self.ttl_s)):
+            self._count('cache_hits')
+            return self._offers(entry['body'], source, cached=True)
+
+        result, shared = self._flight.do(url, lambda: self._fetch_url(url, source))
+        if shared:
+            self._count('coalesced')
+        if not result.get('ok'):
+            return result
+        return self._offers(result['body'], source, cached=result.get('cached', False))
+
+    def _parse(self, body: Any, source: Dict[str, Any]) -> List[Dict[str, Any]]:
+        parser = PARSERS.get(source.get('parser') or 'json', parse_json_offers)
+        return parser(body, source)
+
+    def _offers(self, body: Any, source: Dict[str, Any], cached: bool) -> Dict[str, Any]:
+        try:
+            offers = self._parse(body, source)
+        except Exception as e:
+            # a body the parser does not understand fails this source only, not the whole batch
+            self._count('errors')
+            logger.warning('Competitor source %s: cannot parse response: %s', source['url'], e)
+            return {'ok': False, 'error': f'unparseable response from {source["url"]}: {e}'}
+        return {'ok': True, 'offers': offers, 'cached': cached}
+
+    def _fetch_url(self, url: str, source: Dict[str, Any]) -> Dict[str, Any]:
+        entry = self._cache.get(url)
+        headers = dict(source.get('headers') or {})
+        if entry:
+            # stale entry: revalidate instead of downloading again
+            if entry.get('etag'):
+                headers['If-None-Match'] = entry['etag']
+            if entry.get('last_modified'):
+                headers['If-Modified-Since'] = entry['last_modified']
+        timeout = float(source.get('timeout_s', self.timeout_s))
+
+        last_error = None
+        for attempt in range(self.retries + 1):
+            if attempt:
+                self._count('retries')
+                delay = random.uniform(0, self.backoff_s * (2 ** attempt))
+                if isinstance(last_error, _RetryableStatus) and last_error.retry_after:
+                    delay = max(delay, min(last_error.retry_after, timeout))
+                time.sleep(delay)
+            try:
+                with self._host_slot(url):
+                    self._count('requests')
+                    resp = self.session.get(url, headers=headers, timeout=timeout)
+                if resp.status_code == 304 and entry:
+                    self._count('not_modified')
+                    entry['fetched_at'] = time.monotonic()
+                    return {'ok': True, 'body': entry['body'], 'cached': True}
+                if resp.status_code == 429 or resp.status_code >= 500:
+                    retry_after = resp.headers.get('Retry-After')
+                    raise _RetryableStatus(resp.status_code, float(retry_after) if retry_after and retry_after.isdigit() else None)
+                if resp.status_code != 200:
+                    self._count('errors')
+                    return {'ok': False, 'error': f'HTTP {resp.status_code} from {url}'}
+                try:
+                    body = resp.json()
+                except ValueError as e:
+                    self._count('errors')
+                    return {'ok': False, 'error': f'invalid JSON from {url}: {e}'}
+                self._cache[url] = {'body': body, 'etag': resp.headers.get('ETag'),
+                                    'last_modified': resp.headers.get('Last-Modified'), 'fetched_at': time.monotonic()}
+                return {'ok': True, 'body': body}
+            except (_RetryableStatus, requests.ConnectionError, requests.Timeout) as e:
+                last_error = e
+            except requests.RequestException as e:
+                # invalid URL, too many redirects, ...: retrying would fail the same way
+                self._count('errors')
+                return {'ok': False, 'error': f'request to {url} failed: {e}'}
+        self._count('errors')
+        logger.warning('Competitor source %s failed after %d attempts: %s', url, self.retries + 1, last_error)
+        return {'ok': False, 'error': str(last_error)}
+
+    def fetch_many(self, sources: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
+        """Fetch all sources concurrently; results in source order."""
+        return list(self._pool.map(self.fetch, sources))
+
+    async def afetch_many(self, sources: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
+        futures = [asyncio.wrap_future(self._pool.submit(self.fetch, s)) for s in sources]
+        return list(await asyncio.gather(*futures))
+
+    def clear_cache(self):
+        with self._lock:
+            self._cache.clear()
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            return dict(self._stats, cached_urls=len(self._cache), hosts=len(self._hosts))
+
+
+_fetcher: Optional[CompetitorPriceFetcher] = None
+_fetcher_lock = threading.Lock()
+
+
+def get_price_fetcher() -> Optional[CompetitorPriceFetcher]:
+    """Process-wide fetcher configured from COMPETITOR_FETCH_* env vars; None without requests."""
+    global _fetcher
+    if _fetcher is None and requests is not None:
+        with _fetcher_lock:
+            if _fetcher is None:
+                _fetcher = CompetitorPriceFetcher(
+                    max_workers=int(os.environ.get('COMPETITOR_FETCH_WORKERS', '16')),
+                    per_host=int(os.environ.get('COMPETITOR_FETCH_PER_HOST', '4')),
+                    timeout_s=float(os.environ.get('COMPETITOR_FETCH_TIMEOUT_S', '5')),
+                    retries=int(os.environ.get('COMPETITOR_FETCH_RETRIES', '2')),
+                    ttl_s=float(os.environ.get('COMPETITOR_FETCH_TTL_S', '60')),
+                )
+    return _fetcher
+
+
+def set_price_fetcher(fetcher: Optional[CompetitorPriceFetcher]):
+    global _fetcher
+    _fetcher = fetcher
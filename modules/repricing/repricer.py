@@ -1,27 +1,34 @@
 from typing import List, Dict, Any, Optional
 from datetime import datetime
 import os
+import logging
 from modules.ai.ai_handler import call_gemini
-from prompts import AGENT_PERSONA, REPRICING_PROMPT_BRIEF, REPRICING_PROMPT_TEMPLATE
+from prompts import REPRICING_PROMPT, REPRICING_PROMPT_BRIEF
+from modules.ai.prompt_builder import compact_payload, TASK_FIELDS
+from modules.ai.context_cache import register_context
+from modules.finance.calculator import CostModel
 
-try:
-    from modules.finance.calculator import calculate_margin
-except Exception:
-    # calculator may not be present yet; guard usage
-    def calculate_margin(sale_price, product_costs, marketplace_fees):
-        # fallback simple margin: (sale_price - cost) / sale_price
-        cost = product_costs.get('cost', 0)
-        return (sale_price - cost) / sale_price if sale_price > 0 else 0
+# persona + repricing rules are static: registered once as cached context, requests carry only the brief
+REPRICING_CONTEXT = 'repricing'
+register_context(REPRICING_CONTEXT, REPRICING_PROMPT)
+
+logger = logging.getLogger(__name__)
 
 # Core repricing logic following "Drapieżny Repricing" rules
 
+def number_or(value: Any, default: float) -> float:
+    """float(value), with None (a field sent as null) counting as missing."""
+    return float(default if value is None else value)
+
+
 def compute_new_price(product: Dict[str, Any], competitors: List[Dict[str, Any]],
-                      config: Optional[Dict[str, Any]] = None) -> Dict[str, Any]:
+                      config: Optional[Dict[str, Any]] = None, now: Optional[datetime] = None) -> Dict[str, Any]:
     """Calculate recommended new price for a product.
 
-    product: { id, sku, price, cost, our_lead_time_days, our_rating }
+    product: { id, sku, price, cost, our_lead_time_days, our_rating } (cost optional with COST_TABLE_PATH)
     competitors: [{seller, price, lead_time_days, rating}]
     config: { min_margin_pct, max_discount_pct, epsilon, allow_night_tests }
+    now: clock used for the night-test window (default: current local time)
 
     Returns: { new_price, reason, actions }
     """
@@ -34,17 +41,17 @@ def compute_new_price(product: Dict[str, Any], competitors: List[Dict[str, Any]]
     if config:
         cfg.update(config)
 
-    price = float(product.get('price', 0))
-    cost = float(product.get('cost', 0))
-    our_lead = float(product.get('our_lead_time_days', 1))
-    our_rating = float(product.get('our_rating', 5.0))
+    price = number_or(product.get('price'), 0)
+    # cost from the product, or the cost table by SKU when the product does not carry it
+    cost = CostModel.from_product(product).cost
+    our_lead = number_or(product.get('our_lead_time_days'), 1)
+    our_rating = number_or(product.get('our_rating'), 5.0)
 
     # baseline = minimum acceptable price to keep min margin
     baseline = round(cost * (1 + cfg['min_margin_pct']), 2)
 
-    # find best competitor (lowest price)
-    competitors_sorted = sorted(competitors, key=lambda c: float(c.get('price', 1e9)))
-    best = competitors_sorted[0] if competitors_sorted else None
+    # find best competitor (lowest price; first one on ties)
+    best = min(competitors, key=lambda c: number_or(c.get('price'), 1e9)) if competitors else None
 
     # default response
     new_price = price
@@ -52,9 +59,9 @@ def compute_new_price(product: Dict[str, Any], competitors: List[Dict[str, Any]]
     actions = []
 
     if best:
-        best_price = float(best.get('price', 0))
-        best_lead = float(best.get('lead_time_days', 999))
-        best_rating = float(best.get('rating', 0))
+        best_price = number_or(best.get('price'), 0)
+        best_lead = number_or(best.get('lead_time_days'), 999)
+        best_rating = number_or(best.get('rating'), 0)
 
         # If competitor cheaper but slower or lower rating -> keep price (or small premium)
         if best_price < price:
@@ -68,7 +75,7 @@ def compute_new_price(product: Dict[str, Any], competitors: List[Dict[str, Any]]
                 # target to undercut competitor by epsilon if margin allows
                 target = round(min(price, max(allowable_floor, best_price - cfg['epsilon'])), 2)
                 # night test: allow exploratory micro-jumps during quiet hours
-                hour = datetime.now().hour
+                hour = (now or datetime.now()).hour
                 if cfg['allow_night_tests'] and 0 <= hour <= 5:
                     new_price = target
                     reason = 'Nocny test: mikro-obniżka cenowa (micro-jump) by sprawdzić elastyczność'
@@ -113,17 +120,38 @@ def compute_new_price(product: Dict[str, Any], competitors: List[Dict[str, Any]]
     }
 
 
+def reprice_from_index(product: Dict[str, Any], index=None, config: Optional[Dict[str, Any]] = None,
+                       now: Optional[datetime] = None) -> Dict[str, Any]:
+    """compute_new_price against the best offer kept in the competitor index (no list passed or sorted)."""
+    if index is None:
+        from modules.repricing.competitor_index import get_competitor_index
+        index = get_competitor_index()
+    best = index.best(str(product.get('id')))
+    return compute_new_price(product, [best] if best else [], config=config, now=now)
+
+
+def build_repricing_brief(product: Dict[str, Any], competitors: List[Dict[str, Any]], config: Optional[Dict[str, Any]] = None) -> str:
+    """Per-request part of the repricing prompt with inputs as compact JSON (only the fields the rules use).
+
+    The static part is REPRICING_CONTEXT; send with context=REPRICING_CONTEXT.
+    """
+    fields = TASK_FIELDS['repricing']
+    return REPRICING_PROMPT_BRIEF.format(
+        product=compact_payload('repricing', product, fields=fields['product']),
+        competitors=compact_payload('repricing', competitors, fields=fields['competitors']),
+        config=compact_payload('repricing', config or {}, fields=True),
+    )
+
+
 def run_repricing_ai(product: Dict[str, Any], competitors: List[Dict[str, Any]], config: Optional[Dict[str, Any]] = None) -> Dict[str, Any]:
     """Call Gemini (via ai_handler) with the repricing prompt and return parsed response.
 
     Returns dict like {'ok': True, 'response': {...}} or {'ok': False, 'error': '...'}
     """
     try:
-        persona = AGENT_PERSONA
-        brief = REPRICING_PROMPT_BRIEF.format(persona=persona, product=str(product), competitors=str(competitors), config=str(config or {}))
-        prompt = REPRICING_PROMPT_TEMPLATE.format(persona=persona) + "\n\n" + brief
+        brief = build_repricing_brief(product, competitors, config)
         model = os.environ.get('LM_MODEL', 'models/gemini-3-pro-preview')
-        resp = call_gemini(prompt, model=model, response_mime_type='application/json')
+        resp = call_gemini(brief, model=model, response_mime_type='application/json', task='repricing', context=REPRICING_CONTEXT)
         return resp
     except Exception as e:
         return {'ok': False, 'error': str(e)}
@@ -138,36 +166,57 @@ def enforce_margin_or_adjust(candidate_price: float, product: Dict[str, Any], co
     if config:
         cfg.update(config)
 
-    # build product_costs and marketplace_fees simple structures
-    product_costs = {
-        'cost': float(product.get('cost', 0)),
-        'packaging': float(product.get('packaging_cost', 0)),
-        'shipping': float(product.get('shipping_cost', 0)),
-        'ads': float(product.get('ads_cost', 0))
-    }
-    marketplace_fees = {
-        'fee_pct': float(product.get('marketplace_fee_pct', 0.15))
-    }
-
-    margin = calculate_margin(candidate_price, product_costs, marketplace_fees)
+    costs = CostModel.from_product(product)
+    margin = costs.margin(candidate_price)
     ok = margin >= cfg['min_allowed_margin_pct']
     safe_price = candidate_price
     # If not ok, raise to baseline (cost + min margin)
     if not ok:
-        baseline = round(product_costs['cost'] * (1 + cfg['min_allowed_margin_pct']), 2)
+        baseline = round(costs.cost * (1 + cfg['min_allowed_margin_pct']), 2)
         safe_price = max(baseline, safe_price)
     return {'safe_price': round(safe_price, 2), 'ok': ok, 'margin': margin}
 
 
-# Placeholder for fetching competitor prices from external sources (APIs, scraping)
-# Implement integration per marketplace / partner APIs.
+# Fetching competitor prices from external sources (APIs, scraping).
+# Sources with a 'url' go through the pooled concurrent fetcher (modules/repricing/price_fetcher.py).
+
+def _split_sources(sources: List[Dict[str, Any]]):
+    from modules.repricing.price_fetcher import get_price_fetcher
+    fetcher = get_price_fetcher()
+    if fetcher is None:
+        return None, [], sources
+    return fetcher, [s for s in sources if s.get('url')], [s for s in sources if not s.get('url')]
+
+
+def _offers_from(results: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
+    offers = []
+    for r in results:
+        if r.get('ok'):
+            offers.extend(r['offers'])
+        else:
+            logger.warning('Competitor source skipped: %s', r.get('error'))
+    return offers
+
 
 def fetch_competitor_prices(sources: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
     """Given a list of sources, return competitor price entries.
 
-    sources: [{type: 'api'|'scrape', 'url':..., 'parser': optional}]
-    This is a stub — integrate with real endpoints or use ebay_auth / google_drive_manager if needed.
+    sources: [{type: 'api'|'scrape', 'url':..., 'parser': optional, 'timeout_s': optional}]
+    URL sources are fetched concurrently (failed ones are skipped); the rest use ebay_auth or the inline stub.
     """
+    fetcher, remote, local = _split_sources(sources)
+    results = _offers_from(fetcher.fetch_many(remote)) if remote else []
+    return results + _fetch_local_sources(local)
+
+
+async def afetch_competitor_prices(sources: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
+    """Async fetch_competitor_prices for FastAPI handlers (does not block the event loop)."""
+    fetcher, remote, local = _split_sources(sources)
+    results = _offers_from(await fetcher.afetch_many(remote)) if remote else []
+    return results + _fetch_local_sources(local)
+
+
+def _fetch_local_sources(sources: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
     results = []
     # try to use ebay_auth if available
     try:
@@ -0,0 +1,249 @@
+"""Event-driven incremental repricing.
+
+Products whose inputs changed go into a dirty set: best competitor offer moved (competitor index
+subscription), our cost changed, stock crossed REPRICING_STOCK_THRESHOLD, or the night-test
+window opened. A background loop reprices only dirty products, oldest first, in coalesced batches
+through the bulk engine. A product repriced less than min_interval_s ago stays dirty (deferred)
+so one that keeps changing cannot take every batch. A result computed from a price that
+upsert_product replaced during the batch is dropped and the product is marked dirty again.
+"""
+import os
+import time
+import logging
+import threading
+from datetime import datetime
+from typing import Dict, Any, List, Optional, Callable
+
+from modules.repricing.bulk import reprice_bulk
+from modules.repricing.repricer import number_or
+from modules.repricing.competitor_index import CompetitorIndex, get_competitor_index
+
+logger = logging.getLogger(__name__)
+
+
+def _in_night_window(now: datetime) -> bool:
+    return 0 <= now.hour <= 5
+
+
+class RepricingScheduler:
+    def __init__(self, index: CompetitorIndex = None, batch_size: int = 200, min_interval_s: float = 60.0,
+                 tick_s: float = 1.0, stock_threshold: int = 5, config: Dict[str, Any] = None,
+                 on_result: Callable[[str, Dict[str, Any], Dict[str, Any]], None] = None,
+                 clock: Callable[[], datetime] = None):
+        self.index = index or get_competitor_index()
+        self.batch_size = batch_size
+        self.min_interval_s = min_interval_s
+        self.tick_s = tick_s
+        self.stock_threshold = stock_threshold
+        self.config = config
+        # on_result(product_id, product, result) runs after each repricing (e.g. queue the price push)
+        self.on_result = on_result
+        self.clock = clock or datetime.now
+        self._lock = threading.Lock()
+        self._products: Dict[str, Dict[str, Any]] = {}
+        # product_id -> {'reasons': set, 'since': monotonic}
+        self._dirty: Dict[str, Dict[str, Any]] = {}
+        self._last: Dict[str, Dict[str, Any]] = {}
+        self._was_night = _in_night_window(self.clock())
+        self._stats = {'marked': 0, 'batches': 0, 'repriced': 0, 'deferred': 0, 'price_changes': 0, 'superseded': 0,
+                       'errors': 0}
+        self._reasons: Dict[str, int] = {}
+        self._thread: Optional[threading.Thread] = None
+        self._stop = threading.Event()
+        self.index.subscribe(lambda pid: self.mark_dirty(pid, 'competitor'))
+
+    # --- inputs -------------------------------------------------------------------------
+
+    def mark_dirty(self, product_id: str, reason: str):
+        pid = str(product_id)
+        with self._lock:
+            if pid not in self._products:
+                return  # competitor offers for products we do not sell
+            entry = self._dirty.get(pid)
+            if entry is None:
+                self._dirty[pid] = {'reasons': {reason}, 'since': time.monotonic()}
+            else:
+                entry['reasons'].add(reason)
+            self._stats['marked'] += 1
+            self._reasons[reason] = self._reasons.get(reason, 0) + 1
+
+    def upsert_product(self, product: Dict[str, Any]):
+        """Add or update one of our products; marks it dirty when cost changed or stock crossed the threshold."""
+        pid = str(product['id'])
+        with self._lock:
+            old = self._products.get(pid)
+            merged = dict(old or {}, **product)
+            self._products[pid] = merged
+        if old is None:
+            self.mark_dirty(pid, 'new')
+            return
+        # null cost / stock count as missing
+        if number_or(old.get('cost'), 0) != number_or(merged.get('cost'), 0):
+            self.mark_dirty(pid, 'cost')
+        if old.get('stock') is not None and merged.get('stock') is not None:
+            low_before = float(old['stock']) <= self.stock_threshold
+            low_now = float(merged['stock']) <= self.stock_threshold
+            if low_before != low_now:
+                self.mark_dirty(pid, 'stock')
+
+    def remove_product(self, product_id: str):
+        with self._lock:
+            self._products.pop(str(product_id), None)
+            self._dirty.pop(str(product_id), None)
+            self._last.pop(str(product_id), None)
+
+    def _check_night_window(self):
+        night = _in_night_window(self.clock())
+        opened = night and not self._was_night
+        self._was_night = night
+        if opened and (self.config or {}).get('allow_night_tests', True):
+            for pid in list(self._products):
+                self.mark_dirty(pid, 'night_window')
+
+    # --- processing ---------------------------------------------------------------------
+
+    def _take_batch(self) -> List[tuple]:
+        now = time.monotonic()
+        with self._lock:
+            eligible = []
+            deferred = 0
+            for pid, entry in self._dirty.items():
+                last = self._last.get(pid)
+                if last and now - last['at'] < self.min_interval_s:
+                    deferred += 1
+                    continue
+                eligible.append((entry['since'], pid))
+            eligible.sort()
+            batch = []
+            for _, pid in eligible[:self.batch_size]:
+                batch.append((pid, self._dirty.pop(pid)['reasons'], dict(self._products[pid])))
+            self._stats['deferred'] = deferred
+            return batch
+
+    def run_once(self) -> int:
+        """Reprice one batch of eligible dirty products; returns how many were repriced."""
+        self._check_night_window()
+        batch = self._take_batch()
+        if not batch:
+            return 0
+
+        items = []
+        for pid, _, product in batch:
+            best = self.index.best(pid)
+            items.append({'product': product, 'competitors': [best] if best else []})
+        try:
+            results = reprice_bulk(items, config=self.config, now=self.clock())
+        except Exception:
+            logger.exception('Repricing batch failed; re-queueing %d products', len(batch))
+            with self._lock:
+                self._stats['errors'] += 1
+                for pid, reasons, _ in batch:
+                    self._dirty.setdefault(pid, {'reasons': set(), 'since': time.monotonic()})['reasons'].update(reasons)
+            return 0
+
+        now = time.monotonic()
+        changed = 0
+        superseded = []
+        for (pid, reasons, product), result in zip(batch, results):
+            with self._lock:
+                current = self._products.get(pid)
+                if current is None or current.get('price') != product.get('price'):
+                    # removed, or given a new price by upsert_product while this batch ran: the result is
+                    # stale and must not overwrite the newer price
+                    superseded.append(pid)
+                    continue
+                moved = result['new_price'] != number_or(product.get('price'), 0)
+                changed += moved
+                self._last[pid] = {'at': now, 'reasons': sorted(reasons), 'result': result}
+                if moved:
+                    # the recommendation becomes our current price for the next evaluation
+                    current['price'] = result['new_price']
+            if self.on_result:
+                try:
+                    self.on_result(pid, product, result)
+                except Exception:
+                    logger.exception('Repricing result hook failed for %s', pid)
+        for pid in superseded:
+            self.mark_dirty(pid, 'price')
+        with self._lock:
+            self._stats['batches'] += 1
+            self._stats['repriced'] += len(batch) - len(superseded)
+            self._stats['price_changes'] += changed
+            self._stats['superseded'] += len(superseded)
+        return len(batch)
+
+    def _loop(self):
+        while not self._stop.is_set():
+            try:
+                done = self.run_once()
+            except Exception:
+                logger.exception('Repricing scheduler tick failed')
+                done = 0
+            # full batch: more work is probably waiting, go again without sleeping
+            if done < self.batch_size:
+                self._stop.wait(self.tick_s)
+
+    def start(self):
+        if self._thread and self._thread.is_alive():
+            return
+        self._stop.clear()
+        self._thread = threading.Thread(target=self._loop, name='repricing-scheduler', daemon=True)
+        self._thread.start()
+
+    def stop(self, timeout: float = 5.0):
+        self._stop.set()
+        if self._thread:
+            self._thread.join(timeout)
+
+    # --- observability ------------------------------------------------------------------
+
+    def product_status(self, product_id: str) -> Dict[str, Any]:
+        pid = str(product_id)
+        now = time.monotonic()
+        with self._lock:
+            last = self._last.get(pid)
+            dirty = self._dirty.get(pid)
+            return {
+                'known': pid in self._products,
+                'dirty': sorted(dirty['reasons']) if dirty else [],
+                'dirty_for_s': round(now - dirty['since'], 3) if dirty else None,
+                'last_repriced_ago_s': round(now - last['at'], 3) if last else None,
+                'last_reasons': last['reasons'] if last else None,
+                'last_result': last['result'] if last else None,
+            }
+
+    def stats(self) -> Dict[str, Any]:
+        now = time.monotonic()
+        with self._lock:
+            ages = sorted(now - self._last[pid]['at'] for pid in self._products if pid in self._last)
+            oldest_dirty = min((e['since'] for e in self._dirty.values()), default=None)
+            return dict(
+                self._stats,
+                running=bool(self._thread and self._thread.is_alive()),
+                products=len(self._products),
+                queue_depth=len(self._dirty),
+                oldest_dirty_s=round(now - oldest_dirty, 3) if oldest_dirty is not None else None,
+                never_repriced=len(self._products) - len(ages),
+                since_repriced_p50_s=round(ages[len(ages) // 2], 3) if ages else None,
+                since_repriced_max_s=round(ages[-1], 3) if ages else None,
+                reasons=dict(self._reasons),
+            )
+
+
+_scheduler: Optional[RepricingScheduler] = None
+_scheduler_lock = threading.Lock()
+
+
+def get_repricing_scheduler() -> RepricingScheduler:
+    """Process-wide scheduler configured from REPRICING_* env vars (not started until start())."""
+    global _scheduler
+    if _scheduler is None:
+        with _scheduler_lock:
+            if _scheduler is None:
+                _scheduler = RepricingScheduler(
+                    batch_size=int(os.environ.get('REPRICING_BATCH_SIZE', '200')),
+                    min_interval_s=float(os.environ.get('REPRICING_MIN_INTERVAL_S', '60')),
+                    tick_s=float(os.environ.get('REPRICING_TICK_S', '1')),
+                    stock_threshold=int(os.environ.get('REPRICING_STOCK_THRESHOLD', '5')),
+                )
+    return _scheduler
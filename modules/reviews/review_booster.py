@@ -3,20 +3,17 @@ import logging
 from datetime import datetime
 
 from modules.ai.base import BaseAIHandler
+from modules.ai.prompt_builder import build_prompt
 
 logger = logging.getLogger(__name__)
 
 
 def request_positive_review(order_id: str, order_context: Dict[str, Any]) -> Dict[str, Any]:
     """Generate a personalized review request if transaction was smooth."""
-    handler = BaseAIHandler(response_mime_type='application/json')
-    prompt = {
-        'task': 'Generate a short, friendly, non-pushy review request tailored to the customer and transaction tone.',
-        'order_id': order_id,
-        'order': order_context,
-        'instructions': 'Return JSON: { message: string, send: bool }'
-    }
-    resp = handler.generate(str(prompt))
+    handler = BaseAIHandler(response_mime_type='application/json', task='reviews')
+    prompt = build_prompt('reviews', 'Generate a short, friendly, non-pushy review request tailored to the customer and transaction tone. Return JSON: { message: string, send: bool }',
+                          {'order_id': order_id, 'order': order_context})
+    resp = handler.generate(prompt)
     if not resp.get('ok'):
         logger.warning('Review booster AI failed: %s', resp.get('error'))
         # fallback generic message
@@ -17,7 +17,7 @@ def clone_and_variate(listing_id: str, base_listing: Dict[str, Any] = None, coun
 
     prompt = f"{AGENT_PERSONA}\nModuł: SEO Cloner\nWeź poniższy opis i wygeneruj {count} unikalnych wersji. Każda wersja ma mieć inny 'kąt' sprzedaży (np. oszczędność, premium, szybkość dostawy), unikalną strukturę zdań i nagłówki. Zwróć odpowiedź w JSON jako lista obiektów z polami: title, html_description, keywords, angle.\n\nBase listing:\n{base_listing}\n"
 
-    resp = call_gemini(prompt, model=model, response_mime_type='application/json')
+    resp = call_gemini(prompt, model=model, response_mime_type='application/json', task='seo')
     if not resp.get('ok'):
         logger.error('SEO cloner failed: %s', resp.get('error'))
         # fallback: naive variations
@@ -34,8 +34,8 @@ def clone_and_variate(listing_id: str, base_listing: Dict[str, Any] = None, coun
     parsed = resp.get('response')
     if isinstance(parsed, list):
         return parsed
-+    # if response wrapped in dict
-+    if isinstance(parsed, dict) and parsed.get('variations'):
-+        return parsed.get('variations')
-+
-+    return []
+    # if response wrapped in dict
+    if isinstance(parsed, dict) and parsed.get('variations'):
+        return parsed.get('variations')
+
+    return []
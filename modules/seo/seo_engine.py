@@ -13,7 +13,7 @@ def optimize_listing(product_data: Dict[str, Any], model: str = 'models/gemini-3
     """
     prompt = f"{AGENT_PERSONA}\nModuł: SEO Autopilot\nWygeneruj zoptymalizowany tytuł oparty na LSI, strukturę opisu HTML zastosowaniem AIDA, oraz listę słów kluczowych dla produktu:\n\n{product_data}\n\nWymagaj formatu JSON: { {'title': 'string', 'html_description': 'string', 'keywords': ['kw1','kw2']} }"
 
-    resp = call_gemini(prompt, model=model, response_mime_type='application/json')
+    resp = call_gemini(prompt, model=model, response_mime_type='application/json', task='seo')
     if not resp.get('ok'):
         logger.error('SEO optimize failed: %s', resp.get('error'))
         # fallback basic generation
@@ -20,9 +20,9 @@ Instrukcje:
   4) Nie obniżaj poniżej (cost * (1 + min_margin_pct)). Jeżeli konieczne, rekomenduj alternatywy (np. bundle, darmowa wysyłka powyżej X) zamiast obniżki.
 
 Wejście (JSON):
-- product: { id, sku, price, cost, our_lead_time_days, our_rating }
-- competitors: [{seller, price, lead_time_days, rating}]
-- config: { min_margin_pct: number (0.2 = 20%), max_discount_pct: number (0.15 = 15%), epsilon: number (0.01 = 1%), allow_night_tests: bool }
+- product: {{ id, sku, price, cost, our_lead_time_days, our_rating }}
+- competitors: [{{seller, price, lead_time_days, rating}}]
+- config: {{ min_margin_pct: number (0.2 = 20%), max_discount_pct: number (0.15 = 15%), epsilon: number (0.01 = 1%), allow_night_tests: bool }}
 
 Zadanie: oblicz i zwróć:
 - new_price (liczba, PLN)
@@ -32,8 +32,8 @@ Zadanie: oblicz i zwróć:
 Odpowiedź w formacie JSON.
 """.strip()
 
-# Krótki prompt używany do wywoływania modelu z danymi
-REPRICING_PROMPT_BRIEF = "{persona}\nDane produktu: {product}\nKonkurenci: {competitors}\nKonfiguracja: {config}\n"
+# Krótki prompt używany do wywoływania modelu z danymi (część zmienna; persona jest już w REPRICING_PROMPT)
+REPRICING_PROMPT_BRIEF = "Dane produktu: {product}\nKonkurenci: {competitors}\nKonfiguracja: {config}\n"
 
 
 # Module prompts collection
@@ -49,8 +49,14 @@ MODULE_PROMPTS = {
   - Każdą proponowaną cenę musisz oznaczyć jako 'proposed_price' i uzasadnić krótkim 'reason'. Zwracaj także listę 'actions' (np. ['counter_offer','accept_if_bundle','offer_coupon']).
   - Ograniczenia: nigdy nie proponuj ceny niższej niż nasza cena minimalna (min_price) bez rekomendacji dodatkowych warunków (np. zakup 2 sztuk, zapis do newslettera).
 
-  Wejście (JSON): { client_offer, product, min_price, customer_history, inventory_count, config }
+  Wejście (JSON): {{ client_offer, product, min_price, customer_history, inventory_count, config }}
 
-  Odpowiedź w JSON: { decision: 'ACCEPT'|'REJECT'|'COUNTER_OFFER', proposed_price: number|null, reason: string, message: string, actions: [] }
+  Odpowiedź w JSON: {{ decision: 'ACCEPT'|'REJECT'|'COUNTER_OFFER', proposed_price: number|null, reason: string, message: string, actions: [] }}
   """
 }
+
+
+# Gotowe (sformatowane raz przy imporcie) statyczne prefiksy. Warstwa AI rejestruje je jako
+# cached context u dostawcy modelu (modules/ai/context_cache.py), więc z każdym zapytaniem idzie tylko część zmienna.
+REPRICING_PROMPT = REPRICING_PROMPT_TEMPLATE.format(persona=AGENT_PERSONA.strip())
+NEGOTIATOR_PROMPT = MODULE_PROMPTS['negocjator'].format(persona='').strip()
@@ -0,0 +1,59 @@
+"""Sync AI call deadlines (modules/ai/base.py)."""
+import threading
+import time
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+
+import pytest
+
+from modules.ai import base
+
+
+class SlowHandler(base.BaseAIHandler):
+    def __init__(self, delay_s):
+        super().__init__(model='test-model', task='default')
+        self.delay_s = delay_s
+        self.release = threading.Event()
+
+    def _call_model(self, prompt, model, response_mime_type, task=None, context=None):
+        self.release.wait(self.delay_s)
+        return {'ok': True, 'response': {'prompt': prompt}}
+
+
+@pytest.fixture
+def two_workers(monkeypatch):
+    pool = ThreadPoolExecutor(max_workers=2)
+    monkeypatch.setattr(base, '_deadline_pool', pool)
+    monkeypatch.setattr(base, '_deadline_slots', threading.BoundedSemaphore(2))
+    yield pool
+    pool.shutdown(wait=True)
+
+
+def test_call_over_deadline_fails(two_workers):
+    out = SlowHandler(0.4).generate(f'slow {uuid.uuid4()}', timeout=0.1)
+    assert not out['ok'] and 'deadline' in out['error']
+
+
+def test_full_pool_fails_fast(two_workers):
+    hung = SlowHandler(10)
+    try:
+        # two hung calls take both workers past their deadline
+        for _ in range(2):
+            out = hung.generate(f'hung {uuid.uuid4()}', timeout=0.1)
+            assert 'deadline' in out['error']
+
+        start = time.monotonic()
+        out = SlowHandler(0).generate(f'later {uuid.uuid4()}', timeout=0.5)
+        assert time.monotonic() - start < 0.1
+        assert out['circuit_open'] and 'busy' in out['error']
+    finally:
+        hung.release.set()
+
+    # the hung calls returned: their workers are free again
+    deadline = time.monotonic() + 2
+    while time.monotonic() < deadline:
+        out = SlowHandler(0).generate(f'after {uuid.uuid4()}', timeout=0.5)
+        if out['ok']:
+            break
+        time.sleep(0.01)
+    assert out['ok']
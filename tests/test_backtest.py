@@ -0,0 +1,81 @@
+"""simulate() against compute_new_price applied step by step on the same history."""
+import random
+from datetime import datetime, timedelta
+
+import pytest
+
+np = pytest.importorskip('numpy')
+
+from modules.finance.calculator import CostModel
+from modules.repricing import backtest
+from modules.repricing.repricer import compute_new_price
+
+START = datetime(2026, 1, 1, 0)
+
+
+def _history(seed=3, n=12, steps=10):
+    rng = random.Random(seed)
+    catalog = {}
+    for i in range(n):
+        cost = round(rng.uniform(10, 100), 2)
+        catalog[f'P{i}'] = {'price': round(cost * rng.uniform(1.0, 1.6), 2), 'cost': cost,
+                            'packaging_cost': rng.choice([0, 1.5]), 'marketplace_fee_pct': rng.choice([None, 0.08]),
+                            'our_lead_time_days': rng.choice([1, 3, None]), 'our_rating': rng.choice([4.5, 5.0, None])}
+    records = []
+    for t in range(steps):
+        ts = (START + timedelta(hours=t)).isoformat()
+        for pid, entry in catalog.items():
+            if rng.random() < 0.3:
+                continue  # not observed: the previous snapshot carries over
+            offers = [] if rng.random() < 0.1 else [
+                {'seller': 's', 'price': round(entry['price'] * rng.uniform(0.8, 1.2), 2),
+                 'lead_time_days': rng.choice([1, 2, 5]), 'rating': rng.choice([4.0, 4.9])}]
+            records.append({'ts': ts, 'product_id': pid, 'offers': offers})
+    return catalog, records
+
+
+def _replay(catalog, records):
+    """Scalar reference: compute_new_price per product and step, last snapshot carried forward."""
+    times = sorted({r['ts'] for r in records})
+    latest = {}
+    price = {pid: entry['price'] for pid, entry in catalog.items()}
+    changes, margins, buy_box = 0, [], 0
+    for ts in times:
+        for r in records:
+            if r['ts'] == ts:
+                latest[r['product_id']] = r['offers']
+        for pid, entry in catalog.items():
+            offers = latest.get(pid, [])
+            product = dict(entry, id=pid, price=price[pid])
+            new_price = compute_new_price(product, offers, now=datetime.fromisoformat(ts))['new_price']
+            changes += new_price != price[pid]
+            price[pid] = new_price
+            margins.append(CostModel.from_product(dict(entry, id=pid)).margin(new_price))
+            buy_box += not offers or new_price <= min(o['price'] for o in offers)
+    return {'price_changes': changes, 'avg_margin_pct': sum(margins) / len(margins),
+            'buy_box_rate': buy_box / (len(times) * len(catalog)), 'final_prices': price}
+
+
+def test_simulate_matches_scalar_rules():
+    catalog, records = _history()
+    data = backtest.build_snapshot_data(records, catalog)
+    result = backtest.simulate(data)
+    expected = _replay(catalog, records)
+
+    assert result['price_changes'] == expected['price_changes']
+    assert result['avg_margin_pct'] == pytest.approx(expected['avg_margin_pct'], abs=1e-6)
+    assert result['buy_box_rate'] == pytest.approx(expected['buy_box_rate'], abs=1e-6)
+    final = expected['final_prices']
+    assert result['final_avg_price'] == pytest.approx(sum(final.values()) / len(final), abs=1e-4)
+
+
+def test_save_adds_npz_suffix(tmp_path):
+    catalog, records = _history(n=3, steps=2)
+    data = backtest.build_snapshot_data(records, catalog)
+    path = data.save(str(tmp_path / 'out'))
+    assert path.endswith('out.npz')
+
+    loaded = backtest.SnapshotData.load(str(tmp_path / 'out'))
+    assert loaded.product_ids == data.product_ids
+    assert np.array_equal(loaded.fee_pct, data.fee_pct)
+    assert backtest.run_backtest(str(tmp_path / 'out'), [{}])[0]['price_changes'] == backtest.simulate(data)['price_changes']
@@ -0,0 +1,104 @@
+"""reprice_bulk / reprice_columns against compute_new_price on the same inputs."""
+import math
+import random
+from datetime import datetime
+
+import pytest
+
+np = pytest.importorskip('numpy')
+
+from modules.repricing import bulk
+from modules.repricing.repricer import compute_new_price
+
+NIGHT = datetime(2026, 1, 1, 3)
+DAY = datetime(2026, 1, 1, 14)
+
+
+def _items(seed, n=500):
+    rng = random.Random(seed)
+    items = []
+    for i in range(n):
+        cost = round(rng.uniform(5, 200), 2)
+        price = round(cost * rng.uniform(0.9, 1.8), 2)
+        product = {'id': str(i), 'price': price, 'cost': cost,
+                   'our_lead_time_days': rng.choice([1, 2, 3]), 'our_rating': round(rng.uniform(4.0, 5.0), 1)}
+        competitors = []
+        for _ in range(rng.choice([0, 1, 1, 2, 3])):
+            kind = rng.random()
+            if kind < 0.2:
+                c_price = price  # tie with our price
+            elif kind < 0.3:
+                c_price = round(price - 0.01, 2)
+            else:
+                c_price = round(price * rng.uniform(0.7, 1.3), 2)
+            competitors.append({'seller': f's{len(competitors)}', 'price': c_price,
+                                'lead_time_days': rng.choice([1, 2, 3, 5]), 'rating': round(rng.uniform(3.5, 5.0), 1)})
+        items.append({'product': product, 'competitors': competitors})
+    return items
+
+
+@pytest.mark.parametrize('now', [NIGHT, DAY], ids=['night', 'day'])
+@pytest.mark.parametrize('seed', [1, 2, 3])
+def test_bulk_matches_scalar(seed, now):
+    items = _items(seed)
+    expected = [compute_new_price(i['product'], i['competitors'], now=now) for i in items]
+    assert bulk.reprice_bulk(items, now=now) == expected
+
+    out = bulk.reprice_columns(bulk.columns_from_items(items), now=now)
+    assert out['new_price'].tolist() == [e['new_price'] for e in expected]
+    assert out['baseline'].tolist() == [e['baseline'] for e in expected]
+    reasons = [bulk.RULES[r][0] + (' | korekta do baseline' if f else '')
+               for r, f in zip(out['rule'].tolist(), out['floored'].tolist())]
+    assert reasons == [e['reason'] for e in expected]
+
+
+@pytest.mark.parametrize('now', [NIGHT, DAY], ids=['night', 'day'])
+def test_ties_and_no_competitor(now):
+    items = [
+        {'product': {'price': 100.0, 'cost': 50.0}, 'competitors': []},
+        {'product': {'price': 100.0, 'cost': 50.0}, 'competitors': [{'price': 100.0, 'lead_time_days': 1, 'rating': 5.0}]},
+        {'product': {'price': 55.0, 'cost': 50.0}, 'competitors': [{'price': 55.0}]},
+        {'product': {'price': 100.0, 'cost': 50.0},
+         'competitors': [{'seller': 'a', 'price': 90.0, 'rating': 5.0}, {'seller': 'b', 'price': 90.0, 'rating': 1.0}]},
+    ]
+    expected = [compute_new_price(i['product'], i['competitors'], now=now) for i in items]
+    assert bulk.reprice_bulk(items, now=now) == expected
+    assert expected[0]['reason'] == bulk.RULES[bulk.NO_COMPETITOR][0]
+
+    out = bulk.reprice_columns({'price': [100.0], 'cost': [50.0], 'best_price': [None]}, now=now)
+    assert out['rule'].tolist() == [bulk.NO_COMPETITOR]
+    assert out['new_price'].tolist() == [100.0]
+
+
+def test_null_fields_take_defaults():
+    items = [{'product': {'price': 100.0, 'cost': 50.0, 'our_lead_time_days': None, 'our_rating': None},
+              'competitors': [{'price': 90.0, 'lead_time_days': None, 'rating': None}]}]
+    expected = [compute_new_price(i['product'], i['competitors'], now=DAY) for i in items]
+    assert bulk.reprice_bulk(items, now=DAY) == expected
+
+    out = bulk.reprice_columns({'price': [100.0], 'cost': [50.0], 'our_rating': [None],
+                                'best_price': [90.0], 'best_lead_time_days': [None], 'best_rating': [None]}, now=DAY)
+    assert all(math.isfinite(v) for v in out['new_price'].tolist())
+    assert out['new_price'].tolist() == [expected[0]['new_price']]
+
+
+@pytest.mark.parametrize('column', bulk.REQUIRED_COLUMNS)
+def test_null_required_column_rejected(column):
+    columns = {'price': [100.0, 80.0], 'cost': [50.0, 40.0]}
+    columns[column][1] = None
+    with pytest.raises(ValueError, match=column):
+        bulk.reprice_columns(columns)
+
+
+def test_api_rejects_null_price():
+    pytest.importorskip('fastapi')
+    pytest.importorskip('httpx')
+    from fastapi.testclient import TestClient
+    import main
+
+    client = TestClient(main.app)
+    r = client.post('/api/reprice/bulk', json={'columns': {'price': [100.0, None], 'cost': [50.0, 40.0]}})
+    assert r.status_code == 400
+    r = client.post('/api/reprice/bulk', json={'columns': {'price': [100.0], 'cost': [50.0], 'our_rating': [None]}})
+    assert r.status_code == 200
+    assert r.json()['ok']
@@ -0,0 +1,20 @@
+"""CassetteBackend record/replay (modules/ai/backends.py)."""
+from modules.ai.backends import CassetteBackend
+
+
+class Inner:
+    def generate(self, model, prompt, response_mime_type, task=None, cached_context=None):
+        return {'ok': True, 'response': {'items': [prompt]}}
+
+
+def test_replayed_results_are_copies(tmp_path):
+    path = str(tmp_path / 'cassette.jsonl')
+    recorder = CassetteBackend(path, mode='auto', inner=Inner())
+    recorded = recorder.generate('m', 'hello', 'application/json')
+    recorded['response']['items'].append('mutated by caller')
+
+    for backend in (recorder, CassetteBackend(path, mode='replay')):
+        first = backend.generate('m', 'hello', 'application/json')
+        first['response']['items'].append('mutated by caller')
+        first['routed_model'] = 'm'
+        assert backend.generate('m', 'hello', 'application/json') == {'ok': True, 'response': {'items': ['hello']}}
@@ -0,0 +1,110 @@
+"""CompetitorIndex heaps with lazy deletion, subscribers and snapshot / restore."""
+import random
+
+from modules.repricing.competitor_index import CompetitorIndex
+
+
+def _reference_best(offers):
+    # cheapest, ties broken by the latest upsert order (offers is seller -> (offer, seq))
+    return min(offers.values(), key=lambda o: (o[0]['price'], o[1]))[0] if offers else None
+
+
+def test_best_after_update_and_remove():
+    index = CompetitorIndex()
+    index.upsert('P1', 'a', 10.0)
+    index.upsert('P1', 'b', 12.0)
+    assert index.best('P1')['seller'] == 'a'
+
+    # raising a's price leaves its old, cheaper entry in the heap; it must not surface
+    index.upsert('P1', 'a', 15.0)
+    assert index.best('P1')['seller'] == 'b'
+    index.upsert('P1', 'a', 9.0)
+    best = index.best('P1')
+    assert (best['seller'], best['price']) == ('a', 9.0)
+
+    assert index.remove('P1', 'a')
+    assert index.best('P1')['seller'] == 'b'
+    assert not index.remove('P1', 'a')
+    assert index.remove('P1', 'b')
+    assert index.best('P1') is None
+    assert index.product_ids() == []
+
+
+def test_ties_go_to_first_inserted():
+    index = CompetitorIndex()
+    index.upsert('P1', 'a', 10.0)
+    index.upsert('P1', 'b', 10.0)
+    assert index.best('P1')['seller'] == 'a'
+
+
+def test_lazy_deletion_matches_reference_and_rebuilds():
+    rng = random.Random(7)
+    index = CompetitorIndex()
+    reference = {}
+    seq = 0
+    for _ in range(2000):
+        seller = f's{rng.randrange(6)}'
+        if rng.random() < 0.3:
+            assert index.remove('P1', seller) == (reference.pop(seller, None) is not None)
+        else:
+            seq += 1
+            offer = index.upsert('P1', seller, round(rng.uniform(5, 50), 2), rng.choice([1, 3, 7]), rng.choice([4.0, 5.0]))
+            reference[seller] = (offer, seq)
+        best = index.best('P1')
+        expected = _reference_best(reference)
+        assert (best and best['seller'], best and best['price']) == (expected and expected['seller'], expected and expected['price'])
+
+        effective = index.best_effective('P1')
+        if reference:
+            cheapest = min(index.effective_price(o) for o, _ in reference.values())
+            assert effective['effective_price'] == round(cheapest, 4)
+        else:
+            assert effective is None
+    # stale entries were compacted instead of growing with every update
+    assert index.stats()['rebuilds'] > 0
+    p = index._products.get('P1')
+    assert p is None or len(p.by_price) <= 2 * len(p.offers) + 8
+
+
+def test_subscribers_hear_only_best_changes():
+    index = CompetitorIndex()
+    seen = []
+    index.subscribe(seen.append)
+    index.subscribe(lambda pid: 1 / 0)  # a failing listener does not break the others
+
+    index.upsert('P1', 'a', 10.0)
+    index.upsert('P1', 'b', 12.0)  # not the best: no notification
+    index.upsert('P1', 'b', 11.0)
+    index.upsert('P1', 'b', 9.0)
+    index.remove('P1', 'a')  # a was not the best any more
+    index.remove('P1', 'b')
+    assert index.remove('P1', 'b') is False
+    assert seen == ['P1', 'P1', 'P1']
+
+
+def test_snapshot_restore_round_trip(tmp_path):
+    index = CompetitorIndex()
+    index.upsert('P1', 'a', 10.0, 2, 4.8, updated_at=1.0)
+    index.upsert('P1', 'b', 9.5, 6, 4.0, updated_at=2.0)
+    index.upsert('P1', 'a', 11.0, 2, 4.8, updated_at=3.0)
+    index.upsert('P2', 'c', 20.0, updated_at=4.0)
+    index.remove('P2', 'c')
+    index.upsert('P3', 'd', 5.0, updated_at=5.0)
+
+    state = index.snapshot()
+    assert set(state['products']) == {'P1', 'P3'}
+    assert all('_seq' not in o for offers in state['products'].values() for o in offers)
+
+    restored = CompetitorIndex()
+    restored.restore(state)
+    assert restored.snapshot() == state
+    for pid in ('P1', 'P3'):
+        assert restored.best(pid) == index.best(pid)
+        assert restored.best_effective(pid) == index.best_effective(pid)
+
+    path = str(tmp_path / 'index.json')
+    index.save(path)
+    loaded = CompetitorIndex()
+    assert loaded.load(path)
+    assert loaded.snapshot() == state
+    assert not CompetitorIndex().load(str(tmp_path / 'missing.json'))
@@ -0,0 +1,102 @@
+"""CostTable loading, incremental reloads, upsert overlay and CostModel resolution."""
+import json
+import os
+
+import pytest
+
+from modules.finance.calculator import CostModel, DEFAULT_FEE_PCT
+from modules.finance.cost_table import CostTable, set_cost_table
+
+HEADER = 'sku,cost,packaging_cost,shipping_cost,ads_cost,category,marketplace_fee_pct\n'
+
+
+def _write(path, rows, bump=0):
+    path.write_text(HEADER + ''.join(r + '\n' for r in rows), encoding='utf-8')
+    # mtime granularity: make every rewrite visible as a change
+    st = os.stat(path)
+    os.utime(path, ns=(st.st_atime_ns, st.st_mtime_ns + bump * 1_000_000_000))
+
+
+@pytest.fixture
+def source(tmp_path):
+    path = tmp_path / 'costs.csv'
+    _write(path, ['A,10,1,2,0.5,toys,', 'B,20,,,,books,0.05', 'C,30,,,,,'])
+    fees = tmp_path / 'fees.json'
+    fees.write_text(json.dumps({'default': 0.12, 'categories': {'toys': 0.08}}), encoding='utf-8')
+    return path, fees
+
+
+def _table(source, tmp_path, **kwargs):
+    path, fees = source
+    return CostTable(str(path), fees_path=str(fees), db_path=str(tmp_path / 'costs.db'), check_interval_s=0, **kwargs)
+
+
+def test_resolve_precedence(source, tmp_path):
+    table = _table(source, tmp_path)
+    assert table.resolve({'sku': 'A'}) == {'cost': 10.0, 'packaging_cost': 1.0, 'shipping_cost': 2.0, 'ads_cost': 0.5,
+                                           'category': 'toys', 'marketplace_fee_pct': 0.08}
+    # row fee beats the category, the schedule default covers SKUs without a category
+    assert table.resolve({'sku': 'B'})['marketplace_fee_pct'] == 0.05
+    assert table.resolve({'sku': 'C'})['marketplace_fee_pct'] == 0.12
+    # values on the product win; None counts as missing; unknown SKUs fall back to zero costs
+    resolved = table.resolve({'sku': 'A', 'cost': 12, 'shipping_cost': None, 'marketplace_fee_pct': 0.2})
+    assert (resolved['cost'], resolved['shipping_cost'], resolved['marketplace_fee_pct']) == (12.0, 2.0, 0.2)
+    assert table.resolve({'id': 'B'})['cost'] == 20.0
+    assert table.resolve({'sku': 'nope'})['cost'] == 0.0
+
+
+def test_incremental_reload_and_restart(source, tmp_path):
+    path, _ = source
+    table = _table(source, tmp_path)
+    assert table.stats()['rows_written'] == 3
+
+    _write(path, ['A,10,1,2,0.5,toys,', 'B,25,,,,books,0.05', 'D,5,,,,,'], bump=1)
+    assert table.reload() == {'changed': 2, 'removed': 1}
+    assert table.get('B')['cost'] == 25.0 and table.get('C') is None and table.get('D')['cost'] == 5.0
+    assert table.reload() == {'changed': 0, 'removed': 0}
+
+    # unchanged source after a restart: rows come from SQLite, nothing re-read
+    again = _table(source, tmp_path)
+    assert again.stats()['reloads'] == 0
+    assert again.get('B')['cost'] == 25.0
+
+
+def test_upserts_survive_source_changes(source, tmp_path):
+    path, _ = source
+    table = _table(source, tmp_path)
+    table.upsert([{'sku': 'A', 'cost': 11}, {'sku': 'NEW', 'cost': 3, 'category': 'toys'}])
+    assert table.get('A')['cost'] == 11.0
+
+    _write(path, ['A,10,1,2,0.5,toys,', 'B,20,,,,books,0.05'], bump=2)
+    table.reload()
+    assert table.get('A')['cost'] == 11.0
+    assert table.get('NEW')['cost'] == 3.0
+    assert _table(source, tmp_path).get('NEW')['cost'] == 3.0
+
+    assert table.drop_upserts(['A']) == 1
+    assert table.get('A')['cost'] == 10.0
+    assert table.drop_upserts() == 1 and table.get('NEW') is None
+
+
+def test_from_order_uses_table(source, tmp_path):
+    set_cost_table(_table(source, tmp_path))
+    try:
+        order = {'total_price': 200.0, 'items': [{'sku': 'A', 'qty': 2, 'price': 50.0}, {'sku': 'B', 'qty': None, 'price': 100.0}]}
+        model = CostModel.from_order(order)
+        assert model.cost == 2 * 10.0 + 20.0
+        assert (model.packaging, model.shipping, model.ads) == (2.0, 4.0, 1.0)
+        # fee weighted by item revenue: 100 at 8%, 100 at 5%
+        assert model.fee_pct == pytest.approx(0.065)
+
+        # order-level values win
+        model = CostModel.from_order(dict(order, shipping_cost=9.0, marketplace_fee_pct=0.1))
+        assert (model.shipping, model.fee_pct) == (9.0, 0.1)
+    finally:
+        set_cost_table(None)
+
+
+def test_from_order_null_safe():
+    model = CostModel.from_order({'items': [{'cost': None, 'qty': None, 'price': None}], 'packaging_cost': None,
+                                  'marketplace_fee_pct': None})
+    assert (model.cost, model.packaging, model.fee_pct) == (0.0, 0.0, DEFAULT_FEE_PCT)
+    assert CostModel.from_order({}).fixed_costs == 0.0
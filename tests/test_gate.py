@@ -0,0 +1,98 @@
+"""Gated hybrid repricing (modules/repricing/gate.py)."""
+import asyncio
+
+import pytest
+
+from modules.repricing.gate import GateMetrics, classify_case, combine, hybrid_reprice
+from modules.repricing.repricer import compute_new_price
+
+PRODUCT = {'id': 'p1', 'price': 100.0, 'cost': 50.0, 'our_lead_time_days': 1, 'our_rating': 4.8}
+
+
+def _offer(price, lead=1, rating=4.8):
+    return {'seller': 'rival', 'price': price, 'lead_time_days': lead, 'rating': rating}
+
+
+@pytest.mark.parametrize('competitors, decisive, reason', [
+    ([], True, 'no_competitor'),
+    ([_offer(110.0)], True, 'we_are_cheapest'),
+    ([_offer(99.0)], False, 'price_tie'),
+    ([_offer(100.0)], False, 'price_tie'),
+    ([_offer(90.0, lead=5)], True, 'competitor_slower'),
+    ([_offer(90.0, rating=4.0)], True, 'competitor_worse_rated'),
+    ([_offer(90.0)], False, 'competitor_comparable'),
+    ([_offer(120.0), _offer(90.0, lead=5)], True, 'competitor_slower'),
+])
+def test_classify_case(competitors, decisive, reason):
+    assert classify_case(PRODUCT, competitors) == {'decisive': decisive, 'reason': reason}
+
+
+def test_classify_case_null_fields():
+    product = dict(PRODUCT, our_rating=None, our_lead_time_days=None)
+    assert classify_case(product, [_offer(90.0, lead=None, rating=None)])['decisive']
+    assert classify_case(dict(PRODUCT, price=None), [_offer(90.0)]) == {'decisive': True, 'reason': 'we_are_cheapest'}
+
+
+def test_combine_unusable_model_price_falls_back():
+    deterministic = compute_new_price(PRODUCT, [_offer(90.0)])
+    for bad in ('149,99 zł', 'n/a', -5, float('nan'), [1]):
+        out = combine(deterministic, {'ok': True, 'response': {'new_price': bad}}, PRODUCT)
+        assert out['final_price'] == deterministic['new_price']
+        assert 'model_error' in out
+    out = combine(deterministic, {'ok': True, 'response': {'new_price': '95.5'}}, PRODUCT)
+    assert out['final_price'] == 95.5 and 'model_error' not in out
+
+
+def _run(competitors, model_call, deadline_s=0.5):
+    metrics = GateMetrics()
+    out = asyncio.run(hybrid_reprice(PRODUCT, competitors, None, model_call, deadline_s=deadline_s, metrics=metrics))
+    return out, metrics.stats()
+
+
+def test_decisive_case_skips_model():
+    calls = []
+
+    async def model():
+        calls.append(1)
+        return {'ok': True, 'response': {'new_price': 1.0}}
+
+    out, stats = _run([_offer(110.0)], model)
+    assert calls == [] and out['gate']['source'] == 'deterministic'
+    assert out['final_price'] == compute_new_price(PRODUCT, [_offer(110.0)])['new_price']
+    assert stats['decisive'] == 1 and stats['gate_rate'] == 1.0
+
+
+@pytest.mark.parametrize('reply, source', [
+    ({'ok': True, 'response': {'new_price': 97.0}}, 'model'),
+    ({'ok': True, 'response': {'new_price': '149,99 zł'}}, 'deterministic_model_error'),
+    ({'ok': False, 'error': 'boom'}, 'deterministic_model_error'),
+])
+def test_ambiguous_case_outcomes(reply, source):
+    async def model():
+        return reply
+
+    out, stats = _run([_offer(90.0)], model)
+    assert out['gate']['source'] == source
+    if source == 'model':
+        assert out['final_price'] == 97.0 and stats['model_used'] == 1
+    else:
+        assert out['final_price'] == compute_new_price(PRODUCT, [_offer(90.0)])['new_price']
+        assert stats['model_errors'] == 1
+
+
+def test_model_raising_and_timeout():
+    async def raising():
+        raise RuntimeError('backend down')
+
+    out, stats = _run([_offer(90.0)], raising)
+    assert out['gate']['source'] == 'deterministic_model_error' and stats['model_errors'] == 1
+
+    async def slow():
+        await asyncio.sleep(1.0)
+        return {'ok': True, 'response': {'new_price': 1.0}}
+
+    out, stats = _run([_offer(90.0)], slow, deadline_s=0.05)
+    assert out['gate']['source'] == 'deterministic_timeout'
+    assert out['gate']['elapsed_ms'] < 500
+    assert out['lm']['timeout'] and stats['timeouts'] == 1
+    assert out['final_price'] == compute_new_price(PRODUCT, [_offer(90.0)])['new_price']
@@ -0,0 +1,57 @@
+"""generate_restock_list batching: splitting on dropped answers, no retries on circuit open / timeout."""
+from modules.inventory import guard
+
+
+class FakeHandler:
+    """Answers every product except those in `drop`; or fails every call with `error`."""
+
+    def __init__(self, drop=(), error=None):
+        self.drop = set(drop)
+        self.error = error
+        self.calls = []
+
+    def batch_entry(self, product_id, sales_history, lead_time_days, extra_context=None):
+        return {'product_id': product_id, 'lead_time_days': lead_time_days}
+
+    def predict_stock_batch(self, entries, timeout=None):
+        self.calls.append([e['product_id'] for e in entries])
+        if self.error:
+            return dict({'ok': False, 'error': 'failed'}, **self.error)
+        return {'ok': True, 'predictions': {str(e['product_id']): {'days_to_depletion': 5, 'source': 'model'}
+                                            for e in entries if e['product_id'] not in self.drop}}
+
+
+def _products(n):
+    return [{'id': f'P{i}', 'price': 20.0, 'cost': 10.0, 'stock': 10, 'lead_time_days': 7,
+             'sales_history': [{'date': '2026-01-01', 'qty': 2}, {'date': '2026-01-03', 'qty': 2}]} for i in range(n)]
+
+
+def _run(monkeypatch, handler, n=8):
+    monkeypatch.setattr(guard, 'InventoryAIHandler', lambda: handler)
+    out = guard.generate_restock_list(_products(n), batch_size=n, max_workers=1)
+    return {r['product_id']: r['predicted']['source'] for r in out}
+
+
+def test_dropped_products_are_retried_then_estimated(monkeypatch):
+    handler = FakeHandler(drop={'P2', 'P5'})
+    sources = _run(monkeypatch, handler)
+    assert sources == {f'P{i}': 'velocity_estimate' if i in (2, 5) else 'model' for i in range(8)}
+    # the unanswered products are retried together, then split down to single products
+    assert handler.calls == [[f'P{i}' for i in range(8)], ['P2', 'P5'], ['P2'], ['P5']]
+
+
+def test_split_depth_is_capped(monkeypatch):
+    handler = FakeHandler(drop={f'P{i}' for i in range(16)})
+    sources = _run(monkeypatch, handler, n=16)
+    assert set(sources.values()) == {'velocity_estimate'}
+    # 1 + 2 + 4 + 8 calls, batches of 16 / 8 / 4 / 2
+    assert len(handler.calls) == 15
+    assert min(len(c) for c in handler.calls) == 2
+
+
+def test_circuit_open_and_timeout_are_not_split(monkeypatch):
+    for error in ({'circuit_open': True}, {'timeout': True}):
+        handler = FakeHandler(error=error)
+        sources = _run(monkeypatch, handler)
+        assert set(sources.values()) == {'velocity_estimate'}
+        assert len(handler.calls) == 1
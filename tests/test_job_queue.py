@@ -0,0 +1,75 @@
+"""OrderJobQueue leases, checkpoints and expiry, with two queue instances sharing one database."""
+import time
+
+import pytest
+
+from modules.orders.job_queue import OrderJobQueue, LeaseLost
+
+ORDER = {'order_id': 'J1', 'items': [{'sku': 'A', 'qty': 1, 'price': 10.0}], 'total_price': 10.0}
+
+
+@pytest.fixture
+def db(tmp_path):
+    return str(tmp_path / 'jobs.db')
+
+
+def _expire(lease_s=0.05):
+    time.sleep(lease_s * 2)
+
+
+def test_enqueue_is_idempotent(db):
+    queue = OrderJobQueue(db_path=db)
+    assert queue.enqueue(ORDER)['duplicate'] is False
+    assert queue.enqueue(ORDER)['duplicate'] is True
+    assert queue.enqueue_many([ORDER, ORDER]) == {'ok': True, 'queued': 0, 'duplicates': 2, 'order_ids': ['J1', 'J1']}
+
+    job = queue.lease('w1')
+    queue.checkpoint('J1', 'w1', 'finance', {'ok': True})
+    # changed content restarts the job from scratch
+    changed = dict(ORDER, total_price=12.0)
+    assert queue.enqueue(changed)['duplicate'] is False
+    assert queue.job('J1')['status'] == 'queued'
+    assert queue.job('J1')['checkpoints'] == {}
+    assert job['attempt'] == 1
+
+
+def test_expired_lease_resumes_from_checkpoints_on_other_instance(db):
+    first = OrderJobQueue(db_path=db, lease_s=0.05)
+    second = OrderJobQueue(db_path=db, lease_s=0.05)
+    first.enqueue(ORDER)
+
+    job = first.lease('w1')
+    first.checkpoint('J1', 'w1', 'finance', {'ok': True, 'margin': 0.3})
+    assert second.lease('w2') is None  # still held by w1
+    _expire()
+
+    resumed = second.lease('w2')
+    assert resumed['job_id'] == job['job_id'] and resumed['attempt'] == 2
+    assert resumed['checkpoints'] == {'finance': {'ok': True, 'margin': 0.3}}
+
+    # the first worker wakes up after losing its lease
+    with pytest.raises(LeaseLost):
+        first.checkpoint('J1', 'w1', 'ads', {'ok': True})
+    with pytest.raises(LeaseLost):
+        first.complete('J1', 'w1')
+    second.complete('J1', 'w2')
+    assert first.job('J1')['status'] == 'done'
+
+
+def test_expired_lease_out_of_attempts_fails(db):
+    first = OrderJobQueue(db_path=db, lease_s=0.05, max_attempts=2)
+    second = OrderJobQueue(db_path=db, lease_s=0.05, max_attempts=2)
+    first.enqueue(ORDER)
+
+    assert first.lease('w1')['attempt'] == 1
+    _expire()
+    assert second.lease('w2')['attempt'] == 2
+    _expire()
+
+    assert first.lease('w1') is None
+    job = second.job('J1')
+    assert job['status'] == 'failed'
+    assert job['attempts'] == 2
+    assert job['lease_owner'] is None
+    assert 'lease expired' in job['last_error']
+    assert second.stats()['expired_leases'] == 0
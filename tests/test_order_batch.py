@@ -0,0 +1,97 @@
+"""OrderBatchPool: backpressure, progress and job retention."""
+import threading
+
+import pytest
+
+from modules.orders import batch, order_manager
+from modules.orders.batch import OrderBatchPool
+
+
+@pytest.fixture
+def gate(monkeypatch):
+    """process_new_order blocks until the returned event is set."""
+    release = threading.Event()
+
+    def process(order):
+        release.wait(5)
+        if order.get('fail'):
+            raise RuntimeError('boom')
+        return {'order_id': order['order_id']}
+
+    monkeypatch.setattr(order_manager, 'process_new_order', process)
+    yield release
+    release.set()
+
+
+def _orders(n, start=0):
+    return [{'order_id': f'O{i}'} for i in range(start, start + n)]
+
+
+def _wait_done(pool, job_id):
+    for _ in range(200):
+        job = pool.job(job_id)
+        if job['status'] == 'done':
+            return job
+        threading.Event().wait(0.01)
+    raise AssertionError(f'job {job_id} did not finish: {pool.job(job_id)}')
+
+
+def test_progress(gate):
+    pool = OrderBatchPool(workers=2, max_queue=10)
+    try:
+        out = pool.submit(_orders(3) + [{'order_id': 'bad', 'fail': True}])
+        assert out == {'ok': True, 'job_id': out['job_id'], 'queued': 4}
+        assert pool.job(out['job_id'])['progress'] == 0.0
+        gate.set()
+        job = _wait_done(pool, out['job_id'])
+        assert job['progress'] == 1.0
+        assert (job['done'], job['failed']) == (3, 1)
+        assert sorted(job['order_ids']) == ['O0', 'O1', 'O2']
+        assert job['errors'] == [{'order_id': 'bad', 'error': 'boom'}]
+    finally:
+        pool.stop()
+
+
+def test_unfinished_jobs_are_not_evicted(gate):
+    pool = OrderBatchPool(workers=1, max_queue=20, keep_jobs=2)
+    try:
+        first = pool.submit(_orders(2))['job_id']
+        others = [pool.submit(_orders(1, start=10 + i))['job_id'] for i in range(3)]
+        # every job still has orders waiting: none may be dropped, even over keep_jobs
+        assert all(pool.job(j) is not None for j in [first] + others)
+        gate.set()
+        _wait_done(pool, others[-1])  # one worker: the last job finishes last
+        # once finished, the oldest are forgotten down to keep_jobs
+        assert [j for j in [first] + others if pool.job(j) is not None] == others[-2:]
+    finally:
+        pool.stop()
+
+
+def test_api_backpressure(gate, monkeypatch):
+    pytest.importorskip('fastapi')
+    pytest.importorskip('httpx')
+    from fastapi.testclient import TestClient
+    import main
+
+    pool = OrderBatchPool(workers=1, max_queue=3)
+    monkeypatch.setattr(batch, '_pool', pool)
+    client = TestClient(main.app)
+    try:
+        r = client.post('/api/orders/process_batch', json={'orders': _orders(3)})
+        assert r.status_code == 202
+        job_id = r.json()['job_id']
+
+        r = client.post('/api/orders/process_batch', json={'orders': _orders(3, start=3)})
+        assert r.status_code == 429
+        assert r.json()['error'] == 'queue_full'
+        assert int(r.headers['Retry-After']) == r.json()['retry_after_s'] >= 1
+        assert client.post('/api/orders/process_batch', json={'orders': _orders(4)}).status_code == 413
+
+        gate.set()
+        _wait_done(pool, job_id)
+        r = client.get(f'/api/orders/jobs/{job_id}')
+        assert r.json()['job']['progress'] == 1.0
+        assert client.get('/api/orders/jobs/unknown').status_code == 404
+        assert client.post('/api/orders/process_batch', json={'orders': _orders(3, start=3)}).status_code == 202
+    finally:
+        pool.stop()
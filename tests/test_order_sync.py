@@ -0,0 +1,143 @@
+"""OrderSync against the local Allegro stand-in (modules/allegro/fake_allegro.py)."""
+import threading
+
+import pytest
+
+pytest.importorskip('requests')
+
+from modules.allegro.client import AllegroClient
+from modules.allegro.fake_allegro import start_fake_allegro
+from modules.allegro.order_sync import OrderSync
+from modules.orders import order_manager
+from modules.orders.job_queue import OrderJobQueue, set_order_job_queue
+from modules.orders.order_store import OrderStore, set_order_store
+
+
+class Recorder:
+    def __init__(self):
+        self.orders = []
+        self.threads = set()
+        self._lock = threading.Lock()
+
+    def __call__(self, order):
+        with self._lock:
+            self.orders.append(order)
+            self.threads.add(threading.current_thread().name)
+
+    def ids(self):
+        return [o['order_id'] for o in self.orders]
+
+
+@pytest.fixture
+def allegro():
+    server = start_fake_allegro(seed=7)
+    yield server
+    server.shutdown()
+    server.server_close()
+
+
+def _sync(server, tmp_path, sink, **kwargs):
+    client = AllegroClient(base_url=f'http://127.0.0.1:{server.server_port}', token='test', timeout_s=2.0)
+    return OrderSync(db_path=str(tmp_path / 'sync.db'), client=client, sink=sink, workers=4, **kwargs)
+
+
+def test_new_orders_handed_to_sink(allegro, tmp_path):
+    ids = allegro.generate_orders(30)
+    sink = Recorder()
+    run = _sync(allegro, tmp_path, sink).run_once()
+    assert run['result'] == 'ok' and run['processed'] == 30
+    assert sorted(sink.ids()) == sorted(ids)
+    assert run['cursor'] == allegro.events[-1]['id']
+    assert all(o['items'] and o['total_price'] > 0 for o in sink.orders)
+
+
+def test_cursor_resumes_after_restart(allegro, tmp_path):
+    allegro.generate_orders(20)
+    first = Recorder()
+    _sync(allegro, tmp_path, first, page_size=7).run_once()
+    assert len(first.orders) == 20
+
+    later = allegro.generate_orders(5)
+    fetched = allegro.counters['form_fetches']
+    second = Recorder()
+    run = _sync(allegro, tmp_path, second, page_size=7).run_once()
+    assert sorted(second.ids()) == sorted(later)
+    assert allegro.counters['form_fetches'] - fetched == 5
+    assert run['events'] == 5
+
+    # nothing new: nothing fetched
+    assert _sync(allegro, tmp_path, second).run_once()['forms_fetched'] == 0
+
+
+def test_duplicate_and_replayed_events(allegro, tmp_path):
+    form_id = allegro.add_order()
+    with allegro._lock:
+        # the same form named by several events in one page
+        allegro._emit(form_id, 'READY_FOR_PROCESSING')
+        allegro._emit(form_id, 'READY_FOR_PROCESSING')
+    sink = Recorder()
+    sync = _sync(allegro, tmp_path, sink)
+    run = sync.run_once()
+    assert run['events'] == 3 and run['forms_fetched'] == 1
+    assert sink.ids() == [form_id]
+
+    # replayed event, form unchanged: fetched but not handed over again
+    with allegro._lock:
+        allegro._emit(form_id, 'READY_FOR_PROCESSING')
+    run = sync.run_once()
+    assert run['unchanged'] == 1 and sink.ids() == [form_id]
+
+    # modified form: handed over again
+    allegro.update_order(form_id, buyer={'id': '1', 'login': 'changed', 'email': 'x@example.com'})
+    run = sync.run_once()
+    assert run['processed'] == 1 and len(sink.orders) == 2
+    assert sink.orders[-1]['buyer']['login'] == 'changed'
+
+    # not paid yet: recorded, not handed over
+    form = {k: v for k, v in allegro.forms[form_id].items() if k != 'id'}
+    unpaid = allegro.add_order(dict(form, status='BOUGHT'), event_type='BUYER_MODIFIED')
+    assert sync.run_once()['skipped_status'] == 1 and unpaid not in sink.ids()
+
+
+def test_default_sink_enqueues_jobs(allegro, tmp_path):
+    queue = OrderJobQueue(db_path=str(tmp_path / 'jobs.db'))
+    set_order_job_queue(queue)
+    try:
+        ids = allegro.generate_orders(10)
+        sync = _sync(allegro, tmp_path, None)
+        assert sync.run_once()['processed'] == 10
+        # handed off only: the workflow has not run, the jobs wait for queue workers
+        assert queue.stats()['by_status'] == {'queued': 10}
+        assert all(queue.job(i)['status'] == 'queued' for i in ids)
+
+        # a replay of the whole feed from a fresh sync database enqueues nothing new
+        tmp_other = tmp_path / 'other'
+        tmp_other.mkdir()
+        assert _sync(allegro, tmp_other, None).run_once()['processed'] == 10
+        assert queue.stats()['by_status'] == {'queued': 10}
+    finally:
+        set_order_job_queue(None)
+
+
+def test_cancelled_order_leaves_pnl(allegro, tmp_path, monkeypatch):
+    store = OrderStore(str(tmp_path / 'orders.db'))
+    set_order_store(store)
+    # the workflow itself is not under test here
+    monkeypatch.setattr(order_manager, 'process_order_flow',
+                        lambda order, checkpoints=None, on_step=None: {'status': 'PROCESSING_OK', 'steps': {}})
+    try:
+        kept, cancelled = allegro.generate_orders(2)
+        sync = _sync(allegro, tmp_path, order_manager.process_new_order)
+        assert sync.run_once()['processed'] == 2
+        assert store.pnl.total()['orders'] == 2
+        revenue_kept = store.get(kept)['pnl']['revenue']
+
+        allegro.update_order(cancelled, event_type='BUYER_CANCELLED', status='CANCELLED')
+        assert sync.run_once()['cancelled'] == 1
+        total = store.pnl.total()
+        assert total['orders'] == 1
+        assert total['revenue'] == pytest.approx(revenue_kept)
+        assert store.get(cancelled)['status'] == 'cancelled'
+        assert store.count(status='cancelled') == 1
+    finally:
+        set_order_store(None)
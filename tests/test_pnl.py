@@ -0,0 +1,101 @@
+import threading
+
+import pytest
+
+from modules.finance.pnl import order_facts
+from modules.orders.order_store import OrderStore
+
+
+def _status(carrier='InPost', paused=False):
+    actions = [{'flag': 'PAUSE_ADS'}] if paused else []
+    return {'steps': {'logistics': {'ok': True, 'result': {'carrier': {'carrier_name': carrier}}},
+                      'ads': {'ok': True, 'actions': actions}}}
+
+
+def _summary(order_id, price=120.0, cost=60.0, sku='S1', carrier='InPost'):
+    order = {'order_id': order_id, 'total_price': price, 'created_at': '2026-10-01T10:00:00',
+             'items': [{'sku': sku, 'price': price, 'qty': 1, 'cost': cost}]}
+    return {'order_id': order_id, 'status': 'PROCESSING_OK', 'total_price': price,
+            'pnl': order_facts(order, _status(carrier))}
+
+
+@pytest.fixture
+def db_path(tmp_path):
+    return str(tmp_path / 'orders.db')
+
+
+def test_reprocessing_replaces_contribution(db_path):
+    store = OrderStore(db_path)
+    store.put(_summary('A'))
+    store.put(_summary('A'))
+    store.put(_summary('A', price=100.0))
+    total = store.pnl.total()
+    assert total['orders'] == 1
+    assert total['revenue'] == 100.0
+    assert store.pnl.get('sku', 'S1')['orders'] == 1
+
+
+def test_reprocessing_after_restart_does_not_go_negative(db_path):
+    OrderStore(db_path).put(_summary('A'))
+    store = OrderStore(db_path)  # restart: aggregates come from SQLite, not a fresh zero
+    assert store.pnl.total()['revenue'] == 120.0
+    store.put(_summary('A', carrier='DPD'))
+    assert store.pnl.total()['orders'] == 1
+    assert store.pnl.get('carrier', 'InPost') is None
+    rows = store.pnl.breakdown('carrier')
+    assert [r['key'] for r in rows] == ['DPD']
+    assert all(r['revenue'] >= 0 for r in rows)
+
+
+def test_concurrent_writers_share_totals(db_path):
+    # two stores on the same file stand in for two processes
+    stores = [OrderStore(db_path), OrderStore(db_path)]
+
+    def write(i):
+        for n in range(50):
+            stores[n % 2].put(_summary(f'O{n % 20}', price=100.0 + i))
+
+    threads = [threading.Thread(target=write, args=(i,)) for i in range(4)]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+    incremental = stores[0].pnl.total()
+    assert incremental['orders'] == 20
+    assert stores[0].rebuild_pnl() == 20
+    assert stores[1].pnl.total() == incremental
+
+
+def test_rebuild_matches_incremental_and_day_range(db_path):
+    store = OrderStore(db_path)
+    for i in range(10):
+        store.put(_summary(f'O{i}', price=50.0 + i, sku=f'S{i % 3}'))
+    before = store.pnl.total()
+    store.rebuild_pnl()
+    assert store.pnl.total() == before
+    assert store.pnl.days('2026-10-01', '2026-10-01') == before
+    assert sum(r['orders'] for r in store.pnl.breakdown('sku')) == 10
+    with pytest.raises(ValueError):
+        store.pnl.breakdown('sku', sort_by='revenue; DROP TABLE orders')
+
+
+def test_cancel_removes_contribution(db_path):
+    store = OrderStore(db_path)
+    store.put(_summary('A'))
+    store.put(_summary('B', price=80.0))
+    store.cancel('A', reason='BUYER_CANCELLED')
+    assert store.pnl.total()['revenue'] == 80.0
+    assert store.pnl.get('sku', 'S1')['orders'] == 1
+    assert store.get('A')['status'] == 'cancelled'
+
+    # a workflow run finishing after the cancellation does not bring the order back
+    store.put(_summary('A'))
+    assert store.pnl.total()['orders'] == 1
+    assert store.get('A')['status'] == 'cancelled'
+
+    # cancellation seen before the order was processed
+    store.cancel('C')
+    store.put(_summary('C'))
+    assert store.pnl.total()['orders'] == 1
+    OrderStore(db_path).rebuild_pnl()
+    assert store.pnl.total()['revenue'] == 80.0
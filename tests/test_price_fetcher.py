@@ -0,0 +1,115 @@
+"""CompetitorPriceFetcher against the local price source stand-in (modules/repricing/fake_price_server.py)."""
+import time
+
+import pytest
+
+pytest.importorskip('requests')
+
+from modules.repricing import repricer
+from modules.repricing.fake_price_server import start_fake_price_server
+from modules.repricing.price_fetcher import CompetitorPriceFetcher, set_price_fetcher
+
+
+@pytest.fixture
+def servers():
+    started = []
+
+    def start(**kwargs):
+        server = start_fake_price_server(**kwargs)
+        started.append(server)
+        return server
+
+    yield start
+    for server in started:
+        server.shutdown()
+        server.server_close()
+
+
+@pytest.fixture
+def fetcher():
+    f = CompetitorPriceFetcher(max_workers=8, per_host=4, timeout_s=2.0, retries=1, backoff_s=0.01)
+    yield f
+    f._pool.shutdown(wait=False)
+
+
+def _url(server, key):
+    return f'http://127.0.0.1:{server.server_port}/offers/{key}'
+
+
+def test_fetch_many_keeps_source_order(servers, fetcher):
+    server = servers(latency='uniform:0,0.05', seed=1)
+    server.set_offers('fixed', [{'seller': 'a', 'price': 10.5, 'lead_time_days': 2, 'rating': 4.9}])
+    sources = [{'url': _url(server, f'SKU-{i}')} for i in range(20)] + [{'url': _url(server, 'fixed')}]
+    results = fetcher.fetch_many(sources)
+    assert all(r['ok'] for r in results)
+    assert results[-1]['offers'] == [{'seller': 'a', 'price': 10.5, 'lead_time_days': 2.0, 'rating': 4.9}]
+    assert server.counters['max_in_flight'] <= fetcher.per_host
+
+
+def test_timeout_is_reported_not_raised(servers, fetcher):
+    slow = servers(latency='constant:1.0')
+    start = time.monotonic()
+    result = fetcher.fetch({'url': _url(slow, 'SKU-1'), 'timeout_s': 0.2})
+    elapsed = time.monotonic() - start
+    assert not result['ok']
+    # two attempts of 0.2s plus a short backoff, never the server's full second per attempt
+    assert elapsed < 1.0
+    assert fetcher.stats()['retries'] == 1
+    assert fetcher.stats()['errors'] == 1
+
+
+def test_partial_failures(servers, fetcher):
+    good = servers()
+    bad = servers(error_rate=1.0)
+    slow = servers(latency='constant:1.0')
+    sources = [{'url': _url(good, 'A')}, {'url': _url(bad, 'B')}, {'url': _url(slow, 'C'), 'timeout_s': 0.2},
+               {'url': _url(good, 'D')}]
+    results = fetcher.fetch_many(sources)
+    assert [r['ok'] for r in results] == [True, False, False, True]
+    assert 'HTTP 503' in results[1]['error']
+    # 503 is retried, then given up on
+    assert bad.counters['requests'] == fetcher.retries + 1
+
+    set_price_fetcher(fetcher)
+    try:
+        offers = repricer.fetch_competitor_prices(sources)
+    finally:
+        set_price_fetcher(None)
+    assert offers == results[0]['offers'] + results[3]['offers']
+
+
+def test_cache_and_revalidation(servers, fetcher):
+    server = servers()
+    source = {'url': _url(server, 'SKU-1')}
+    first = fetcher.fetch(source)
+    assert first['ok'] and not first['cached']
+    assert fetcher.fetch(source)['cached']
+    assert server.counters['requests'] == 1
+
+    # expired entry: conditional request answered with 304
+    again = fetcher.fetch(dict(source, ttl_s=0))
+    assert again['ok'] and again['cached'] and again['offers'] == first['offers']
+    assert server.counters['not_modified'] == 1
+
+    server.set_offers('SKU-1', [{'seller': 'x', 'price': 1.0}])
+    changed = fetcher.fetch(dict(source, ttl_s=0))
+    assert [o['price'] for o in changed['offers']] == [1.0]
+
+
+def test_request_and_parser_errors_stay_per_source(servers, fetcher, monkeypatch):
+    from modules.repricing import price_fetcher
+
+    def broken(body, source):
+        raise KeyError('offers')
+
+    monkeypatch.setitem(price_fetcher.PARSERS, 'broken', broken)
+    good = servers()
+    sources = [{'url': _url(good, 'A')}, {'url': 'no-scheme/offers/B'}, {'url': _url(good, 'C'), 'parser': 'broken'},
+               {'url': _url(good, 'D')}]
+    results = fetcher.fetch_many(sources)
+    assert [r['ok'] for r in results] == [True, False, False, True]
+    assert 'request to no-scheme/offers/B failed' in results[1]['error']
+    assert 'unparseable response' in results[2]['error']
+    # the cached body goes through the same guarded parse
+    assert not fetcher.fetch(sources[2])['ok']
+    assert fetcher.stats()['errors'] == 3
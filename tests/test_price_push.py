@@ -0,0 +1,133 @@
+"""PricePushQueue against the local Allegro stand-in (modules/allegro/fake_allegro.py)."""
+import time
+
+import pytest
+
+pytest.importorskip('requests')
+
+from modules.allegro.client import AllegroClient
+from modules.allegro.fake_allegro import start_fake_allegro
+from modules.allegro.price_push import PricePushQueue, TokenBucket
+
+
+@pytest.fixture
+def allegro():
+    started = []
+
+    def start(**kwargs):
+        kwargs.setdefault('process_delay', 0.05)
+        server = start_fake_allegro(**kwargs)
+        started.append(server)
+        return server
+
+    yield start
+    for server in started:
+        server.shutdown()
+        server.server_close()
+
+
+def _client(server):
+    return AllegroClient(base_url=f'http://127.0.0.1:{server.server_port}', token='test', timeout_s=2.0)
+
+
+def _queue(tmp_path, client, **kwargs):
+    opts = dict(rate=50.0, burst=10, poll_interval_s=0.05, batch_size=20)
+    opts.update(kwargs)
+    return PricePushQueue(db_path=str(tmp_path / 'push.db'), client=client, **opts)
+
+
+def _drain(queue, timeout=10.0):
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        queue.run_once()
+        stats = queue.stats()
+        if not stats['pending'] and not stats['offers_in_flight']:
+            return stats
+        time.sleep(0.02)
+    raise AssertionError(f'queue did not drain: {queue.stats()}')
+
+
+def test_token_bucket():
+    bucket = TokenBucket(rate=20.0, burst=3)
+    assert [bucket.try_acquire() for _ in range(4)] == [True, True, True, False]
+    time.sleep(0.06)
+    assert bucket.try_acquire()
+
+    bucket.pause(0.1)
+    time.sleep(0.06)
+    assert not bucket.try_acquire()
+    time.sleep(0.1)
+    assert bucket.try_acquire()
+
+
+def test_prices_applied_in_batches(allegro, tmp_path):
+    server = allegro()
+    queue = _queue(tmp_path, _client(server))
+    queue.enqueue_many([{'offer_id': f'o{i}', 'price': 10 + i % 3} for i in range(50)])
+    # a newer price replaces the queued one
+    assert queue.enqueue('o0', 99.0)['coalesced'] == 1
+
+    stats = _drain(queue)
+    assert stats['applied'] == 50
+    assert server.prices['o0'] == 99.0
+    assert all(server.prices[f'o{i}'] == 10 + i % 3 for i in range(1, 50))
+    # grouped by price, at most batch_size offers per command
+    assert server.counters['commands'] == stats['commands_sent'] <= 6
+    assert queue.offer_status('o7')['status'] == 'applied'
+
+
+def test_failed_offers_retried_then_given_up(allegro, tmp_path):
+    server = allegro(fail_rate=1.0)
+    queue = _queue(tmp_path, _client(server), max_attempts=3)
+    queue.enqueue_many([{'offer_id': 'a', 'price': 5.0}, {'offer_id': 'b', 'price': 5.0}])
+
+    stats = _drain(queue)
+    assert server.counters['commands'] == 3
+    assert stats['retried'] == 4 and stats['failed'] == 2 and stats['applied'] == 0
+    status = queue.offer_status('a')
+    assert status['status'] == 'failed' and status['error']
+
+
+def test_rate_limited_by_server(allegro, tmp_path):
+    server = allegro(rate=20.0, burst=2)
+    # one price per offer so every offer needs its own command, far above the server's rate
+    queue = _queue(tmp_path, _client(server), rate=100.0, burst=20)
+    queue.enqueue_many([{'offer_id': f'o{i}', 'price': 1.0 + i} for i in range(12)])
+
+    stats = _drain(queue, timeout=20.0)
+    assert stats['applied'] == 12
+    assert stats['rate_limited'] > 0
+    assert server.counters['rate_limited'] > 0
+    assert all(server.prices[f'o{i}'] == 1.0 + i for i in range(12))
+
+
+def test_commands_survive_restart(allegro, tmp_path):
+    server = allegro()
+    # first process: the API is unreachable, so commands are stored but never sent
+    down = AllegroClient(base_url='http://127.0.0.1:9', token='test', timeout_s=0.5)
+    first = _queue(tmp_path, down)
+    first.enqueue_many([{'offer_id': f'o{i}', 'price': 7.0} for i in range(5)])
+    first.run_once()
+    stats = first.stats()
+    assert stats['commands_unsent'] == 1 and stats['offers_in_flight'] == 5
+    first.enqueue('late', 8.0)
+
+    # after a restart the same command (same id) is sent, and the queued change too
+    second = _queue(tmp_path, _client(server))
+    stats = _drain(second)
+    assert stats['applied'] == 6
+    assert server.prices == {**{f'o{i}': 7.0 for i in range(5)}, 'late': 8.0}
+    assert server.counters['commands'] == 2
+
+
+def test_submitted_command_polled_after_restart(allegro, tmp_path):
+    server = allegro(process_delay=0.2)
+    first = _queue(tmp_path, _client(server))
+    first.enqueue_many([{'offer_id': 'x', 'price': 3.0}])
+    first.run_once()
+    assert first.stats()['commands_in_flight'] == 1
+
+    second = _queue(tmp_path, _client(server))
+    stats = _drain(second)
+    assert stats['applied'] == 1 and stats['commands_sent'] == 0
+    assert server.prices == {'x': 3.0} and server.counters['commands'] == 1
@@ -0,0 +1,64 @@
+"""RepricingScheduler bookkeeping around product updates."""
+from datetime import datetime
+
+import pytest
+
+pytest.importorskip('numpy')
+
+from modules.repricing.competitor_index import CompetitorIndex
+from modules.repricing.scheduler import RepricingScheduler
+
+
+def _scheduler(index=None, **kwargs):
+    return RepricingScheduler(index=index or CompetitorIndex(), min_interval_s=0, clock=lambda: datetime(2026, 1, 1, 14),
+                              **kwargs)
+
+
+def test_null_cost_and_stock_count_as_missing():
+    sched = _scheduler()
+    sched.upsert_product({'id': 'p1', 'price': 100.0, 'cost': None, 'stock': 10})
+    sched.run_once()
+    sched.upsert_product({'id': 'p1', 'cost': 0, 'stock': None})
+    sched.upsert_product({'id': 'p1', 'stock': 2})
+    assert sched.product_status('p1')['dirty'] == []
+
+    sched.upsert_product({'id': 'p1', 'cost': 60.0})
+    assert sched.product_status('p1')['dirty'] == ['cost']
+
+
+def test_result_does_not_overwrite_newer_price():
+    index = CompetitorIndex()
+    index.upsert('p1', 'rival', 90.0, lead_time_days=1, rating=5.0)
+    results = []
+    sched = _scheduler(index, on_result=lambda pid, product, result: results.append(pid))
+    sched.upsert_product({'id': 'p1', 'price': 100.0, 'cost': 50.0})
+
+    best = index.best
+
+    def best_and_update(pid):
+        # our price changes while the batch is being repriced
+        sched.upsert_product({'id': pid, 'price': 120.0})
+        return best(pid)
+
+    index.best = best_and_update
+    sched.run_once()
+    index.best = best
+    assert sched._products['p1']['price'] == 120.0
+    assert results == []
+    assert sched.product_status('p1')['dirty'] == ['price']
+    assert sched.stats()['superseded'] == 1
+
+    # the next run reprices from the new price
+    sched.run_once()
+    assert results == ['p1']
+    assert sched.product_status('p1')['last_result']['new_price'] == sched._products['p1']['price'] == 102.0
+
+
+def test_remove_product_forgets_last_result():
+    sched = _scheduler()
+    sched.upsert_product({'id': 'p1', 'price': 100.0, 'cost': 50.0})
+    sched.run_once()
+    assert sched.product_status('p1')['last_result'] is not None
+    sched.remove_product('p1')
+    assert sched.product_status('p1')['last_result'] is None
+    assert sched.stats()['never_repriced'] == 0
@@ -0,0 +1,118 @@
+import time
+import threading
+
+from modules.orders.workflow_engine import Step, run_steps
+
+
+def _sleep_step(seconds, result=None):
+    def fn(order):
+        time.sleep(seconds)
+        return dict(result or {'ok': True})
+    return fn
+
+
+def _finance(order):
+    time.sleep(0.005)
+    order['calculated_margin'] = 0.25
+    return {'ok': True, 'margin': 0.25}
+
+
+def _uses_margin(order):
+    return {'ok': True, 'margin_seen': order.get('calculated_margin')}
+
+
+def _graph(slow_s=0.3):
+    return [
+        Step('finance', _finance),
+        Step('ads', _uses_margin, ('finance',)),
+        Step('inventory', _sleep_step(slow_s)),
+        Step('communication', _sleep_step(slow_s)),
+        Step('logistics', _sleep_step(slow_s)),
+        Step('risk_analysis', _uses_margin, ('finance',)),
+    ]
+
+
+def test_independent_steps_run_in_parallel():
+    started = time.monotonic()
+    results, timings = run_steps({}, steps=_graph(0.2))
+    assert time.monotonic() - started < 0.5
+    assert all(r['ok'] for r in results.values())
+    assert results['ads']['margin_seen'] == 0.25
+    assert set(timings) == {s.name for s in _graph()}
+
+
+def test_slow_step_times_out_and_dependents_still_run(monkeypatch):
+    monkeypatch.setenv('WORKFLOW_TIMEOUT_INVENTORY', '0.05')
+    results, timings = run_steps({}, steps=_graph(0.5))
+    assert results['inventory'] == {'ok': False, 'error': 'timeout'}
+    assert timings['inventory'] < 400
+    assert results['communication']['ok']
+
+
+def test_concurrent_orders_do_not_time_out_while_waiting(monkeypatch):
+    # 60 orders x 6 steps at once; finance gets 100 ms from when it starts, which is plenty for 5 ms of work
+    monkeypatch.setenv('WORKFLOW_TIMEOUT_FINANCE', '0.1')
+    out = []
+
+    def one():
+        out.append(run_steps({}, steps=_graph(0.3))[0])
+
+    threads = [threading.Thread(target=one) for _ in range(60)]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+    assert len(out) == 60
+    assert all(r['finance']['ok'] and r['ads']['margin_seen'] == 0.25 for r in out)
+
+
+def test_checkpoints_are_not_rerun_and_restore_side_effects():
+    calls = []
+
+    def finance(order):
+        calls.append('finance')
+        return {'ok': True, 'margin': 0.5}
+
+    def restore(order, result):
+        order['calculated_margin'] = result['margin']
+
+    steps = [Step('finance', finance, restore=restore), Step('ads', _uses_margin, ('finance',))]
+    results, timings = run_steps({}, steps=steps, checkpoints={'finance': {'ok': True, 'margin': 0.4}})
+    assert calls == []
+    assert results['ads']['margin_seen'] == 0.4
+    assert 'finance' not in timings
+
+
+def test_on_step_called_for_each_finished_step():
+    seen = []
+    run_steps({}, steps=_graph(0.01), on_step=lambda name, result, ms: seen.append(name))
+    assert sorted(seen) == sorted(s.name for s in _graph())
+
+
+def test_timed_out_step_does_not_change_order_data(monkeypatch):
+    monkeypatch.setenv('WORKFLOW_TIMEOUT_FINANCE', '0.05')
+    done = threading.Event()
+
+    def slow_finance(order):
+        time.sleep(0.2)
+        order['calculated_margin'] = -1.0
+        order['items'].append({'sku': 'late'})
+        done.set()
+        return {'ok': True, 'margin': -1.0}
+
+    order = {'items': [{'sku': 'A'}]}
+    steps = [Step('finance', slow_finance), Step('ads', _uses_margin, ('finance',)),
+             Step('risk_analysis', _uses_margin, ('finance',))]
+    results, _ = run_steps(order, steps=steps)
+    assert results['finance'] == {'ok': False, 'error': 'timeout'}
+    assert results['ads']['margin_seen'] is None
+    assert results['risk_analysis']['margin_seen'] is None
+
+    assert done.wait(1.0)
+    assert order == {'items': [{'sku': 'A'}]}
+
+
+def test_finished_step_changes_are_merged():
+    order = {'total_price': 10.0}
+    run_steps(order, steps=_graph(0.01))
+    assert order == {'total_price': 10.0, 'calculated_margin': 0.25}